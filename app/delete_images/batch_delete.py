@@ -0,0 +1,222 @@
+"""
+Bulk delete endpoint (DELETE /images, handler batch_delete.batch_delete_handler).
+
+Takes {"image_ids": [...]} or {"filter": {"title": ..., "description": ...}}
+and removes up to MAX_BATCH_SIZE images per call with batched round-trips:
+batch_get_item to resolve metadata (100 keys per call), BatchWriteItem to
+delete rows (25 per call, unprocessed items retried with backoff) and S3
+DeleteObjects (1000 keys per call). Every image_id gets its own result.
+"""
+import json
+import time
+from botocore.exceptions import ClientError
+from search_index import SEARCH_INDEX_TABLE_NAME, remove_image
+from similarity_index import SIMILARITY_LOG_TABLE_NAME, record_change
+from blob_store import BLOB_TABLE_NAME, release_blob
+from metadata_cache import shared_store, tombstone
+from request_metrics import instrument, record
+from lambda_function import s3, dynamodb, S3_BUCKET_NAME, DYNAMODB_TABLE_NAME
+
+MAX_BATCH_SIZE = 1000
+BATCH_GET_MAX_KEYS = 100
+BATCH_WRITE_MAX_ITEMS = 25
+S3_DELETE_MAX_KEYS = 1000
+MAX_ATTEMPTS = 6
+BACKOFF_SECONDS = 0.05
+
+RESULT_DELETED = 'deleted'
+RESULT_NOT_FOUND = 'not_found'
+
+def response(status_code, body):
+    return {
+        'statusCode': status_code,
+        'body': json.dumps(body)
+    }
+
+def chunks(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+# Resolve metadata for image_ids with batch_get_item; returns {image_id: item}
+def get_images_metadata(image_ids):
+    found = {}
+    for chunk in chunks(image_ids, BATCH_GET_MAX_KEYS):
+        request = {DYNAMODB_TABLE_NAME: {'Keys': [{'image_id': image_id} for image_id in chunk],
+                                         'ConsistentRead': True}}
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                result = dynamodb.batch_get_item(RequestItems=request)
+            except ClientError as e:
+                raise Exception(f"Error retrieving metadata from DynamoDB: {str(e)}")
+            for item in result.get('Responses', {}).get(DYNAMODB_TABLE_NAME, []):
+                found[item['image_id']] = item
+            request = result.get('UnprocessedKeys') or {}
+            if not request:
+                break
+            time.sleep(BACKOFF_SECONDS * (2 ** attempt))
+        if request:
+            raise Exception("Error retrieving metadata from DynamoDB: unprocessed keys remained after retries")
+    return found
+
+# Image ids whose title/description contain the filter values (one scan)
+def find_image_ids(title=None, description=None, limit=MAX_BATCH_SIZE):
+    filters = []
+    values = {}
+    if title:
+        filters.append('contains(title, :title)')
+        values[':title'] = title
+    if description:
+        filters.append('contains(#description, :description)')
+        values[':description'] = description
+    request = {
+        'ProjectionExpression': 'image_id',
+        'FilterExpression': ' and '.join(filters),
+        'ExpressionAttributeValues': values
+    }
+    if description:
+        request['ExpressionAttributeNames'] = {'#description': 'description'}
+
+    table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+    image_ids = []
+    try:
+        while len(image_ids) < limit:
+            result = table.scan(**request)
+            image_ids.extend(item['image_id'] for item in result.get('Items', []))
+            if 'LastEvaluatedKey' not in result:
+                break
+            request['ExclusiveStartKey'] = result['LastEvaluatedKey']
+    except ClientError as e:
+        raise Exception(f"Error querying DynamoDB: {str(e)}")
+    return image_ids[:limit]
+
+def delete_metadata_batch(image_ids):
+    """
+    Deletes metadata rows with BatchWriteItem, 25 per call, retrying
+    unprocessed items with exponential backoff. Returns the ids that could
+    not be deleted.
+    """
+    failed = []
+    for chunk in chunks(image_ids, BATCH_WRITE_MAX_ITEMS):
+        request = {DYNAMODB_TABLE_NAME: [{'DeleteRequest': {'Key': {'image_id': image_id}}} for image_id in chunk]}
+        try:
+            for attempt in range(MAX_ATTEMPTS):
+                result = dynamodb.batch_write_item(RequestItems=request)
+                request = result.get('UnprocessedItems') or {}
+                if not request:
+                    break
+                time.sleep(BACKOFF_SECONDS * (2 ** attempt))
+        except ClientError:
+            pass  # earlier attempts deleted everything but what is still in request
+        for unprocessed in request.get(DYNAMODB_TABLE_NAME, []):
+            failed.append(unprocessed['DeleteRequest']['Key']['image_id'])
+    return failed
+
+# Delete S3 keys with DeleteObjects, 1000 per call; returns {key: error message}
+def delete_objects(keys):
+    errors = {}
+    for chunk in chunks(keys, S3_DELETE_MAX_KEYS):
+        try:
+            result = s3.delete_objects(Bucket=S3_BUCKET_NAME,
+                                       Delete={'Objects': [{'Key': key} for key in chunk], 'Quiet': True})
+        except ClientError as e:
+            errors.update((key, str(e)) for key in chunk)
+            continue
+        for error in result.get('Errors', []):
+            errors[error['Key']] = error.get('Message', error.get('Code', 'Error deleting object'))
+    return errors
+
+def delete_images(image_ids):
+    """
+    Deletes a batch of images (metadata, search postings, S3 original and
+    derivatives). Returns {image_id: 'deleted' | 'not_found' | 'error: ...'}.
+    """
+    image_ids = list(dict.fromkeys(image_ids))  # de-duplicate, keep order
+    metadata = get_images_metadata(image_ids)
+    results = {image_id: RESULT_NOT_FOUND for image_id in image_ids if image_id not in metadata}
+
+    failed = set(delete_metadata_batch(list(metadata)))
+    for image_id in failed:
+        results[image_id] = 'error: metadata could not be deleted'
+    deleted = [item for image_id, item in metadata.items() if image_id not in failed]
+
+    # Best effort, like the single delete: the objects still have to go
+    store = shared_store()
+    for item in deleted:
+        try:
+            tombstone(store, item['image_id'])
+        except Exception:
+            record('cache_errors')
+
+    # Search postings of every deleted image go out through one batch writer.
+    # Best effort as well: search results are hydrated from the metadata
+    # table, which no longer has these rows
+    index_table = dynamodb.Table(SEARCH_INDEX_TABLE_NAME)
+    try:
+        with index_table.batch_writer() as writer:
+            for item in deleted:
+                remove_image(index_table, item['image_id'], item.get('title'), item.get('description'), batch=writer)
+    except Exception:
+        record('search_index_errors')
+    hashed = [item['image_id'] for item in deleted if item.get('phash')]
+    if hashed:
+        # Best effort too; the similarity indexes are rebuilt periodically
+        log_table = dynamodb.Table(SIMILARITY_LOG_TABLE_NAME)
+        try:
+            with log_table.batch_writer() as writer:
+                for image_id in hashed:
+                    record_change(log_table, image_id, batch=writer)
+        except Exception:
+            record('similarity_log_errors')
+
+    # Collect the S3 keys to remove; shared blobs only with their last reference
+    keys_by_image = {}
+    blob_table = dynamodb.Table(BLOB_TABLE_NAME)
+    for item in deleted:
+        image_id = item['image_id']
+        keys = [derivative['key'] for derivative in item.get('derivatives') or []]
+        content_sha256 = item.get('content_sha256')
+        if not content_sha256 or release_blob(blob_table, content_sha256):
+            keys.append(item.get('s3_key') or f'{image_id}.jpg')
+        keys_by_image[image_id] = keys
+
+    errors = delete_objects([key for keys in keys_by_image.values() for key in keys])
+    for image_id, keys in keys_by_image.items():
+        key_errors = [f'{key}: {errors[key]}' for key in keys if key in errors]
+        results[image_id] = f"error: {'; '.join(key_errors)}" if key_errors else RESULT_DELETED
+    return results
+
+# Lambda handler to delete many images at once
+@instrument('delete_images.batch')
+def batch_delete_handler(event, context):
+    try:
+        try:
+            payload = json.loads(event.get('body') or '{}')
+        except ValueError:
+            return response(400, {'message': 'Request body must be JSON'})
+
+        image_ids = payload.get('image_ids')
+        image_filter = payload.get('filter')
+        if image_ids is not None:
+            if not isinstance(image_ids, list) or not all(isinstance(i, str) and i for i in image_ids):
+                return response(400, {'message': 'image_ids must be a list of strings'})
+            if len(image_ids) > MAX_BATCH_SIZE:
+                return response(400, {'message': f'At most {MAX_BATCH_SIZE} image_ids per request'})
+        elif isinstance(image_filter, dict) and (image_filter.get('title') or image_filter.get('description')):
+            image_ids = find_image_ids(image_filter.get('title'), image_filter.get('description'))
+        else:
+            return response(400, {'message': 'image_ids or a title/description filter is required'})
+
+        results = delete_images(image_ids)
+        counts = {}
+        for result in results.values():
+            status = result.split(':', 1)[0]
+            counts[status] = counts.get(status, 0) + 1
+
+        return response(200, {
+            'message': 'Batch delete completed',
+            'counts': counts,
+            'results': results
+        })
+
+    except Exception as e:
+        return response(500, {'message': str(e)})
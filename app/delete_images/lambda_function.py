@@ -1,13 +1,18 @@
 import json
-import boto3
 from botocore.exceptions import ClientError
+from aws_clients import lazy_client, lazy_dynamodb
+from search_index import SEARCH_INDEX_TABLE_NAME, remove_image
+from similarity_index import SIMILARITY_LOG_TABLE_NAME, record_change
+from blob_store import BLOB_TABLE_NAME, release_blob
+from metadata_cache import shared_store, tombstone
+from request_metrics import instrument, record
 
 S3_BUCKET_NAME = 'image-bucket-madhu'
 DYNAMODB_TABLE_NAME = 'images-metadata'
 
 # Initialize DynamoDB and S3 clients
-dynamodb = boto3.resource('dynamodb')
-s3 = boto3.client('s3')
+dynamodb = lazy_dynamodb()
+s3 = lazy_client('s3')
 
 # get image metadata from DynamoDB by image_id
 def get_image_metadata(image_id):
@@ -31,19 +36,51 @@ def delete_image_from_s3(image_key):
     except ClientError as e:
         raise Exception(f"Error deleting image from S3: {str(e)}")
 
+# Helper function to delete an image's derivatives (thumbnails etc.) from S3
+def delete_derivatives_from_s3(derivatives):
+    keys = [{'Key': derivative['key']} for derivative in derivatives or []]
+    if not keys:
+        return True
+    try:
+        s3.delete_objects(Bucket=S3_BUCKET_NAME, Delete={'Objects': keys, 'Quiet': True})
+        return True
+    except ClientError as e:
+        raise Exception(f"Error deleting derivatives from S3: {str(e)}")
+
 # Helper function to delete image metadata from DynamoDB
 def delete_image_metadata_from_dynamodb(image_id):
     table = dynamodb.Table(DYNAMODB_TABLE_NAME)
     try:
         # Delete the image metadata from DynamoDB
         response = table.delete_item(
-            Key={'image_id': image_id}
+            Key={'image_id': image_id},
+            ReturnValues='ALL_OLD'
         )
-        return response
     except ClientError as e:
         raise Exception(f"Error deleting metadata from DynamoDB: {str(e)}")
 
+    # Drop the deleted item's postings from the search index. Best effort:
+    # search results are hydrated from the metadata table, which no longer
+    # has the row, and failing here would strand the S3 objects
+    old_item = response.get('Attributes')
+    if old_item:
+        try:
+            remove_image(dynamodb.Table(SEARCH_INDEX_TABLE_NAME), image_id,
+                         old_item.get('title'), old_item.get('description'))
+        except Exception:
+            record('search_index_errors')
+        # and, when it was hashed, from the similarity indexes. Best effort:
+        # indexes are rebuilt from the table every
+        # SIMILARITY_INDEX_MAX_AGE_SECONDS and drop ids whose rows are gone
+        if old_item.get('phash'):
+            try:
+                record_change(dynamodb.Table(SIMILARITY_LOG_TABLE_NAME), image_id)
+            except Exception:
+                record('similarity_log_errors')
+    return response
+
 # Lambda handler to delete image
+@instrument('delete_images')
 def lambda_handler(event, context):
     try:
         # Extract the image_id from the path parameters
@@ -66,13 +103,24 @@ def lambda_handler(event, context):
             }
 
         # Get the S3 key 
-        s3_key = f'{image_id}.jpg'
+        s3_key = image_metadata.get('s3_key') or f'{image_id}.jpg'
 
-        # Delete the image metadata from DynamoDB
+        # Delete the image metadata from DynamoDB, then stop cached copies
+        # from being served. Best effort: the row is already gone, cached
+        # copies expire on their own, and failing here would strand the S3
+        # objects
         delete_image_metadata_from_dynamodb(image_id)
+        try:
+            tombstone(shared_store(), image_id)
+        except Exception:
+            record('cache_errors')
         
-        # Delete the image from S3
-        delete_image_from_s3(s3_key)
+        # Delete the image from S3; a shared content-addressed blob is only
+        # deleted with its last reference
+        content_sha256 = image_metadata.get('content_sha256')
+        if not content_sha256 or release_blob(dynamodb.Table(BLOB_TABLE_NAME), content_sha256):
+            delete_image_from_s3(s3_key)
+        delete_derivatives_from_s3(image_metadata.get('derivatives'))
 
 
         # Respond with a success message
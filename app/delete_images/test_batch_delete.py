@@ -0,0 +1,158 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import io
+import os
+import sys
+import json
+from botocore.exceptions import ClientError
+
+# Shared modules ship as a Lambda layer; make them importable for local runs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'layer', 'python'))
+
+from batch_delete import batch_delete_handler, delete_images, delete_metadata_batch, delete_objects
+
+
+class TestBatchDelete(unittest.TestCase):
+
+    @patch('batch_delete.time.sleep')
+    @patch('batch_delete.dynamodb')
+    def test_delete_metadata_retries_unprocessed_items(self, mock_dynamodb, mock_sleep):
+        unprocessed = {'images-metadata': [{'DeleteRequest': {'Key': {'image_id': 'b'}}}]}
+        mock_dynamodb.batch_write_item.side_effect = [{'UnprocessedItems': unprocessed}, {'UnprocessedItems': {}}]
+
+        self.assertEqual(delete_metadata_batch(['a', 'b']), [])
+        self.assertEqual(mock_dynamodb.batch_write_item.call_count, 2)
+        self.assertEqual(mock_dynamodb.batch_write_item.call_args_list[1][1]['RequestItems'], unprocessed)
+        mock_sleep.assert_called_once()
+
+    @patch('batch_delete.time.sleep')
+    @patch('batch_delete.dynamodb')
+    def test_delete_metadata_error_on_retry_fails_only_undeleted_ids(self, mock_dynamodb, mock_sleep):
+        unprocessed = {'images-metadata': [{'DeleteRequest': {'Key': {'image_id': 'b'}}}]}
+        throttled = ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'slow down'}}, 'BatchWriteItem')
+        mock_dynamodb.batch_write_item.side_effect = [{'UnprocessedItems': unprocessed}, throttled]
+
+        # 'a' and 'c' went out with the first call
+        self.assertEqual(delete_metadata_batch(['a', 'b', 'c']), ['b'])
+
+    @patch('batch_delete.dynamodb')
+    def test_delete_metadata_chunks_of_25(self, mock_dynamodb):
+        mock_dynamodb.batch_write_item.return_value = {}
+        delete_metadata_batch([f'id-{n}' for n in range(60)])
+        sizes = [len(call[1]['RequestItems']['images-metadata'])
+                 for call in mock_dynamodb.batch_write_item.call_args_list]
+        self.assertEqual(sizes, [25, 25, 10])
+
+    @patch('batch_delete.s3')
+    def test_delete_objects_maps_errors_to_keys(self, mock_s3):
+        mock_s3.delete_objects.return_value = {'Errors': [{'Key': 'b.jpg', 'Code': 'AccessDenied',
+                                                           'Message': 'Access Denied'}]}
+        self.assertEqual(delete_objects(['a.jpg', 'b.jpg']), {'b.jpg': 'Access Denied'})
+
+    @patch('batch_delete.record_change')
+    @patch('batch_delete.release_blob')
+    @patch('batch_delete.remove_image')
+    @patch('batch_delete.delete_objects')
+    @patch('batch_delete.delete_metadata_batch')
+    @patch('batch_delete.get_images_metadata')
+    def test_delete_images_reports_per_id(self, mock_get_metadata, mock_delete_metadata, mock_delete_objects,
+                                          mock_remove_image, mock_release_blob, mock_record_change):
+        mock_get_metadata.return_value = {
+            'a': {'image_id': 'a', 'title': 'Sunset', 'derivatives': [{'key': 'derivatives/a/128.jpg'}],
+                  'phash': '00ff00ff00ff00ff'},
+            'b': {'image_id': 'b', 's3_key': 'blobs/abc', 'content_sha256': 'abc'},
+            'c': {'image_id': 'c'}
+        }
+        mock_delete_metadata.return_value = []
+        mock_release_blob.return_value = False  # blob still shared
+        mock_delete_objects.return_value = {'c.jpg': 'Access Denied'}
+
+        results = delete_images(['a', 'b', 'c', 'missing', 'a'])
+
+        self.assertEqual(results, {'a': 'deleted', 'b': 'deleted', 'c': 'error: c.jpg: Access Denied',
+                                   'missing': 'not_found'})
+        mock_delete_objects.assert_called_once_with(['derivatives/a/128.jpg', 'a.jpg', 'c.jpg'])
+        self.assertEqual(mock_remove_image.call_count, 3)
+        # Only the hashed image is logged as removed from the similarity indexes
+        self.assertEqual([call[0][1] for call in mock_record_change.call_args_list], ['a'])
+
+    @patch('batch_delete.shared_store')
+    @patch('batch_delete.remove_image')
+    @patch('batch_delete.delete_objects')
+    @patch('batch_delete.delete_metadata_batch')
+    @patch('batch_delete.get_images_metadata')
+    def test_cache_error_still_deletes_objects(self, mock_get_metadata, mock_delete_metadata, mock_delete_objects,
+                                               mock_remove_image, mock_shared_store):
+        mock_get_metadata.return_value = {'a': {'image_id': 'a'}}
+        mock_delete_metadata.return_value = []
+        mock_delete_objects.return_value = {}
+        mock_shared_store.return_value.set.side_effect = ConnectionError('cache unreachable')
+        self.assertEqual(delete_images(['a']), {'a': 'deleted'})
+        mock_delete_objects.assert_called_once_with(['a.jpg'])
+
+    @patch('batch_delete.record_change')
+    @patch('batch_delete.remove_image')
+    @patch('batch_delete.delete_objects')
+    @patch('batch_delete.delete_metadata_batch')
+    @patch('batch_delete.get_images_metadata')
+    def test_log_error_still_deletes_objects(self, mock_get_metadata, mock_delete_metadata, mock_delete_objects,
+                                             mock_remove_image, mock_record_change):
+        mock_get_metadata.return_value = {'a': {'image_id': 'a', 'phash': '00ff00ff00ff00ff'}}
+        mock_delete_metadata.return_value = []
+        mock_delete_objects.return_value = {}
+        mock_record_change.side_effect = Exception('Error recording similarity change: throttled')
+        self.assertEqual(delete_images(['a']), {'a': 'deleted'})
+        mock_delete_objects.assert_called_once_with(['a.jpg'])
+
+    @patch('batch_delete.remove_image')
+    @patch('batch_delete.delete_objects')
+    @patch('batch_delete.delete_metadata_batch')
+    @patch('batch_delete.get_images_metadata')
+    def test_index_error_still_deletes_objects(self, mock_get_metadata, mock_delete_metadata, mock_delete_objects,
+                                               mock_remove_image):
+        mock_get_metadata.return_value = {'a': {'image_id': 'a', 'title': 'Sunset'}}
+        mock_delete_metadata.return_value = []
+        mock_delete_objects.return_value = {}
+        mock_remove_image.side_effect = Exception('Error removing search postings: throttled')
+        self.assertEqual(delete_images(['a']), {'a': 'deleted'})
+        mock_delete_objects.assert_called_once_with(['a.jpg'])
+
+    @patch('batch_delete.shared_store')
+    @patch('batch_delete.remove_image')
+    @patch('batch_delete.delete_objects')
+    @patch('batch_delete.delete_metadata_batch')
+    @patch('batch_delete.get_images_metadata')
+    def test_handler_emits_metrics(self, mock_get_metadata, mock_delete_metadata, mock_delete_objects,
+                                   mock_remove_image, mock_shared_store):
+        mock_get_metadata.return_value = {'a': {'image_id': 'a'}}
+        mock_delete_metadata.return_value = []
+        mock_delete_objects.return_value = {}
+        mock_shared_store.return_value.set.side_effect = ConnectionError('cache unreachable')
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            response = batch_delete_handler({'body': json.dumps({'image_ids': ['a']})}, None)
+        self.assertEqual(response['statusCode'], 200)
+        document = json.loads(stdout.getvalue().splitlines()[-1])
+        self.assertEqual((document['handler'], document['cache_errors']), ('delete_images.batch', 1))
+
+    def test_handler_requires_ids_or_filter(self):
+        response = batch_delete_handler({'body': json.dumps({})}, None)
+        self.assertEqual(response['statusCode'], 400)
+        response = batch_delete_handler({'body': json.dumps({'image_ids': 'abc'})}, None)
+        self.assertEqual(response['statusCode'], 400)
+
+    @patch('batch_delete.delete_images')
+    @patch('batch_delete.find_image_ids')
+    def test_handler_with_filter(self, mock_find_image_ids, mock_delete_images):
+        mock_find_image_ids.return_value = ['a', 'b']
+        mock_delete_images.return_value = {'a': 'deleted', 'b': 'not_found'}
+
+        response = batch_delete_handler({'body': json.dumps({'filter': {'title': 'Sunset'}})}, None)
+
+        self.assertEqual(response['statusCode'], 200)
+        mock_find_image_ids.assert_called_once_with('Sunset', None)
+        body = json.loads(response['body'])
+        self.assertEqual(body['counts'], {'deleted': 1, 'not_found': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
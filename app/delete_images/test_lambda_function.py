@@ -1,7 +1,13 @@
 import unittest
 from unittest.mock import patch, MagicMock
+import os
+import sys
 import json
-from lambda_function import lambda_handler, get_image_metadata, delete_image_from_s3, delete_image_metadata_from_dynamodb
+
+# Shared modules ship as a Lambda layer; make them importable for local runs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'layer', 'python'))
+
+from lambda_function import lambda_handler, get_image_metadata, delete_image_from_s3, delete_image_metadata_from_dynamodb, delete_derivatives_from_s3
 
 S3_BUCKET_NAME = 'image_bucket'
 
@@ -69,5 +75,97 @@ class TestDeleteImageLambdaHandler(unittest.TestCase):
         body = json.loads(response['body'])
         self.assertEqual(body['message'], 'S3 deletion failed')
 
+    @patch('lambda_function.remove_image')
+    @patch('lambda_function.dynamodb')
+    def test_delete_metadata_removes_search_postings(self, mock_dynamodb, mock_remove_image):
+        table = mock_dynamodb.Table.return_value
+        table.delete_item.return_value = {
+            'Attributes': {'image_id': '123', 'title': 'Sunset', 'description': 'Beach'}
+        }
+        delete_image_metadata_from_dynamodb('123')
+        table.delete_item.assert_called_once_with(Key={'image_id': '123'}, ReturnValues='ALL_OLD')
+        mock_remove_image.assert_called_once_with(table, '123', 'Sunset', 'Beach')
+        table.put_item.assert_not_called()  # never hashed, so nothing to log
+
+    @patch('lambda_function.remove_image')
+    @patch('lambda_function.dynamodb')
+    def test_delete_metadata_logs_hashed_images(self, mock_dynamodb, mock_remove_image):
+        table = mock_dynamodb.Table.return_value
+        table.delete_item.return_value = {'Attributes': {'image_id': '123', 'phash': '00ff00ff00ff00ff'}}
+        delete_image_metadata_from_dynamodb('123')
+        mock_dynamodb.Table.assert_any_call('images-similarity-log')
+        item = table.put_item.call_args[1]['Item']
+        self.assertEqual(item['image_id'], '123')
+        self.assertNotIn('phash', item)
+
+    @patch('lambda_function.remove_image')
+    @patch('lambda_function.dynamodb')
+    def test_delete_metadata_survives_index_errors(self, mock_dynamodb, mock_remove_image):
+        table = mock_dynamodb.Table.return_value
+        table.delete_item.return_value = {'Attributes': {'image_id': '123', 'title': 'Sunset'}}
+        mock_remove_image.side_effect = Exception('Error removing search postings: throttled')
+        response = delete_image_metadata_from_dynamodb('123')
+        self.assertEqual(response['Attributes']['image_id'], '123')
+
+    @patch('lambda_function.record_change')
+    @patch('lambda_function.remove_image')
+    @patch('lambda_function.dynamodb')
+    def test_delete_metadata_survives_log_errors(self, mock_dynamodb, mock_remove_image, mock_record_change):
+        table = mock_dynamodb.Table.return_value
+        table.delete_item.return_value = {'Attributes': {'image_id': '123', 'phash': '00ff00ff00ff00ff'}}
+        mock_record_change.side_effect = Exception('Error recording similarity change: throttled')
+        response = delete_image_metadata_from_dynamodb('123')
+        self.assertEqual(response['Attributes']['image_id'], '123')
+
+    @patch('lambda_function.s3')
+    def test_delete_derivatives_from_s3(self, mock_s3):
+        delete_derivatives_from_s3([{'key': 'derivatives/123/128.jpg'}, {'key': 'derivatives/123/128.webp'}])
+        mock_s3.delete_objects.assert_called_once_with(Bucket='image-bucket-madhu', Delete={
+            'Objects': [{'Key': 'derivatives/123/128.jpg'}, {'Key': 'derivatives/123/128.webp'}], 'Quiet': True})
+        mock_s3.reset_mock()
+        delete_derivatives_from_s3(None)
+        mock_s3.delete_objects.assert_not_called()
+
+    @patch('lambda_function.release_blob')
+    @patch('lambda_function.get_image_metadata')
+    @patch('lambda_function.delete_image_from_s3')
+    @patch('lambda_function.delete_image_metadata_from_dynamodb')
+    def test_delete_shared_blob_keeps_object(self, mock_delete_metadata, mock_delete_s3, mock_get_metadata,
+                                             mock_release_blob):
+        mock_get_metadata.return_value = {'image_id': '123', 's3_key': 'blobs/abc', 'content_sha256': 'abc'}
+        mock_release_blob.return_value = False
+        response = lambda_handler({'pathParameters': {'image_id': '123'}}, None)
+        self.assertEqual(response['statusCode'], 200)
+        mock_delete_s3.assert_not_called()
+
+        # Last reference: the blob object goes too
+        mock_release_blob.return_value = True
+        lambda_handler({'pathParameters': {'image_id': '123'}}, None)
+        mock_delete_s3.assert_called_once_with('blobs/abc')
+
+    @patch('lambda_function.shared_store')
+    @patch('lambda_function.get_image_metadata')
+    @patch('lambda_function.delete_image_from_s3')
+    @patch('lambda_function.delete_image_metadata_from_dynamodb')
+    def test_delete_tombstones_cached_metadata(self, mock_delete_metadata, mock_delete_s3, mock_get_metadata,
+                                               mock_shared_store):
+        mock_get_metadata.return_value = {'image_id': '123'}
+        lambda_handler({'pathParameters': {'image_id': '123'}}, None)
+        mock_shared_store.return_value.set.assert_called_once()
+        key, value, _ = mock_shared_store.return_value.set.call_args[0]
+        self.assertEqual((key, value), ('image-metadata:123', 'null'))
+
+    @patch('lambda_function.shared_store')
+    @patch('lambda_function.get_image_metadata')
+    @patch('lambda_function.delete_image_from_s3')
+    @patch('lambda_function.delete_image_metadata_from_dynamodb')
+    def test_cache_error_still_deletes_object(self, mock_delete_metadata, mock_delete_s3, mock_get_metadata,
+                                              mock_shared_store):
+        mock_get_metadata.return_value = {'image_id': '123'}
+        mock_shared_store.return_value.set.side_effect = ConnectionError('cache unreachable')
+        response = lambda_handler({'pathParameters': {'image_id': '123'}}, None)
+        self.assertEqual(response['statusCode'], 200)
+        mock_delete_s3.assert_called_once_with('123.jpg')
+
 if __name__ == '__main__':
     unittest.main()
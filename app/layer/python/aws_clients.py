@@ -0,0 +1,198 @@
+"""
+Shared, lazily created AWS clients.
+
+Every Lambda used to build `boto3.resource('dynamodb')` and `boto3.client('s3')`
+at import with default settings. This module creates low-level clients on
+first use, memoizes them for the life of the execution environment and
+configures them once (including request_metrics' per-call timing):
+
+    AWS_MAX_POOL_CONNECTIONS  HTTP connections per client (default 32; botocore's is 10)
+    AWS_RETRY_MODE            retry mode (default adaptive: client-side rate limiting on throttles)
+    AWS_MAX_ATTEMPTS          attempts per call including the first (default 5)
+    AWS_TCP_KEEPALIVE         keep idle pooled connections alive (default true)
+    AWS_CONNECT_TIMEOUT       seconds (default 5)
+    AWS_READ_TIMEOUT          seconds (default 30)
+    AWS_ENDPOINT_URL          endpoint override for every service, e.g. http://localhost:4566 (LocalStack)
+    AWS_ENDPOINT_URL_<SVC>    per-service override, e.g. AWS_ENDPOINT_URL_S3
+    AWS_CLIENTS_PREWARM       services to create during init instead of on first use,
+                              e.g. dynamodb,s3 (provisioned concurrency, where init is
+                              off the request path)
+
+DynamoDB is exposed through a small stand-in for the `boto3.resource` API
+(`Table(...)`, `batch_get_item`, `batch_write_item`, `table.batch_writer()`)
+that reuses boto3's own type (de)serialization hooks on a plain client, so
+handlers keep working with Python values without loading the resource model.
+"""
+import os
+import threading
+
+MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', 32))
+RETRY_MODE = os.environ.get('AWS_RETRY_MODE', 'adaptive')
+MAX_ATTEMPTS = int(os.environ.get('AWS_MAX_ATTEMPTS', 5))
+TCP_KEEPALIVE = os.environ.get('AWS_TCP_KEEPALIVE', 'true').lower() == 'true'
+CONNECT_TIMEOUT = float(os.environ.get('AWS_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(os.environ.get('AWS_READ_TIMEOUT', 30))
+PREWARM = [name.strip() for name in os.environ.get('AWS_CLIENTS_PREWARM', '').split(',') if name.strip()]
+
+_clients = {}
+_lock = threading.Lock()
+
+# Endpoint override for a service, or None for the AWS default
+def endpoint_url(service_name):
+    env_name = 'AWS_ENDPOINT_URL_' + service_name.upper().replace('-', '_')
+    return os.environ.get(env_name) or os.environ.get('AWS_ENDPOINT_URL') or None
+
+def client_config():
+    from botocore.config import Config
+
+    return Config(
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        retries={'mode': RETRY_MODE, 'max_attempts': MAX_ATTEMPTS},
+        tcp_keepalive=TCP_KEEPALIVE,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT
+    )
+
+def _memoized(key, factory):
+    found = _clients.get(key)
+    if found is not None:
+        return found
+    with _lock:
+        # Clients are thread safe once built, but building one is not
+        if key not in _clients:
+            _clients[key] = factory()
+        return _clients[key]
+
+# Memoized low-level client for a service (created on first call)
+def client(service_name, region_name=None):
+    def create():
+        import boto3
+        import request_metrics
+
+        aws_client = boto3.client(service_name, region_name=region_name,
+                                  endpoint_url=endpoint_url(service_name), config=client_config())
+        request_metrics.register_client(aws_client)
+        return aws_client
+    return _memoized(('client', service_name, region_name), create)
+
+# Memoized DynamoDB handle with the boto3.resource-style API. With
+# native_numbers=True numbers come back as int/float instead of Decimal, for
+# read-only callers that only serialize them to JSON.
+def dynamodb(region_name=None, native_numbers=False):
+    def create():
+        import boto3
+        import request_metrics
+
+        dynamodb_client = boto3.client('dynamodb', region_name=region_name,
+                                       endpoint_url=endpoint_url('dynamodb'), config=client_config())
+        request_metrics.register_client(dynamodb_client)
+        return DynamoDB(dynamodb_client, deserializer=native_number_deserializer() if native_numbers else None)
+    return _memoized(('dynamodb', region_name, native_numbers), create)
+
+def native_number_deserializer():
+    from boto3.dynamodb.types import TypeDeserializer
+
+    class NativeNumberDeserializer(TypeDeserializer):
+        def _deserialize_n(self, value):
+            try:
+                return int(value)
+            except ValueError:
+                return float(value)
+
+    return NativeNumberDeserializer()
+
+# Create clients now rather than on first use
+def prewarm(service_names):
+    for service_name in service_names:
+        if service_name == 'dynamodb':
+            dynamodb()
+        else:
+            client(service_name)
+
+# Forget every memoized client (tests, or after changing the environment)
+def reset():
+    with _lock:
+        _clients.clear()
+
+class DynamoDB(object):
+    """
+    Python-typed DynamoDB operations on one low-level client. The client gets
+    the same serialization hooks boto3.resource('dynamodb') installs, so Key,
+    Item and ExpressionAttributeValues take plain Python values and
+    responses come back deserialized.
+    """
+    def __init__(self, dynamodb_client, deserializer=None):
+        from boto3.dynamodb.transform import TransformationInjector, copy_dynamodb_params
+
+        injector = TransformationInjector(deserializer=deserializer)
+        events = dynamodb_client.meta.events
+        events.register('provide-client-params.dynamodb', copy_dynamodb_params,
+                        unique_id='dynamodb-create-params-copy')
+        events.register('before-parameter-build.dynamodb', injector.inject_condition_expressions,
+                        unique_id='dynamodb-condition-expression')
+        events.register('before-parameter-build.dynamodb', injector.inject_attribute_value_input,
+                        unique_id='dynamodb-attr-value-input')
+        events.register('after-call.dynamodb', injector.inject_attribute_value_output,
+                        unique_id='dynamodb-attr-value-output')
+        self.client = dynamodb_client
+
+    def Table(self, name):
+        return Table(name, self.client)
+
+    def batch_get_item(self, **kwargs):
+        return self.client.batch_get_item(**kwargs)
+
+    def batch_write_item(self, **kwargs):
+        return self.client.batch_write_item(**kwargs)
+
+class Table(object):
+    def __init__(self, name, dynamodb_client):
+        self.name = name
+        self.client = dynamodb_client
+
+    def get_item(self, **kwargs):
+        return self.client.get_item(TableName=self.name, **kwargs)
+
+    def put_item(self, **kwargs):
+        return self.client.put_item(TableName=self.name, **kwargs)
+
+    def update_item(self, **kwargs):
+        return self.client.update_item(TableName=self.name, **kwargs)
+
+    def delete_item(self, **kwargs):
+        return self.client.delete_item(TableName=self.name, **kwargs)
+
+    def query(self, **kwargs):
+        return self.client.query(TableName=self.name, **kwargs)
+
+    def scan(self, **kwargs):
+        return self.client.scan(TableName=self.name, **kwargs)
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        from boto3.dynamodb.table import BatchWriter
+
+        return BatchWriter(self.name, self.client, overwrite_by_pkeys=overwrite_by_pkeys)
+
+class Lazy(object):
+    """
+    Module-level stand-in that builds the real object on first attribute
+    access, so importing a handler creates no clients and a handler that
+    never touches S3 never pays for an S3 client.
+    """
+    def __init__(self, factory, *args, **kwargs):
+        self._factory = factory
+        self._args = args
+        self._kwargs = kwargs
+
+    def __getattr__(self, name):
+        # Memoized by the factory, so this is a dict lookup after the first call
+        return getattr(self._factory(*self._args, **self._kwargs), name)
+
+def lazy_client(service_name, region_name=None):
+    return Lazy(client, service_name, region_name=region_name)
+
+def lazy_dynamodb(region_name=None, native_numbers=False):
+    return Lazy(dynamodb, region_name=region_name, native_numbers=native_numbers)
+
+if PREWARM:
+    prewarm(PREWARM)
@@ -0,0 +1,78 @@
+"""
+Reference-counted, content-addressed image blobs.
+
+With content-addressed storage enabled, upload_image stores image bytes
+once per SHA-256 under blobs/{sha256} and every image_id that has those
+bytes points at the same object. The images-blobs table (partition key
+`content_sha256`) counts the references; delete_images only removes the S3
+object when the last reference goes away.
+"""
+from botocore.exceptions import ClientError
+
+BLOB_TABLE_NAME = 'images-blobs'
+BLOB_KEY_PREFIX = 'blobs/'
+
+def blob_key(content_sha256):
+    return f'{BLOB_KEY_PREFIX}{content_sha256}'
+
+def acquire_blob(table, content_sha256, size):
+    """
+    Adds a reference to the blob, creating its row if needed. Returns True
+    when the caller must upload the bytes (no earlier upload completed).
+    """
+    try:
+        response = table.update_item(
+            Key={'content_sha256': content_sha256},
+            UpdateExpression='ADD ref_count :one SET s3_key = if_not_exists(s3_key, :key), '
+                             'size_bytes = if_not_exists(size_bytes, :size)',
+            ExpressionAttributeValues={':one': 1, ':key': blob_key(content_sha256), ':size': size},
+            ReturnValues='ALL_OLD'
+        )
+    except ClientError as e:
+        raise Exception(f"Error updating blob reference count: {str(e)}")
+    return not response.get('Attributes', {}).get('uploaded', False)
+
+# Record that the blob's bytes are in S3, so later references skip the upload
+def mark_blob_uploaded(table, content_sha256):
+    try:
+        table.update_item(
+            Key={'content_sha256': content_sha256},
+            UpdateExpression='SET uploaded = :true',
+            ExpressionAttributeValues={':true': True}
+        )
+    except ClientError as e:
+        raise Exception(f"Error updating blob reference count: {str(e)}")
+
+def release_blob(table, content_sha256):
+    """
+    Drops one reference. Returns True when it was the last one: the row is
+    deleted and the caller should delete the S3 object.
+    """
+    try:
+        response = table.update_item(
+            Key={'content_sha256': content_sha256},
+            UpdateExpression='ADD ref_count :minus_one',
+            ConditionExpression='attribute_exists(content_sha256)',
+            ExpressionAttributeValues={':minus_one': -1},
+            ReturnValues='UPDATED_NEW'
+        )
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            return False  # Already released
+        raise Exception(f"Error updating blob reference count: {str(e)}")
+
+    if response['Attributes']['ref_count'] > 0:
+        return False
+
+    # Only remove the row if no upload re-acquired the blob in the meantime
+    try:
+        table.delete_item(
+            Key={'content_sha256': content_sha256},
+            ConditionExpression='ref_count <= :zero',
+            ExpressionAttributeValues={':zero': 0}
+        )
+        return True
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            return False
+        raise Exception(f"Error deleting blob reference: {str(e)}")
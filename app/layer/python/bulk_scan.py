@@ -0,0 +1,277 @@
+"""
+Parallel bulk reads of a whole DynamoDB table.
+
+Whole-catalog jobs (export, reindex, audits) read every item. A single scan
+reads one page at a time; this runs DynamoDB parallel scan instead: the table
+is split into TotalSegments segments, scanned by a thread pool, and the pages
+are streamed to the caller through a bounded queue, so scanning threads block
+(rather than buffer the table in memory) when the consumer falls behind.
+
+Progress can be checkpointed as each segment's LastEvaluatedKey after its
+page has been consumed; a restarted job skips finished segments and resumes
+the others where they stopped. Delivery is at least once: a page consumed
+but not yet checkpointed when a job dies is read again on resume.
+
+    python bulk_scan.py export --output images.ndjson --segments 8 --checkpoint export.ckpt
+"""
+import os
+import json
+import queue
+import decimal
+import threading
+from botocore.exceptions import ClientError
+
+DEFAULT_SEGMENTS = int(os.environ.get('BULK_SCAN_SEGMENTS', 8))
+# Pages buffered between the scanning threads and the consumer
+MAX_PENDING_PAGES = int(os.environ.get('BULK_SCAN_MAX_PENDING_PAGES', 16))
+COLUMNAR_BATCH_SIZE = 1000
+
+_DONE = object()
+
+# json.dumps fallback for DynamoDB numbers, which boto3 returns as Decimal
+def json_default(value):
+    if isinstance(value, decimal.Decimal):
+        number = int(value)
+        return number if number == value else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=str)
+    if isinstance(value, (bytes, bytearray)):
+        import base64
+
+        return base64.b64encode(value).decode('ascii')
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+class Checkpoint(object):
+    """
+    Per-segment scan progress, saved to `path` as JSON after every advance.
+    Keys are stored in DynamoDB's typed form so numbers round-trip exactly.
+    """
+    def __init__(self, path, total_segments):
+        self.path = path
+        self.total_segments = total_segments
+        self.positions = {}  # segment -> ExclusiveStartKey to resume from
+        self.done = set()
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        from boto3.dynamodb.types import TypeDeserializer
+
+        with open(self.path) as f:
+            state = json.load(f)
+        if state.get('total_segments') != self.total_segments:
+            raise ValueError(f"Checkpoint {self.path} was written for {state.get('total_segments')} segments, "
+                             f"not {self.total_segments}")
+        deserializer = TypeDeserializer()
+        self.done = set(state.get('done', []))
+        self.positions = {int(segment): {name: deserializer.deserialize(value) for name, value in key.items()}
+                          for segment, key in state.get('positions', {}).items()}
+
+    def save(self):
+        from boto3.dynamodb.types import TypeSerializer
+
+        serializer = TypeSerializer()
+        state = {
+            'total_segments': self.total_segments,
+            'done': sorted(self.done),
+            'positions': {str(segment): {name: serializer.serialize(value) for name, value in key.items()}
+                          for segment, key in self.positions.items()}
+        }
+        # Write then rename, so a crash never leaves a torn checkpoint
+        temporary_path = f'{self.path}.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(temporary_path, self.path)
+
+    @property
+    def complete(self):
+        return len(self.done) == self.total_segments
+
+    def start_key(self, segment):
+        return self.positions.get(segment)
+
+    # Record that everything up to last_key (None: the whole segment) was consumed
+    def advance(self, segment, last_key):
+        with self.lock:
+            if last_key is None:
+                self.done.add(segment)
+                self.positions.pop(segment, None)
+            else:
+                self.positions[segment] = last_key
+            if self.path:
+                self.save()
+
+# Scan one segment, handing each page to `put`; stops early once `stop` is set
+def _scan_segment(table, request, segment, total_segments, start_key, put, stop):
+    request = dict(request, Segment=segment, TotalSegments=total_segments)
+    while not stop.is_set():
+        if start_key:
+            request['ExclusiveStartKey'] = start_key
+        response = table.scan(**request)
+        start_key = response.get('LastEvaluatedKey')
+        put((segment, response.get('Items', []), start_key))
+        if not start_key:
+            return
+
+# Generator of (segment, items, last_key) pages from a parallel scan of
+# `table`; last_key is None on a segment's final page. `request` holds extra
+# scan parameters (ProjectionExpression, FilterExpression, Limit, ...).
+# Segments a checkpoint marks done are skipped; the others resume from it.
+def scan_pages(table, total_segments=DEFAULT_SEGMENTS, request=None, checkpoint=None, workers=None,
+               max_pending_pages=MAX_PENDING_PAGES):
+    from concurrent.futures import ThreadPoolExecutor
+
+    request = dict(request or {})
+    segments = [segment for segment in range(total_segments)
+                if checkpoint is None or segment not in checkpoint.done]
+    if not segments:
+        return
+    pages = queue.Queue(maxsize=max_pending_pages)
+    stop = threading.Event()
+
+    # Block while the queue is full (backpressure), waking up to notice a stop
+    def put(entry):
+        while not stop.is_set():
+            try:
+                pages.put(entry, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def run(segment):
+        try:
+            start_key = checkpoint.start_key(segment) if checkpoint is not None else None
+            _scan_segment(table, request, segment, total_segments, start_key, put, stop)
+            put(_DONE)
+        except Exception as e:
+            put(e)
+
+    executor = ThreadPoolExecutor(max_workers=min(workers or len(segments), len(segments)))
+    try:
+        for segment in segments:
+            executor.submit(run, segment)
+        remaining = len(segments)
+        while remaining:
+            entry = pages.get()
+            if entry is _DONE:
+                remaining -= 1
+            elif isinstance(entry, Exception):
+                if isinstance(entry, ClientError):
+                    raise Exception(f"Error scanning DynamoDB: {str(entry)}")
+                raise entry
+            else:
+                yield entry
+    finally:
+        # Also runs when the consumer stops iterating early
+        stop.set()
+        executor.shutdown(wait=True)
+
+# Every item of a parallel scan, in no particular order
+def scan_items(table, total_segments=DEFAULT_SEGMENTS, request=None, workers=None):
+    for _, items, _ in scan_pages(table, total_segments, request=request, workers=workers):
+        for item in items:
+            yield item
+
+class NdjsonWriter(object):
+    """One JSON object per line."""
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, items):
+        for item in items:
+            self.stream.write(json.dumps(item, default=json_default, separators=(',', ':')))
+            self.stream.write('\n')
+
+    def flush(self):
+        self.stream.flush()
+
+class ColumnarWriter(object):
+    """
+    Column-oriented batches, one JSON object per line:
+    {"count": n, "columns": {"image_id": [...], "title": [...], ...}}, with
+    null where an item lacks an attribute. Loads straight into a dataframe or
+    Parquet row group, and repeated attribute names are written once per batch.
+    """
+    def __init__(self, stream, batch_size=COLUMNAR_BATCH_SIZE):
+        self.stream = stream
+        self.batch_size = batch_size
+        self.pending = []
+
+    def write(self, items):
+        self.pending.extend(items)
+        while len(self.pending) >= self.batch_size:
+            self.write_batch(self.pending[:self.batch_size])
+            del self.pending[:self.batch_size]
+
+    def write_batch(self, items):
+        names = []
+        seen = set()
+        for item in items:
+            for name in item:
+                if name not in seen:
+                    seen.add(name)
+                    names.append(name)
+        columns = {name: [item.get(name) for item in items] for name in names}
+        self.stream.write(json.dumps({'count': len(items), 'columns': columns}, default=json_default,
+                                     separators=(',', ':')))
+        self.stream.write('\n')
+
+    # Write the partial batch too: a checkpoint must never cover buffered items
+    def flush(self):
+        if self.pending:
+            self.write_batch(self.pending)
+            self.pending = []
+        self.stream.flush()
+
+WRITERS = {'ndjson': NdjsonWriter, 'columnar': ColumnarWriter}
+
+# Export every item of `table` through `writer`, checkpointing each page
+# after it is written; returns the number of items written
+def export_table(table, writer, total_segments=DEFAULT_SEGMENTS, request=None, checkpoint=None, workers=None):
+    exported = 0
+    for segment, items, last_key in scan_pages(table, total_segments, request=request, checkpoint=checkpoint,
+                                               workers=workers):
+        writer.write(items)
+        exported += len(items)
+        if checkpoint is not None:
+            writer.flush()
+            checkpoint.advance(segment, last_key)
+    writer.flush()
+    return exported
+
+# CLI only; argparse stays out of the handlers' import path
+def main(argv=None):
+    import argparse
+    import aws_clients
+
+    parser = argparse.ArgumentParser(description='Export a DynamoDB table with a parallel scan.')
+    parser.add_argument('command', choices=['export'])
+    parser.add_argument('--table', default='images-metadata')
+    parser.add_argument('--output', required=True, help='file to write (appended to when resuming)')
+    parser.add_argument('--format', choices=sorted(WRITERS), default='ndjson')
+    parser.add_argument('--segments', type=int, default=DEFAULT_SEGMENTS)
+    parser.add_argument('--workers', type=int, default=None, help='scanning threads (default: one per segment)')
+    parser.add_argument('--checkpoint', default=None, help='progress file; rerun with the same file to resume')
+    parser.add_argument('--endpoint-url', default=None, help='DynamoDB endpoint, e.g. http://localhost:4566')
+    args = parser.parse_args(argv)
+
+    if args.endpoint_url:
+        os.environ['AWS_ENDPOINT_URL_DYNAMODB'] = args.endpoint_url
+    table = aws_clients.dynamodb().Table(args.table)
+    checkpoint = Checkpoint(args.checkpoint, args.segments) if args.checkpoint else None
+    if checkpoint is not None and checkpoint.complete:
+        print(f"Checkpoint {args.checkpoint} is complete; nothing to export")
+        return 0
+
+    resuming = checkpoint is not None and (checkpoint.done or checkpoint.positions)
+    with open(args.output, 'a' if resuming else 'w') as stream:
+        exported = export_table(table, WRITERS[args.format](stream), args.segments, checkpoint=checkpoint,
+                                workers=args.workers)
+    print(f"Exported {exported} items to {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    import sys
+
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+Listing keys of images-metadata: who uploaded an image, and when.
+
+Every row gets created_at (epoch milliseconds), time_bucket and, for
+authenticated uploads, owner_id. Two global secondary indexes (projection
+ALL) turn "newest first" and "my images" into Query calls:
+
+    owner-created-index   partition owner_id,    sort created_at
+    recent-created-index  partition time_bucket, sort created_at
+
+time_bucket is `YYYY-MM#shard`: one partition per month, split
+CATALOG_RECENT_SHARDS ways (default 4) by a hash of the image_id, so upload
+bursts do not all land on one partition. Readers query every shard of a
+month and merge, newest month first. The shard count may be raised but not
+lowered: rows in shards no longer read drop out of recency listings.
+
+    python catalog_index.py create-indexes
+    python catalog_index.py backfill [--dry-run]
+
+create-indexes adds whichever index is missing (one per call, as DynamoDB
+requires; rerun it once the first is ACTIVE). backfill sets created_at,
+time_bucket and size_bytes on rows written before they existed, from the
+original's S3 LastModified and ContentLength. owner_id cannot be recovered,
+so older images only show up in recency listings.
+"""
+import os
+import time
+import zlib
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+
+DYNAMODB_TABLE_NAME = 'images-metadata'
+S3_BUCKET_NAME = 'image-bucket-madhu'
+OWNER_INDEX_NAME = 'owner-created-index'
+RECENT_INDEX_NAME = 'recent-created-index'
+RECENT_SHARDS = int(os.environ.get('CATALOG_RECENT_SHARDS', 4))
+
+BACKFILL_PROJECTION = 'image_id, s3_key, created_at, time_bucket, size_bytes'
+BACKFILL_CHUNK_SIZE = 1000
+
+def now_ms():
+    return int(time.time() * 1000)
+
+# 'YYYY-MM' of an epoch-milliseconds timestamp
+def month_of(created_at):
+    return datetime.fromtimestamp(created_at / 1000.0, tz=timezone.utc).strftime('%Y-%m')
+
+def previous_month(month):
+    year, number = int(month[:4]), int(month[5:7])
+    return f'{year - 1}-12' if number == 1 else f'{year}-{number - 1:02d}'
+
+def shard_of(image_id, shards=None):
+    return zlib.crc32(image_id.encode('utf-8')) % (shards or RECENT_SHARDS)
+
+def time_bucket(created_at, image_id):
+    return f'{month_of(created_at)}#{shard_of(image_id)}'
+
+# Attributes to write on a new metadata row
+def listing_attributes(image_id, owner_id=None, created_at=None):
+    created_at = now_ms() if created_at is None else created_at
+    attributes = {'created_at': created_at, 'time_bucket': time_bucket(created_at, image_id)}
+    if owner_id:
+        attributes['owner_id'] = owner_id
+    return attributes
+
+def request_owner(event):
+    """
+    The caller's id from the API Gateway authorizer: the Cognito/JWT `sub`
+    claim or a Lambda authorizer's principalId. None for anonymous calls.
+    """
+    authorizer = (event.get('requestContext') or {}).get('authorizer') or {}
+    claims = authorizer.get('claims') or (authorizer.get('jwt') or {}).get('claims') or {}
+    owner_id = claims.get('sub') or authorizer.get('principalId')
+    return str(owner_id) if owner_id else None
+
+def index_definitions():
+    return {
+        OWNER_INDEX_NAME: ('owner_id', 'created_at'),
+        RECENT_INDEX_NAME: ('time_bucket', 'created_at')
+    }
+
+def create_indexes(client, table_name=DYNAMODB_TABLE_NAME):
+    """
+    Adds the first missing listing index to the table. Returns its name, or
+    None when both exist.
+    """
+    try:
+        table = client.describe_table(TableName=table_name)['Table']
+    except ClientError as e:
+        raise Exception(f"Error describing table: {str(e)}")
+    existing = {index['IndexName'] for index in table.get('GlobalSecondaryIndexes', [])}
+    for index_name, (partition_key, sort_key) in index_definitions().items():
+        if index_name in existing:
+            continue
+        create = {
+            'IndexName': index_name,
+            'KeySchema': [{'AttributeName': partition_key, 'KeyType': 'HASH'},
+                          {'AttributeName': sort_key, 'KeyType': 'RANGE'}],
+            'Projection': {'ProjectionType': 'ALL'}
+        }
+        if table.get('BillingModeSummary', {}).get('BillingMode') != 'PAY_PER_REQUEST':
+            throughput = table.get('ProvisionedThroughput', {})
+            create['ProvisionedThroughput'] = {'ReadCapacityUnits': throughput.get('ReadCapacityUnits') or 5,
+                                               'WriteCapacityUnits': throughput.get('WriteCapacityUnits') or 5}
+        try:
+            client.update_table(
+                TableName=table_name,
+                AttributeDefinitions=[{'AttributeName': partition_key, 'AttributeType': 'S'},
+                                      {'AttributeName': sort_key, 'AttributeType': 'N'}],
+                GlobalSecondaryIndexUpdates=[{'Create': create}]
+            )
+        except ClientError as e:
+            raise Exception(f"Error creating index {index_name}: {str(e)}")
+        return index_name
+    return None
+
+# (created_at, size_bytes) of an original from S3, or None when it is missing
+def object_facts(s3, s3_key):
+    try:
+        head = s3.head_object(Bucket=S3_BUCKET_NAME, Key=s3_key)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise Exception(f"Error reading object from S3: {str(e)}")
+    return int(head['LastModified'].timestamp() * 1000), head.get('ContentLength', 0)
+
+# Fill in the listing attributes of one row; returns 'updated', 'current',
+# 'missing_object' or 'deleted'
+def backfill_item(table, s3, item, dry_run=False):
+    if 'created_at' in item and 'time_bucket' in item and 'size_bytes' in item:
+        return 'current'
+    created_at, size = item.get('created_at'), item.get('size_bytes')
+    if created_at is None or size is None:
+        facts = object_facts(s3, item.get('s3_key') or f"{item['image_id']}.jpg")
+        if facts is None:
+            return 'missing_object'  # left to reconcile_images
+        created_at = int(created_at if created_at is not None else facts[0])
+        size = size if size is not None else facts[1]
+    if dry_run:
+        return 'updated'
+    try:
+        # if_not_exists: a concurrent writer's values win over backfilled ones
+        table.update_item(
+            Key={'image_id': item['image_id']},
+            UpdateExpression='SET created_at = if_not_exists(created_at, :created_at), '
+                             'time_bucket = if_not_exists(time_bucket, :bucket), '
+                             'size_bytes = if_not_exists(size_bytes, :size)',
+            ConditionExpression='attribute_exists(image_id)',
+            ExpressionAttributeValues={':created_at': created_at, ':size': size,
+                                       ':bucket': time_bucket(created_at, item['image_id'])}
+        )
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            return 'deleted'
+        raise Exception(f"Error updating metadata in DynamoDB: {str(e)}")
+    return 'updated'
+
+def backfill(table, s3, segments=8, workers=8, dry_run=False):
+    """
+    Backfills every row of images-metadata with a parallel scan; returns
+    {outcome: count}. Safe to rerun: rows that are already current are only read.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from bulk_scan import scan_items
+
+    counts = {}
+    request = {'ProjectionExpression': BACKFILL_PROJECTION}
+
+    def run(chunk):
+        for outcome in executor.map(lambda item: backfill_item(table, s3, item, dry_run), chunk):
+            counts[outcome] = counts.get(outcome, 0) + 1
+
+    # Executor.map submits its whole input up front, so feed it in chunks
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        chunk = []
+        for item in scan_items(table, segments, request=request):
+            chunk.append(item)
+            if len(chunk) >= BACKFILL_CHUNK_SIZE:
+                run(chunk)
+                chunk = []
+        run(chunk)
+    return counts
+
+def main(argv=None):
+    import argparse
+    import aws_clients
+
+    parser = argparse.ArgumentParser(description='Maintain the listing indexes of images-metadata.')
+    parser.add_argument('command', choices=['create-indexes', 'backfill'])
+    parser.add_argument('--segments', type=int, default=8, help='parallel scan segments of images-metadata')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent row updates')
+    parser.add_argument('--dry-run', action='store_true', help='count the rows backfill would update')
+    parser.add_argument('--endpoint-url', default=None, help='AWS endpoint, e.g. http://localhost:4566')
+    args = parser.parse_args(argv)
+
+    if args.endpoint_url:
+        os.environ['AWS_ENDPOINT_URL'] = args.endpoint_url
+    if args.command == 'create-indexes':
+        created = create_indexes(aws_clients.client('dynamodb'))
+        print(f"Creating {created}; rerun once it is ACTIVE" if created else "Both listing indexes exist")
+        return 0
+
+    counts = backfill(aws_clients.dynamodb().Table(DYNAMODB_TABLE_NAME), aws_clients.client('s3'),
+                      segments=args.segments, workers=args.workers, dry_run=args.dry_run)
+    print(' '.join(f'{outcome}={count}' for outcome, count in sorted(counts.items())))
+    return 0
+
+if __name__ == '__main__':
+    import sys
+
+    sys.exit(main())
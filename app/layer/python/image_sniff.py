@@ -0,0 +1,224 @@
+"""
+Image format and dimensions from file headers, without decoding pixels.
+
+Reads the magic bytes and the header that carries the size: the JPEG SOF
+segment, the PNG IHDR chunk, the GIF logical screen descriptor, the WebP
+VP8/VP8L/VP8X header and the HEIC ispe property of the primary item. Only
+the segments or boxes in front of the size are touched, so the cost does
+not depend on the image's byte size or pixel count.
+
+validate_image() applies the upload limits:
+
+    IMAGE_ALLOWED_FORMATS   comma-separated formats (default jpeg,png,gif,webp,heic)
+    MAX_UPLOAD_BYTES        largest file (default 50 MB)
+    IMAGE_MAX_DIMENSION     largest width or height (default 30000)
+    IMAGE_MAX_PIXELS        largest width x height (default 100 million)
+"""
+import os
+import struct
+
+FORMAT_CONTENT_TYPES = {'jpeg': 'image/jpeg', 'png': 'image/png', 'gif': 'image/gif', 'webp': 'image/webp',
+                        'heic': 'image/heic'}
+FORMAT_EXTENSIONS = {'jpeg': '.jpg', 'png': '.png', 'gif': '.gif', 'webp': '.webp', 'heic': '.heic'}
+
+ALLOWED_FORMATS = tuple(name.strip() for name in
+                        os.environ.get('IMAGE_ALLOWED_FORMATS', ','.join(FORMAT_EXTENSIONS)).split(',') if name.strip())
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 50 * 1024 * 1024))
+MAX_DIMENSION = int(os.environ.get('IMAGE_MAX_DIMENSION', 30000))
+MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', 100 * 1000 * 1000))
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Start-of-frame markers: every SOFn except DHT (C4), JPG (C8) and DAC (CC)
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# Markers without a length field: TEM and RST0-7
+JPEG_STANDALONE_MARKERS = frozenset([0x01] + list(range(0xD0, 0xD8)))
+# Real files have a few dozen segments before the frame header; bounds the
+# walk over crafted ones
+JPEG_MAX_SEGMENTS = 1024
+HEIC_BRANDS = frozenset([b'heic', b'heix', b'heim', b'heis', b'hevc', b'hevx'])
+
+def jpeg_size(data):
+    offset = 2
+    length = len(data)
+    for _ in range(JPEG_MAX_SEGMENTS):
+        if offset + 4 > length:
+            break
+        if data[offset] != 0xFF:
+            raise ValueError('corrupt JPEG segment')
+        marker = data[offset + 1]
+        if marker == 0xFF:  # fill byte
+            offset += 1
+            continue
+        offset += 2
+        if marker in JPEG_STANDALONE_MARKERS:
+            continue
+        if marker in (0xD9, 0xDA):  # end of image or start of scan before any frame header
+            break
+        if marker in JPEG_SOF_MARKERS:
+            if offset + 7 > length:
+                break
+            height, width = struct.unpack_from('>HH', data, offset + 3)
+            return width, height
+        segment_length = struct.unpack_from('>H', data, offset)[0]
+        if segment_length < 2:
+            raise ValueError('corrupt JPEG segment')
+        offset += segment_length
+    raise ValueError('JPEG frame header not found')
+
+def png_size(data):
+    if len(data) < 24 or data[12:16] != b'IHDR':
+        raise ValueError('truncated PNG header')
+    return struct.unpack_from('>II', data, 16)
+
+def gif_size(data):
+    if len(data) < 10:
+        raise ValueError('truncated GIF header')
+    return struct.unpack_from('<HH', data, 6)
+
+def webp_size(data):
+    chunk = data[12:16]
+    if chunk == b'VP8 ' and len(data) >= 30 and data[23:26] == b'\x9d\x01\x2a':
+        width, height = struct.unpack_from('<HH', data, 26)
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and len(data) >= 25 and data[20] == 0x2F:
+        bits = struct.unpack_from('<I', data, 21)[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X' and len(data) >= 30:
+        return int.from_bytes(data[24:27], 'little') + 1, int.from_bytes(data[27:30], 'little') + 1
+    raise ValueError('unsupported or truncated WebP header')
+
+# (type, payload start, box end) of the ISO BMFF boxes in data[start:end]
+def iter_boxes(data, start, end):
+    offset = start
+    while offset + 8 <= end:
+        size = struct.unpack_from('>I', data, offset)[0]
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                break
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            raise ValueError('corrupt HEIC box')
+        yield bytes(data[offset + 4:offset + 8]), offset + header, min(offset + size, end)
+        offset += size
+
+def heic_brands(data):
+    size = struct.unpack_from('>I', data, 0)[0]
+    brands = {bytes(data[8:12])}
+    for offset in range(16, min(size, len(data)) - 3, 4):
+        brands.add(bytes(data[offset:offset + 4]))
+    return brands
+
+# Size from the ispe property associated with the primary item (pitm/ipma),
+# or the largest ispe when the associations cannot be resolved
+def heic_size(data):
+    meta = next((box for box in iter_boxes(data, 0, len(data)) if box[0] == b'meta'), None)
+    if meta is None:
+        raise ValueError('HEIC meta box not found')
+    primary, properties, associations = None, [], {}
+    # meta is a full box: 4 bytes of version and flags before its children
+    for box_type, start, end in iter_boxes(data, meta[1] + 4, meta[2]):
+        if box_type == b'pitm':
+            primary = struct.unpack_from('>H' if data[start] == 0 else '>I', data, start + 4)[0]
+        elif box_type == b'iprp':
+            for child_type, child_start, child_end in iter_boxes(data, start, end):
+                if child_type == b'ipco':
+                    properties = list(iter_boxes(data, child_start, child_end))
+                elif child_type == b'ipma':
+                    associations = heic_associations(data, child_start, child_end)
+
+    for index in associations.get(primary, ()):
+        if 0 < index <= len(properties) and properties[index - 1][0] == b'ispe':
+            # ispe is a full box too: width and height follow version and flags
+            return struct.unpack_from('>II', data, properties[index - 1][1] + 4)
+    sizes = [struct.unpack_from('>II', data, start + 4) for box_type, start, end in properties
+             if box_type == b'ispe' and end - start >= 12]
+    if not sizes:
+        raise ValueError('HEIC image size not found')
+    return max(sizes, key=lambda size: size[0] * size[1])
+
+# {item_id: [1-based ipco property index, ...]} from an ipma box
+def heic_associations(data, start, end):
+    version, flags = data[start], int.from_bytes(data[start + 1:start + 4], 'big')
+    offset = start + 8
+    associations = {}
+    for _ in range(struct.unpack_from('>I', data, start + 4)[0]):
+        if offset + 3 > end:
+            break
+        if version < 1:
+            item_id = struct.unpack_from('>H', data, offset)[0]
+            offset += 2
+        else:
+            item_id = struct.unpack_from('>I', data, offset)[0]
+            offset += 4
+        count = data[offset]
+        offset += 1
+        indexes = []
+        for _ in range(count):
+            if flags & 1:
+                indexes.append(struct.unpack_from('>H', data, offset)[0] & 0x7FFF)
+                offset += 2
+            else:
+                indexes.append(data[offset] & 0x7F)
+                offset += 1
+        associations[item_id] = indexes
+    return associations
+
+def sniff_image(data):
+    """
+    Returns (format, width, height) of an image from its header bytes.
+    Raises ValueError for unrecognized or truncated headers.
+    """
+    try:
+        if data[:3] == b'\xff\xd8\xff':
+            return ('jpeg',) + tuple(jpeg_size(data))
+        if data[:8] == PNG_SIGNATURE:
+            return ('png',) + tuple(png_size(data))
+        if data[:6] in (b'GIF87a', b'GIF89a'):
+            return ('gif',) + tuple(gif_size(data))
+        if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+            return ('webp',) + tuple(webp_size(data))
+        if data[4:8] == b'ftyp' and heic_brands(data) & HEIC_BRANDS:
+            return ('heic',) + tuple(heic_size(data))
+    except (struct.error, IndexError):
+        raise ValueError('truncated image header')
+    raise ValueError('unrecognized image format')
+
+def validate_image(data, allowed_formats=None, max_bytes=None, max_dimension=None, max_pixels=None):
+    """
+    Sniffs an upload and checks it against the configured limits. Returns
+    {'format', 'width', 'height', 'size_bytes'}; raises ValueError with a
+    message for the client otherwise.
+    """
+    allowed_formats = ALLOWED_FORMATS if allowed_formats is None else allowed_formats
+    max_bytes = MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+    max_dimension = MAX_DIMENSION if max_dimension is None else max_dimension
+    max_pixels = MAX_PIXELS if max_pixels is None else max_pixels
+
+    size = len(data)
+    if size > max_bytes:
+        raise ValueError(f'file is {size} bytes, the limit is {max_bytes}')
+    image_format, width, height = sniff_image(data)
+    if image_format not in allowed_formats:
+        raise ValueError(f'{image_format} images are not accepted')
+    if not width or not height:
+        raise ValueError('image has no dimensions')
+    if max(width, height) > max_dimension or width * height > max_pixels:
+        raise ValueError(f'{width}x{height} exceeds the size limit')
+    return {'format': image_format, 'width': width, 'height': height, 'size_bytes': size}
+
+# Key of an original image: {image_id} plus its format's extension
+def original_key(image_id, image_format):
+    return f'{image_id}{FORMAT_EXTENSIONS.get(image_format, ".jpg")}'
+
+# image_id of an original's key at the bucket root, or None for other keys
+def image_id_for_original(key):
+    if '/' in key:
+        return None
+    stem, dot, extension = key.rpartition('.')
+    if not dot or not stem or f'.{extension}' not in FORMAT_EXTENSIONS.values():
+        return None
+    return stem
@@ -0,0 +1,137 @@
+"""
+Job queue for work that does not need to finish on the request path.
+
+Producers send JSON-serializable job bodies; workers receive batches and
+delete the jobs they finished. Unfinished jobs become visible again after
+the visibility timeout and are redelivered, so job handlers must be
+idempotent. Two implementations share this interface:
+
+    SqsQueue    Amazon SQS (UPLOAD_QUEUE_URL), consumed by a Lambda event
+                source mapping or by receive()/delete() polling
+    LocalQueue  in-process stand-in with the same semantics, used when no
+                queue URL is configured (tests, benchmarks, local runs)
+"""
+import os
+import json
+import time
+import uuid
+import threading
+from collections import deque
+from botocore.exceptions import ClientError
+
+UPLOAD_QUEUE_URL = os.environ.get('UPLOAD_QUEUE_URL')
+VISIBILITY_TIMEOUT_SECONDS = int(os.environ.get('JOB_VISIBILITY_TIMEOUT_SECONDS', 300))
+# SQS limits
+MAX_BATCH_SIZE = 10
+MAX_WAIT_SECONDS = 20
+
+class Job(object):
+    def __init__(self, job_id, body, receipt, receive_count=1):
+        self.job_id = job_id
+        self.body = body
+        self.receipt = receipt
+        self.receive_count = receive_count
+
+class SqsQueue(object):
+    def __init__(self, queue_url, sqs=None):
+        self.queue_url = queue_url
+        if sqs is None:
+            from aws_clients import lazy_client
+
+            sqs = lazy_client('sqs')
+        self.sqs = sqs
+
+    def send(self, body, deduplication_id=None):
+        request = {'QueueUrl': self.queue_url, 'MessageBody': json.dumps(body)}
+        # FIFO queues drop a repeated deduplication id within five minutes
+        if deduplication_id and self.queue_url.endswith('.fifo'):
+            request['MessageDeduplicationId'] = deduplication_id
+            request['MessageGroupId'] = deduplication_id
+        try:
+            return self.sqs.send_message(**request)['MessageId']
+        except ClientError as e:
+            raise Exception(f"Error enqueueing job: {str(e)}")
+
+    def receive(self, max_jobs=MAX_BATCH_SIZE, wait_seconds=0):
+        try:
+            response = self.sqs.receive_message(
+                QueueUrl=self.queue_url,
+                MaxNumberOfMessages=min(max_jobs, MAX_BATCH_SIZE),
+                WaitTimeSeconds=min(wait_seconds, MAX_WAIT_SECONDS),
+                AttributeNames=['ApproximateReceiveCount']
+            )
+        except ClientError as e:
+            raise Exception(f"Error receiving jobs: {str(e)}")
+        return [Job(message['MessageId'], json.loads(message['Body']), message['ReceiptHandle'],
+                    int(message.get('Attributes', {}).get('ApproximateReceiveCount', 1)))
+                for message in response.get('Messages', [])]
+
+    def delete(self, jobs):
+        for start in range(0, len(jobs), MAX_BATCH_SIZE):
+            entries = [{'Id': str(number), 'ReceiptHandle': job.receipt}
+                       for number, job in enumerate(jobs[start:start + MAX_BATCH_SIZE])]
+            try:
+                self.sqs.delete_message_batch(QueueUrl=self.queue_url, Entries=entries)
+            except ClientError as e:
+                raise Exception(f"Error deleting jobs: {str(e)}")
+
+class LocalQueue(object):
+    """
+    In-process queue with SQS delivery semantics: received jobs stay invisible
+    for visibility_timeout seconds and come back unless deleted.
+    """
+    def __init__(self, visibility_timeout=VISIBILITY_TIMEOUT_SECONDS, clock=time.monotonic):
+        self.visibility_timeout = visibility_timeout
+        self.clock = clock
+        self.ready = deque()
+        self.in_flight = {}  # receipt -> (visible_at, job_id, body, receive_count)
+        self.condition = threading.Condition()
+
+    def send(self, body, deduplication_id=None):
+        job_id = str(uuid.uuid4())
+        with self.condition:
+            self.ready.append((job_id, json.loads(json.dumps(body)), 0))
+            self.condition.notify()
+        return job_id
+
+    def requeue_expired(self):
+        now = self.clock()
+        for receipt, (visible_at, job_id, body, receive_count) in list(self.in_flight.items()):
+            if visible_at <= now:
+                del self.in_flight[receipt]
+                self.ready.append((job_id, body, receive_count))
+
+    def receive(self, max_jobs=MAX_BATCH_SIZE, wait_seconds=0):
+        deadline = time.monotonic() + wait_seconds
+        with self.condition:
+            self.requeue_expired()
+            while not self.ready and time.monotonic() < deadline:
+                self.condition.wait(deadline - time.monotonic())
+                self.requeue_expired()
+            jobs = []
+            while self.ready and len(jobs) < max_jobs:
+                job_id, body, receive_count = self.ready.popleft()
+                receipt = str(uuid.uuid4())
+                self.in_flight[receipt] = (self.clock() + self.visibility_timeout, job_id, body, receive_count + 1)
+                jobs.append(Job(job_id, body, receipt, receive_count + 1))
+            return jobs
+
+    def delete(self, jobs):
+        with self.condition:
+            for job in jobs:
+                self.in_flight.pop(job.receipt, None)
+
+    def __len__(self):
+        with self.condition:
+            return len(self.ready) + len(self.in_flight)
+
+_local_queue = None
+
+# The upload job queue: SQS when UPLOAD_QUEUE_URL is set, else the process's LocalQueue
+def upload_queue():
+    global _local_queue
+    if UPLOAD_QUEUE_URL:
+        return SqsQueue(UPLOAD_QUEUE_URL)
+    if _local_queue is None:
+        _local_queue = LocalQueue()
+    return _local_queue
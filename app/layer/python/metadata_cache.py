@@ -0,0 +1,259 @@
+"""
+Read-through cache for image metadata.
+
+Level one is a per-container LRU with a TTL and a bounded size. Level two is
+an optional shared store (Redis when METADATA_CACHE_REDIS_URL is set, or any
+object with the Store methods below; InMemoryStore stands in for it in
+tests). Missing and not-yet-active images are cached briefly as negative
+entries. delete_images writes a tombstone to the shared store so other
+containers stop serving the image; level-one entries elsewhere expire within
+METADATA_CACHE_TTL_SECONDS.
+
+Items are kept in the shared store as DynamoDB JSON, so Decimal and binary
+attributes round-trip exactly.
+"""
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+
+CACHE_TTL_SECONDS = float(os.environ.get('METADATA_CACHE_TTL_SECONDS', 60))
+CACHE_MAX_ENTRIES = int(os.environ.get('METADATA_CACHE_MAX_ENTRIES', 2048))
+NEGATIVE_TTL_SECONDS = float(os.environ.get('METADATA_CACHE_NEGATIVE_TTL_SECONDS', 5))
+SHARED_TTL_SECONDS = int(os.environ.get('METADATA_CACHE_SHARED_TTL_SECONDS', 300))
+REDIS_URL = os.environ.get('METADATA_CACHE_REDIS_URL')
+
+KEY_PREFIX = 'image-metadata:'
+NEGATIVE = 'null'  # shared-store value of a missing image or tombstone
+
+def cache_key(image_id):
+    return KEY_PREFIX + image_id
+
+# Only active images are cached for the full TTL; pending uploads turn
+# active on their own, so they get the negative TTL like a miss
+def is_cacheable(item):
+    return bool(item) and item.get('status', 'active') == 'active'
+
+def encode(item):
+    if item is None:
+        return NEGATIVE
+    from boto3.dynamodb.types import TypeSerializer
+
+    serializer = TypeSerializer()
+    return json.dumps({name: serializer.serialize(value) for name, value in item.items()})
+
+def decode(value):
+    if value == NEGATIVE:
+        return None
+    from boto3.dynamodb.types import TypeDeserializer
+
+    deserializer = TypeDeserializer()
+    return {name: deserializer.deserialize(attribute) for name, attribute in json.loads(value).items()}
+
+class InMemoryStore(object):
+    """
+    Shared-store interface, kept in process: get(key) -> str or None,
+    set(key, value, ttl, only_if_absent=False) -> bool, delete(key).
+    """
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= self.clock():
+                del self.values[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl, only_if_absent=False):
+        with self.lock:
+            entry = self.values.get(key)
+            if only_if_absent and entry is not None and entry[1] > self.clock():
+                return False
+            self.values[key] = (value, self.clock() + ttl)
+            return True
+
+    def delete(self, key):
+        with self.lock:
+            self.values.pop(key, None)
+
+class RedisStore(object):
+    """The shared-store interface on a redis-py client (ElastiCache)."""
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key):
+        value = self.client.get(key)
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def set(self, key, value, ttl, only_if_absent=False):
+        return bool(self.client.set(key, value, ex=max(1, int(ttl)), nx=only_if_absent))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+_shared_store = None
+
+# Shared store from the environment, or None when level two is not configured
+def shared_store():
+    global _shared_store
+    if _shared_store is None and REDIS_URL:
+        # redis-py is only packaged where METADATA_CACHE_REDIS_URL is set
+        import redis
+
+        _shared_store = RedisStore(redis.Redis.from_url(REDIS_URL, socket_timeout=0.2))
+    return _shared_store
+
+# Mark an image deleted in the shared store; overrides any cached copy
+def tombstone(store, image_id, ttl=SHARED_TTL_SECONDS):
+    if store is None:
+        return
+    try:
+        store.set(cache_key(image_id), NEGATIVE, ttl)
+    except Exception as e:
+        raise Exception(f"Error updating metadata cache: {str(e)}")
+
+# Drop an image from the shared store so the next read reloads it
+def invalidate(store, image_id):
+    if store is None:
+        return
+    try:
+        store.delete(cache_key(image_id))
+    except Exception as e:
+        raise Exception(f"Error updating metadata cache: {str(e)}")
+
+class MetadataCache(object):
+    """
+    get(image_id) returns the metadata item (or None) from level one, then
+    level two, then `loader(image_id)`, filling the levels it missed.
+    get_many(image_ids) does the same for a batch, loading all misses with
+    one `batch_loader(image_ids) -> {image_id: item}` call.
+    """
+    def __init__(self, loader, store=None, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS,
+                 negative_ttl=NEGATIVE_TTL_SECONDS, shared_ttl=SHARED_TTL_SECONDS, clock=time.monotonic,
+                 batch_loader=None):
+        self.loader = loader
+        self.batch_loader = batch_loader
+        self.store = store
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.shared_ttl = shared_ttl
+        self.clock = clock
+        self.entries = OrderedDict()  # image_id -> (expires_at, item or None)
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(['hits', 'negative_hits', 'shared_hits', 'misses', 'evictions',
+                                       'expirations', 'shared_errors'], 0)
+
+    def get(self, image_id):
+        found, item = self.get_local(image_id)
+        if not found:
+            found, item = self.get_shared(image_id)
+        if found:
+            return item
+
+        self.count('misses')
+        item = self.loader(image_id)
+        self.fill(image_id, item)
+        return item
+
+    def get_many(self, image_ids):
+        found = {}
+        missing = []
+        for image_id in dict.fromkeys(image_ids):
+            hit, item = self.get_local(image_id)
+            if not hit:
+                hit, item = self.get_shared(image_id)
+            if hit:
+                found[image_id] = item
+            else:
+                missing.append(image_id)
+
+        if missing:
+            with self.lock:
+                self.counters['misses'] += len(missing)
+            if self.batch_loader is not None:
+                loaded = self.batch_loader(missing)
+            else:
+                loaded = {image_id: self.loader(image_id) for image_id in missing}
+            for image_id in missing:
+                found[image_id] = loaded.get(image_id)
+                self.fill(image_id, found[image_id])
+        return found
+
+    # (found, item) from the shared store, filling level one on a hit
+    def get_shared(self, image_id):
+        if self.store is None:
+            return False, None
+        try:
+            value = self.store.get(cache_key(image_id))
+        except Exception:
+            self.count('shared_errors')  # the shared level is best effort
+            return False, None
+        if value is None:
+            return False, None
+        self.count('shared_hits')
+        item = decode(value)
+        self.put_local(image_id, item)
+        return True, item
+
+    # Cache a freshly loaded item at both levels
+    def fill(self, image_id, item):
+        self.put_local(image_id, item)
+        if self.store is not None:
+            try:
+                # Never overwrite a tombstone written by a concurrent delete
+                ttl = self.shared_ttl if is_cacheable(item) else self.negative_ttl
+                self.store.set(cache_key(image_id), encode(item), ttl, only_if_absent=True)
+            except Exception:
+                self.count('shared_errors')
+
+    def get_local(self, image_id):
+        with self.lock:
+            entry = self.entries.get(image_id)
+            if entry is None:
+                return False, None
+            expires_at, item = entry
+            if expires_at <= self.clock():
+                del self.entries[image_id]
+                self.counters['expirations'] += 1
+                return False, None
+            self.entries.move_to_end(image_id)
+            self.counters['hits' if is_cacheable(item) else 'negative_hits'] += 1
+            return True, item
+
+    def put_local(self, image_id, item):
+        ttl = self.ttl if is_cacheable(item) else self.negative_ttl
+        with self.lock:
+            self.entries[image_id] = (self.clock() + ttl, item)
+            self.entries.move_to_end(image_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    # Forget an image in this container and in the shared store
+    def invalidate(self, image_id, tombstone_entry=False):
+        with self.lock:
+            self.entries.pop(image_id, None)
+        if tombstone_entry:
+            tombstone(self.store, image_id, self.shared_ttl)
+        else:
+            invalidate(self.store, image_id)
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters, size=len(self.entries), max_entries=self.max_entries)
+        lookups = stats['hits'] + stats['negative_hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_ratio'] = round((lookups - stats['misses']) / lookups, 4) if lookups else None
+        return stats
@@ -0,0 +1,291 @@
+"""
+Per-request latency metrics in CloudWatch Embedded Metric Format.
+
+Handlers are wrapped with `instrument(name)`; each invocation prints one
+JSON line that CloudWatch Logs turns into metrics (namespace
+METRICS_NAMESPACE, default ImageService, dimension `handler`):
+
+    duration_ms       whole invocation
+    <phase>_ms        time inside `with phase('<phase>'):` blocks, e.g. parse,
+                      validate, presign, serialize. Every AWS call made
+                      through aws_clients is timed as a phase too, named after
+                      the operation: dynamo_get, dynamo_query, s3_put,
+                      s3_upload_part, sqs_send_message, ...
+    request_bytes     length of event['body']; response_bytes of the response body
+    aws_calls         AWS API calls; retries is botocore's RetryAttempts summed over them
+    cold_start        1 on the first invocation of the execution environment
+    errors            1 when the handler raised or returned a 5xx
+
+status_code and the request id are logged as properties. Phase times are
+summed across threads, so a phase run on a pool can exceed duration_ms.
+Work on threads other than the handler's (pools inside a handler) is
+attributed to the invocation in flight when there is only one, as in
+Lambda; with concurrent invocations in one process (load tests, the local
+gateway) only each handler's own thread is recorded.
+
+METRICS_MODE=off returns handlers unwrapped and makes phase() a shared
+no-op. To summarize captured logs (files or stdin; CloudWatch prefixes
+before the JSON are ignored):
+
+    python request_metrics.py summarize logs.txt [--by cold_start]
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import threading
+import functools
+
+METRICS_MODE = os.environ.get('METRICS_MODE', 'emf')
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'ImageService')
+
+SERVICE_PREFIXES = {'dynamodb': 'dynamo'}
+BYTE_METRICS = ('request_bytes', 'response_bytes')
+
+_local = threading.local()
+_active = []
+_cold_start = True
+
+class Recorder(object):
+    """Phase timings and counters of one invocation."""
+    def __init__(self, handler_name):
+        self.handler_name = handler_name
+        self.values = {}
+        self.properties = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, value):
+        with self._lock:
+            self.values[name] = self.values.get(name, 0) + value
+
+    def add_phase(self, name, seconds):
+        self.add(f'{name}_ms', seconds * 1000.0)
+
+class Phase(object):
+    __slots__ = ('recorder', 'name', 'started')
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.recorder.add_phase(self.name, time.perf_counter() - self.started)
+        return False
+
+class NullPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_PHASE = NullPhase()
+
+# Recorder of the invocation running on this thread, else of the only one in flight
+def current():
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is None:
+        # One snapshot: another thread may finish its invocation in between
+        active = _active[:]
+        recorder = active[0] if len(active) == 1 else None
+    return recorder
+
+# Time a block as `name` in the current invocation (no-op outside one)
+def phase(name):
+    recorder = current()
+    if recorder is None:
+        return NULL_PHASE
+    return Phase(recorder, name)
+
+# Add to a counter of the current invocation (no-op outside one)
+def record(name, value=1):
+    recorder = current()
+    if recorder is not None:
+        recorder.add(name, value)
+
+def body_length(message):
+    body = message.get('body') if isinstance(message, dict) else None
+    return len(body) if isinstance(body, (str, bytes)) else 0
+
+# 'GetItem' -> 'get', 'PutObject' -> 'put', 'UploadPart' -> 'upload_part'
+def operation_phase(service_name, operation_name):
+    operation = re.sub(r'(?<!^)(?=[A-Z])', '_', operation_name).lower()
+    operation = re.sub(r'_(item|object)$', '', operation)
+    return f'{SERVICE_PREFIXES.get(service_name, service_name)}_{operation}'
+
+def _before_call(context=None, **kwargs):
+    if context is not None and current() is not None:
+        context['metrics_started'] = time.perf_counter()
+
+def _after_call(model=None, parsed=None, context=None, **kwargs):
+    recorder = current()
+    if recorder is None or context is None or 'metrics_started' not in context:
+        return
+    seconds = time.perf_counter() - context.pop('metrics_started')
+    recorder.add_phase(operation_phase(model.service_model.service_name, model.name), seconds)
+    recorder.add('aws_calls', 1)
+    retries = ((parsed or {}).get('ResponseMetadata') or {}).get('RetryAttempts') or 0
+    if retries:
+        recorder.add('retries', retries)
+
+# Time every call of a botocore client (aws_clients does this for the clients it builds)
+def register_client(aws_client):
+    if METRICS_MODE == 'off':
+        return
+    events = aws_client.meta.events
+    events.register('before-call.*.*', _before_call, unique_id='request-metrics-before')
+    events.register('after-call.*.*', _after_call, unique_id='request-metrics-after')
+
+def metric_unit(name):
+    if name.endswith('_ms'):
+        return 'Milliseconds'
+    if name in BYTE_METRICS:
+        return 'Bytes'
+    return 'Count'
+
+_directives = {}
+
+# The CloudWatchMetrics directive for a set of metric names, serialized once
+def metrics_directive(names):
+    directive = _directives.get(names)
+    if directive is None:
+        directive = _directives[names] = json.dumps([{
+            'Namespace': NAMESPACE,
+            'Dimensions': [['handler']],
+            'Metrics': [{'Name': name, 'Unit': metric_unit(name)} for name in names]
+        }], separators=(',', ':'))
+    return directive
+
+def emf_line(recorder, timestamp_ms=None):
+    """One EMF log line: the directive, then handler, properties and values."""
+    values = {'handler': recorder.handler_name}
+    values.update(recorder.properties)
+    for name, value in recorder.values.items():
+        values[name] = round(value, 3) if isinstance(value, float) else value
+    timestamp_ms = int(time.time() * 1000) if timestamp_ms is None else timestamp_ms
+    return '{"_aws":{"Timestamp":%d,"CloudWatchMetrics":%s},%s' % (
+        timestamp_ms, metrics_directive(tuple(sorted(recorder.values))),
+        json.dumps(values, separators=(',', ':'), default=str)[1:])
+
+def emit(recorder):
+    # One write per line so concurrent output cannot interleave inside it
+    sys.stdout.write(emf_line(recorder) + '\n')
+    sys.stdout.flush()
+
+def instrument(handler_name):
+    """
+    Decorator for a Lambda handler: records the invocation and prints its
+    EMF line. Returns the handler itself when METRICS_MODE is off.
+    """
+    def decorate(handler):
+        if METRICS_MODE == 'off':
+            return handler
+
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            global _cold_start
+            recorder = Recorder(handler_name)
+            recorder.values['cold_start'] = 1 if _cold_start else 0
+            _cold_start = False
+            request_id = getattr(context, 'aws_request_id', None)
+            if request_id:
+                recorder.properties['request_id'] = request_id
+            recorder.values['request_bytes'] = body_length(event)
+            previous, _local.recorder = getattr(_local, 'recorder', None), recorder
+            _active.append(recorder)
+            started = time.perf_counter()
+            response = None
+            try:
+                response = handler(event, context)
+                return response
+            except BaseException:
+                recorder.add('errors', 1)
+                raise
+            finally:
+                recorder.values['duration_ms'] = (time.perf_counter() - started) * 1000.0
+                _local.recorder = previous
+                _active.remove(recorder)
+                if isinstance(response, dict):
+                    recorder.values['response_bytes'] = body_length(response)
+                    status_code = response.get('statusCode')
+                    if status_code is not None:
+                        recorder.properties['status_code'] = status_code
+                        if isinstance(status_code, int) and status_code >= 500:
+                            recorder.add('errors', 1)
+                try:
+                    emit(recorder)
+                except Exception:
+                    pass  # metrics never fail a request
+        return wrapper
+    return decorate
+
+def read_documents(lines):
+    for line in lines:
+        start = line.find('{')
+        if start < 0:
+            continue
+        try:
+            document = json.loads(line[start:])
+        except ValueError:
+            continue
+        if isinstance(document, dict) and '_aws' in document:
+            yield document
+
+# Nearest-rank percentile of a sorted list
+def percentile(ordered, pct):
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+def summarize(documents, by=None):
+    """
+    Groups EMF documents by handler (and the `by` property) and returns
+    {group: {metric: {'count', 'p50', 'p90', 'p99', 'max'}}}.
+    """
+    samples = {}
+    for document in documents:
+        group = document.get('handler', '-')
+        if by:
+            group = f"{group} {by}={document.get(by, '-')}"
+        for directive in document['_aws'].get('CloudWatchMetrics', []):
+            for metric in directive.get('Metrics', []):
+                value = document.get(metric['Name'])
+                if isinstance(value, (int, float)):
+                    samples.setdefault(group, {}).setdefault(metric['Name'], []).append(value)
+
+    summary = {}
+    for group, metrics in samples.items():
+        summary[group] = {}
+        for name, values in metrics.items():
+            values.sort()
+            summary[group][name] = {'count': len(values), 'p50': percentile(values, 50),
+                                    'p90': percentile(values, 90), 'p99': percentile(values, 99),
+                                    'max': values[-1]}
+    return summary
+
+def main(argv=None):
+    import argparse
+    import fileinput
+
+    parser = argparse.ArgumentParser(description='Summarize request metrics from captured Lambda logs.')
+    parser.add_argument('command', choices=['summarize'])
+    parser.add_argument('files', nargs='*', help='log files (default: stdin)')
+    parser.add_argument('--by', default=None, help='also group by this field, e.g. cold_start or status_code')
+    args = parser.parse_args(argv)
+
+    summary = summarize(read_documents(fileinput.input(args.files or ['-'])), by=args.by)
+    print(f"{'handler':<32} {'metric':<24} {'count':>7} {'p50':>10} {'p90':>10} {'p99':>10} {'max':>10}")
+    for group in sorted(summary):
+        for name in sorted(summary[group]):
+            stats = summary[group][name]
+            print(f"{group:<32} {name:<24} {stats['count']:>7} {stats['p50']:>10.2f} {stats['p90']:>10.2f} "
+                  f"{stats['p99']:>10.2f} {stats['max']:>10.2f}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
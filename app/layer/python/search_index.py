@@ -0,0 +1,181 @@
+"""
+Inverted token index over image titles and descriptions.
+
+Postings live in a separate DynamoDB table (partition key `term`, sort key
+`image_id`) so a search reads one partition per query term instead of
+scanning the whole metadata table. upload_image and delete_images keep the
+index current; `python search_index.py rebuild` repopulates it from
+images-metadata.
+"""
+import re
+from botocore.exceptions import ClientError
+
+DYNAMODB_TABLE_NAME = 'images-metadata'
+SEARCH_INDEX_TABLE_NAME = 'images-search-index'
+
+TITLE_WEIGHT = 3
+DESCRIPTION_WEIGHT = 1
+MIN_TERM_LENGTH = 2
+STOP_WORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is',
+    'it', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'with'
+])
+
+TOKEN_PATTERN = re.compile(r'[0-9a-z]+')
+
+# Split text into unique, lowercased search terms (in order of appearance)
+def tokenize(text):
+    if not text:
+        return []
+    terms = []
+    seen = set()
+    for term in TOKEN_PATTERN.findall(text.lower()):
+        if len(term) < MIN_TERM_LENGTH or term in STOP_WORDS or term in seen:
+            continue
+        seen.add(term)
+        terms.append(term)
+    return terms
+
+# Score of each term for one image; title matches outrank description matches
+def term_weights(title, description):
+    weights = {}
+    for term in tokenize(title):
+        weights[term] = weights.get(term, 0) + TITLE_WEIGHT
+    for term in tokenize(description):
+        weights[term] = weights.get(term, 0) + DESCRIPTION_WEIGHT
+    return weights
+
+# Write the postings for one image. Pass an open batch_writer as `batch`
+# to share it across many images (bulk rebuild).
+def index_image(table, image_id, title, description, batch=None):
+    weights = term_weights(title, description)
+    try:
+        if batch is not None:
+            for term, weight in weights.items():
+                batch.put_item(Item={'term': term, 'image_id': image_id, 'weight': weight})
+            return len(weights)
+        with table.batch_writer() as writer:
+            for term, weight in weights.items():
+                writer.put_item(Item={'term': term, 'image_id': image_id, 'weight': weight})
+        return len(weights)
+    except ClientError as e:
+        raise Exception(f"Error updating search index: {str(e)}")
+
+# Remove the postings written by index_image for the same title/description.
+# Pass an open batch_writer as `batch` to share it across many images.
+def remove_image(table, image_id, title, description, batch=None):
+    try:
+        if batch is not None:
+            for term in term_weights(title, description):
+                batch.delete_item(Key={'term': term, 'image_id': image_id})
+            return
+        with table.batch_writer() as writer:
+            for term in term_weights(title, description):
+                writer.delete_item(Key={'term': term, 'image_id': image_id})
+    except ClientError as e:
+        raise Exception(f"Error updating search index: {str(e)}")
+
+# Read the full posting list of one term as {image_id: weight}
+def get_postings(table, term):
+    postings = {}
+    request = {
+        'KeyConditionExpression': '#term = :term',
+        'ExpressionAttributeNames': {'#term': 'term'},
+        'ExpressionAttributeValues': {':term': term}
+    }
+    try:
+        while True:
+            response = table.query(**request)
+            for item in response.get('Items', []):
+                postings[item['image_id']] = int(item.get('weight', 1))
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key:
+                return postings
+            request['ExclusiveStartKey'] = last_key
+    except ClientError as e:
+        raise Exception(f"Error querying search index: {str(e)}")
+
+# Return [(image_id, score), ...] for images matching every query term,
+# best match first
+def search(table, query):
+    terms = tokenize(query)
+    if not terms:
+        return []
+
+    posting_lists = [get_postings(table, term) for term in terms]
+    posting_lists.sort(key=len)
+
+    # Intersect starting from the shortest posting list
+    matches = set(posting_lists[0])
+    for postings in posting_lists[1:]:
+        matches.intersection_update(postings)
+        if not matches:
+            return []
+
+    scored = [(image_id, sum(postings[image_id] for postings in posting_lists)) for image_id in matches]
+    scored.sort(key=lambda entry: (-entry[1], entry[0]))
+    return scored
+
+# Delete every posting in the index table
+def clear_index(index_table):
+    request = {'ProjectionExpression': '#term, image_id', 'ExpressionAttributeNames': {'#term': 'term'}}
+    deleted = 0
+    with index_table.batch_writer() as writer:
+        while True:
+            response = index_table.scan(**request)
+            for item in response.get('Items', []):
+                writer.delete_item(Key={'term': item['term'], 'image_id': item['image_id']})
+                deleted += 1
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key:
+                return deleted
+            request['ExclusiveStartKey'] = last_key
+
+# Repopulate the index from every item in the metadata table, reading it
+# with a parallel scan of `segments` segments
+def rebuild_index(metadata_table, index_table, segments=1):
+    from bulk_scan import scan_items
+
+    request = {
+        'ProjectionExpression': 'image_id, title, #description',
+        'ExpressionAttributeNames': {'#description': 'description'}
+    }
+    indexed = 0
+    try:
+        # Postings are written from this thread only; batch_writer is not thread safe
+        with index_table.batch_writer() as writer:
+            for item in scan_items(metadata_table, segments, request=request):
+                index_image(index_table, item['image_id'], item.get('title'), item.get('description'), batch=writer)
+                indexed += 1
+        return indexed
+    except ClientError as e:
+        raise Exception(f"Error rebuilding search index: {str(e)}")
+
+# CLI only; argparse stays out of the handlers' import path
+def main(argv=None):
+    import os
+    import argparse
+    import aws_clients
+
+    parser = argparse.ArgumentParser(description='Maintain the images search index.')
+    parser.add_argument('command', choices=['rebuild'])
+    parser.add_argument('--clear', action='store_true', help='delete all postings before rebuilding')
+    parser.add_argument('--segments', type=int, default=8, help='parallel scan segments of images-metadata')
+    parser.add_argument('--endpoint-url', default=None, help='DynamoDB endpoint, e.g. http://localhost:4566')
+    args = parser.parse_args(argv)
+
+    if args.endpoint_url:
+        os.environ['AWS_ENDPOINT_URL_DYNAMODB'] = args.endpoint_url
+    # Shared low-level client: unlike boto3 resources it is safe across the scan threads
+    dynamodb = aws_clients.dynamodb()
+    index_table = dynamodb.Table(SEARCH_INDEX_TABLE_NAME)
+    if args.clear:
+        print(f"Deleted {clear_index(index_table)} postings")
+    indexed = rebuild_index(dynamodb.Table(DYNAMODB_TABLE_NAME), index_table, segments=args.segments)
+    print(f"Indexed {indexed} images")
+    return 0
+
+if __name__ == '__main__':
+    import sys
+
+    sys.exit(main())
@@ -0,0 +1,352 @@
+"""
+Perceptual hashes and a Hamming-distance index for similar-image search.
+
+Every original gets a 64-bit difference hash (dHash) stored on its metadata
+row as `phash` (16 hex digits): the image is reduced to 9x8 grayscale and
+each bit says whether a pixel is brighter than its right-hand neighbour.
+Re-encoding, resizing and small edits flip few bits, so near-duplicates lie
+within a small Hamming distance of each other (0-5 for copies, up to about
+12 for visibly similar images).
+
+Searches run against a multi-index hash held per container: built from a parallel
+scan of images-metadata on first use and then kept current from the
+images-similarity-log table (partition key `stream`, sort key `change_id`),
+to which process_derivatives appends each new hash and delete_images each
+removal. A container reads the log at most every SIMILARITY_REFRESH_SECONDS
+(default 10) and rebuilds from a fresh scan after
+SIMILARITY_INDEX_MAX_AGE_SECONDS (default 6 hours); log rows expire after
+SIMILARITY_LOG_RETENTION_SECONDS (default 1 day, enable TTL on `expires_at`).
+
+    python similarity_index.py query --image-id ID [--distance 10]
+    python similarity_index.py backfill
+
+backfill hashes rows written before phash existed, which needs Pillow.
+"""
+import os
+import io
+import time
+import threading
+from botocore.exceptions import ClientError
+
+DYNAMODB_TABLE_NAME = 'images-metadata'
+SIMILARITY_LOG_TABLE_NAME = 'images-similarity-log'
+S3_BUCKET_NAME = 'image-bucket-madhu'
+
+HASH_WIDTH = 9  # 8 comparisons per row
+HASH_HEIGHT = 8
+HASH_HEX_DIGITS = 16
+DEFAULT_DISTANCE = 10
+MAX_DISTANCE = 16  # beyond this the chunk lookups cost as much as a linear scan
+
+LOG_STREAM = 'changes'
+LOG_RETENTION_SECONDS = int(os.environ.get('SIMILARITY_LOG_RETENTION_SECONDS', 24 * 3600))
+REFRESH_SECONDS = float(os.environ.get('SIMILARITY_REFRESH_SECONDS', 10))
+INDEX_MAX_AGE_SECONDS = float(os.environ.get('SIMILARITY_INDEX_MAX_AGE_SECONDS', 6 * 3600))
+SCAN_SEGMENTS = int(os.environ.get('SIMILARITY_SCAN_SEGMENTS', 4))
+# Log reads start this far before the last sync, so changes written with a
+# slightly lagging clock are not missed; replaying a change is harmless
+CLOCK_SKEW_MS = 5000
+
+def now_ms():
+    return int(time.time() * 1000)
+
+def image_hash(image):
+    """
+    dHash of a decoded PIL image as an int. Callers that already hold the
+    decoded original (process_derivatives) pass it here to avoid a second decode.
+    """
+    from PIL import Image
+
+    pixels = image.convert('L').resize((HASH_WIDTH, HASH_HEIGHT), Image.BILINEAR).tobytes()
+    value = 0
+    for row in range(HASH_HEIGHT):
+        for column in range(HASH_WIDTH - 1):
+            offset = row * HASH_WIDTH + column
+            value = (value << 1) | (pixels[offset] > pixels[offset + 1])
+    return value
+
+# dHash of encoded image bytes; raises ValueError when they do not decode
+def dhash(data):
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        raise Exception('Pillow is required to hash images')
+    try:
+        image = Image.open(io.BytesIO(data))
+        # JPEGs decode at up to 1/8 scale; the hash only needs 9x8 pixels
+        image.draft('L', (HASH_WIDTH * 8, HASH_HEIGHT * 8))
+        return image_hash(ImageOps.exif_transpose(image))
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise ValueError(f'cannot decode image: {str(e)}')
+
+def hash_hex(value):
+    return format(value, '016x')
+
+# int from 16 hex digits (the stored form); raises ValueError otherwise
+def parse_hash(text):
+    if not isinstance(text, str) or len(text) != HASH_HEX_DIGITS:
+        raise ValueError(f'hash must be {HASH_HEX_DIGITS} hex digits')
+    try:
+        return int(text, 16)
+    except ValueError:
+        raise ValueError(f'hash must be {HASH_HEX_DIGITS} hex digits')
+
+# Set bits of an int; int.bit_count is Python 3.10+
+try:
+    popcount = int.bit_count
+except AttributeError:
+    def popcount(value):
+        return bin(value).count('1')
+
+def hamming(a, b):
+    return popcount(a ^ b)
+
+class MultiIndexHash(object):
+    """
+    Multi-index hashing over 64-bit hashes. Each hash is split into
+    CHUNKS 16-bit chunks, and each chunk position has a table from chunk
+    value to image_ids. If two hashes differ in at most r bits, one of
+    their chunks differs in at most r // CHUNKS bits (pigeonhole), so a
+    search looks up every chunk value that close to the query's chunks and
+    checks the full distance of the candidates only. A BK-tree visits most
+    of its nodes at the distances near-duplicate search needs (about 10 of
+    64 bits) and ends up slower than a linear scan; see bench_similarity.py.
+    """
+    CHUNKS = 4
+    CHUNK_BITS = 16
+
+    def __init__(self):
+        self.tables = [{} for _ in range(self.CHUNKS)]
+        self.hashes = {}  # image_id -> hash
+        self.masks = {}  # chunk radius -> masks with at most that many bits set
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def chunks(self, value):
+        mask = (1 << self.CHUNK_BITS) - 1
+        return [(value >> (self.CHUNK_BITS * position)) & mask for position in range(self.CHUNKS)]
+
+    def flip_masks(self, radius):
+        masks = self.masks.get(radius)
+        if masks is None:
+            masks = [0]
+            for _ in range(radius):
+                masks = list(set(masks) | {mask | (1 << bit) for mask in masks for bit in range(self.CHUNK_BITS)})
+            self.masks[radius] = masks
+        return masks
+
+    def add(self, image_id, value):
+        previous = self.hashes.get(image_id)
+        if previous == value:
+            return
+        if previous is not None:
+            self.remove(image_id)
+        self.hashes[image_id] = value
+        for table, chunk in zip(self.tables, self.chunks(value)):
+            table.setdefault(chunk, set()).add(image_id)
+
+    def remove(self, image_id):
+        value = self.hashes.pop(image_id, None)
+        if value is None:
+            return False
+        for table, chunk in zip(self.tables, self.chunks(value)):
+            bucket = table[chunk]
+            bucket.discard(image_id)
+            if not bucket:
+                del table[chunk]
+        return True
+
+    # [(distance, image_id), ...] within max_distance of value, nearest first
+    def search(self, value, max_distance):
+        masks = self.flip_masks(max_distance // self.CHUNKS)
+        candidates = set()
+        for table, chunk in zip(self.tables, self.chunks(value)):
+            for mask in masks:
+                bucket = table.get(chunk ^ mask)
+                if bucket:
+                    candidates.update(bucket)
+        hashes = self.hashes
+        matches = []
+        for image_id in candidates:
+            distance = popcount(hashes[image_id] ^ value)
+            if distance <= max_distance:
+                matches.append((distance, image_id))
+        matches.sort()
+        return matches
+
+# Append a change to the log: a new hash, or a removal when phash is None
+def record_change(log_table, image_id, phash=None, batch=None):
+    changed_at = now_ms()
+    item = {
+        'stream': LOG_STREAM,
+        'change_id': f'{changed_at:013d}#{image_id}',
+        'image_id': image_id,
+        'expires_at': changed_at // 1000 + LOG_RETENTION_SECONDS
+    }
+    if phash is not None:
+        item['phash'] = phash
+    if batch is not None:
+        batch.put_item(Item=item)
+        return
+    try:
+        log_table.put_item(Item=item)
+    except ClientError as e:
+        raise Exception(f"Error writing similarity log to DynamoDB: {str(e)}")
+
+# Log rows written after `since_ms`, oldest first
+def changes_since(log_table, since_ms):
+    request = {
+        'KeyConditionExpression': '#stream = :stream and change_id > :since',
+        'ExpressionAttributeNames': {'#stream': 'stream'},
+        'ExpressionAttributeValues': {':stream': LOG_STREAM, ':since': f'{max(since_ms, 0):013d}'}
+    }
+    changes = []
+    try:
+        while True:
+            response = log_table.query(**request)
+            changes.extend(response.get('Items', []))
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key:
+                return changes
+            request['ExclusiveStartKey'] = last_key
+    except ClientError as e:
+        raise Exception(f"Error reading similarity log from DynamoDB: {str(e)}")
+
+class SimilarityIndex(object):
+    """A MultiIndexHash plus the time it was built and last synced with the log."""
+    def __init__(self, metadata_table, log_table, segments=SCAN_SEGMENTS):
+        self.metadata_table = metadata_table
+        self.log_table = log_table
+        self.segments = segments
+        self.hashes = MultiIndexHash()
+        self.built_at = self.synced_at = 0
+        self.refreshed = 0.0
+
+    def build(self):
+        from bulk_scan import scan_items
+
+        started = now_ms()
+        hashes = MultiIndexHash()
+        request = {'ProjectionExpression': 'image_id, phash', 'FilterExpression': 'attribute_exists(phash)'}
+        for item in scan_items(self.metadata_table, self.segments, request=request):
+            hashes.add(item['image_id'], parse_hash(item['phash']))
+        self.hashes = hashes
+        self.built_at = started
+        self.synced_at = started - CLOCK_SKEW_MS
+        self.refreshed = time.monotonic()
+
+    # Apply log rows in order; returns how many there were
+    def apply(self, changes):
+        for change in changes:
+            if change.get('phash'):
+                self.hashes.add(change['image_id'], parse_hash(change['phash']))
+            else:
+                self.hashes.remove(change['image_id'])
+        return len(changes)
+
+    def refresh(self):
+        started = now_ms()
+        self.apply(changes_since(self.log_table, self.synced_at))
+        self.synced_at = started - CLOCK_SKEW_MS
+        self.refreshed = time.monotonic()
+
+    # Build on first use and when too old for the log; else read the log
+    # when the last read is more than REFRESH_SECONDS old
+    def ensure_current(self):
+        if not self.built_at or now_ms() - self.built_at > INDEX_MAX_AGE_SECONDS * 1000:
+            self.build()
+        elif time.monotonic() - self.refreshed >= REFRESH_SECONDS:
+            self.refresh()
+
+    def search(self, value, max_distance):
+        return self.hashes.search(value, max_distance)
+
+_index = None
+_index_lock = threading.Lock()
+
+# The container's index, built or refreshed as needed
+def cached_index(metadata_table, log_table):
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SimilarityIndex(metadata_table, log_table)
+        try:
+            _index.ensure_current()
+        except ClientError as e:
+            raise Exception(f"Error loading similarity index: {str(e)}")
+        return _index
+
+def reset_cache():
+    global _index
+    with _index_lock:
+        _index = None
+
+# Hash rows that have no phash yet; returns {outcome: count}
+def backfill(metadata_table, log_table, s3, segments=8):
+    from bulk_scan import scan_items
+
+    counts = {}
+    request = {'ProjectionExpression': 'image_id, s3_key', 'FilterExpression': 'attribute_not_exists(phash)'}
+    for item in scan_items(metadata_table, segments, request=request):
+        try:
+            data = s3.get_object(Bucket=S3_BUCKET_NAME, Key=item.get('s3_key') or f"{item['image_id']}.jpg")
+            phash = hash_hex(dhash(data['Body'].read()))
+            metadata_table.update_item(
+                Key={'image_id': item['image_id']},
+                UpdateExpression='SET phash = :phash',
+                ConditionExpression='attribute_exists(image_id)',
+                ExpressionAttributeValues={':phash': phash}
+            )
+            record_change(log_table, item['image_id'], phash)
+            outcome = 'hashed'
+        except ValueError:
+            outcome = 'undecodable'
+        except ClientError as e:
+            outcome = {'ConditionalCheckFailedException': 'deleted', 'NoSuchKey': 'missing_object'}.get(
+                e.response.get('Error', {}).get('Code'), 'error')
+        counts[outcome] = counts.get(outcome, 0) + 1
+    return counts
+
+def main(argv=None):
+    import argparse
+    import aws_clients
+
+    parser = argparse.ArgumentParser(description='Query and maintain the perceptual hashes of images-metadata.')
+    parser.add_argument('command', choices=['query', 'backfill'])
+    parser.add_argument('--image-id', default=None, help='query: find images similar to this one')
+    parser.add_argument('--hash', default=None, help='query: find images near this hash (16 hex digits)')
+    parser.add_argument('--distance', type=int, default=DEFAULT_DISTANCE, help='query: largest Hamming distance')
+    parser.add_argument('--segments', type=int, default=8, help='parallel scan segments of images-metadata')
+    parser.add_argument('--endpoint-url', default=None, help='AWS endpoint, e.g. http://localhost:4566')
+    args = parser.parse_args(argv)
+
+    if args.endpoint_url:
+        os.environ['AWS_ENDPOINT_URL'] = args.endpoint_url
+    dynamodb = aws_clients.dynamodb()
+    metadata_table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+    log_table = dynamodb.Table(SIMILARITY_LOG_TABLE_NAME)
+    if args.command == 'backfill':
+        counts = backfill(metadata_table, log_table, aws_clients.client('s3'), segments=args.segments)
+        print(' '.join(f'{outcome}={count}' for outcome, count in sorted(counts.items())))
+        return 0
+
+    if args.hash:
+        value = parse_hash(args.hash)
+    elif args.image_id:
+        item = metadata_table.get_item(Key={'image_id': args.image_id}).get('Item') or {}
+        if not item.get('phash'):
+            parser.error(f'{args.image_id} has no phash')
+        value = parse_hash(item['phash'])
+    else:
+        parser.error('query needs --image-id or --hash')
+    index = SimilarityIndex(metadata_table, log_table, segments=args.segments)
+    index.build()
+    for distance, image_id in index.search(value, args.distance):
+        print(f'{distance:>3} {image_id}')
+    return 0
+
+if __name__ == '__main__':
+    import sys
+
+    sys.exit(main())
@@ -0,0 +1,70 @@
+import os
+import unittest
+from unittest.mock import patch, MagicMock
+import aws_clients
+
+
+class TestAwsClients(unittest.TestCase):
+
+    def setUp(self):
+        aws_clients.reset()
+
+    def tearDown(self):
+        aws_clients.reset()
+
+    @patch('boto3.client')
+    def test_client_is_created_once_with_shared_config(self, mock_client):
+        first = aws_clients.client('s3')
+        second = aws_clients.client('s3')
+        self.assertIs(first, second)
+        mock_client.assert_called_once()
+        config = mock_client.call_args[1]['config']
+        self.assertEqual(config.max_pool_connections, aws_clients.MAX_POOL_CONNECTIONS)
+        self.assertEqual(config.retries['mode'], aws_clients.RETRY_MODE)
+        self.assertEqual(config.tcp_keepalive, aws_clients.TCP_KEEPALIVE)
+
+    @patch.dict(os.environ, {'AWS_ENDPOINT_URL': 'http://localhost:4566',
+                             'AWS_ENDPOINT_URL_S3': 'http://localhost:9000'})
+    def test_endpoint_override(self):
+        self.assertEqual(aws_clients.endpoint_url('s3'), 'http://localhost:9000')
+        self.assertEqual(aws_clients.endpoint_url('dynamodb'), 'http://localhost:4566')
+
+    @patch('aws_clients.client')
+    def test_lazy_client_creates_on_first_use(self, mock_client):
+        s3 = aws_clients.lazy_client('s3', region_name='ap-south-1')
+        mock_client.assert_not_called()
+        s3.put_object(Bucket='b', Key='k')
+        mock_client.assert_called_once_with('s3', region_name='ap-south-1')
+        mock_client.return_value.put_object.assert_called_once_with(Bucket='b', Key='k')
+
+    def test_table_binds_table_name(self):
+        dynamodb_client = MagicMock()
+        table = aws_clients.Table('images-metadata', dynamodb_client)
+        table.get_item(Key={'image_id': '123'})
+        dynamodb_client.get_item.assert_called_once_with(TableName='images-metadata', Key={'image_id': '123'})
+        writer = table.batch_writer()
+        self.assertEqual(writer._table_name, 'images-metadata')
+
+    @patch('boto3.client')
+    def test_dynamodb_installs_serialization_hooks(self, mock_client):
+        aws_clients.dynamodb()
+        events = [call[0][0] for call in mock_client.return_value.meta.events.register.call_args_list]
+        self.assertIn('before-parameter-build.dynamodb', events)
+        self.assertIn('after-call.dynamodb', events)
+
+    def test_native_number_deserializer(self):
+        deserializer = aws_clients.native_number_deserializer()
+        item = deserializer.deserialize({'M': {'size': {'N': '128'}, 'ratio': {'N': '1.5'}, 'tags': {'NS': ['7']}}})
+        self.assertEqual(item, {'size': 128, 'ratio': 1.5, 'tags': {7}})
+        self.assertIs(type(item['size']), int)
+
+    @patch('aws_clients.dynamodb')
+    @patch('aws_clients.client')
+    def test_prewarm(self, mock_client, mock_dynamodb):
+        aws_clients.prewarm(['dynamodb', 's3'])
+        mock_dynamodb.assert_called_once_with()
+        mock_client.assert_called_once_with('s3')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+from unittest.mock import MagicMock
+from botocore.exceptions import ClientError
+from blob_store import blob_key, acquire_blob, mark_blob_uploaded, release_blob
+
+
+def conditional_check_failed():
+    return ClientError({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'failed'}}, 'UpdateItem')
+
+
+class TestBlobStore(unittest.TestCase):
+
+    def test_first_reference_needs_upload(self):
+        table = MagicMock()
+        table.update_item.return_value = {}
+        self.assertTrue(acquire_blob(table, 'abc', 10))
+        kwargs = table.update_item.call_args[1]
+        self.assertEqual(kwargs['Key'], {'content_sha256': 'abc'})
+        self.assertEqual(kwargs['ExpressionAttributeValues'][':key'], blob_key('abc'))
+
+    def test_uploaded_blob_is_reused(self):
+        table = MagicMock()
+        table.update_item.return_value = {'Attributes': {'ref_count': 2, 'uploaded': True}}
+        self.assertFalse(acquire_blob(table, 'abc', 10))
+
+    def test_mark_blob_uploaded(self):
+        table = MagicMock()
+        mark_blob_uploaded(table, 'abc')
+        self.assertEqual(table.update_item.call_args[1]['UpdateExpression'], 'SET uploaded = :true')
+
+    def test_release_keeps_shared_blob(self):
+        table = MagicMock()
+        table.update_item.return_value = {'Attributes': {'ref_count': 1}}
+        self.assertFalse(release_blob(table, 'abc'))
+        table.delete_item.assert_not_called()
+
+    def test_release_last_reference_deletes_row(self):
+        table = MagicMock()
+        table.update_item.return_value = {'Attributes': {'ref_count': 0}}
+        self.assertTrue(release_blob(table, 'abc'))
+        self.assertEqual(table.delete_item.call_args[1]['ConditionExpression'], 'ref_count <= :zero')
+
+    def test_release_loses_race_with_new_upload(self):
+        table = MagicMock()
+        table.update_item.return_value = {'Attributes': {'ref_count': 0}}
+        table.delete_item.side_effect = conditional_check_failed()
+        self.assertFalse(release_blob(table, 'abc'))
+
+    def test_release_missing_blob(self):
+        table = MagicMock()
+        table.update_item.side_effect = conditional_check_failed()
+        self.assertFalse(release_blob(table, 'abc'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import io
+import os
+import json
+import tempfile
+import unittest
+from decimal import Decimal
+from botocore.exceptions import ClientError
+from bulk_scan import Checkpoint, ColumnarWriter, NdjsonWriter, export_table, scan_items, scan_pages
+
+
+class SegmentedTable(object):
+    """Serves Segment/TotalSegments scans over a list, page_size items per page."""
+    def __init__(self, count, page_size=3):
+        self.items = [{'image_id': f'img-{number:03d}', 'size': Decimal(number)} for number in range(count)]
+        self.page_size = page_size
+        self.requests = []
+
+    def scan(self, **kwargs):
+        self.requests.append(kwargs)
+        segment = [item for number, item in enumerate(self.items) if number % kwargs['TotalSegments'] == kwargs['Segment']]
+        start = 0
+        if 'ExclusiveStartKey' in kwargs:
+            start = [item['image_id'] for item in segment].index(kwargs['ExclusiveStartKey']['image_id']) + 1
+        page = segment[start:start + self.page_size]
+        response = {'Items': page}
+        if start + self.page_size < len(segment):
+            response['LastEvaluatedKey'] = {'image_id': page[-1]['image_id']}
+        return response
+
+
+class TestBulkScan(unittest.TestCase):
+
+    def test_reads_every_item_once(self):
+        table = SegmentedTable(50)
+        items = list(scan_items(table, 4, request={'ProjectionExpression': 'image_id'}, workers=2))
+        self.assertEqual(sorted(item['image_id'] for item in items), [item['image_id'] for item in table.items])
+        self.assertEqual({request['Segment'] for request in table.requests}, {0, 1, 2, 3})
+        self.assertTrue(all(request['ProjectionExpression'] == 'image_id' for request in table.requests))
+
+    def test_resumes_from_checkpoint(self):
+        table = SegmentedTable(40)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.ckpt')
+            checkpoint = Checkpoint(path, 4)
+            first = io.StringIO()
+            pages = scan_pages(table, 4, checkpoint=checkpoint, max_pending_pages=1)
+            for _ in range(5):
+                segment, items, last_key = next(pages)
+                NdjsonWriter(first).write(items)
+                checkpoint.advance(segment, last_key)
+            pages.close()  # the job dies
+
+            second = io.StringIO()
+            exported = export_table(table, NdjsonWriter(second), 4, checkpoint=Checkpoint(path, 4))
+            self.assertTrue(Checkpoint(path, 4).complete)
+
+        lines = (first.getvalue() + second.getvalue()).splitlines()
+        self.assertEqual(len(first.getvalue().splitlines()) + exported, 40)
+        self.assertEqual(sorted(json.loads(line)['image_id'] for line in lines),
+                         [item['image_id'] for item in table.items])
+
+    def test_checkpoint_rejects_other_segment_count(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.ckpt')
+            Checkpoint(path, 4).advance(0, {'image_id': 'img-004', 'size': Decimal('1.5')})
+            self.assertEqual(Checkpoint(path, 4).start_key(0), {'image_id': 'img-004', 'size': Decimal('1.5')})
+            with self.assertRaises(ValueError):
+                Checkpoint(path, 8)
+
+    def test_scan_errors_reach_the_consumer(self):
+        table = SegmentedTable(10)
+        table.scan = lambda **kwargs: (_ for _ in ()).throw(
+            ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException', 'Message': 'slow down'}}, 'Scan'))
+        with self.assertRaises(Exception) as raised:
+            list(scan_items(table, 2))
+        self.assertIn('Error scanning DynamoDB', str(raised.exception))
+
+    def test_columnar_writer_batches_columns(self):
+        stream = io.StringIO()
+        writer = ColumnarWriter(stream, batch_size=2)
+        writer.write([{'image_id': 'a', 'size': Decimal(1)}, {'image_id': 'b', 'title': 'Sunset'},
+                      {'image_id': 'c', 'size': Decimal('1.5')}])
+        writer.flush()
+        batches = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(batches[0], {'count': 2, 'columns': {'image_id': ['a', 'b'], 'size': [1, None],
+                                                              'title': [None, 'Sunset']}})
+        self.assertEqual(batches[1], {'count': 1, 'columns': {'image_id': ['c'], 'size': [1.5]}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+from botocore.exceptions import ClientError
+from catalog_index import (time_bucket, shard_of, previous_month, listing_attributes, request_owner, backfill_item,
+                           create_indexes)
+
+CREATED_AT = 1760000000000  # 2025-10-09
+
+
+def client_error(code):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, 'Operation')
+
+
+class TestListingAttributes(unittest.TestCase):
+
+    def test_time_bucket_is_month_and_stable_shard(self):
+        bucket = time_bucket(CREATED_AT, 'abc')
+        self.assertEqual(bucket, f'2025-10#{shard_of("abc")}')
+        self.assertEqual(bucket, time_bucket(CREATED_AT + 1000, 'abc'))
+        self.assertEqual({shard_of(f'img-{number}') for number in range(100)}, {0, 1, 2, 3})
+        self.assertEqual(previous_month('2025-01'), '2024-12')
+        self.assertEqual(previous_month('2025-10'), '2025-09')
+
+    def test_listing_attributes(self):
+        self.assertEqual(listing_attributes('abc', 'user-1', CREATED_AT),
+                         {'created_at': CREATED_AT, 'time_bucket': time_bucket(CREATED_AT, 'abc'),
+                          'owner_id': 'user-1'})
+        self.assertNotIn('owner_id', listing_attributes('abc'))
+
+    def test_request_owner(self):
+        self.assertEqual(request_owner({'requestContext': {'authorizer': {'claims': {'sub': 'u1'}}}}), 'u1')
+        self.assertEqual(request_owner({'requestContext': {'authorizer': {'jwt': {'claims': {'sub': 'u2'}}}}}), 'u2')
+        self.assertEqual(request_owner({'requestContext': {'authorizer': {'principalId': 'u3'}}}), 'u3')
+        self.assertIsNone(request_owner({}))
+        self.assertIsNone(request_owner({'requestContext': {'authorizer': None}}))
+
+
+class TestBackfill(unittest.TestCase):
+
+    def setUp(self):
+        self.table = MagicMock()
+        self.s3 = MagicMock()
+        self.s3.head_object.return_value = {
+            'LastModified': datetime.fromtimestamp(CREATED_AT / 1000, tz=timezone.utc), 'ContentLength': 2048}
+
+    def test_updates_from_object(self):
+        self.assertEqual(backfill_item(self.table, self.s3, {'image_id': 'abc', 's3_key': 'abc.png'}), 'updated')
+        self.s3.head_object.assert_called_once_with(Bucket='image-bucket-madhu', Key='abc.png')
+        values = self.table.update_item.call_args[1]['ExpressionAttributeValues']
+        self.assertEqual(values, {':created_at': CREATED_AT, ':size': 2048,
+                                  ':bucket': time_bucket(CREATED_AT, 'abc')})
+
+    def test_keeps_known_values(self):
+        item = {'image_id': 'abc', 'created_at': 5, 'size_bytes': 10}
+        self.assertEqual(backfill_item(self.table, self.s3, item), 'updated')
+        self.s3.head_object.assert_not_called()
+        self.assertEqual(self.table.update_item.call_args[1]['ExpressionAttributeValues'][':created_at'], 5)
+
+        item['time_bucket'] = time_bucket(5, 'abc')
+        self.assertEqual(backfill_item(self.table, self.s3, item), 'current')
+
+    def test_missing_object_dry_run_and_deleted_row(self):
+        self.s3.head_object.side_effect = client_error('404')
+        self.assertEqual(backfill_item(self.table, self.s3, {'image_id': 'abc'}), 'missing_object')
+        self.s3.head_object.assert_called_once_with(Bucket='image-bucket-madhu', Key='abc.jpg')
+
+        self.s3.head_object.side_effect = None
+        self.assertEqual(backfill_item(self.table, self.s3, {'image_id': 'abc'}, dry_run=True), 'updated')
+        self.table.update_item.assert_not_called()
+
+        self.table.update_item.side_effect = client_error('ConditionalCheckFailedException')
+        self.assertEqual(backfill_item(self.table, self.s3, {'image_id': 'abc'}), 'deleted')
+
+
+class TestCreateIndexes(unittest.TestCase):
+
+    def test_adds_first_missing_index(self):
+        client = MagicMock()
+        client.describe_table.return_value = {'Table': {
+            'BillingModeSummary': {'BillingMode': 'PAY_PER_REQUEST'},
+            'GlobalSecondaryIndexes': [{'IndexName': 'owner-created-index'}]}}
+        self.assertEqual(create_indexes(client), 'recent-created-index')
+        kwargs = client.update_table.call_args[1]
+        create = kwargs['GlobalSecondaryIndexUpdates'][0]['Create']
+        self.assertEqual([key['AttributeName'] for key in create['KeySchema']], ['time_bucket', 'created_at'])
+        self.assertNotIn('ProvisionedThroughput', create)
+        self.assertEqual(kwargs['AttributeDefinitions'][1], {'AttributeName': 'created_at', 'AttributeType': 'N'})
+
+        client.describe_table.return_value['Table']['GlobalSecondaryIndexes'].append(
+            {'IndexName': 'recent-created-index'})
+        client.update_table.reset_mock()
+        self.assertIsNone(create_indexes(client))
+        client.update_table.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
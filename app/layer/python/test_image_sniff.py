@@ -0,0 +1,88 @@
+import io
+import struct
+import unittest
+from image_sniff import sniff_image, validate_image, original_key, image_id_for_original
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def box(box_type, payload):
+    return struct.pack('>I', 8 + len(payload)) + box_type + payload
+
+
+def full_box(box_type, payload, version=0, flags=0):
+    return box(box_type, bytes([version]) + flags.to_bytes(3, 'big') + payload)
+
+
+def heic(primary=2):
+    """A HEIC header with a 64x64 tile and a 4032x3024 item, as phones write them."""
+    ispe = lambda width, height: full_box(b'ispe', struct.pack('>II', width, height))
+    ipco = box(b'ipco', ispe(64, 64) + ispe(4032, 3024))
+    ipma = full_box(b'ipma', struct.pack('>I', 2) + struct.pack('>HB', 1, 1) + bytes([0x81])
+                    + struct.pack('>HB', 2, 1) + bytes([0x82]))
+    meta = full_box(b'meta', full_box(b'pitm', struct.pack('>H', primary)) + box(b'iprp', ipco + ipma))
+    return box(b'ftyp', b'heic' + b'\x00\x00\x00\x00' + b'mif1heic') + meta + box(b'mdat', b'\x00' * 32)
+
+
+def jpeg(width, height):
+    app1 = b'\xff\xe1' + struct.pack('>H', 2 + 1000) + b'\x00' * 1000
+    sof = b'\xff\xc2' + struct.pack('>HBHHB', 8, 8, height, width, 3)
+    return b'\xff\xd8' + app1 + b'\xff\xff' + sof + b'\xff\xda\x00\x02' + b'\x00' * 64 + b'\xff\xd9'
+
+
+class TestSniffImage(unittest.TestCase):
+
+    def test_formats_from_headers(self):
+        self.assertEqual(sniff_image(jpeg(640, 480)), ('jpeg', 640, 480))
+        png = b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' + struct.pack('>IIBBBBB', 300, 200, 8, 2, 0, 0, 0)
+        self.assertEqual(sniff_image(png), ('png', 300, 200))
+        self.assertEqual(sniff_image(b'GIF89a' + struct.pack('<HH', 10, 20) + b'\x00' * 4), ('gif', 10, 20))
+        vp8x = b'RIFF\x00\x00\x00\x00WEBPVP8X' + b'\x0a\x00\x00\x00' + b'\x10\x00\x00\x00' \
+            + (1919).to_bytes(3, 'little') + (1079).to_bytes(3, 'little')
+        self.assertEqual(sniff_image(vp8x), ('webp', 1920, 1080))
+
+    def test_heic_uses_primary_item_size(self):
+        self.assertEqual(sniff_image(heic()), ('heic', 4032, 3024))
+        self.assertEqual(sniff_image(heic(primary=1)), ('heic', 64, 64))
+        self.assertEqual(sniff_image(memoryview(heic())), ('heic', 4032, 3024))
+
+    @unittest.skipUnless(Image, 'Pillow is not installed')
+    def test_matches_pillow(self):
+        for image_format, options in (('JPEG', {}), ('JPEG', {'progressive': True}), ('PNG', {}), ('GIF', {}),
+                                      ('WEBP', {}), ('WEBP', {'lossless': True})):
+            output = io.BytesIO()
+            Image.new('RGB', (321, 123), (200, 80, 20)).save(output, format=image_format, **options)
+            self.assertEqual(sniff_image(output.getvalue()), (image_format.lower(), 321, 123))
+
+    def test_rejects_unknown_and_truncated(self):
+        for data in (b'', b'dummy image data', jpeg(640, 480)[:1010], b'\x89PNG\r\n\x1a\n\x00\x00', heic()[:40],
+                     b'\xff\xd8\xff\xe1\x00\x00' + b'\x00' * 16):
+            with self.assertRaises(ValueError):
+                sniff_image(data)
+
+
+class TestValidateImage(unittest.TestCase):
+
+    def test_limits(self):
+        data = jpeg(4000, 3000)
+        self.assertEqual(validate_image(data), {'format': 'jpeg', 'width': 4000, 'height': 3000,
+                                                'size_bytes': len(data)})
+        for limits in ({'allowed_formats': ('png',)}, {'max_bytes': 100}, {'max_dimension': 3999},
+                       {'max_pixels': 4000 * 2999}):
+            with self.assertRaises(ValueError):
+                validate_image(data, **limits)
+        with self.assertRaises(ValueError):
+            validate_image(jpeg(640, 0))
+
+    def test_original_keys(self):
+        self.assertEqual(original_key('abc', 'webp'), 'abc.webp')
+        self.assertEqual(image_id_for_original('abc.heic'), 'abc')
+        for key in ('derivatives/abc/128.jpg', 'notes.txt', '.jpg', 'abc'):
+            self.assertIsNone(image_id_for_original(key))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import json
+import unittest
+from unittest.mock import MagicMock
+from job_queue import LocalQueue, SqsQueue
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLocalQueue(unittest.TestCase):
+
+    def test_unfinished_jobs_are_redelivered_after_visibility_timeout(self):
+        clock = FakeClock()
+        queue = LocalQueue(visibility_timeout=30, clock=clock)
+        for number in range(3):
+            queue.send({'image_id': f'img-{number}'})
+
+        jobs = queue.receive(max_jobs=2)
+        self.assertEqual([job.body['image_id'] for job in jobs], ['img-0', 'img-1'])
+        queue.delete(jobs[:1])
+        self.assertEqual([job.body['image_id'] for job in queue.receive()], ['img-2'])
+        self.assertEqual(queue.receive(), [])
+
+        clock.now = 31
+        redelivered = queue.receive()
+        self.assertEqual(sorted(job.body['image_id'] for job in redelivered), ['img-1', 'img-2'])
+        self.assertEqual({job.receive_count for job in redelivered}, {2})
+        queue.delete(redelivered)
+        self.assertEqual(len(queue), 0)
+
+    def test_bodies_are_copied(self):
+        queue = LocalQueue()
+        body = {'image_id': 'img-1'}
+        queue.send(body)
+        body['image_id'] = 'changed'
+        self.assertEqual(queue.receive()[0].body, {'image_id': 'img-1'})
+
+
+class TestSqsQueue(unittest.TestCase):
+
+    def test_send_receive_delete(self):
+        sqs = MagicMock()
+        sqs.send_message.return_value = {'MessageId': 'm-1'}
+        sqs.receive_message.return_value = {'Messages': [
+            {'MessageId': 'm-1', 'Body': json.dumps({'image_id': 'img-1'}), 'ReceiptHandle': 'r-1',
+             'Attributes': {'ApproximateReceiveCount': '3'}}
+        ]}
+        queue = SqsQueue('https://sqs.example.com/uploads.fifo', sqs=sqs)
+
+        self.assertEqual(queue.send({'image_id': 'img-1'}, deduplication_id='img-1'), 'm-1')
+        request = sqs.send_message.call_args[1]
+        self.assertEqual((request['MessageDeduplicationId'], request['MessageGroupId']), ('img-1', 'img-1'))
+
+        jobs = queue.receive(max_jobs=25, wait_seconds=60)
+        self.assertEqual(sqs.receive_message.call_args[1]['MaxNumberOfMessages'], 10)
+        self.assertEqual(sqs.receive_message.call_args[1]['WaitTimeSeconds'], 20)
+        self.assertEqual((jobs[0].body, jobs[0].receive_count), ({'image_id': 'img-1'}, 3))
+
+        queue.delete(jobs * 12)
+        self.assertEqual([len(call[1]['Entries']) for call in sqs.delete_message_batch.call_args_list], [10, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+from decimal import Decimal
+from unittest.mock import MagicMock
+from metadata_cache import MetadataCache, InMemoryStore, cache_key, encode, decode, tombstone
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestMetadataCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.items = {'a': {'image_id': 'a', 'title': 'Sunset', 'derivatives': [{'size': Decimal(128)}]},
+                      'p': {'image_id': 'p', 'status': 'pending'}}
+        self.loader = MagicMock(side_effect=lambda image_id: self.items.get(image_id))
+
+    def cache(self, **kwargs):
+        return MetadataCache(self.loader, clock=self.clock, ttl=60, negative_ttl=5, **kwargs)
+
+    def test_hit_within_ttl_and_reload_after(self):
+        cache = self.cache()
+        self.assertEqual(cache.get('a'), self.items['a'])
+        self.assertEqual(cache.get('a'), self.items['a'])
+        self.assertEqual(self.loader.call_count, 1)
+        self.clock.now += 61
+        cache.get('a')
+        self.assertEqual(self.loader.call_count, 2)
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['expirations']), (1, 2, 1))
+
+    def test_negative_results_expire_quickly(self):
+        cache = self.cache()
+        self.assertIsNone(cache.get('missing'))
+        self.assertEqual(cache.get('p'), self.items['p'])  # pending: short TTL
+        self.assertIsNone(cache.get('missing'))
+        self.assertEqual(cache.stats()['negative_hits'], 1)
+        self.clock.now += 6
+        cache.get('missing')
+        self.assertEqual(self.loader.call_count, 3)
+
+    def test_lru_eviction(self):
+        self.items.update({'b': {'image_id': 'b'}, 'c': {'image_id': 'c'}})
+        cache = self.cache(max_entries=2)
+        cache.get('a')
+        cache.get('b')
+        cache.get('a')  # a is now the most recently used
+        cache.get('c')
+        self.assertEqual(list(cache.entries), ['a', 'c'])
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_shared_store_fills_other_containers(self):
+        store = InMemoryStore(clock=self.clock)
+        self.cache(store=store).get('a')
+        other = self.cache(store=store)
+        self.assertEqual(other.get('a'), self.items['a'])
+        self.assertEqual(self.loader.call_count, 1)
+        self.assertEqual(other.stats()['shared_hits'], 1)
+
+    def test_get_many_loads_misses_in_one_batch(self):
+        batch_loader = MagicMock(side_effect=lambda ids: {i: self.items[i] for i in ids if i in self.items})
+        cache = self.cache(batch_loader=batch_loader)
+        cache.get('a')
+        found = cache.get_many(['a', 'p', 'missing', 'p'])
+        self.assertEqual(found, {'a': self.items['a'], 'p': self.items['p'], 'missing': None})
+        batch_loader.assert_called_once_with(['p', 'missing'])
+        self.assertIsNone(cache.get('missing'))  # cached negative
+        self.assertEqual(self.loader.call_count, 1)
+
+    def test_tombstone_hides_deleted_image(self):
+        store = InMemoryStore(clock=self.clock)
+        self.cache(store=store).get('a')
+        tombstone(store, 'a')
+        self.assertIsNone(self.cache(store=store).get('a'))
+        self.assertEqual(self.loader.call_count, 1)
+
+    def test_fill_does_not_overwrite_tombstone(self):
+        store = InMemoryStore(clock=self.clock)
+        tombstone(store, 'a')
+        cache = self.cache(store=store)
+        cache.entries.clear()
+        store.delete(cache_key('a'))
+        # A read that started before the delete finishes after it
+        self.loader.side_effect = lambda image_id: (tombstone(store, image_id), self.items[image_id])[1]
+        cache.get('a')
+        self.assertIsNone(decode(store.get(cache_key('a'))))
+
+    def test_shared_store_errors_fall_back_to_loader(self):
+        store = MagicMock()
+        store.get.side_effect = ConnectionError('down')
+        cache = self.cache(store=store)
+        self.assertEqual(cache.get('a'), self.items['a'])
+        self.assertEqual(cache.stats()['shared_errors'], 1)
+
+    def test_encode_round_trips_decimals(self):
+        self.assertEqual(decode(encode(self.items['a'])), self.items['a'])
+        self.assertIsNone(decode(encode(None)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import io
+import json
+import unittest
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import patch
+import request_metrics
+from request_metrics import instrument, phase, record, operation_phase, read_documents, summarize, NULL_PHASE
+
+
+def operation_model(service_name, operation_name):
+    return SimpleNamespace(name=operation_name, service_model=SimpleNamespace(service_name=service_name))
+
+
+class TestInstrument(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch('sys.stdout', new_callable=io.StringIO)
+        self.stdout = patcher.start()
+        self.addCleanup(patcher.stop)
+        request_metrics._cold_start = True
+
+    def documents(self):
+        return [json.loads(line) for line in self.stdout.getvalue().splitlines()]
+
+    def test_emits_one_emf_line_per_invocation(self):
+        @instrument('upload_image')
+        def handler(event, context):
+            with phase('parse'):
+                pass
+            with phase('parse'):
+                pass
+            record('items', 3)
+            return {'statusCode': 200, 'body': '{"ok": true}'}
+
+        handler({'body': 'x' * 10}, SimpleNamespace(aws_request_id='req-1'))
+        handler({}, None)
+
+        first, second = self.documents()
+        directive = first['_aws']['CloudWatchMetrics'][0]
+        self.assertEqual(directive['Dimensions'], [['handler']])
+        units = {metric['Name']: metric['Unit'] for metric in directive['Metrics']}
+        self.assertEqual(units['duration_ms'], 'Milliseconds')
+        self.assertEqual(units['parse_ms'], 'Milliseconds')
+        self.assertEqual(units['request_bytes'], 'Bytes')
+        self.assertEqual(units['items'], 'Count')
+        self.assertEqual((first['handler'], first['request_id'], first['status_code']), ('upload_image', 'req-1', 200))
+        self.assertEqual((first['request_bytes'], first['response_bytes'], first['items']), (10, 12, 3))
+        self.assertGreaterEqual(first['duration_ms'], first['parse_ms'])
+        self.assertEqual((first['cold_start'], second['cold_start']), (1, 0))
+        self.assertNotIn('errors', first)
+
+    def test_errors(self):
+        @instrument('view_images')
+        def failing(event, context):
+            raise RuntimeError('boom')
+
+        @instrument('view_images')
+        def server_error(event, context):
+            return {'statusCode': 500, 'body': '{}'}
+
+        with self.assertRaises(RuntimeError):
+            failing({}, None)
+        server_error({}, None)
+        self.assertEqual([document['errors'] for document in self.documents()], [1, 1])
+
+    def test_aws_calls_are_timed_with_retries(self):
+        @instrument('view_images')
+        def handler(event, context):
+            for retries in (0, 2):
+                context_dict = {}
+                request_metrics._before_call(context=context_dict)
+                request_metrics._after_call(model=operation_model('dynamodb', 'GetItem'), context=context_dict,
+                                            parsed={'ResponseMetadata': {'RetryAttempts': retries}})
+            return {'statusCode': 200}
+
+        handler({}, None)
+        document = self.documents()[0]
+        self.assertEqual((document['aws_calls'], document['retries']), (2, 2))
+        self.assertIn('dynamo_get_ms', document)
+
+    def test_concurrent_invocations_keep_their_own_phases(self):
+        started = threading.Barrier(2)
+
+        @instrument('list_images')
+        def handler(event, context):
+            started.wait()  # both invocations in flight
+            with phase(event['phase']):
+                pass
+            started.wait()
+            return {'statusCode': 200}
+
+        threads = [threading.Thread(target=handler, args=({'phase': name}, None)) for name in ('parse', 'serialize')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        phases = sorted(tuple(name for name in document if name in ('parse_ms', 'serialize_ms'))
+                        for document in self.documents())
+        self.assertEqual(phases, [('parse_ms',), ('serialize_ms',)])
+
+    def test_pool_threads_count_toward_the_only_invocation(self):
+        @instrument('process_uploads')
+        def handler(event, context):
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                list(pool.map(lambda _: record('jobs'), range(4)))
+            return {}
+
+        handler({}, None)
+        self.assertEqual(self.documents()[0]['jobs'], 4)
+
+    def test_invocation_finishing_during_lookup(self):
+        class Finishing(list):
+            # Reports the one invocation that is removed right after the check
+            def __len__(self):
+                return 1
+
+        with patch('request_metrics._active', Finishing()):
+            self.assertIs(phase('parse'), NULL_PHASE)
+
+    def test_off_mode_and_outside_invocations(self):
+        self.assertIs(phase('parse'), NULL_PHASE)
+        record('items')  # no current invocation: ignored
+
+        def handler(event, context):
+            return {'statusCode': 200}
+
+        with patch('request_metrics.METRICS_MODE', 'off'):
+            self.assertIs(instrument('list_images')(handler), handler)
+        self.assertEqual(self.stdout.getvalue(), '')
+
+
+class TestOperationPhase(unittest.TestCase):
+
+    def test_names(self):
+        self.assertEqual(operation_phase('dynamodb', 'GetItem'), 'dynamo_get')
+        self.assertEqual(operation_phase('dynamodb', 'BatchWriteItem'), 'dynamo_batch_write')
+        self.assertEqual(operation_phase('s3', 'PutObject'), 's3_put')
+        self.assertEqual(operation_phase('s3', 'UploadPart'), 's3_upload_part')
+        self.assertEqual(operation_phase('sqs', 'SendMessage'), 'sqs_send_message')
+
+
+class TestSummarize(unittest.TestCase):
+
+    def test_percentiles_from_log_lines(self):
+        lines = ['START RequestId: 1', 'not json {', '{"message": "plain log"}']
+        for number in range(1, 101):
+            recorder = request_metrics.Recorder('list_images')
+            recorder.values.update(duration_ms=float(number), cold_start=1 if number == 1 else 0)
+            lines.append('2025-10-09T00:00:00Z\treq\tINFO\t' + request_metrics.emf_line(recorder, timestamp_ms=0))
+
+        documents = list(read_documents(lines))
+        self.assertEqual(len(documents), 100)
+        stats = summarize(documents)['list_images']['duration_ms']
+        self.assertEqual((stats['count'], stats['p50'], stats['p99'], stats['max']), (100, 50.0, 99.0, 100.0))
+        by_cold_start = summarize(documents, by='cold_start')
+        self.assertEqual(by_cold_start['list_images cold_start=1']['duration_ms']['count'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
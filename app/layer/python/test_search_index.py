@@ -0,0 +1,77 @@
+import unittest
+from unittest.mock import MagicMock
+from search_index import tokenize, term_weights, index_image, remove_image, search, rebuild_index
+
+
+class TestSearchIndex(unittest.TestCase):
+
+    def test_tokenize_normalizes_and_drops_stop_words(self):
+        self.assertEqual(tokenize('The Sunset, over the SEA-shore!'), ['sunset', 'over', 'sea', 'shore'])
+        self.assertEqual(tokenize(None), [])
+
+    def test_term_weights_prefers_title(self):
+        weights = term_weights('Sunset beach', 'A beach at sunset')
+        self.assertEqual(weights['sunset'], 4)
+        self.assertEqual(weights['beach'], 4)
+        self.assertNotIn('at', weights)
+
+    def test_index_image_writes_one_posting_per_term(self):
+        table = MagicMock()
+        writer = table.batch_writer.return_value.__enter__.return_value
+        count = index_image(table, 'img-1', 'Red car', 'A red sports car')
+        self.assertEqual(count, 3)
+        items = [call[1]['Item'] for call in writer.put_item.call_args_list]
+        self.assertIn({'term': 'red', 'image_id': 'img-1', 'weight': 4}, items)
+        self.assertIn({'term': 'sports', 'image_id': 'img-1', 'weight': 1}, items)
+
+    def test_remove_image_deletes_postings(self):
+        table = MagicMock()
+        writer = table.batch_writer.return_value.__enter__.return_value
+        remove_image(table, 'img-1', 'Red car', None)
+        keys = [call[1]['Key'] for call in writer.delete_item.call_args_list]
+        self.assertEqual(keys, [{'term': 'red', 'image_id': 'img-1'}, {'term': 'car', 'image_id': 'img-1'}])
+
+    def test_remove_image_shares_open_batch(self):
+        table = MagicMock()
+        batch = MagicMock()
+        remove_image(table, 'img-1', 'Red car', None, batch=batch)
+        self.assertEqual(batch.delete_item.call_count, 2)
+        table.batch_writer.assert_not_called()
+
+    def test_search_intersects_and_ranks(self):
+        postings = {
+            'red': [{'image_id': 'a', 'weight': 3}, {'image_id': 'b', 'weight': 1}, {'image_id': 'c', 'weight': 1}],
+            'car': [{'image_id': 'b', 'weight': 3}, {'image_id': 'c', 'weight': 1}]
+        }
+        table = MagicMock()
+        table.query.side_effect = lambda **kwargs: {'Items': postings[kwargs['ExpressionAttributeValues'][':term']]}
+        self.assertEqual(search(table, 'red car'), [('b', 4), ('c', 2)])
+
+    def test_search_follows_posting_pages(self):
+        table = MagicMock()
+        table.query.side_effect = [
+            {'Items': [{'image_id': 'a', 'weight': 1}], 'LastEvaluatedKey': {'term': 'red', 'image_id': 'a'}},
+            {'Items': [{'image_id': 'b', 'weight': 1}]}
+        ]
+        self.assertEqual(search(table, 'red'), [('a', 1), ('b', 1)])
+        self.assertEqual(table.query.call_args_list[1][1]['ExclusiveStartKey'], {'term': 'red', 'image_id': 'a'})
+
+    def test_search_without_terms(self):
+        table = MagicMock()
+        self.assertEqual(search(table, 'the a'), [])
+        table.query.assert_not_called()
+
+    def test_rebuild_index_scans_all_pages(self):
+        metadata_table = MagicMock()
+        metadata_table.scan.side_effect = [
+            {'Items': [{'image_id': '1', 'title': 'Red car', 'description': 'fast'}], 'LastEvaluatedKey': {'image_id': '1'}},
+            {'Items': [{'image_id': '2', 'title': 'Blue sky', 'description': 'clouds'}]}
+        ]
+        index_table = MagicMock()
+        writer = index_table.batch_writer.return_value.__enter__.return_value
+        self.assertEqual(rebuild_index(metadata_table, index_table), 2)
+        self.assertEqual(writer.put_item.call_count, 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
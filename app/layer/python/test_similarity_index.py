@@ -0,0 +1,152 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import io
+import random
+import similarity_index
+from similarity_index import (MultiIndexHash, SimilarityIndex, dhash, hash_hex, parse_hash, hamming, record_change,
+                              changes_since)
+
+try:
+    from PIL import Image, ImageFilter
+except ImportError:
+    Image = None
+
+
+def encoded(image, image_format='PNG', **options):
+    output = io.BytesIO()
+    image.save(output, format=image_format, **options)
+    return output.getvalue()
+
+
+class TestMultiIndexHash(unittest.TestCase):
+
+    def test_search_matches_a_linear_scan(self):
+        rng = random.Random(7)
+        centers = [rng.getrandbits(64) for _ in range(20)]
+        hashes = {}
+        # Clusters of near-duplicates plus unrelated hashes
+        for number in range(2000):
+            value = rng.choice(centers) ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) \
+                if number % 2 else rng.getrandbits(64)
+            hashes[f'img-{number}'] = value
+        index = MultiIndexHash()
+        for image_id, value in hashes.items():
+            index.add(image_id, value)
+        self.assertEqual(len(index), 2000)
+
+        for query in centers[:5] + [rng.getrandbits(64)]:
+            for radius in (0, 3, 10, 17):
+                expected = sorted((hamming(query, value), image_id) for image_id, value in hashes.items()
+                                  if hamming(query, value) <= radius)
+                self.assertEqual(index.search(query, radius), expected)
+
+    def test_remove_and_rehash(self):
+        index = MultiIndexHash()
+        index.add('a', 0b1111)
+        index.add('b', 0b1110)
+        index.add('c', 0b1111)
+        self.assertTrue(index.remove('a'))
+        self.assertFalse(index.remove('a'))
+        self.assertEqual(index.search(0b1111, 1), [(0, 'c'), (1, 'b')])
+        # A new hash for an image replaces its old one
+        index.add('c', 0)
+        self.assertEqual(index.search(0b1111, 1), [(1, 'b')])
+        self.assertEqual(len(index), 2)
+        # Emptied buckets are dropped
+        index.remove('b')
+        index.remove('c')
+        self.assertEqual(index.tables, [{}, {}, {}, {}])
+
+    def test_parse_hash(self):
+        self.assertEqual(parse_hash(hash_hex(255)), 255)
+        self.assertEqual(hash_hex(255), '00000000000000ff')
+        for bad in ('ff', 'zz00000000000000', None):
+            with self.assertRaises(ValueError):
+                parse_hash(bad)
+
+
+@unittest.skipIf(Image is None, 'Pillow is not installed')
+class TestDhash(unittest.TestCase):
+
+    def test_near_duplicates_are_close(self):
+        original = Image.radial_gradient('L').resize((640, 480)).convert('RGB')
+        value = dhash(encoded(original))
+        copies = [encoded(original.resize((320, 240))), encoded(original, 'JPEG', quality=40),
+                  encoded(original.filter(ImageFilter.GaussianBlur(2)))]
+        for data in copies:
+            self.assertLessEqual(hamming(value, dhash(data)), 5)
+        other = Image.linear_gradient('L').rotate(90).resize((640, 480)).convert('RGB')
+        self.assertGreater(hamming(value, dhash(encoded(other))), 20)
+
+    def test_undecodable_bytes(self):
+        with self.assertRaises(ValueError):
+            dhash(b'not an image')
+
+
+class TestSimilarityIndex(unittest.TestCase):
+
+    def test_record_change(self):
+        table = MagicMock()
+        record_change(table, 'a', '00000000000000ff')
+        item = table.put_item.call_args[1]['Item']
+        self.assertEqual((item['stream'], item['image_id'], item['phash']), ('changes', 'a', '00000000000000ff'))
+        self.assertTrue(item['change_id'].endswith('#a'))
+        batch = MagicMock()
+        record_change(table, 'b', batch=batch)
+        self.assertNotIn('phash', batch.put_item.call_args[1]['Item'])
+        self.assertEqual(table.put_item.call_count, 1)
+
+    def test_changes_since_follows_pages(self):
+        table = MagicMock()
+        table.query.side_effect = [{'Items': [{'image_id': 'a'}], 'LastEvaluatedKey': {'change_id': 'x'}},
+                                   {'Items': [{'image_id': 'b'}]}]
+        self.assertEqual([change['image_id'] for change in changes_since(table, 1234)], ['a', 'b'])
+        first = table.query.call_args_list[0][1]
+        self.assertEqual(first['ExpressionAttributeValues'][':since'], '0000000001234')
+        self.assertEqual(table.query.call_args_list[1][1]['ExclusiveStartKey'], {'change_id': 'x'})
+
+    @patch('similarity_index.now_ms')
+    @patch('bulk_scan.scan_items')
+    def test_build_then_apply_log(self, mock_scan_items, mock_now_ms):
+        mock_now_ms.return_value = 100000
+        mock_scan_items.return_value = [{'image_id': 'a', 'phash': hash_hex(0)},
+                                        {'image_id': 'b', 'phash': hash_hex(1)}]
+        log_table = MagicMock()
+        log_table.query.return_value = {'Items': [
+            {'image_id': 'c', 'phash': hash_hex(3)},
+            {'image_id': 'a'}  # removed
+        ]}
+        index = SimilarityIndex(MagicMock(), log_table)
+        index.build()
+        self.assertEqual(index.search(0, 2), [(0, 'a'), (1, 'b')])
+
+        mock_now_ms.return_value = 200000
+        index.refresh()
+        self.assertEqual(index.search(0, 2), [(1, 'b'), (2, 'c')])
+        # The log is read from just before the build, then from just before the refresh
+        self.assertEqual(log_table.query.call_args[1]['ExpressionAttributeValues'][':since'], '0000000095000')
+        self.assertEqual(index.synced_at, 195000)
+
+    @patch('similarity_index.SimilarityIndex.refresh')
+    @patch('similarity_index.SimilarityIndex.build')
+    def test_cached_index_refreshes_at_most_every_interval(self, mock_build, mock_refresh):
+        similarity_index.reset_cache()
+        self.addCleanup(similarity_index.reset_cache)
+
+        def build(index=None):
+            similarity_index._index.built_at = similarity_index.now_ms()
+            similarity_index._index.refreshed = 1000.0
+        mock_build.side_effect = build
+
+        with patch('similarity_index.time.monotonic', return_value=1000.0):
+            index = similarity_index.cached_index(MagicMock(), MagicMock())
+            self.assertIs(similarity_index.cached_index(MagicMock(), MagicMock()), index)
+        mock_build.assert_called_once()
+        mock_refresh.assert_not_called()
+        with patch('similarity_index.time.monotonic', return_value=1000.0 + similarity_index.REFRESH_SECONDS):
+            similarity_index.cached_index(MagicMock(), MagicMock())
+        mock_refresh.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
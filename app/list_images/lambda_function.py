@@ -1,65 +1,503 @@
+import os
+import re
 import json
-import boto3
+import time
+import base64
+import decimal
+from datetime import datetime, timezone
 from botocore.exceptions import ClientError
+from aws_clients import lazy_dynamodb
+from search_index import SEARCH_INDEX_TABLE_NAME, search
+from catalog_index import (OWNER_INDEX_NAME, RECENT_INDEX_NAME, RECENT_SHARDS, now_ms, month_of, previous_month,
+                           request_owner)
+from request_metrics import instrument, phase
 
 S3_BUCKET_NAME = 'image-bucket'
 DYNAMODB_TABLE_NAME = 'images-metadata'
+TITLE_INDEX_NAME = 'title-index'  # GSI: partition key = title
+SORT_ORDERS = ('recent',)
+# Oldest month a recency listing walks back to when created_after is not given
+FIRST_MONTH = os.environ.get('LIST_IMAGES_FIRST_MONTH', '2020-01')
 
-# Initialize DynamoDB client
-dynamodb = boto3.resource('dynamodb')
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+# Items evaluated per DynamoDB page when a title/description filter is
+# applied. DynamoDB applies Limit before FilterExpression, so filtered reads
+# use bigger pages.
+FILTERED_PAGE_SIZE = 200
+# Upper bound on pages read by a single listing call; the caller continues
+# with next_token when a very selective filter hits this bound. Recency
+# listings do not count queries of empty month partitions.
+MAX_PAGES_PER_REQUEST = 20
 
-# Helper function to query DynamoDB with optional filters
-def query_images(title=None, description=None, limit=10):
-    table = dynamodb.Table(DYNAMODB_TABLE_NAME)
-    filter_expression = []
-    expression_values = {}
+# Attributes returned when the caller does not ask for `fields`; fields=all
+# returns whole items. image_id is always included.
+DEFAULT_FIELDS = ('image_id', 'title', 'description')
+MAX_FIELDS = 20
+FIELD_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]{0,63}$')
+
+BATCH_GET_MAX_KEYS = 100
+BATCH_GET_MAX_ATTEMPTS = 5
+BATCH_GET_BACKOFF_SECONDS = 0.05
+
+# Initialize DynamoDB client. Listings only serialize what they read, so
+# numbers are deserialized straight to int/float rather than Decimal.
+dynamodb = lazy_dynamodb(native_numbers=True)
+
+# json.dumps fallback for Decimal values (items that did not come through the
+# native-number client)
+def decimal_default(value):
+    if value.__class__ is decimal.Decimal:
+        number = int(value)
+        return number if number == value else float(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+# Attribute names to return from the `fields` query parameter: None for
+# every attribute (fields=all), else a tuple starting with image_id
+def parse_fields(fields_param):
+    if not fields_param:
+        return DEFAULT_FIELDS
+    if fields_param == 'all':
+        return None
+    fields = ['image_id']
+    for name in fields_param.split(','):
+        name = name.strip()
+        if not FIELD_NAME.match(name):
+            raise ValueError(f'Invalid field name: {name}')
+        if name not in fields:
+            fields.append(name)
+    if len(fields) > MAX_FIELDS:
+        raise ValueError(f'At most {MAX_FIELDS} fields can be requested')
+    return tuple(fields)
+
+# ProjectionExpression (with placeholder names, so reserved words like
+# `size` work) for the given attributes, merged into `request`
+def add_projection(request, fields):
+    if fields is None:
+        return request
+    names = request.setdefault('ExpressionAttributeNames', {})
+    placeholders = []
+    for number, name in enumerate(fields):
+        placeholder = f'#f{number}'
+        names[placeholder] = name
+        placeholders.append(placeholder)
+    request['ProjectionExpression'] = ', '.join(placeholders)
+    return request
+
+# Wrap a DynamoDB key (ExclusiveStartKey) into an opaque pagination cursor
+def encode_next_token(last_key):
+    if not last_key:
+        return None
+    raw = json.dumps(last_key, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+# Unwrap a cursor produced by encode_next_token
+def decode_next_token(next_token):
+    if not next_token:
+        return None
+    try:
+        last_key = json.loads(base64.urlsafe_b64decode(next_token.encode('ascii')))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid next_token')
+    if not isinstance(last_key, dict) or not last_key:
+        raise ValueError('Invalid next_token')
+    return last_key
+
+# Epoch milliseconds from a created_after/created_before parameter: ISO 8601
+# (a date, or a date and time, UTC unless it carries an offset) or epoch
+# milliseconds like created_at itself
+def parse_time(name, value):
+    if value.isdigit():
+        return int(value)
+    try:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f'{name} must be an ISO 8601 time or epoch milliseconds')
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+# Range filters from the query string: created_after/created_before (epoch
+# ms, inclusive) and min_size/max_size (bytes, inclusive). Absent ones are left out.
+def parse_ranges(query_params):
+    ranges = {}
+    for name in ('created_after', 'created_before'):
+        if query_params.get(name):
+            ranges[name] = parse_time(name, query_params[name])
+    for name in ('min_size', 'max_size'):
+        if query_params.get(name):
+            try:
+                ranges[name] = int(query_params[name])
+            except ValueError:
+                raise ValueError(f'{name} must be a number of bytes')
+    if ranges.get('created_after', 0) > ranges.get('created_before', float('inf')):
+        raise ValueError('created_after must not be later than created_before')
+    return ranges
+
+# FilterExpression, names and values shared by every kind of listing
+def build_filter(title=None, description=None, exact_title=False, ranges=None):
+    # Skip rows of presigned uploads that have not been finalized yet
+    filter_expression = ['(attribute_not_exists(#status) or #status = :active)']
+    expression_names = {'#status': 'status'}
+    expression_values = {':active': 'active'}
 
-    # Build the filter expression based on provided filters
     if title:
-        filter_expression.append('contains(title, :title)')
+        filter_expression.append('#title = :title' if exact_title else 'contains(#title, :title)')
+        expression_names['#title'] = 'title'
         expression_values[':title'] = title
     if description:
-        filter_expression.append('contains(description, :description)')
+        filter_expression.append('contains(#description, :description)')
+        expression_names['#description'] = 'description'
         expression_values[':description'] = description
+    ranges = ranges or {}
+    if 'min_size' in ranges or 'max_size' in ranges:
+        expression_names['#size'] = 'size_bytes'
+        if 'min_size' in ranges:
+            filter_expression.append('#size >= :min_size')
+            expression_values[':min_size'] = ranges['min_size']
+        if 'max_size' in ranges:
+            filter_expression.append('#size <= :max_size')
+            expression_values[':max_size'] = ranges['max_size']
+    if 'created_after' in ranges or 'created_before' in ranges:
+        expression_names['#created'] = 'created_at'
+        if 'created_after' in ranges:
+            filter_expression.append('#created >= :created_after')
+            expression_values[':created_after'] = ranges['created_after']
+        if 'created_before' in ranges:
+            filter_expression.append('#created <= :created_before')
+            expression_values[':created_before'] = ranges['created_before']
+
+    return {
+        'FilterExpression': ' and '.join(filter_expression),
+        'ExpressionAttributeNames': expression_names,
+        'ExpressionAttributeValues': expression_values
+    }
+
+# Build the read request: a Query on the title GSI for exact title matches,
+# otherwise a table scan with optional substring filters
+def build_read_request(title=None, description=None, exact_title=False, ranges=None):
+    if title and exact_title:
+        request = build_filter(None, description, ranges=ranges)
+        request['IndexName'] = TITLE_INDEX_NAME
+        request['KeyConditionExpression'] = '#title = :title'
+        request['ExpressionAttributeNames']['#title'] = 'title'
+        request['ExpressionAttributeValues'][':title'] = title
+        return request
+    return build_filter(title, description, ranges=ranges)
+
+# Query on a created_at-sorted index, newest first. The created_at range is
+# part of the key condition, so rows outside it are never read.
+def build_index_request(index_name, partition_name, partition_value, title=None, description=None,
+                        exact_title=False, ranges=None):
+    ranges = dict(ranges or {})
+    created_after = ranges.pop('created_after', None)
+    created_before = ranges.pop('created_before', None)
+    request = build_filter(title, description, exact_title, ranges)
+    names, values = request['ExpressionAttributeNames'], request['ExpressionAttributeValues']
+    names['#partition'] = partition_name
+    values[':partition'] = partition_value
+    key_condition = '#partition = :partition'
+    if created_after is not None or created_before is not None:
+        names['#created'] = 'created_at'
+        values[':created_after'] = created_after if created_after is not None else 0
+        values[':created_before'] = created_before if created_before is not None else 2 ** 53
+        key_condition += ' and #created BETWEEN :created_after AND :created_before'
+    request.update(IndexName=index_name, KeyConditionExpression=key_condition, ScanIndexForward=False)
+    return request
+
+# Read up to `limit` items with one request shape, following
+# LastEvaluatedKey; returns (items, last_key). key_attributes are the
+# attributes a resume key is built from.
+def read_listing(read, request, key_attributes, is_filtered, limit, start_key, fields):
+    # Filters see whole items; the projection only trims what is returned,
+    # plus the key attributes the cursor needs
+    extra_attributes = []
+    if fields is not None:
+        extra_attributes = [name for name in key_attributes if name not in fields]
+        add_projection(request, tuple(fields) + tuple(extra_attributes))
+
+    items = []
+    last_key = None
+    for _ in range(MAX_PAGES_PER_REQUEST):
+        remaining = limit - len(items)
+        request['Limit'] = max(remaining, FILTERED_PAGE_SIZE) if is_filtered else remaining
+        if start_key:
+            request['ExclusiveStartKey'] = start_key
+
+        response = read(**request)
+        page = response.get('Items', [])
+        start_key = response.get('LastEvaluatedKey')
+
+        if len(page) > remaining:
+            # Page overshot the limit: resume after the last item returned
+            items.extend(page[:remaining])
+            last_key = {name: items[-1][name] for name in key_attributes}
+            break
+
+        items.extend(page)
+        last_key = start_key
+        if not start_key or len(items) >= limit:
+            break
+
+    for item in items:
+        for name in extra_attributes:
+            item.pop(name, None)
+    return items, last_key
+
+# Helper function to read one page of images with optional filters, returning
+# only `fields` of each (None for whole items).
+# Returns (items, next_token); next_token is None once the listing is exhausted.
+def query_images(title=None, description=None, limit=DEFAULT_LIMIT, next_token=None, exact_title=False,
+                 fields=None, ranges=None):
+    table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+    request = build_read_request(title, description, exact_title, ranges)
+    is_query = 'KeyConditionExpression' in request
+    is_filtered = bool(title and not exact_title) or bool(description) or bool(ranges)
+
+    # Attributes needed to resume right after a given item
+    key_attributes = ['image_id', 'title'] if is_query else ['image_id']
+    try:
+        items, last_key = read_listing(table.query if is_query else table.scan, request, key_attributes,
+                                       is_filtered, limit, decode_next_token(next_token), fields)
+        return items, encode_next_token(last_key)
+
+    except ClientError as e:
+        raise Exception(f"Error querying DynamoDB: {str(e)}")
 
-    # Join filters if both are provided
-    filter_expression_str = ' and '.join(filter_expression) if filter_expression else None
+# One owner's images, newest first, from the owner/created_at index
+def list_owner_images(owner_id, title=None, description=None, exact_title=False, ranges=None,
+                      limit=DEFAULT_LIMIT, next_token=None, fields=None):
+    table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+    request = build_index_request(OWNER_INDEX_NAME, 'owner_id', owner_id, title, description, exact_title, ranges)
+    is_filtered = bool(title) or bool(description) or 'min_size' in (ranges or {}) or 'max_size' in (ranges or {})
+    try:
+        items, last_key = read_listing(table.query, request, ['image_id', 'owner_id', 'created_at'],
+                                       is_filtered, limit, decode_next_token(next_token), fields)
+        return items, encode_next_token(last_key)
+    except ClientError as e:
+        raise Exception(f"Error querying DynamoDB: {str(e)}")
+
+class ShardReader(object):
+    """
+    Pages through one time_bucket partition of the recency index, newest
+    first. `position` is the key to resume after: the last item taken, or the
+    end of a page that had no matches.
+    """
+    KEY_ATTRIBUTES = ('image_id', 'time_bucket', 'created_at')
+
+    def __init__(self, read, request, position=None):
+        self.read = read
+        self.request = request
+        self.position = position
+        self.buffer = []
+        self.page_end = position
+        self.exhausted = False
+
+    def fill(self, page_size):
+        request = dict(self.request, Limit=page_size)
+        if self.page_end:
+            request['ExclusiveStartKey'] = self.page_end
+        response = self.read(**request)
+        self.buffer = response.get('Items', [])
+        self.buffer.reverse()  # pop() takes the newest
+        self.page_end = response.get('LastEvaluatedKey')
+        if not self.buffer:
+            self.position = self.page_end
+        self.exhausted = not self.page_end
+
+    def head(self):
+        return (self.buffer[-1]['created_at'], self.buffer[-1]['image_id']) if self.buffer else None
 
+    def take(self):
+        item = self.buffer.pop()
+        self.position = {name: item[name] for name in self.KEY_ATTRIBUTES}
+        return item
+
+    def done(self):
+        return self.exhausted and not self.buffer
+
+# Recency cursor: the month being read and each shard's position in it
+# (None before its first page, 'done' once it is exhausted)
+def decode_recent_cursor(next_token):
+    cursor = decode_next_token(next_token)
+    if cursor is None:
+        return None, {}
+    month, positions = cursor.get('month'), cursor.get('positions')
+    if not isinstance(month, str) or not re.match(r'^\d{4}-\d{2}$', month) or not isinstance(positions, dict):
+        raise ValueError('Invalid next_token')
+    return month, positions
+
+# Every image, newest first: a k-way merge of the time_bucket shards of the
+# recency index, one month at a time
+def list_recent_images(title=None, description=None, exact_title=False, ranges=None, limit=DEFAULT_LIMIT,
+                       next_token=None, fields=None):
+    table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+    ranges = ranges or {}
+    month, positions = decode_recent_cursor(next_token)
+    month = month or month_of(ranges.get('created_before', now_ms()))
+    last_month = month_of(ranges['created_after']) if 'created_after' in ranges else FIRST_MONTH
+    is_filtered = bool(title) or bool(description) or 'min_size' in ranges or 'max_size' in ranges
+    page_size = FILTERED_PAGE_SIZE if is_filtered else limit
+
+    items = []
+    pages = 0
     try:
-        # Perform a scan query with filters if any
-        response = table.scan(
-            FilterExpression=filter_expression_str,
-            ExpressionAttributeValues=expression_values,
-            Limit=limit
-        )
-        return response['Items']
+        while month >= last_month and len(items) < limit:
+            readers = {}
+            for shard in range(RECENT_SHARDS):
+                position = positions.get(str(shard))
+                if position != 'done':
+                    request = build_index_request(RECENT_INDEX_NAME, 'time_bucket', f'{month}#{shard}', title,
+                                                  description, exact_title, ranges)
+                    if fields is not None:
+                        add_projection(request, tuple(fields) + tuple(name for name in ShardReader.KEY_ATTRIBUTES
+                                                                      if name not in fields))
+                    readers[shard] = ShardReader(table.query, request, position)
+
+            while len(items) < limit:
+                # Every shard needs its next item in hand before the newest can be picked
+                pending = [reader for reader in readers.values() if not reader.buffer and not reader.done()]
+                if pending:
+                    if pages >= MAX_PAGES_PER_REQUEST:
+                        break
+                    for reader in pending[:MAX_PAGES_PER_REQUEST - pages]:
+                        reader.fill(page_size)
+                        # Empty partitions (months nobody uploaded in) are
+                        # free, so gaps in the catalog never end a call early
+                        if reader.buffer or not reader.exhausted:
+                            pages += 1
+                    continue
+                live = [reader for reader in readers.values() if reader.buffer]
+                if not live:
+                    break
+                items.append(max(live, key=ShardReader.head).take())
 
+            positions = {str(shard): 'done' if shard not in readers or readers[shard].done()
+                         else readers[shard].position for shard in range(RECENT_SHARDS)}
+            if any(position != 'done' for position in positions.values()):
+                break  # item or page limit reached inside this month
+            month, positions = previous_month(month), {}
     except ClientError as e:
         raise Exception(f"Error querying DynamoDB: {str(e)}")
 
+    if fields is not None:
+        for item in items:
+            for name in ShardReader.KEY_ATTRIBUTES:
+                if name not in fields:
+                    item.pop(name, None)
+    finished = month < last_month
+    return items, None if finished else encode_next_token({'month': month, 'positions': positions})
+
+# Fetch metadata items (only `fields` of them when given) with
+# batch_get_item, keeping the order of image_ids. Ids without a metadata item
+# are skipped.
+def get_images_by_ids(image_ids, fields=None):
+    found = {}
+    keys = [{'image_id': image_id} for image_id in image_ids]
+
+    try:
+        for start in range(0, len(keys), BATCH_GET_MAX_KEYS):
+            request = {DYNAMODB_TABLE_NAME: add_projection({'Keys': keys[start:start + BATCH_GET_MAX_KEYS]}, fields)}
+            for attempt in range(BATCH_GET_MAX_ATTEMPTS):
+                response = dynamodb.batch_get_item(RequestItems=request)
+                for item in response.get('Responses', {}).get(DYNAMODB_TABLE_NAME, []):
+                    found[item['image_id']] = item
+                request = response.get('UnprocessedKeys') or {}
+                if not request:
+                    break
+                time.sleep(BATCH_GET_BACKOFF_SECONDS * (2 ** attempt))
+            if request:
+                raise Exception("Error querying DynamoDB: unprocessed keys remained after retries")
+    except ClientError as e:
+        raise Exception(f"Error querying DynamoDB: {str(e)}")
+
+    return [found[image_id] for image_id in image_ids if image_id in found]
+
+# Full-text search through the inverted index; returns (items, next_token)
+# with results ranked by relevance
+def search_images(query, limit=DEFAULT_LIMIT, next_token=None, fields=None):
+    cursor = decode_next_token(next_token) or {'offset': 0}
+    offset = cursor.get('offset')
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError('Invalid next_token')
+
+    ranked = search(dynamodb.Table(SEARCH_INDEX_TABLE_NAME), query)
+    page = ranked[offset:offset + limit]
+    items = get_images_by_ids([image_id for image_id, _ in page], fields=fields)
+
+    end = offset + limit
+    return items, encode_next_token({'offset': end}) if end < len(ranked) else None
+
 # Lambda handler to list images with filters
+@instrument('list_images')
 def lambda_handler(event, context):
     try:
         # Extract query parameters for filtering (title and description)
-        query_params = event.get('queryStringParameters', {})
+        query_params = event.get('queryStringParameters') or {}
         title_filter = query_params.get('title', None)
         description_filter = query_params.get('description', None)
-        limit = int(query_params.get('limit', 10))  # Default to 10 results if limit is not provided
+        search_query = query_params.get('q', None)
+        exact_title = query_params.get('match') == 'exact'
+        next_token = query_params.get('next_token', None)
+        owner = query_params.get('owner', None)  # an owner_id, or `me` for the caller
+        sort_order = query_params.get('sort', None)
+
+        try:
+            limit = int(query_params.get('limit', DEFAULT_LIMIT))  # Default to 10 results if limit is not provided
+        except (TypeError, ValueError):
+            limit = 0
+        if limit < 1 or limit > MAX_LIMIT:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'message': f'limit must be between 1 and {MAX_LIMIT}'})
+            }
 
         # Query DynamoDB for images
-        images = query_images(title=title_filter, description=description_filter, limit=limit)
+        try:
+            with phase('parse'):
+                fields = parse_fields(query_params.get('fields', None))
+                ranges = parse_ranges(query_params)
+                if sort_order and sort_order not in SORT_ORDERS:
+                    raise ValueError(f'sort must be one of {", ".join(SORT_ORDERS)}')
+                if owner == 'me':
+                    owner = request_owner(event)
+                    if not owner:
+                        raise ValueError('owner=me needs an authenticated caller')
+
+            if search_query:
+                images, next_token = search_images(search_query, limit=limit, next_token=next_token, fields=fields)
+            elif owner:
+                images, next_token = list_owner_images(owner, title=title_filter, description=description_filter,
+                                                       exact_title=exact_title, ranges=ranges, limit=limit,
+                                                       next_token=next_token, fields=fields)
+            elif sort_order == 'recent' or 'created_after' in ranges or 'created_before' in ranges:
+                images, next_token = list_recent_images(title=title_filter, description=description_filter,
+                                                        exact_title=exact_title, ranges=ranges, limit=limit,
+                                                        next_token=next_token, fields=fields)
+            else:
+                images, next_token = query_images(title=title_filter, description=description_filter, limit=limit,
+                                                  next_token=next_token, exact_title=exact_title, fields=fields,
+                                                  ranges=ranges)
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'message': str(e)})
+            }
 
         # Prepare response with images metadata
+        with phase('serialize'):
+            body = json.dumps({
+                'message': 'Images retrieved successfully',
+                'images': images,
+                'next_token': next_token
+            }, default=decimal_default)
         return {
             'statusCode': 200,
-            'body': json.dumps({
-                'message': 'Images retrieved successfully',
-                'images': images
-            })
+            'body': body
         }
 
     except Exception as e:
         return {
             'statusCode': 500,
             'body': json.dumps({'message': str(e)})
-        }
\ No newline at end of file
+        }
@@ -0,0 +1,125 @@
+"""
+Similar-image search (GET or POST /images/similar, handler similar_images.similar_images_handler).
+
+Finds images whose perceptual hash lies within `distance` bits (Hamming
+distance, default 10, at most 16) of a query: ?image_id=... (an image
+already in the catalog, left out of its own results), ?hash=... (16 hex
+digits) or a POST body {"image_file": "<base64>"}. Hashing a query image
+needs Pillow packaged with this function; the other two forms do not.
+
+Matches come from the container's hash index (similarity_index), nearest
+first, and are then read back with batch_get_item, so images deleted since
+the tree was last refreshed drop out. Each image carries its `distance`;
+limit, next_token and fields work as in list_images.
+"""
+import json
+import base64
+import binascii
+from similarity_index import (SIMILARITY_LOG_TABLE_NAME, DEFAULT_DISTANCE, MAX_DISTANCE, cached_index, dhash,
+                              hash_hex, parse_hash)
+from request_metrics import instrument, phase
+from lambda_function import (dynamodb, DYNAMODB_TABLE_NAME, DEFAULT_LIMIT, MAX_LIMIT, decimal_default, parse_fields,
+                             encode_next_token, decode_next_token, get_images_by_ids)
+
+def response(status_code, body):
+    return {
+        'statusCode': status_code,
+        'body': json.dumps(body, default=decimal_default)
+    }
+
+def parse_int(query_params, name, default, low, high):
+    try:
+        value = int(query_params.get(name, default))
+    except (TypeError, ValueError):
+        value = low - 1
+    if value < low or value > high:
+        raise ValueError(f'{name} must be between {low} and {high}')
+    return value
+
+# The query from the request: ('image_id', id), ('hash', int) or ('image', bytes)
+def parse_query(event):
+    query_params = event.get('queryStringParameters') or {}
+    if event.get('body'):
+        try:
+            payload = json.loads(event['body'])
+            image_file = base64.b64decode(payload['image_file'], validate=True)
+        except (ValueError, TypeError, KeyError, binascii.Error):
+            raise ValueError('Request body must be JSON with a base64 image_file')
+        if not image_file:
+            raise ValueError('image_file is empty')
+        return 'image', image_file
+    if query_params.get('hash'):
+        return 'hash', parse_hash(query_params['hash'])
+    if query_params.get('image_id'):
+        return 'image_id', query_params['image_id']
+    raise ValueError('image_id, hash or an image_file body is required')
+
+# Page of (distance, image_id) matches for a cursor produced by this handler
+def page_of(matches, limit, next_token):
+    cursor = decode_next_token(next_token) or {'offset': 0}
+    offset = cursor.get('offset')
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError('Invalid next_token')
+    end = offset + limit
+    return matches[offset:end], encode_next_token({'offset': end}) if end < len(matches) else None
+
+# Metadata of the matched images (active ones only), each with its distance
+def hydrate(page, fields):
+    # status is read to skip unfinished presigned uploads, and dropped again
+    # when the caller did not ask for it
+    read_fields = fields if fields is None or 'status' in fields else fields + ('status',)
+    distances = {image_id: distance for distance, image_id in page}
+    images = []
+    for item in get_images_by_ids([image_id for _, image_id in page], fields=read_fields):
+        if item.get('status', 'active') != 'active':
+            continue
+        if read_fields is not fields:
+            item.pop('status', None)
+        item['distance'] = distances[item['image_id']]
+        images.append(item)
+    return images
+
+# Lambda handler to find images similar to a query image
+@instrument('list_images.similar')
+def similar_images_handler(event, context):
+    try:
+        query_params = event.get('queryStringParameters') or {}
+        try:
+            with phase('parse'):
+                kind, query = parse_query(event)
+                distance = parse_int(query_params, 'distance', DEFAULT_DISTANCE, 0, MAX_DISTANCE)
+                limit = parse_int(query_params, 'limit', DEFAULT_LIMIT, 1, MAX_LIMIT)
+                fields = parse_fields(query_params.get('fields', None))
+            if kind == 'image':
+                with phase('hash'):
+                    query = dhash(query)
+        except ValueError as e:
+            return response(400, {'message': str(e)})
+
+        exclude = None
+        if kind == 'image_id':
+            found = get_images_by_ids([query], fields=('image_id', 'phash'))
+            if not found:
+                return response(404, {'message': 'Image not found'})
+            if not found[0].get('phash'):
+                return response(409, {'message': 'Image has not been hashed yet'})
+            exclude, query = query, parse_hash(found[0]['phash'])
+
+        with phase('index'):
+            index = cached_index(dynamodb.Table(DYNAMODB_TABLE_NAME), dynamodb.Table(SIMILARITY_LOG_TABLE_NAME))
+        with phase('search'):
+            matches = [match for match in index.search(query, distance) if match[1] != exclude]
+        try:
+            page, next_token = page_of(matches, limit, query_params.get('next_token', None))
+        except ValueError as e:
+            return response(400, {'message': str(e)})
+
+        return response(200, {
+            'message': 'Similar images retrieved successfully',
+            'hash': hash_hex(query),
+            'images': hydrate(page, fields),
+            'next_token': next_token
+        })
+
+    except Exception as e:
+        return response(500, {'message': str(e)})
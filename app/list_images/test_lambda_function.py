@@ -1,16 +1,51 @@
 import unittest
 from unittest.mock import patch, MagicMock
+import os
+import sys
 import json
-from lambda_function import lambda_handler, query_images
+from decimal import Decimal
+
+# Shared modules ship as a Lambda layer; make them importable for local runs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'layer', 'python'))
+
+from lambda_function import (lambda_handler, query_images, search_images, encode_next_token, decode_next_token,
+                             parse_fields, parse_ranges, list_owner_images, list_recent_images, DEFAULT_FIELDS,
+                             MAX_FIELDS)
+from catalog_index import listing_attributes
+
+DAY_MS = 86400 * 1000
+NOW_MS = 1760000000000  # 2025-10-09
+
+
+class RecencyIndex(object):
+    """Answers recent-created-index queries (newest first, Limit, ExclusiveStartKey) over a list of rows."""
+    def __init__(self, items):
+        self.items = items
+        self.calls = 0
+
+    def query(self, **kwargs):
+        self.calls += 1
+        values = kwargs['ExpressionAttributeValues']
+        rows = sorted((item for item in self.items if item['time_bucket'] == values[':partition']
+                       and values.get(':created_after', 0) <= item['created_at'] <= values.get(':created_before', 2 ** 53)),
+                      key=lambda item: (item['created_at'], item['image_id']), reverse=True)
+        start = 0
+        if 'ExclusiveStartKey' in kwargs:
+            start = [item['image_id'] for item in rows].index(kwargs['ExclusiveStartKey']['image_id']) + 1
+        page = [dict(item) for item in rows[start:start + kwargs['Limit']]]
+        response = {'Items': page}
+        if start + kwargs['Limit'] < len(rows):
+            response['LastEvaluatedKey'] = {name: page[-1][name] for name in ('image_id', 'time_bucket', 'created_at')}
+        return response
 
 class TestLambdaHandler(unittest.TestCase):
 
     @patch('lambda_function.query_images')
     def test_list_images_no_filters(self, mock_query_images):
-        mock_query_images.return_value = [
+        mock_query_images.return_value = ([
             {'image_id': '1', 'title': 'Sunset', 'description': 'A beautiful sunset'},
             {'image_id': '2', 'title': 'Mountain', 'description': 'A scenic mountain view'}
-        ]
+        ], None)
         event = {
             'queryStringParameters': {}
         }
@@ -22,9 +57,9 @@ class TestLambdaHandler(unittest.TestCase):
 
     @patch('lambda_function.query_images')
     def test_list_images_with_filters(self, mock_query_images):
-        mock_query_images.return_value = [
+        mock_query_images.return_value = ([
             {'image_id': '1', 'title': 'Sunset', 'description': 'A beautiful sunset'}
-        ]
+        ], None)
         event = {
             'queryStringParameters': {
                 'title': 'Sunset',
@@ -39,7 +74,7 @@ class TestLambdaHandler(unittest.TestCase):
 
     @patch('lambda_function.query_images')
     def test_list_images_empty_result(self, mock_query_images):
-        mock_query_images.return_value = []
+        mock_query_images.return_value = ([], None)
         event = {
             'queryStringParameters': {
                 'description': 'Nonexistent',
@@ -63,5 +98,265 @@ class TestLambdaHandler(unittest.TestCase):
         body = json.loads(response['body'])
         self.assertEqual(body['message'], 'Database error')
 
+    @patch('lambda_function.query_images')
+    def test_list_images_returns_next_token(self, mock_query_images):
+        mock_query_images.return_value = ([{'image_id': '1'}], 'cursor')
+        event = {
+            'queryStringParameters': {
+                'limit': '1',
+                'next_token': 'previous'
+            }
+        }
+        response = lambda_handler(event, None)
+        self.assertEqual(response['statusCode'], 200)
+        body = json.loads(response['body'])
+        self.assertEqual(body['next_token'], 'cursor')
+        mock_query_images.assert_called_once_with(title=None, description=None, limit=1,
+                                                  next_token='previous', exact_title=False, fields=DEFAULT_FIELDS,
+                                                  ranges={})
+
+    def test_list_images_invalid_limit(self):
+        event = {
+            'queryStringParameters': {
+                'limit': '0'
+            }
+        }
+        response = lambda_handler(event, None)
+        self.assertEqual(response['statusCode'], 400)
+
+    def test_list_images_invalid_next_token(self):
+        event = {
+            'queryStringParameters': {
+                'next_token': 'not-a-token'
+            }
+        }
+        response = lambda_handler(event, None)
+        self.assertEqual(response['statusCode'], 400)
+        body = json.loads(response['body'])
+        self.assertEqual(body['message'], 'Invalid next_token')
+
+    def test_next_token_round_trip(self):
+        key = {'image_id': 'abc', 'title': 'Sunset'}
+        self.assertEqual(decode_next_token(encode_next_token(key)), key)
+        self.assertIsNone(encode_next_token(None))
+
+    @patch('lambda_function.dynamodb')
+    def test_query_images_keeps_reading_until_limit(self, mock_dynamodb):
+        table = mock_dynamodb.Table.return_value
+        table.scan.side_effect = [
+            {'Items': [], 'LastEvaluatedKey': {'image_id': '1'}},
+            {'Items': [{'image_id': '2'}], 'LastEvaluatedKey': {'image_id': '2'}},
+            {'Items': [{'image_id': '3'}, {'image_id': '4'}], 'LastEvaluatedKey': {'image_id': '4'}}
+        ]
+        images, next_token = query_images(title='Sun', limit=2)
+        self.assertEqual([image['image_id'] for image in images], ['2', '3'])
+        # The third page overshot the limit, so the cursor resumes after image 3
+        self.assertEqual(decode_next_token(next_token), {'image_id': '3'})
+        self.assertEqual(table.scan.call_count, 3)
+        self.assertEqual(table.scan.call_args_list[1][1]['ExclusiveStartKey'], {'image_id': '1'})
+
+    @patch('lambda_function.dynamodb')
+    def test_query_images_exhausted_listing_has_no_token(self, mock_dynamodb):
+        table = mock_dynamodb.Table.return_value
+        table.scan.return_value = {'Items': [{'image_id': '1'}]}
+        images, next_token = query_images(limit=5)
+        self.assertEqual(len(images), 1)
+        self.assertIsNone(next_token)
+        # Only the status filter applies, so pages are sized to the limit
+        kwargs = table.scan.call_args[1]
+        self.assertEqual(kwargs['FilterExpression'], '(attribute_not_exists(#status) or #status = :active)')
+        self.assertEqual(kwargs['Limit'], 5)
+
+    @patch('lambda_function.dynamodb')
+    def test_query_images_exact_title_uses_index(self, mock_dynamodb):
+        table = mock_dynamodb.Table.return_value
+        table.query.return_value = {'Items': [{'image_id': '1', 'title': 'Sunset'}]}
+        images, next_token = query_images(title='Sunset', exact_title=True)
+        self.assertEqual(len(images), 1)
+        table.scan.assert_not_called()
+        kwargs = table.query.call_args[1]
+        self.assertEqual(kwargs['IndexName'], 'title-index')
+        self.assertEqual(kwargs['KeyConditionExpression'], '#title = :title')
+
+    @patch('lambda_function.dynamodb')
+    def test_query_images_projects_fields_and_cursor_keys(self, mock_dynamodb):
+        table = mock_dynamodb.Table.return_value
+        table.query.return_value = {'Items': [{'image_id': '1', 'title': 'Sunset', 'size': 128},
+                                              {'image_id': '2', 'title': 'Sunset', 'size': 512}],
+                                    'LastEvaluatedKey': {'image_id': '2', 'title': 'Sunset'}}
+        images, next_token = query_images(title='Sunset', exact_title=True, limit=1, fields=('image_id', 'size'))
+        kwargs = table.query.call_args[1]
+        self.assertEqual(kwargs['ProjectionExpression'], '#f0, #f1, #f2')
+        self.assertEqual([kwargs['ExpressionAttributeNames'][name] for name in ('#f0', '#f1', '#f2')],
+                         ['image_id', 'size', 'title'])
+        # title was only read for the cursor
+        self.assertEqual(images, [{'image_id': '1', 'size': 128}])
+        self.assertEqual(decode_next_token(next_token), {'image_id': '1', 'title': 'Sunset'})
+
+    @patch('lambda_function.FIRST_MONTH', '2025-01')
+    @patch('lambda_function.now_ms', return_value=NOW_MS)
+    @patch('lambda_function.dynamodb')
+    def test_recent_listing_merges_shards_across_months(self, mock_dynamodb, mock_now_ms):
+        items = []
+        for number in range(40):
+            image_id = f'img-{number:02d}'
+            item = {'image_id': image_id, 'title': 'Sunset'}
+            item.update(listing_attributes(image_id, created_at=NOW_MS - number * 3 * DAY_MS))
+            items.append(item)
+        index = RecencyIndex(items)
+        mock_dynamodb.Table.return_value.query.side_effect = index.query
+
+        seen, next_token = [], None
+        while True:
+            images, next_token = list_recent_images(limit=7, next_token=next_token, fields=('image_id',))
+            self.assertLessEqual(len(images), 7)  # short when the page budget runs out on empty months
+            for image in images:
+                self.assertFalse({'created_at', 'time_bucket'} & set(image))  # cursor keys are stripped
+                seen.append(image['image_id'])
+            if next_token is None:
+                break
+        self.assertEqual(seen, [f'img-{number:02d}' for number in range(40)])
+
+        kwargs = mock_dynamodb.Table.return_value.query.call_args[1]
+        self.assertEqual(kwargs['IndexName'], 'recent-created-index')
+        self.assertFalse(kwargs['ScanIndexForward'])
+
+    @patch('lambda_function.now_ms', return_value=NOW_MS)
+    @patch('lambda_function.dynamodb')
+    def test_recent_listing_skips_sparse_months(self, mock_dynamodb, mock_now_ms):
+        # Years of empty months between uploads
+        items = []
+        for number, days_ago in enumerate((0, 400, 1500)):
+            item = {'image_id': f'img-{number}'}
+            item.update(listing_attributes(item['image_id'], created_at=NOW_MS - days_ago * DAY_MS))
+            items.append(item)
+        index = RecencyIndex(items)
+        mock_dynamodb.Table.return_value.query.side_effect = index.query
+
+        images, next_token = list_recent_images(limit=2)
+        self.assertEqual([image['image_id'] for image in images], ['img-0', 'img-1'])
+        images, next_token = list_recent_images(limit=2, next_token=next_token)
+        self.assertEqual([image['image_id'] for image in images], ['img-2'])
+        self.assertIsNone(next_token)
+
+    @patch('lambda_function.now_ms', return_value=NOW_MS)
+    @patch('lambda_function.dynamodb')
+    def test_recent_listing_stops_at_created_after(self, mock_dynamodb, mock_now_ms):
+        items = []
+        for number in range(10):
+            item = {'image_id': f'img-{number}'}
+            item.update(listing_attributes(item['image_id'], created_at=NOW_MS - number * 20 * DAY_MS))
+            items.append(item)
+        mock_dynamodb.Table.return_value.query.side_effect = RecencyIndex(items).query
+        ranges = {'created_after': NOW_MS - 50 * DAY_MS, 'created_before': NOW_MS - 10 * DAY_MS}
+        images, next_token = list_recent_images(ranges=ranges, limit=10)
+        self.assertEqual([image['image_id'] for image in images], ['img-1', 'img-2'])
+        self.assertIsNone(next_token)
+
+    @patch('lambda_function.dynamodb')
+    def test_owner_listing_queries_owner_index(self, mock_dynamodb):
+        table = mock_dynamodb.Table.return_value
+        table.query.return_value = {'Items': [{'image_id': '1', 'owner_id': 'u1', 'created_at': 5}]}
+        images, next_token = list_owner_images('u1', ranges={'created_after': 1, 'min_size': 100}, fields=None)
+        kwargs = table.query.call_args[1]
+        self.assertEqual(kwargs['IndexName'], 'owner-created-index')
+        self.assertEqual(kwargs['KeyConditionExpression'],
+                         '#partition = :partition and #created BETWEEN :created_after AND :created_before')
+        self.assertIn('#size >= :min_size', kwargs['FilterExpression'])
+        self.assertEqual(kwargs['Limit'], 200)  # size filter: bigger pages
+        self.assertIsNone(next_token)
+
+    def test_parse_ranges(self):
+        self.assertEqual(parse_ranges({}), {})
+        self.assertEqual(parse_ranges({'created_after': '2025-10-09', 'created_before': '1760054400000',
+                                       'max_size': '1024'}),
+                         {'created_after': 1759968000000, 'created_before': 1760054400000, 'max_size': 1024})
+        for params in ({'created_after': 'yesterday'}, {'min_size': 'big'},
+                       {'created_after': '2025-10-09', 'created_before': '2025-10-01'}):
+            with self.assertRaises(ValueError):
+                parse_ranges(params)
+
+    @patch('lambda_function.list_owner_images')
+    @patch('lambda_function.list_recent_images')
+    def test_handler_routes_sort_and_owner(self, mock_list_recent_images, mock_list_owner_images):
+        mock_list_recent_images.return_value = mock_list_owner_images.return_value = ([], None)
+        self.assertEqual(lambda_handler({'queryStringParameters': {'sort': 'recent'}}, None)['statusCode'], 200)
+        mock_list_recent_images.assert_called_once()
+
+        event = {'queryStringParameters': {'owner': 'me'},
+                 'requestContext': {'authorizer': {'claims': {'sub': 'user-7'}}}}
+        self.assertEqual(lambda_handler(event, None)['statusCode'], 200)
+        self.assertEqual(mock_list_owner_images.call_args[0][0], 'user-7')
+
+        self.assertEqual(lambda_handler({'queryStringParameters': {'owner': 'me'}}, None)['statusCode'], 400)
+        self.assertEqual(lambda_handler({'queryStringParameters': {'sort': 'title'}}, None)['statusCode'], 400)
+
+    def test_parse_fields(self):
+        self.assertEqual(parse_fields(None), DEFAULT_FIELDS)
+        self.assertIsNone(parse_fields('all'))
+        self.assertEqual(parse_fields('title, derivatives,title'), ('image_id', 'title', 'derivatives'))
+        for bad in ('title,', 'derivatives[0]', 'a.b', ','.join(f'f{n}' for n in range(MAX_FIELDS))):
+            with self.assertRaises(ValueError):
+                parse_fields(bad)
+
+    def test_list_images_invalid_fields(self):
+        response = lambda_handler({'queryStringParameters': {'fields': 'title;drop'}}, None)
+        self.assertEqual(response['statusCode'], 400)
+
+    @patch('lambda_function.search_images')
+    def test_list_images_full_text_search(self, mock_search_images):
+        mock_search_images.return_value = ([{'image_id': '1', 'title': 'Sunset'}], None)
+        event = {
+            'queryStringParameters': {
+                'q': 'sunset beach',
+                'limit': '5'
+            }
+        }
+        response = lambda_handler(event, None)
+        self.assertEqual(response['statusCode'], 200)
+        body = json.loads(response['body'])
+        self.assertEqual(len(body['images']), 1)
+        mock_search_images.assert_called_once_with('sunset beach', limit=5, next_token=None, fields=DEFAULT_FIELDS)
+
+    @patch('lambda_function.search')
+    @patch('lambda_function.dynamodb')
+    def test_search_images_pages_ranked_results(self, mock_dynamodb, mock_search):
+        mock_search.return_value = [('b', 4), ('a', 3), ('c', 1)]
+        mock_dynamodb.batch_get_item.return_value = {
+            'Responses': {'images-metadata': [{'image_id': 'a'}, {'image_id': 'b'}]}
+        }
+        images, next_token = search_images('red car', limit=2)
+        # Ranking order is kept even though batch_get_item returns items unordered
+        self.assertEqual([image['image_id'] for image in images], ['b', 'a'])
+        self.assertEqual(decode_next_token(next_token), {'offset': 2})
+
+        mock_dynamodb.batch_get_item.return_value = {'Responses': {'images-metadata': [{'image_id': 'c'}]}}
+        images, next_token = search_images('red car', limit=2, next_token=next_token)
+        self.assertEqual([image['image_id'] for image in images], ['c'])
+        self.assertIsNone(next_token)
+
+    @patch('lambda_function.time')
+    @patch('lambda_function.search')
+    @patch('lambda_function.dynamodb')
+    def test_search_images_retries_unprocessed_keys(self, mock_dynamodb, mock_search, mock_time):
+        mock_search.return_value = [('a', 1), ('b', 1)]
+        mock_dynamodb.batch_get_item.side_effect = [
+            {'Responses': {'images-metadata': [{'image_id': 'a'}]},
+             'UnprocessedKeys': {'images-metadata': {'Keys': [{'image_id': 'b'}]}}},
+            {'Responses': {'images-metadata': [{'image_id': 'b'}]}}
+        ]
+        images, _ = search_images('red')
+        self.assertEqual([image['image_id'] for image in images], ['a', 'b'])
+        self.assertEqual(mock_dynamodb.batch_get_item.call_count, 2)
+
+    @patch('lambda_function.query_images')
+    def test_list_images_serializes_numbers(self, mock_query_images):
+        mock_query_images.return_value = ([{'image_id': '1', 'size_bytes': Decimal('42'), 'ratio': Decimal('1.5')}], None)
+        response = lambda_handler({'queryStringParameters': None}, None)
+        self.assertEqual(response['statusCode'], 200)
+        body = json.loads(response['body'])
+        self.assertEqual(body['images'][0]['size_bytes'], 42)
+        self.assertEqual(body['images'][0]['ratio'], 1.5)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+import sys
+import json
+import base64
+
+# Shared modules ship as a Lambda layer; make them importable for local runs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'layer', 'python'))
+
+from similar_images import similar_images_handler, parse_query
+from similarity_index import MultiIndexHash, hash_hex
+
+
+def index_of(hashes):
+    index = MagicMock()
+    structure = MultiIndexHash()
+    for image_id, value in hashes.items():
+        structure.add(image_id, value)
+    index.search.side_effect = structure.search
+    return index
+
+
+class TestSimilarImages(unittest.TestCase):
+
+    def test_parse_query(self):
+        self.assertEqual(parse_query({'queryStringParameters': {'image_id': 'a'}}), ('image_id', 'a'))
+        self.assertEqual(parse_query({'queryStringParameters': {'hash': hash_hex(5)}}), ('hash', 5))
+        body = json.dumps({'image_file': base64.b64encode(b'bytes').decode('ascii')})
+        self.assertEqual(parse_query({'body': body}), ('image', b'bytes'))
+        for event in ({}, {'queryStringParameters': {'hash': 'xyz'}}, {'body': 'not json'},
+                      {'body': json.dumps({'image_file': '***'})}):
+            with self.assertRaises(ValueError):
+                parse_query(event)
+
+    @patch('similar_images.get_images_by_ids')
+    @patch('similar_images.cached_index')
+    def test_similar_to_an_image_id(self, mock_cached_index, mock_get_images_by_ids):
+        mock_cached_index.return_value = index_of({'a': 0, 'b': 0b1, 'c': 0b111, 'd': 0xffff, 'e': 0b11})
+
+        def get_images(image_ids, fields=None):
+            if fields == ('image_id', 'phash'):
+                return [{'image_id': 'a', 'phash': hash_hex(0)}]
+            rows = {'b': {'image_id': 'b', 'title': 'B'}, 'c': {'image_id': 'c', 'title': 'C'},
+                    'e': {'image_id': 'e', 'title': 'E', 'status': 'pending'}}
+            return [rows[image_id] for image_id in image_ids if image_id in rows]
+        mock_get_images_by_ids.side_effect = get_images
+
+        response = similar_images_handler({'queryStringParameters': {'image_id': 'a', 'distance': '3',
+                                                                     'limit': '2'}}, None)
+        self.assertEqual(response['statusCode'], 200)
+        body = json.loads(response['body'])
+        # The query image itself is left out and the pending upload is dropped
+        self.assertEqual(body['images'], [{'image_id': 'b', 'title': 'B', 'distance': 1}])
+        self.assertEqual(mock_get_images_by_ids.call_args[1]['fields'], ('image_id', 'title', 'description', 'status'))
+
+        response = similar_images_handler({'queryStringParameters': {'image_id': 'a', 'distance': '3', 'limit': '2',
+                                                                     'next_token': body['next_token']}}, None)
+        body = json.loads(response['body'])
+        self.assertEqual(body['images'], [{'image_id': 'c', 'title': 'C', 'distance': 3}])
+        self.assertIsNone(body['next_token'])
+
+    @patch('similar_images.get_images_by_ids')
+    def test_image_id_not_found_or_not_hashed(self, mock_get_images_by_ids):
+        mock_get_images_by_ids.return_value = []
+        event = {'queryStringParameters': {'image_id': 'a'}}
+        self.assertEqual(similar_images_handler(event, None)['statusCode'], 404)
+        mock_get_images_by_ids.return_value = [{'image_id': 'a'}]
+        self.assertEqual(similar_images_handler(event, None)['statusCode'], 409)
+
+    @patch('similar_images.dhash')
+    @patch('similar_images.get_images_by_ids')
+    @patch('similar_images.cached_index')
+    def test_query_image(self, mock_cached_index, mock_get_images_by_ids, mock_dhash):
+        mock_cached_index.return_value = index_of({'a': 0b10})
+        mock_get_images_by_ids.return_value = [{'image_id': 'a', 'status': 'active'}]
+        mock_dhash.return_value = 0
+        event = {'body': json.dumps({'image_file': base64.b64encode(b'image').decode('ascii')}),
+                 'queryStringParameters': {'fields': 'all'}}
+        body = json.loads(similar_images_handler(event, None)['body'])
+        mock_dhash.assert_called_once_with(b'image')
+        self.assertEqual(body['hash'], hash_hex(0))
+        self.assertEqual(body['images'], [{'image_id': 'a', 'status': 'active', 'distance': 1}])
+
+        mock_dhash.side_effect = ValueError('cannot decode image')
+        self.assertEqual(similar_images_handler(event, None)['statusCode'], 400)
+
+    def test_rejects_bad_parameters(self):
+        for params in ({'hash': hash_hex(1), 'distance': '65'}, {'hash': hash_hex(1), 'limit': '0'},
+                       {'hash': hash_hex(1), 'distance': 'x'}):
+            self.assertEqual(similar_images_handler({'queryStringParameters': params}, None)['statusCode'], 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
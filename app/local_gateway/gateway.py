@@ -0,0 +1,506 @@
+"""
+Local HTTP front end for the image API, without a Lambda emulator.
+
+    python app/local_gateway/gateway.py --port 8080 --workers 32 --limits upload=8,batch_upload=2
+
+An asyncio server that routes the API Gateway paths in README.md (/upload,
+/images, /image/{image_id}, ...) to the functions' handlers in-process. It
+builds API-Gateway-shaped (REST, proxy integration) events, runs each
+handler on a thread pool of --workers threads (boto3 calls block) and turns
+its result back into an HTTP response. AWS calls go wherever the handlers'
+clients point, e.g. AWS_ENDPOINT_URL=http://localhost:4566 for LocalStack.
+
+HTTP/1.1 with keep-alive (and HTTP/1.0 with Connection: keep-alive).
+Request bodies are read from the socket as they arrive, with
+Content-Length or chunked transfer encoding and Expect: 100-continue, up to
+--max-body-mb. A request only starts reading its body once its route has a
+free slot, so a saturated upload route does not buffer queued bodies.
+
+Each route admits at most its limit of concurrent requests (--limits
+name=n, else --default-limit); the others wait up to --queue-timeout
+seconds for a slot and then get 429 with Retry-After, as API Gateway
+throttling would. GET /_gateway/stats returns in-flight, queued, completed
+and throttled counts per route.
+
+The handlers' clients share AWS_MAX_POOL_CONNECTIONS connections per
+service; it defaults to --workers here so every handler thread gets one.
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import base64
+import signal
+import asyncio
+import argparse
+import importlib.util
+from http import HTTPStatus
+from urllib.parse import urlsplit, unquote, parse_qsl
+from concurrent.futures import ThreadPoolExecutor
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAYER_DIR = os.path.join(APP_DIR, 'layer', 'python')
+
+DEFAULT_LIMIT = int(os.environ.get('GATEWAY_DEFAULT_LIMIT', 64))
+QUEUE_TIMEOUT_SECONDS = float(os.environ.get('GATEWAY_QUEUE_TIMEOUT_SECONDS', 5))
+MAX_BODY_BYTES = int(os.environ.get('GATEWAY_MAX_BODY_MB', 64)) * 1024 * 1024
+MAX_HEADER_BYTES = 64 * 1024
+KEEP_ALIVE_SECONDS = float(os.environ.get('GATEWAY_KEEP_ALIVE_SECONDS', 15))
+BODY_CHUNK_BYTES = 256 * 1024
+HANDLER_TIMEOUT_MS = 30000  # what get_remaining_time_in_millis counts down from
+
+# Bodies of these types reach the handlers base64-encoded, like API Gateway
+# binary media types; upload_image decodes multipart bodies itself
+BINARY_CONTENT_TYPES = ('multipart/', 'image/', 'application/octet-stream')
+
+class Route(object):
+    """One method and path template, e.g. GET /image/{image_id}, and the handler serving it."""
+    def __init__(self, name, method, path, function_name, module_name='lambda_function',
+                 handler_name='lambda_handler'):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.function_name = function_name
+        self.module_name = module_name
+        self.handler_name = handler_name
+        self.pattern = re.compile('^' + re.sub(r'\{(\w+)\}', r'(?P<\1>[^/]+)', path) + '$')
+        self.handler = None
+
+    def match(self, path):
+        found = self.pattern.match(path)
+        return None if found is None else {name: unquote(value) for name, value in found.groupdict().items()}
+
+ROUTES = [
+    Route('upload', 'POST', '/upload', 'upload_image'),
+    Route('presign', 'POST', '/upload/presign', 'upload_image', 'presigned_upload', 'create_upload_handler'),
+    Route('finalize', 'POST', '/upload/{image_id}/finalize', 'upload_image', 'presigned_upload',
+          'finalize_upload_handler'),
+    Route('batch_upload', 'POST', '/images/batch', 'upload_image', 'batch_upload', 'batch_upload_handler'),
+    Route('list', 'GET', '/images', 'list_images'),
+    Route('similar', 'GET', '/images/similar', 'list_images', 'similar_images', 'similar_images_handler'),
+    Route('similar', 'POST', '/images/similar', 'list_images', 'similar_images', 'similar_images_handler'),
+    Route('batch_view', 'POST', '/images/view', 'view_images', 'batch_view', 'batch_view_handler'),
+    Route('batch_delete', 'DELETE', '/images', 'delete_images', 'batch_delete', 'batch_delete_handler'),
+    Route('view', 'GET', '/image/{image_id}', 'view_images'),
+    Route('status', 'GET', '/image/{image_id}/status', 'view_images', handler_name='status_handler'),
+    Route('transform', 'GET', '/image/{image_id}/transform', 'view_images', 'transform_image', 'transform_handler'),
+    Route('delete', 'DELETE', '/image/{image_id}', 'delete_images')
+]
+
+def load_function(function_name, module_names):
+    """
+    Imports one function's modules; returns {module_name: module}. Every
+    function has its own lambda_function.py and the batch modules import
+    from it by that name, so while a function loads, `lambda_function`
+    resolves to its own copy; each module is registered under a unique
+    name (`upload_image_batch_upload`).
+    """
+    if LAYER_DIR not in sys.path:
+        # Shared modules ship as a Lambda layer; make them importable for local runs
+        sys.path.insert(0, LAYER_DIR)
+    function_dir = os.path.join(APP_DIR, function_name)
+    saved = sys.modules.pop('lambda_function', None)
+    sys.path.insert(0, function_dir)
+    modules = {}
+    try:
+        for module_name in ['lambda_function'] + sorted(set(module_names) - {'lambda_function'}):
+            spec = importlib.util.spec_from_file_location(f'{function_name}_{module_name}',
+                                                          os.path.join(function_dir, f'{module_name}.py'))
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[spec.name] = module
+            if module_name == 'lambda_function':
+                sys.modules['lambda_function'] = module
+            spec.loader.exec_module(module)
+            modules[module_name] = module
+    finally:
+        sys.path.remove(function_dir)
+        sys.modules.pop('lambda_function', None)
+        if saved is not None:
+            sys.modules['lambda_function'] = saved
+    return modules
+
+# Import every route's handler, one function at a time
+def load_routes(routes):
+    modules_by_function = {}
+    for route in routes:
+        modules_by_function.setdefault(route.function_name, set()).add(route.module_name)
+    loaded = {name: load_function(name, modules) for name, modules in modules_by_function.items()}
+    for route in routes:
+        route.handler = getattr(loaded[route.function_name][route.module_name], route.handler_name)
+    return routes
+
+class Context(object):
+    """The parts of the Lambda context object the handlers use."""
+    def __init__(self, function_name, request_id):
+        self.function_name = function_name
+        self.aws_request_id = request_id
+        self.deadline = time.monotonic() + HANDLER_TIMEOUT_MS / 1000.0
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self.deadline - time.monotonic()) * 1000))
+
+class Request(object):
+    def __init__(self, method, target, version, headers):
+        self.method = method
+        self.version = version
+        self.headers = headers  # [(name, value)] in arrival order
+        parts = urlsplit(target)
+        self.path = unquote(parts.path) or '/'
+        self.raw_path = parts.path or '/'
+        self.query = parse_qsl(parts.query, keep_blank_values=True)
+        self.body = b''
+
+    def header(self, name):
+        name = name.lower()
+        for key, value in reversed(self.headers):
+            if key.lower() == name:
+                return value
+        return None
+
+    def keep_alive(self):
+        connection = (self.header('Connection') or '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+class HttpError(Exception):
+    def __init__(self, status, message, close=True):
+        super(HttpError, self).__init__(message)
+        self.status = status
+        self.close = close
+
+# Header names as Title-Case, so the handlers' headers.get('Content-Type')
+# lookups match whatever case the client sent
+def canonical_header(name):
+    return '-'.join(part.capitalize() for part in name.split('-'))
+
+def build_event(route, request, path_parameters, peer=None, request_id=None):
+    """An API Gateway REST proxy-integration event for the request."""
+    headers, multi_headers = {}, {}
+    for name, value in request.headers:
+        name = canonical_header(name)
+        headers[name] = value
+        multi_headers.setdefault(name, []).append(value)
+    query, multi_query = {}, {}
+    for name, value in request.query:
+        query[name] = value
+        multi_query.setdefault(name, []).append(value)
+
+    content_type = (headers.get('Content-Type') or '').lower()
+    body, is_base64 = None, False
+    if request.body:
+        if content_type.startswith(BINARY_CONTENT_TYPES):
+            body, is_base64 = base64.b64encode(request.body).decode('ascii'), True
+        else:
+            try:
+                body = request.body.decode('utf-8')
+            except UnicodeDecodeError:
+                body, is_base64 = base64.b64encode(request.body).decode('ascii'), True
+
+    return {
+        'resource': route.path,
+        'path': request.path,
+        'httpMethod': request.method,
+        'headers': headers or None,
+        'multiValueHeaders': multi_headers or None,
+        'queryStringParameters': query or None,
+        'multiValueQueryStringParameters': multi_query or None,
+        'pathParameters': path_parameters or None,
+        'stageVariables': None,
+        'requestContext': {
+            'resourcePath': route.path,
+            'httpMethod': request.method,
+            'path': request.path,
+            'stage': 'local',
+            'requestId': request_id or str(uuid.uuid4()),
+            'requestTimeEpoch': int(time.time() * 1000),
+            'identity': {'sourceIp': peer}
+        },
+        'body': body,
+        'isBase64Encoded': is_base64
+    }
+
+# (status, [(name, value)], body bytes) from a handler's result
+def parse_result(result):
+    if not isinstance(result, dict) or not isinstance(result.get('statusCode'), int):
+        return 502, [('Content-Type', 'application/json')], json.dumps({'message': 'Internal server error'}).encode()
+    headers = [(name, str(value)) for name, value in (result.get('headers') or {}).items()]
+    for name, values in (result.get('multiValueHeaders') or {}).items():
+        headers.extend((name, str(value)) for value in values)
+    if not any(name.lower() == 'content-type' for name, _ in headers):
+        headers.append(('Content-Type', 'application/json'))
+    body = result.get('body') or ''
+    if result.get('isBase64Encoded'):
+        body = base64.b64decode(body)
+    elif isinstance(body, str):
+        body = body.encode('utf-8')
+    return result['statusCode'], headers, body
+
+def json_response(status, body, headers=()):
+    return status, [('Content-Type', 'application/json')] + list(headers), json.dumps(body).encode('utf-8')
+
+async def read_head(reader, timeout):
+    """The next request's line and headers, or None when the client closed the connection."""
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout)
+    except asyncio.IncompleteReadError as e:
+        if e.partial.strip():
+            raise HttpError(400, 'Incomplete request head')
+        return None
+    except asyncio.LimitOverrunError:
+        raise HttpError(431, 'Request header fields too large')
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, version = lines[0].split(' ')
+    except ValueError:
+        raise HttpError(400, 'Malformed request line')
+    if version not in ('HTTP/1.0', 'HTTP/1.1'):
+        raise HttpError(505, 'HTTP version not supported')
+    headers = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, separator, value = line.partition(':')
+        if not separator or not name or name != name.strip():
+            raise HttpError(400, 'Malformed header line')
+        headers.append((name, value.strip()))
+    return Request(method, target, version, headers)
+
+async def read_body(reader, writer, request, max_bytes):
+    """Reads the request body as it arrives (Content-Length or chunked)."""
+    transfer_encoding = (request.header('Transfer-Encoding') or '').lower()
+    length = request.header('Content-Length')
+    if transfer_encoding and transfer_encoding != 'chunked':
+        raise HttpError(501, 'Unsupported transfer encoding')
+    if not transfer_encoding:
+        try:
+            length = int(length or 0)
+        except ValueError:
+            raise HttpError(400, 'Invalid Content-Length')
+        if length < 0:
+            raise HttpError(400, 'Invalid Content-Length')
+        if length > max_bytes:
+            raise HttpError(413, 'Request body too large')
+
+    if (request.header('Expect') or '').lower() == '100-continue' and request.version == 'HTTP/1.1':
+        writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+        await writer.drain()
+
+    chunks = []
+    try:
+        if not transfer_encoding:
+            remaining = length
+            while remaining:
+                chunk = await reader.read(min(remaining, BODY_CHUNK_BYTES))
+                if not chunk:
+                    raise HttpError(400, 'Incomplete request body')
+                chunks.append(chunk)
+                remaining -= len(chunk)
+        else:
+            received = 0
+            while True:
+                size_line = await reader.readuntil(b'\r\n')
+                try:
+                    size = int(size_line.split(b';', 1)[0].strip(), 16)
+                except ValueError:
+                    raise HttpError(400, 'Invalid chunk size')
+                if size == 0:
+                    # Skip trailers up to the blank line
+                    while (await reader.readuntil(b'\r\n')) != b'\r\n':
+                        pass
+                    break
+                received += size
+                if received > max_bytes:
+                    raise HttpError(413, 'Request body too large')
+                chunks.append(await reader.readexactly(size))
+                if await reader.readexactly(2) != b'\r\n':
+                    raise HttpError(400, 'Invalid chunk terminator')
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        raise HttpError(400, 'Incomplete request body')
+    request.body = b''.join(chunks)
+
+def encode_response(status, headers, body, keep_alive, head_only=False):
+    try:
+        reason = HTTPStatus(status).phrase
+    except ValueError:
+        reason = ''
+    lines = [f'HTTP/1.1 {status} {reason}']
+    lines.extend(f'{name}: {value}' for name, value in headers if name.lower() not in ('content-length', 'connection'))
+    lines.append(f'Content-Length: {len(body)}')
+    lines.append('Connection: ' + ('keep-alive' if keep_alive else 'close'))
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + (b'' if head_only else body)
+
+class RouteLimit(object):
+    """Concurrency slots of one route and its counters."""
+    def __init__(self, limit):
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+        self.in_flight = self.queued = self.completed = self.throttled = 0
+
+    def stats(self):
+        return {'limit': self.limit, 'in_flight': self.in_flight, 'queued': self.queued,
+                'completed': self.completed, 'throttled': self.throttled}
+
+class Gateway(object):
+    def __init__(self, routes, limits=None, default_limit=DEFAULT_LIMIT, queue_timeout=QUEUE_TIMEOUT_SECONDS,
+                 max_body_bytes=MAX_BODY_BYTES, keep_alive_seconds=KEEP_ALIVE_SECONDS, executor=None):
+        self.routes = routes
+        self.limit_config = dict(limits or {})
+        self.default_limit = default_limit
+        self.queue_timeout = queue_timeout
+        self.max_body_bytes = max_body_bytes
+        self.keep_alive_seconds = keep_alive_seconds
+        self.executor = executor
+        self.limits = {}
+
+    def limit_for(self, route):
+        found = self.limits.get(route.name)
+        if found is None:
+            found = self.limits[route.name] = RouteLimit(self.limit_config.get(route.name, self.default_limit))
+        return found
+
+    # (route, path parameters), or an HttpError for unknown paths and methods
+    def resolve(self, request):
+        allowed = []
+        for route in self.routes:
+            path_parameters = route.match(request.raw_path)
+            if path_parameters is None:
+                continue
+            if route.method == request.method:
+                return route, path_parameters
+            allowed.append(route.method)
+        if allowed:
+            raise HttpError(405, 'Method not allowed', close=False)
+        raise HttpError(404, 'Not found', close=False)
+
+    async def invoke(self, route, request, path_parameters, peer):
+        request_id = str(uuid.uuid4())
+        event = build_event(route, request, path_parameters, peer=peer, request_id=request_id)
+        context = Context(route.function_name, request_id)
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self.executor, route.handler, event, context)
+        except Exception as e:
+            print(f'{route.name}: handler raised {type(e).__name__}: {e}', file=sys.stderr)
+            result = None
+        return parse_result(result)
+
+    async def handle(self, reader, writer, request, peer):
+        """Serves one request; returns (status, headers, body, close)."""
+        if request.method == 'GET' and request.path == '/_gateway/stats':
+            stats = {name: limit.stats() for name, limit in sorted(self.limits.items())}
+            return json_response(200, stats) + (False,)
+        try:
+            route, path_parameters = self.resolve(request)
+        except HttpError as e:
+            # The body of a rejected request is still read so the connection can be reused
+            await read_body(reader, writer, request, self.max_body_bytes)
+            return json_response(e.status, {'message': str(e)}) + (False,)
+
+        limit = self.limit_for(route)
+        limit.queued += 1
+        try:
+            await asyncio.wait_for(limit.semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            limit.throttled += 1
+            # The unread body makes the connection unusable; the client reconnects
+            return json_response(429, {'message': 'Too Many Requests'},
+                                 [('Retry-After', str(max(1, int(self.queue_timeout))))]) + (True,)
+        finally:
+            limit.queued -= 1
+        limit.in_flight += 1
+        try:
+            await read_body(reader, writer, request, self.max_body_bytes)
+            return await self.invoke(route, request, path_parameters, peer) + (False,)
+        finally:
+            limit.in_flight -= 1
+            limit.completed += 1
+            limit.semaphore.release()
+
+    async def serve_connection(self, reader, writer):
+        peer = (writer.get_extra_info('peername') or ('', None))[0]
+        try:
+            while True:
+                try:
+                    request = await read_head(reader, self.keep_alive_seconds)
+                except asyncio.TimeoutError:
+                    return  # idle keep-alive connection
+                if request is None:
+                    return
+                keep_alive = request.keep_alive()
+                try:
+                    status, headers, body, close = await self.handle(reader, writer, request, peer)
+                except HttpError as e:
+                    (status, headers, body), close = json_response(e.status, {'message': str(e)}), e.close
+                keep_alive = keep_alive and not close
+                writer.write(encode_response(status, headers, body, keep_alive, head_only=request.method == 'HEAD'))
+                await writer.drain()
+                if not keep_alive:
+                    return
+        except HttpError as e:
+            writer.write(encode_response(*json_response(e.status, {'message': str(e)}), keep_alive=False))
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host, port):
+        return await asyncio.start_server(self.serve_connection, host, port, limit=MAX_HEADER_BYTES)
+
+def parse_limits(value):
+    limits = {}
+    names = {route.name for route in ROUTES}
+    for part in filter(None, value.split(',')):
+        name, _, count = part.partition('=')
+        if name not in names:
+            raise argparse.ArgumentTypeError(f'unknown route {name}; use {", ".join(sorted(names))}')
+        try:
+            limits[name] = int(count)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f'limit of {name} must be a number')
+        if limits[name] < 1:
+            raise argparse.ArgumentTypeError(f'limit of {name} must be at least 1')
+    return limits
+
+async def serve(args):
+    executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix='handler')
+    gateway = Gateway(load_routes(ROUTES), limits=args.limits, default_limit=args.default_limit,
+                      queue_timeout=args.queue_timeout, max_body_bytes=args.max_body_mb * 1024 * 1024,
+                      executor=executor)
+    server = await gateway.start(args.host, args.port)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, stop.set)
+    print(f"Serving {len(ROUTES)} routes on http://{args.host}:{args.port} with {args.workers} handler threads",
+          file=sys.stderr)
+    async with server:
+        await stop.wait()
+    executor.shutdown(wait=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the image API handlers over HTTP without a Lambda emulator.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=32, help='handler threads')
+    parser.add_argument('--limits', type=parse_limits, default={},
+                        help='per-route concurrency, e.g. upload=8,list=64')
+    parser.add_argument('--default-limit', type=int, default=DEFAULT_LIMIT, help='concurrency of other routes')
+    parser.add_argument('--queue-timeout', type=float, default=QUEUE_TIMEOUT_SECONDS,
+                        help='seconds a request waits for a slot before 429')
+    parser.add_argument('--max-body-mb', type=int, default=MAX_BODY_BYTES // (1024 * 1024))
+    parser.add_argument('--endpoint-url', default=None, help='AWS endpoint, e.g. http://localhost:4566')
+    args = parser.parse_args(argv)
+
+    if args.endpoint_url:
+        os.environ['AWS_ENDPOINT_URL'] = args.endpoint_url
+    # Read by aws_clients when the handlers import it
+    os.environ.setdefault('AWS_MAX_POOL_CONNECTIONS', str(args.workers))
+    asyncio.run(serve(args))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+import unittest
+import os
+import sys
+import json
+import base64
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Shared modules ship as a Lambda layer; make them importable for local runs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'layer', 'python'))
+
+import gateway
+from gateway import Gateway, Route, Request, build_event, parse_result, load_routes
+
+
+def echo_handler(event, context):
+    return {'statusCode': 200, 'body': json.dumps({
+        'path': event['path'],
+        'pathParameters': event['pathParameters'],
+        'query': event['queryStringParameters'],
+        'body': event['body'],
+        'isBase64Encoded': event['isBase64Encoded'],
+        'contentType': (event['headers'] or {}).get('Content-Type'),
+        'function': context.function_name
+    })}
+
+
+def routes(handlers=None):
+    handlers = handlers or {}
+    table = [Route('upload', 'POST', '/upload', 'upload_image'),
+             Route('list', 'GET', '/images', 'list_images'),
+             Route('view', 'GET', '/image/{image_id}', 'view_images'),
+             Route('delete', 'DELETE', '/image/{image_id}', 'delete_images')]
+    for route in table:
+        route.handler = handlers.get(route.name, echo_handler)
+    return table
+
+
+async def exchange(port, payload, responses=1):
+    """Sends raw bytes and reads back that many responses; returns [(status, headers, body)]."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(payload)
+    await writer.drain()
+    found = []
+    try:
+        for _ in range(responses):
+            found.append(await read_response(reader))
+    finally:
+        writer.close()
+    return found
+
+
+async def read_response(reader):
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+    status = int(head[0].split(' ')[1])
+    headers = {name.lower(): value.strip() for name, _, value in (line.partition(':') for line in head[1:] if line)}
+    body = await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers, body
+
+
+class TestEvents(unittest.TestCase):
+
+    def test_route_matching(self):
+        table = routes()
+        self.assertEqual(table[2].match('/image/abc%20d'), {'image_id': 'abc d'})
+        self.assertIsNone(table[2].match('/image/a/b'))
+        self.assertEqual(table[1].match('/images'), {})
+
+    def test_build_event(self):
+        request = Request('POST', '/upload?title=A&tag=x&tag=y', 'HTTP/1.1',
+                          [('content-type', 'multipart/form-data; boundary=b'), ('x-trace', '1')])
+        request.body = b'\xff\x00binary'
+        event = build_event(routes()[0], request, {}, peer='10.0.0.1', request_id='r-1')
+        self.assertEqual(event['headers']['Content-Type'], 'multipart/form-data; boundary=b')
+        self.assertEqual(event['queryStringParameters'], {'title': 'A', 'tag': 'y'})
+        self.assertEqual(event['multiValueQueryStringParameters']['tag'], ['x', 'y'])
+        self.assertTrue(event['isBase64Encoded'])
+        self.assertEqual(base64.b64decode(event['body']), request.body)
+        self.assertIsNone(event['pathParameters'])
+        self.assertEqual(event['requestContext']['requestId'], 'r-1')
+        self.assertEqual(event['requestContext']['identity']['sourceIp'], '10.0.0.1')
+
+        request = Request('GET', '/image/a', 'HTTP/1.1', [('Content-Type', 'application/json')])
+        request.body = b'{"a": 1}'
+        event = build_event(routes()[2], request, {'image_id': 'a'})
+        self.assertEqual((event['body'], event['isBase64Encoded']), ('{"a": 1}', False))
+        self.assertEqual(event['resource'], '/image/{image_id}')
+        self.assertIsNone(event['queryStringParameters'])
+
+    def test_parse_result(self):
+        status, headers, body = parse_result({'statusCode': 200, 'isBase64Encoded': True, 'body': 'aGk=',
+                                              'headers': {'Content-Type': 'image/png'},
+                                              'multiValueHeaders': {'Set-Cookie': ['a=1', 'b=2']}})
+        self.assertEqual((status, body), (200, b'hi'))
+        self.assertEqual(headers, [('Content-Type', 'image/png'), ('Set-Cookie', 'a=1'), ('Set-Cookie', 'b=2')])
+        self.assertEqual(parse_result({'statusCode': 204})[1], [('Content-Type', 'application/json')])
+        self.assertEqual(parse_result(None)[0], 502)
+
+    def test_load_routes_imports_each_function_once(self):
+        previous = sys.modules.get('lambda_function')
+        table = load_routes([Route(route.name, route.method, route.path, route.function_name, route.module_name,
+                                   route.handler_name) for route in gateway.ROUTES])
+        self.assertTrue(all(callable(route.handler) for route in table))
+        by_name = {route.name: route for route in table}
+        # Each companion module sees its own function's lambda_function
+        batch_upload = sys.modules['upload_image_batch_upload']
+        self.assertIs(batch_upload.s3, sys.modules['upload_image_lambda_function'].s3)
+        similar = sys.modules['list_images_similar_images']
+        self.assertIs(similar.get_images_by_ids, sys.modules['list_images_lambda_function'].get_images_by_ids)
+        self.assertEqual(by_name['view'].handler.__module__, 'view_images_lambda_function')
+        self.assertIs(by_name['status'].handler, sys.modules['view_images_lambda_function'].status_handler)
+        self.assertIs(sys.modules.get('lambda_function'), previous)
+
+
+class TestGateway(unittest.TestCase):
+
+    def serve(self, gateway_instance, client):
+        """Runs the gateway on an ephemeral port and the client coroutine against it."""
+        async def run():
+            server = await gateway_instance.start('127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                return await client(port)
+        executor = ThreadPoolExecutor(max_workers=8)
+        gateway_instance.executor = executor
+        try:
+            return asyncio.run(run())
+        finally:
+            executor.shutdown(wait=True)
+
+    def test_keep_alive_and_path_parameters(self):
+        payload = (b'GET /image/abc?fields=all HTTP/1.1\r\nHost: x\r\n\r\n'
+                   b'GET /images HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n')
+        (first, second) = self.serve(Gateway(routes()), lambda port: exchange(port, payload, 2))
+        self.assertEqual(first[0], 200)
+        self.assertEqual(first[1]['connection'], 'keep-alive')
+        body = json.loads(first[2])
+        self.assertEqual((body['pathParameters'], body['query'], body['function']),
+                         ({'image_id': 'abc'}, {'fields': 'all'}, 'view_images'))
+        self.assertEqual(second[1]['connection'], 'close')
+        self.assertEqual(json.loads(second[2])['path'], '/images')
+
+    def test_chunked_and_expect_continue(self):
+        chunked = (b'POST /upload HTTP/1.1\r\nContent-Type: text/plain\r\nTransfer-Encoding: chunked\r\n\r\n'
+                   b'5\r\nhello\r\n6;ext=1\r\n world\r\n0\r\nX-Trailer: 1\r\n\r\n')
+        (status, _, body), = self.serve(Gateway(routes()), lambda port: exchange(port, chunked))
+        self.assertEqual((status, json.loads(body)['body']), (200, 'hello world'))
+
+        async def expect_continue(port):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'POST /upload HTTP/1.1\r\nContent-Type: image/png\r\nContent-Length: 3\r\n'
+                         b'Expect: 100-continue\r\n\r\n')
+            await writer.drain()
+            interim = await reader.readuntil(b'\r\n\r\n')
+            writer.write(b'\x89PN')
+            found = await read_response(reader)
+            writer.close()
+            return interim, found
+        interim, (status, _, body) = self.serve(Gateway(routes()), expect_continue)
+        self.assertTrue(interim.startswith(b'HTTP/1.1 100'))
+        body = json.loads(body)
+        self.assertTrue(body['isBase64Encoded'])
+        self.assertEqual(base64.b64decode(body['body']), b'\x89PN')
+
+    def test_errors(self):
+        def failing(event, context):
+            raise RuntimeError('boom')
+        payload = (b'GET /nowhere HTTP/1.1\r\n\r\n'
+                   b'POST /images HTTP/1.1\r\nContent-Length: 2\r\n\r\n{}'
+                   b'DELETE /image/a HTTP/1.1\r\n\r\n'
+                   b'POST /upload HTTP/1.1\r\nContent-Length: 100\r\n\r\n')
+        responses = self.serve(Gateway(routes({'delete': failing}), max_body_bytes=10),
+                               lambda port: exchange(port, payload, 4))
+        self.assertEqual([status for status, _, _ in responses], [404, 405, 502, 413])
+        self.assertEqual(responses[3][1]['connection'], 'close')
+
+        (status, _, _), = self.serve(Gateway(routes()), lambda port: exchange(port, b'NONSENSE\r\n\r\n'))
+        self.assertEqual(status, 400)
+
+    def test_route_limit_throttles(self):
+        started, release = threading.Event(), threading.Event()
+
+        def slow(event, context):
+            started.set()
+            release.wait(5)
+            return {'statusCode': 200, 'body': '{}'}
+
+        instance = Gateway(routes({'upload': slow}), limits={'upload': 1}, queue_timeout=0.2)
+
+        async def client(port):
+            first = asyncio.ensure_future(exchange(port, b'POST /upload HTTP/1.1\r\nContent-Length: 0\r\n\r\n'))
+            await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+            throttled = await exchange(port, b'POST /upload HTTP/1.1\r\nContent-Length: 0\r\n\r\n')
+            # Other routes keep their own slots
+            other = await exchange(port, b'GET /images HTTP/1.1\r\n\r\n')
+            stats = await exchange(port, b'GET /_gateway/stats HTTP/1.1\r\n\r\n')
+            release.set()
+            return (await first)[0], throttled[0], other[0], json.loads(stats[0][2])
+
+        first, throttled, other, stats = self.serve(instance, client)
+        self.assertEqual(first[0], 200)
+        self.assertEqual(throttled[0], 429)
+        self.assertEqual(throttled[1]['retry-after'], '1')
+        self.assertEqual(other[0], 200)
+        self.assertEqual(stats['upload'], {'limit': 1, 'in_flight': 1, 'queued': 0, 'completed': 0,
+                                           'throttled': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
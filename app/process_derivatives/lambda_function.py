@@ -0,0 +1,242 @@
+import os
+import io
+import json
+from urllib.parse import unquote_plus
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from aws_clients import lazy_client, lazy_dynamodb
+from metadata_cache import shared_store, invalidate
+from image_sniff import image_id_for_original
+from similarity_index import SIMILARITY_LOG_TABLE_NAME, image_hash, hash_hex, record_change
+from request_metrics import instrument, phase
+
+# Pillow is packaged with this function; of the others list_images may carry
+# it, to hash query images for similar-image search, and view_images, to serve
+# transforms
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = ImageOps = None
+
+S3_BUCKET_NAME = 'image-bucket-madhu'
+DYNAMODB_TABLE_NAME = 'images-metadata'
+
+# Longest edge in pixels, and output formats, of every derivative
+DERIVATIVE_SIZES = [int(size) for size in os.environ.get('DERIVATIVE_SIZES', '128,512,1024').split(',')]
+DERIVATIVE_FORMATS = os.environ.get('DERIVATIVE_FORMATS', 'jpeg,webp').split(',')
+DERIVATIVE_QUALITY = int(os.environ.get('DERIVATIVE_QUALITY', 82))
+# Lambda has no /dev/shm for multiprocessing, so decode in-process there and
+# use one process per core on regular workers
+DEFAULT_WORKERS = 1 if os.environ.get('AWS_LAMBDA_FUNCTION_NAME') else (os.cpu_count() or 1)
+DERIVATIVE_WORKERS = int(os.environ.get('DERIVATIVE_WORKERS', DEFAULT_WORKERS))
+IO_THREADS = 8
+
+FORMAT_EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp', 'png': 'png'}
+FORMAT_CONTENT_TYPES = {'jpeg': 'image/jpeg', 'webp': 'image/webp', 'png': 'image/png'}
+
+s3 = lazy_client('s3')
+dynamodb = lazy_dynamodb()
+
+def derivative_key(image_id, size, image_format):
+    return f'derivatives/{image_id}/{size}.{FORMAT_EXTENSIONS[image_format]}'
+
+def decode_original(data, largest):
+    image = Image.open(io.BytesIO(data))
+    # Let the JPEG decoder downscale by up to 8x while decoding when the
+    # largest derivative is much smaller than the original
+    image.draft('RGB', (largest, largest))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    return image
+
+def render_sizes(image, sizes, formats, quality):
+    results = []
+    current = image
+    for size in sizes:
+        if size >= max(image.size):
+            continue
+        # Each size is resized from the previous (larger) one, not the original
+        current = current.copy()
+        current.thumbnail((size, size), Image.LANCZOS)
+        for image_format in formats:
+            output = io.BytesIO()
+            current.save(output, format=image_format.upper(), quality=quality)
+            results.append((size, image_format, output.getvalue(), current.width, current.height))
+    return results
+
+def render_derivatives(data, sizes=None, formats=None, quality=DERIVATIVE_QUALITY):
+    """
+    Decodes an image once and encodes it at every configured size/format.
+
+    Returns [(size, format, encoded_bytes, width, height), ...]. Sizes at or
+    above the original's longest edge are skipped (no upscaling). Runs in
+    worker processes, so it only takes and returns plain data.
+    """
+    if Image is None:
+        raise Exception('Pillow is required to render derivatives')
+    sizes = sorted(sizes or DERIVATIVE_SIZES, reverse=True)
+    return render_sizes(decode_original(data, sizes[0]), sizes, formats or DERIVATIVE_FORMATS, quality)
+
+# Derivatives plus the perceptual hash (16 hex digits) from a single decode
+def render_image(data):
+    if Image is None:
+        raise Exception('Pillow is required to render derivatives')
+    sizes = sorted(DERIVATIVE_SIZES, reverse=True)
+    image = decode_original(data, sizes[0])
+    return render_sizes(image, sizes, DERIVATIVE_FORMATS, DERIVATIVE_QUALITY), hash_hex(image_hash(image))
+
+# S3 key of the original when the caller has none (direct invocations);
+# content-addressed uploads record it in metadata
+def original_key(image_id):
+    table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+    try:
+        item = table.get_item(Key={'image_id': image_id}, ProjectionExpression='s3_key').get('Item') or {}
+    except ClientError as e:
+        raise Exception(f"Error retrieving metadata from DynamoDB: {str(e)}")
+    return item.get('s3_key') or f'{image_id}.jpg'
+
+def download_original(image_id, key=None):
+    try:
+        return s3.get_object(Bucket=S3_BUCKET_NAME, Key=key or original_key(image_id))['Body'].read()
+    except ClientError as e:
+        raise Exception(f"Error downloading image from S3: {str(e)}")
+
+def upload_derivative(image_id, size, image_format, data):
+    key = derivative_key(image_id, size, image_format)
+    try:
+        s3.put_object(Bucket=S3_BUCKET_NAME, Key=key, Body=data, ContentType=FORMAT_CONTENT_TYPES[image_format])
+        return key
+    except ClientError as e:
+        raise Exception(f"Error uploading derivative to S3: {str(e)}")
+
+# Record the derivatives (and perceptual hash) on the image's metadata item,
+# if it still exists
+def save_derivatives_to_dynamodb(image_id, derivatives, phash=None):
+    table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+    values = {':derivatives': derivatives}
+    update_expression = 'SET derivatives = :derivatives'
+    if phash:
+        update_expression += ', phash = :phash'
+        values[':phash'] = phash
+    try:
+        table.update_item(
+            Key={'image_id': image_id},
+            UpdateExpression=update_expression,
+            ConditionExpression='attribute_exists(image_id)',
+            ExpressionAttributeValues=values
+        )
+        return True
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            return False  # Deleted while we were rendering
+        raise Exception(f"Error saving derivatives to DynamoDB: {str(e)}")
+
+# Upload one image's renders and record them with its hash; returns the
+# derivative list
+def store_derivatives(image_id, renders, io_pool, phash=None):
+    uploads = [io_pool.submit(upload_derivative, image_id, size, image_format, data)
+               for size, image_format, data, _, _ in renders]
+    derivatives = []
+    for (size, image_format, data, width, height), upload in zip(renders, uploads):
+        derivatives.append({
+            'size': size,
+            'format': image_format,
+            'key': upload.result(),
+            'width': width,
+            'height': height,
+            'bytes': len(data)
+        })
+    if save_derivatives_to_dynamodb(image_id, derivatives, phash):
+        # Cached copies predate the derivatives
+        invalidate(shared_store(), image_id)
+        if phash:
+            # Similarity indexes in other containers pick the hash up from the log
+            record_change(dynamodb.Table(SIMILARITY_LOG_TABLE_NAME), image_id, phash)
+    return derivatives
+
+def process_batch(image_ids, workers=DERIVATIVE_WORKERS, keys=None):
+    """
+    Generates derivatives for a batch of images. S3/DynamoDB I/O runs on a
+    thread pool while decoding/encoding runs on a process pool, so every
+    core stays busy. keys maps image_ids to their originals' S3 keys where
+    known (looked up in metadata otherwise). Returns
+    {image_id: derivatives or {'error': message}}.
+    """
+    keys = keys or {}
+    results = {}
+    with ThreadPoolExecutor(max_workers=IO_THREADS) as io_pool:
+        downloads = {image_id: io_pool.submit(download_original, image_id, keys.get(image_id))
+                     for image_id in image_ids}
+
+        cpu_pool = None
+        if workers > 1:
+            # Imported here: multiprocessing is never loaded inside Lambda (workers=1)
+            from concurrent.futures import ProcessPoolExecutor
+
+            cpu_pool = ProcessPoolExecutor(max_workers=workers)
+        try:
+            renders = {}
+            for image_id, download in downloads.items():
+                try:
+                    data = download.result()
+                except Exception as e:
+                    results[image_id] = {'error': str(e)}
+                    continue
+                if cpu_pool:
+                    renders[image_id] = cpu_pool.submit(render_image, data)
+                else:
+                    try:
+                        with phase('render'):
+                            renders[image_id] = render_image(data)
+                    except Exception as e:
+                        results[image_id] = {'error': f"Error rendering derivatives: {str(e)}"}
+
+            for image_id, render in renders.items():
+                try:
+                    rendered, phash = render.result() if cpu_pool else render
+                    results[image_id] = store_derivatives(image_id, rendered, io_pool, phash)
+                except Exception as e:
+                    results[image_id] = {'error': str(e)}
+        finally:
+            if cpu_pool:
+                cpu_pool.shutdown()
+    return results
+
+# {image_id: S3 key of the original} from an S3 ObjectCreated event, or
+# {image_id: None} from a direct {"image_ids": [...]} invocation. The event's
+# key is used as is: it may arrive before the metadata row is written.
+# Content-addressed blobs (blobs/{sha256}) are shared by several image_ids and
+# are skipped; those images need a direct invocation
+def originals_from_event(event):
+    if 'image_ids' in event:
+        return dict.fromkeys(event['image_ids'])
+    originals = {}
+    for record in event.get('Records', []):
+        key = unquote_plus(record['s3']['object']['key'])
+        # Originals are stored as {image_id}.{extension of their format} at the bucket root
+        image_id = image_id_for_original(key)
+        if image_id:
+            originals[image_id] = key
+    return originals
+
+# Lambda handler to generate derivatives for newly uploaded images
+@instrument('process_derivatives')
+def lambda_handler(event, context):
+    try:
+        originals = originals_from_event(event)
+        results = process_batch(list(originals), keys=originals)
+        failed = [image_id for image_id, result in results.items() if isinstance(result, dict)]
+        return {
+            'statusCode': 500 if failed else 200,
+            'body': json.dumps({
+                'message': 'Derivatives generated' if not failed else 'Some derivatives failed',
+                'results': results
+            })
+        }
+
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'message': str(e)})
+        }
@@ -0,0 +1,103 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import io
+import os
+import sys
+import json
+
+# Shared modules ship as a Lambda layer; make them importable for local runs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'layer', 'python'))
+
+from lambda_function import (lambda_handler, render_derivatives, render_image, process_batch, originals_from_event,
+                             Image)
+from similarity_index import dhash, parse_hash, hamming
+
+
+def jpeg_bytes(width, height):
+    output = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 80, 20)).save(output, format='JPEG')
+    return output.getvalue()
+
+
+@unittest.skipIf(Image is None, 'Pillow is not installed')
+class TestRenderDerivatives(unittest.TestCase):
+
+    def test_renders_every_size_and_format(self):
+        renders = render_derivatives(jpeg_bytes(1600, 800), sizes=[128, 512], formats=['jpeg', 'webp'])
+        self.assertEqual([(size, image_format) for size, image_format, _, _, _ in renders],
+                         [(512, 'jpeg'), (512, 'webp'), (128, 'jpeg'), (128, 'webp')])
+        size, _, data, width, height = renders[0]
+        self.assertEqual((width, height), (512, 256))
+        self.assertEqual(Image.open(io.BytesIO(data)).size, (512, 256))
+
+    def test_does_not_upscale(self):
+        renders = render_derivatives(jpeg_bytes(300, 200), sizes=[128, 512], formats=['jpeg'])
+        self.assertEqual([size for size, _, _, _, _ in renders], [128])
+
+    def test_render_image_hashes_the_decoded_original(self):
+        image = Image.linear_gradient('L').resize((1200, 900)).convert('RGB')
+        output = io.BytesIO()
+        image.save(output, format='JPEG')
+        renders, phash = render_image(output.getvalue())
+        self.assertTrue(renders)
+        # Same hash as hashing the file on its own, up to JPEG draft-scaling noise
+        self.assertLessEqual(hamming(parse_hash(phash), dhash(output.getvalue())), 2)
+
+
+class TestProcessDerivatives(unittest.TestCase):
+
+    def test_originals_from_s3_event(self):
+        event = {'Records': [{'s3': {'object': {'key': 'abc.jpg'}}},
+                             {'s3': {'object': {'key': 'derivatives/abc/128.jpg'}}},
+                             {'s3': {'object': {'key': 'def.png'}}},
+                             # Shared content-addressed blobs need a direct invocation
+                             {'s3': {'object': {'key': 'blobs/' + 'ab' * 32}}}]}
+        self.assertEqual(originals_from_event(event), {'abc': 'abc.jpg', 'def': 'def.png'})
+        self.assertEqual(originals_from_event({'image_ids': ['x', 'y']}), {'x': None, 'y': None})
+
+    @patch('lambda_function.render_image')
+    @patch('lambda_function.dynamodb')
+    @patch('lambda_function.s3')
+    def test_event_key_is_downloaded_without_metadata(self, mock_s3, mock_dynamodb, mock_render_image):
+        mock_s3.get_object.return_value = {'Body': io.BytesIO(b'original')}
+        mock_render_image.return_value = ([], None)
+        # The row is not written yet
+        mock_dynamodb.Table.return_value.get_item.return_value = {}
+
+        lambda_handler({'Records': [{'s3': {'object': {'key': 'abc.png'}}}]}, None)
+
+        mock_s3.get_object.assert_called_once_with(Bucket='image-bucket-madhu', Key='abc.png')
+        mock_dynamodb.Table.return_value.get_item.assert_not_called()
+
+    @patch('lambda_function.render_image')
+    @patch('lambda_function.dynamodb')
+    @patch('lambda_function.s3')
+    def test_process_batch_uploads_and_records(self, mock_s3, mock_dynamodb, mock_render_image):
+        mock_s3.get_object.return_value = {'Body': io.BytesIO(b'original')}
+        mock_dynamodb.Table.return_value.get_item.return_value = {'Item': {'s3_key': 'blobs/123'}}
+        mock_render_image.return_value = ([(128, 'webp', b'small', 128, 64)], '00ff00ff00ff00ff')
+
+        results = process_batch(['abc'], workers=1)
+
+        mock_s3.get_object.assert_called_once_with(Bucket='image-bucket-madhu', Key='blobs/123')
+        self.assertEqual(results['abc'], [{'size': 128, 'format': 'webp', 'key': 'derivatives/abc/128.webp',
+                                           'width': 128, 'height': 64, 'bytes': 5}])
+        mock_s3.put_object.assert_called_once_with(Bucket='image-bucket-madhu', Key='derivatives/abc/128.webp',
+                                                   Body=b'small', ContentType='image/webp')
+        kwargs = mock_dynamodb.Table.return_value.update_item.call_args[1]
+        self.assertEqual(kwargs['ExpressionAttributeValues'][':derivatives'], results['abc'])
+        self.assertEqual(kwargs['ExpressionAttributeValues'][':phash'], '00ff00ff00ff00ff')
+        # The new hash is appended to the similarity log
+        logged = mock_dynamodb.Table.return_value.put_item.call_args[1]['Item']
+        self.assertEqual((logged['image_id'], logged['phash']), ('abc', '00ff00ff00ff00ff'))
+
+    @patch('lambda_function.process_batch')
+    def test_lambda_handler_reports_failures(self, mock_process_batch):
+        mock_process_batch.return_value = {'abc': {'error': 'Error downloading image from S3: missing'}}
+        response = lambda_handler({'image_ids': ['abc']}, None)
+        self.assertEqual(response['statusCode'], 500)
+        self.assertIn('abc', json.loads(response['body'])['results'])
+
+
+if __name__ == '__main__':
+    unittest.main()
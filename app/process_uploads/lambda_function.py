@@ -0,0 +1,238 @@
+"""
+Worker for uploads queued by upload_image (UPLOAD_ASYNC_PROCESSING=true).
+
+upload_image stores the bytes at {image_id}.{ext}, writes a "queued" row and
+sends {"image_id", "s3_key"} to the upload queue. This function consumes the
+queue (SQS event source mapping with ReportBatchItemFailures, or drain() on
+the in-process LocalQueue), runs UPLOAD_WORKER_CONCURRENCY jobs of a batch at
+a time and moves each row queued -> processing -> active (or failed).
+
+Jobs can be delivered more than once. The image_id is the idempotency key:
+a worker only starts a job after a conditional update claims the row with
+a lease, and a job whose row is already active or failed is acknowledged
+without doing anything.
+"""
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from aws_clients import lazy_client, lazy_dynamodb
+from search_index import SEARCH_INDEX_TABLE_NAME, index_image
+from blob_store import BLOB_TABLE_NAME, blob_key, acquire_blob, mark_blob_uploaded, release_blob
+from metadata_cache import shared_store, invalidate
+from job_queue import upload_queue
+from request_metrics import instrument
+
+S3_BUCKET_NAME = 'image-bucket-madhu'
+DYNAMODB_TABLE_NAME = 'images-metadata'
+# Same setting as upload_image: store each distinct file once under blobs/{sha256}
+CONTENT_ADDRESSED_STORAGE = os.environ.get('CONTENT_ADDRESSED_STORAGE', 'false').lower() == 'true'
+WORKER_CONCURRENCY = int(os.environ.get('UPLOAD_WORKER_CONCURRENCY', 4))
+# A claimed job another worker may take over once the lease runs out
+LEASE_SECONDS = int(os.environ.get('UPLOAD_WORKER_LEASE_SECONDS', 300))
+MAX_ATTEMPTS = int(os.environ.get('UPLOAD_MAX_ATTEMPTS', 5))
+
+STATUS_QUEUED = 'queued'
+STATUS_PROCESSING = 'processing'
+STATUS_ACTIVE = 'active'
+STATUS_FAILED = 'failed'
+
+# Outcomes of one job
+DONE = 'done'
+DUPLICATE = 'duplicate'
+FAILED = 'failed'
+RETRY = 'retry'
+
+s3 = lazy_client('s3')
+dynamodb = lazy_dynamodb()
+
+class RetryLater(Exception):
+    pass
+
+def is_conditional_check_failure(error):
+    return error.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException'
+
+# Claim a queued row (or one whose lease expired); returns the claimed item,
+# or None when the row is not claimable
+def claim(image_id, now):
+    table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+    try:
+        return table.update_item(
+            Key={'image_id': image_id},
+            UpdateExpression='SET #status = :processing, lease_until = :lease ADD attempts :one',
+            ConditionExpression='#status = :queued or (#status = :processing and lease_until < :now)',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':processing': STATUS_PROCESSING, ':queued': STATUS_QUEUED,
+                                       ':lease': int(now) + LEASE_SECONDS, ':now': int(now), ':one': 1},
+            ReturnValues='ALL_NEW'
+        )['Attributes']
+    except ClientError as e:
+        if is_conditional_check_failure(e):
+            return None
+        raise Exception(f"Error claiming upload job: {str(e)}")
+
+def get_row(image_id):
+    try:
+        return dynamodb.Table(DYNAMODB_TABLE_NAME).get_item(Key={'image_id': image_id}, ConsistentRead=True).get('Item')
+    except ClientError as e:
+        raise Exception(f"Error retrieving metadata from DynamoDB: {str(e)}")
+
+# Move the staged bytes into place; returns the attributes to record
+def store_upload(item, staged_key):
+    image_id = item['image_id']
+    if CONTENT_ADDRESSED_STORAGE and item.get('content_sha256'):
+        # An earlier attempt already stored the blob and removed the staged copy
+        return {'s3_key': blob_key(item['content_sha256'])}
+
+    try:
+        if not CONTENT_ADDRESSED_STORAGE:
+            size = s3.head_object(Bucket=S3_BUCKET_NAME, Key=staged_key)['ContentLength']
+            if not size:
+                raise ValueError('uploaded file is empty')
+            return {'s3_key': staged_key, 'size_bytes': size}
+
+        data = s3.get_object(Bucket=S3_BUCKET_NAME, Key=staged_key)['Body'].read()
+        if not data:
+            raise ValueError('uploaded file is empty')
+        content_sha256 = hashlib.sha256(data).hexdigest()
+        key = blob_key(content_sha256)
+        blob_table = dynamodb.Table(BLOB_TABLE_NAME)
+        must_upload = acquire_blob(blob_table, content_sha256, len(data))
+        try:
+            if must_upload:
+                s3.copy_object(Bucket=S3_BUCKET_NAME, Key=key,
+                               CopySource={'Bucket': S3_BUCKET_NAME, 'Key': staged_key})
+                mark_blob_uploaded(blob_table, content_sha256)
+            # Recorded before the staged copy goes, so a retry after this point
+            # neither takes a second reference nor needs the staged bytes
+            dynamodb.Table(DYNAMODB_TABLE_NAME).update_item(
+                Key={'image_id': image_id},
+                UpdateExpression='SET content_sha256 = :sha',
+                ExpressionAttributeValues={':sha': content_sha256}
+            )
+        except Exception:
+            # The retry acquires the blob again; give this attempt's reference back
+            if release_blob(blob_table, content_sha256):
+                s3.delete_object(Bucket=S3_BUCKET_NAME, Key=key)
+            raise
+        s3.delete_object(Bucket=S3_BUCKET_NAME, Key=staged_key)
+        return {'s3_key': key, 'content_sha256': content_sha256, 'size_bytes': len(data)}
+    except ClientError as e:
+        raise Exception(f"Error storing uploaded image: {str(e)}")
+
+# Mark a claimed row active and index it
+def complete(item, attributes, now):
+    image_id = item['image_id']
+    names = {'#status': 'status'}
+    values = {':active': STATUS_ACTIVE, ':processing': STATUS_PROCESSING, ':now': int(now)}
+    assignments = ['#status = :active', 'processed_at = :now']
+    for number, (name, value) in enumerate(sorted(attributes.items())):
+        names[f'#a{number}'] = name
+        values[f':a{number}'] = value
+        assignments.append(f'#a{number} = :a{number}')
+    try:
+        dynamodb.Table(DYNAMODB_TABLE_NAME).update_item(
+            Key={'image_id': image_id},
+            UpdateExpression='SET ' + ', '.join(assignments) + ' REMOVE lease_until',
+            ConditionExpression='#status = :processing',
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+    except ClientError as e:
+        if is_conditional_check_failure(e):
+            raise RetryLater(f'{image_id} is no longer claimed by this worker')
+        raise Exception(f"Error saving metadata to DynamoDB: {str(e)}")
+
+    # Keep the title/description search index in sync
+    index_image(dynamodb.Table(SEARCH_INDEX_TABLE_NAME), image_id, item.get('title'), item.get('description'))
+    invalidate(shared_store(), image_id)
+
+# Give a failed attempt back to the queue, or give up after MAX_ATTEMPTS
+# (at once for invalid uploads, which no retry fixes)
+def release(item, error):
+    final = isinstance(error, ValueError) or item.get('attempts', 1) >= MAX_ATTEMPTS
+    try:
+        dynamodb.Table(DYNAMODB_TABLE_NAME).update_item(
+            Key={'image_id': item['image_id']},
+            UpdateExpression='SET #status = :status, #error = :error REMOVE lease_until',
+            ConditionExpression='#status = :processing',
+            ExpressionAttributeNames={'#status': 'status', '#error': 'error'},
+            ExpressionAttributeValues={':status': STATUS_FAILED if final else STATUS_QUEUED,
+                                       ':processing': STATUS_PROCESSING, ':error': str(error)}
+        )
+    except ClientError as e:
+        if not is_conditional_check_failure(e):
+            raise Exception(f"Error saving metadata to DynamoDB: {str(e)}")
+    return FAILED if final else RETRY
+
+# Run one job; returns DONE, DUPLICATE, FAILED or RETRY (deliver again later)
+def handle_job(body, now=None):
+    now = time.time() if now is None else now
+    image_id = body['image_id']
+    item = claim(image_id, now)
+    if item is None:
+        row = get_row(image_id)
+        if row is None or row.get('status') in (STATUS_ACTIVE, STATUS_FAILED):
+            return DUPLICATE  # already handled, or the image was deleted
+        return RETRY  # another worker holds the lease
+
+    try:
+        attributes = store_upload(item, body.get('s3_key') or f'{image_id}.jpg')
+        complete(item, attributes, now)
+        return DONE
+    except RetryLater:
+        return RETRY
+    except Exception as e:
+        print(json.dumps({'upload_job': image_id, 'error': str(e), 'attempts': int(item.get('attempts', 1))}))
+        return release(item, e)
+
+# Run jobs ({job_id: body}) on up to WORKER_CONCURRENCY threads; returns {job_id: outcome}
+def process_jobs(jobs, concurrency=None):
+    if not jobs:
+        return {}
+
+    def run(body):
+        try:
+            return handle_job(body)
+        except Exception as e:
+            print(json.dumps({'upload_job': body.get('image_id'), 'error': str(e)}))
+            return RETRY
+
+    with ThreadPoolExecutor(max_workers=min(concurrency or WORKER_CONCURRENCY, len(jobs))) as executor:
+        outcomes = executor.map(run, jobs.values())
+        return dict(zip(jobs.keys(), outcomes))
+
+# Poll a queue (the in-process LocalQueue by default) until it is empty or
+# max_batches batches ran; returns {outcome: count}
+def drain(queue=None, batch_size=10, max_batches=None, concurrency=None):
+    queue = queue or upload_queue()
+    counts = {}
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        jobs = queue.receive(batch_size)
+        if not jobs:
+            break
+        outcomes = process_jobs({job.job_id: job.body for job in jobs}, concurrency)
+        queue.delete([job for job in jobs if outcomes[job.job_id] != RETRY])
+        for outcome in outcomes.values():
+            counts[outcome] = counts.get(outcome, 0) + 1
+        batches += 1
+    return counts
+
+# Lambda handler for the SQS event source mapping. Jobs to retry are reported
+# as batch item failures, so only they are delivered again.
+@instrument('process_uploads')
+def lambda_handler(event, context):
+    records = event.get('Records') or []
+    jobs = {}
+    for record in records:
+        try:
+            jobs[record['messageId']] = json.loads(record['body'])
+        except (KeyError, ValueError):
+            print(json.dumps({'upload_job': record.get('messageId'), 'error': 'malformed job body'}))
+    outcomes = process_jobs(jobs)
+    failures = [{'itemIdentifier': job_id} for job_id, outcome in outcomes.items() if outcome == RETRY]
+    print(json.dumps({'upload_jobs': len(records), 'retry': len(failures)}))
+    return {'batchItemFailures': failures}
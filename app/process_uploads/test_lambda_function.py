@@ -0,0 +1,121 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+import sys
+import json
+from botocore.exceptions import ClientError
+
+# Shared modules ship as a Lambda layer; make them importable for local runs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'layer', 'python'))
+
+from lambda_function import lambda_handler, handle_job, drain, DONE, DUPLICATE, FAILED, RETRY
+from job_queue import LocalQueue
+
+NOW = 1700000000
+
+
+def conditional_check_failed(operation='UpdateItem'):
+    return ClientError({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'failed'}}, operation)
+
+
+class TestHandleJob(unittest.TestCase):
+
+    @patch('lambda_function.index_image')
+    @patch('lambda_function.s3')
+    @patch('lambda_function.dynamodb')
+    def test_claims_stores_and_completes(self, mock_dynamodb, mock_s3, mock_index_image):
+        table = mock_dynamodb.Table.return_value
+        table.update_item.side_effect = [
+            {'Attributes': {'image_id': 'img-1', 'title': 'Sunset', 'description': 'Beach', 'attempts': 1}}, {}
+        ]
+        mock_s3.head_object.return_value = {'ContentLength': 1024}
+
+        self.assertEqual(handle_job({'image_id': 'img-1', 's3_key': 'img-1.jpg'}, NOW), DONE)
+
+        claim, complete = table.update_item.call_args_list
+        self.assertEqual(claim[1]['ExpressionAttributeValues'][':lease'], NOW + 300)
+        values = complete[1]['ExpressionAttributeValues']
+        self.assertEqual(values[':active'], 'active')
+        self.assertIn(1024, values.values())
+        mock_index_image.assert_called_once_with(table, 'img-1', 'Sunset', 'Beach')
+
+    @patch('lambda_function.dynamodb')
+    def test_redelivered_job_is_a_duplicate(self, mock_dynamodb):
+        table = mock_dynamodb.Table.return_value
+        table.update_item.side_effect = conditional_check_failed()
+        table.get_item.return_value = {'Item': {'image_id': 'img-1', 'status': 'active'}}
+        self.assertEqual(handle_job({'image_id': 'img-1'}, NOW), DUPLICATE)
+
+        # Still leased by another worker: try again later
+        table.get_item.return_value = {'Item': {'image_id': 'img-1', 'status': 'processing'}}
+        self.assertEqual(handle_job({'image_id': 'img-1'}, NOW), RETRY)
+
+    @patch('lambda_function.MAX_ATTEMPTS', 2)
+    @patch('lambda_function.s3')
+    @patch('lambda_function.dynamodb')
+    def test_failed_attempts_retry_then_fail(self, mock_dynamodb, mock_s3):
+        table = mock_dynamodb.Table.return_value
+        mock_s3.head_object.side_effect = ClientError({'Error': {'Code': '500', 'Message': 'Internal'}}, 'HeadObject')
+
+        table.update_item.side_effect = [{'Attributes': {'image_id': 'img-1', 'attempts': 1}}, {}]
+        self.assertEqual(handle_job({'image_id': 'img-1'}, NOW), RETRY)
+        self.assertEqual(table.update_item.call_args[1]['ExpressionAttributeValues'][':status'], 'queued')
+
+        table.update_item.side_effect = [{'Attributes': {'image_id': 'img-1', 'attempts': 2}}, {}]
+        self.assertEqual(handle_job({'image_id': 'img-1'}, NOW), FAILED)
+        self.assertEqual(table.update_item.call_args[1]['ExpressionAttributeValues'][':status'], 'failed')
+
+    @patch('lambda_function.CONTENT_ADDRESSED_STORAGE', True)
+    @patch('lambda_function.release_blob')
+    @patch('lambda_function.mark_blob_uploaded')
+    @patch('lambda_function.acquire_blob')
+    @patch('lambda_function.s3')
+    @patch('lambda_function.dynamodb')
+    def test_failed_blob_copy_releases_its_reference(self, mock_dynamodb, mock_s3, mock_acquire_blob,
+                                                     mock_mark_blob_uploaded, mock_release_blob):
+        table = mock_dynamodb.Table.return_value
+        table.update_item.side_effect = [{'Attributes': {'image_id': 'img-1', 'attempts': 1}}, {}]
+        mock_s3.get_object.return_value = {'Body': MagicMock(read=MagicMock(return_value=b'bytes'))}
+        mock_s3.copy_object.side_effect = ClientError({'Error': {'Code': '500', 'Message': 'Internal'}}, 'CopyObject')
+        mock_acquire_blob.return_value = True
+        mock_release_blob.return_value = True
+
+        self.assertEqual(handle_job({'image_id': 'img-1', 's3_key': 'staging/img-1'}, NOW), RETRY)
+        mock_release_blob.assert_called_once()
+        mock_mark_blob_uploaded.assert_not_called()
+        # Nothing else holds the blob: whatever was copied goes too, the staged bytes stay for the retry
+        deleted = [call[1]['Key'] for call in mock_s3.delete_object.call_args_list]
+        self.assertEqual(len(deleted), 1)
+        self.assertTrue(deleted[0].startswith('blobs/'))
+
+    @patch('lambda_function.s3')
+    @patch('lambda_function.dynamodb')
+    def test_empty_upload_fails_without_retrying(self, mock_dynamodb, mock_s3):
+        table = mock_dynamodb.Table.return_value
+        table.update_item.side_effect = [{'Attributes': {'image_id': 'img-1', 'attempts': 1}}, {}]
+        mock_s3.head_object.return_value = {'ContentLength': 0}
+        self.assertEqual(handle_job({'image_id': 'img-1'}, NOW), FAILED)
+
+
+class TestWorker(unittest.TestCase):
+
+    @patch('lambda_function.handle_job')
+    def test_handler_reports_retries_as_batch_item_failures(self, mock_handle_job):
+        mock_handle_job.side_effect = lambda body: {'a': DONE, 'b': RETRY, 'c': DUPLICATE}[body['image_id']]
+        event = {'Records': [{'messageId': f'm-{image_id}', 'body': json.dumps({'image_id': image_id})}
+                             for image_id in 'abc']}
+        self.assertEqual(lambda_handler(event, None), {'batchItemFailures': [{'itemIdentifier': 'm-b'}]})
+
+    @patch('lambda_function.handle_job')
+    def test_drain_deletes_finished_jobs(self, mock_handle_job):
+        mock_handle_job.side_effect = lambda body: RETRY if body['image_id'] == 'img-3' else DONE
+        queue = LocalQueue(visibility_timeout=60)
+        for number in range(5):
+            queue.send({'image_id': f'img-{number}'})
+
+        self.assertEqual(drain(queue, batch_size=2, concurrency=2), {DONE: 4, RETRY: 1})
+        self.assertEqual(len(queue), 1)  # invisible until its timeout, then redelivered
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,364 @@
+"""
+Reconciles S3 objects with images-metadata rows.
+
+Uploads write S3 before DynamoDB and deletes remove the row before the
+object, so a failure between the two steps leaves an orphaned object or a
+dangling row. This job streams the bucket listing (already sorted by key)
+and a parallel scan of the metadata table, sorts the rows by their object
+key in bounded-size runs spilled to disk, and merge-joins the two sorted
+streams. Memory stays at one run plus one listing page however large the
+catalog is.
+
+Findings are logged one JSON line each. With repair enabled, each one is
+re-checked right before acting on it (the live system keeps writing while
+the job runs):
+
+    orphan object      original or blob with no row: deleted after the grace period
+    orphan derivatives derivatives/{image_id}/ with no row: deleted after the grace period
+    dangling row       active row whose object is missing: row deleted, with its
+                       search postings, derivatives and blob reference
+    unknown object     key that no row could point at: reported only
+
+Invoke with {"prefix": "3"} (or {"prefixes": ["0", ..., "f", "blobs/"]}) to
+reconcile one key range at a time, and "repair": true to fix what is found.
+"""
+import os
+import json
+import time
+import heapq
+import tempfile
+from botocore.exceptions import ClientError
+from aws_clients import lazy_client, lazy_dynamodb
+from bulk_scan import scan_items
+from search_index import SEARCH_INDEX_TABLE_NAME, remove_image
+from blob_store import BLOB_TABLE_NAME, BLOB_KEY_PREFIX, release_blob
+from metadata_cache import shared_store, tombstone
+from image_sniff import image_id_for_original
+from request_metrics import instrument
+
+S3_BUCKET_NAME = 'image-bucket-madhu'
+DYNAMODB_TABLE_NAME = 'images-metadata'
+DERIVATIVE_PREFIX = 'derivatives/'
+# Key of originals whose row has no s3_key (written before keys followed the format)
+ORIGINAL_SUFFIX = '.jpg'
+
+# Rows sorted in memory before a run is spilled to disk
+RUN_SIZE = int(os.environ.get('RECONCILE_RUN_SIZE', 100000))
+SCAN_SEGMENTS = int(os.environ.get('RECONCILE_SCAN_SEGMENTS', 8))
+# Objects younger than this may belong to an upload whose row is not written yet
+GRACE_SECONDS = int(os.environ.get('RECONCILE_GRACE_SECONDS', 3600))
+# Findings of each kind returned in the response (all of them are logged)
+SAMPLE_SIZE = 20
+# Stop starting new prefixes when less time than this is left
+MIN_REMAINING_MS = 60000
+
+s3 = lazy_client('s3')
+dynamodb = lazy_dynamodb()
+
+class SortedRuns(object):
+    """
+    External sort of tuples of strings: add() in any order, then iterate in
+    sorted order. At most run_size entries are held in memory; full runs are
+    sorted and spilled to temporary files, and iteration merges them.
+    """
+    def __init__(self, run_size=RUN_SIZE):
+        self.run_size = run_size
+        self.buffer = []
+        self.runs = []
+        self.count = 0
+
+    def add(self, entry):
+        self.buffer.append(entry)
+        self.count += 1
+        if len(self.buffer) >= self.run_size:
+            self.spill()
+
+    def spill(self):
+        self.buffer.sort()
+        run = tempfile.TemporaryFile(mode='w+', encoding='utf-8')
+        for entry in self.buffer:
+            run.write(json.dumps(entry, separators=(',', ':')))
+            run.write('\n')
+        run.seek(0)
+        self.runs.append(run)
+        self.buffer = []
+
+    def read_run(self, run):
+        for line in run:
+            yield tuple(json.loads(line))
+
+    def __iter__(self):
+        self.buffer.sort()
+        return heapq.merge(self.buffer, *[self.read_run(run) for run in self.runs])
+
+    def close(self):
+        for run in self.runs:
+            run.close()
+        self.runs = []
+        self.buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# Object key a metadata row points at
+def expected_key(item):
+    return item.get('s3_key') or f"{item['image_id']}{ORIGINAL_SUFFIX}"
+
+# image_id an original's key belongs to, or None for keys no row points at
+def image_id_for_key(key):
+    if key.startswith(BLOB_KEY_PREFIX):
+        return None
+    return image_id_for_original(key)
+
+# Stream (key, last_modified epoch seconds) for every object under prefix, in key order
+def list_objects(prefix):
+    paginator = s3.get_paginator('list_objects_v2')
+    try:
+        for page in paginator.paginate(Bucket=S3_BUCKET_NAME, Prefix=prefix):
+            for entry in page.get('Contents', []):
+                yield entry['Key'], entry['LastModified'].timestamp()
+    except ClientError as e:
+        raise Exception(f"Error listing S3 objects: {str(e)}")
+
+# Sorted runs of (object key, image_id, status) and of (image_id + '/',) for
+# every row under prefix. The '/' makes ids sort the way their derivative
+# keys do ('ab-c/' before 'ab/').
+def sort_metadata(prefix, originals, image_ids):
+    request = {
+        'ProjectionExpression': 'image_id, s3_key, #status',
+        'ExpressionAttributeNames': {'#status': 'status'}
+    }
+    if prefix:
+        request['FilterExpression'] = 'begins_with(image_id, :prefix) or begins_with(s3_key, :prefix)'
+        request['ExpressionAttributeValues'] = {':prefix': prefix}
+    try:
+        for item in scan_items(dynamodb.Table(DYNAMODB_TABLE_NAME), SCAN_SEGMENTS, request=request):
+            key = expected_key(item)
+            if key.startswith(prefix):
+                originals.add((key, item['image_id'], item.get('status', 'active')))
+            if item['image_id'].startswith(prefix):
+                image_ids.add((item['image_id'] + '/',))
+    except ClientError as e:
+        raise Exception(f"Error scanning DynamoDB: {str(e)}")
+
+# Merge-join sorted (key, last_modified) objects with sorted (key, image_id,
+# status) rows. Yields ('object', key, last_modified) for objects without a
+# row and ('row', key, (image_id, status)) for rows without an object.
+def merge_join(objects, rows):
+    objects = iter(objects)
+    rows = iter(rows)
+    current_object = next(objects, None)
+    current_row = next(rows, None)
+    while current_object is not None or current_row is not None:
+        if current_row is None or (current_object is not None and current_object[0] < current_row[0]):
+            yield 'object', current_object[0], current_object[1]
+            current_object = next(objects, None)
+        elif current_object is None or current_row[0] < current_object[0]:
+            yield 'row', current_row[0], current_row[1:]
+            current_row = next(rows, None)
+        else:
+            # Several rows may share one blob
+            key = current_row[0]
+            while current_row is not None and current_row[0] == key:
+                current_row = next(rows, None)
+            current_object = next(objects, None)
+
+# Group a sorted derivatives/ listing into ('{image_id}/', keys, newest last_modified)
+def group_derivatives(objects):
+    group_key, keys, newest = None, [], 0
+    for key, last_modified in objects:
+        image_id = key[len(DERIVATIVE_PREFIX):].split('/', 1)[0]
+        if image_id + '/' != group_key:
+            if group_key is not None:
+                yield group_key, keys, newest
+            group_key, keys, newest = image_id + '/', [], 0
+        keys.append(key)
+        newest = max(newest, last_modified)
+    if group_key is not None:
+        yield group_key, keys, newest
+
+class Report(object):
+    KINDS = ('orphan_objects', 'orphan_derivatives', 'dangling_rows', 'unknown_objects')
+
+    def __init__(self, prefix, repair):
+        self.prefix = prefix
+        self.repair = repair
+        self.counts = dict.fromkeys(self.KINDS + ('objects', 'rows', 'recent', 'repaired', 'skipped'), 0)
+        self.samples = {kind: [] for kind in self.KINDS}
+
+    def finding(self, kind, key, action, **details):
+        self.counts[kind] += 1
+        if action in ('repaired', 'skipped', 'recent'):
+            self.counts[action] += 1
+        entry = dict({'key': key, 'action': action}, **details)
+        if len(self.samples[kind]) < SAMPLE_SIZE:
+            self.samples[kind].append(entry)
+        print(json.dumps(dict({'reconcile': kind, 'prefix': self.prefix}, **entry)))
+
+    def as_dict(self):
+        return {'prefix': self.prefix, 'repair': self.repair, 'counts': self.counts, 'samples': self.samples}
+
+def row_exists(image_id):
+    try:
+        table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+        return 'Item' in table.get_item(Key={'image_id': image_id}, ConsistentRead=True,
+                                        ProjectionExpression='image_id')
+    except ClientError as e:
+        raise Exception(f"Error retrieving metadata from DynamoDB: {str(e)}")
+
+def object_exists(key):
+    try:
+        s3.head_object(Bucket=S3_BUCKET_NAME, Key=key)
+        return True
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise Exception(f"Error checking S3 object: {str(e)}")
+
+def delete_keys(keys):
+    try:
+        for start in range(0, len(keys), 1000):
+            objects = [{'Key': key} for key in keys[start:start + 1000]]
+            s3.delete_objects(Bucket=S3_BUCKET_NAME, Delete={'Objects': objects, 'Quiet': True})
+    except ClientError as e:
+        raise Exception(f"Error deleting S3 objects: {str(e)}")
+
+# Delete an orphaned original or blob unless a row appeared for it
+def repair_orphan_object(key):
+    if key.startswith(BLOB_KEY_PREFIX):
+        content_sha256 = key[len(BLOB_KEY_PREFIX):]
+        blob_table = dynamodb.Table(BLOB_TABLE_NAME)
+        try:
+            blob = blob_table.get_item(Key={'content_sha256': content_sha256}, ConsistentRead=True).get('Item')
+            if blob and blob.get('ref_count', 0) > 0:
+                return False  # An upload took a reference after the scan
+            delete_keys([key])
+            if blob:
+                blob_table.delete_item(Key={'content_sha256': content_sha256},
+                                       ConditionExpression='attribute_not_exists(ref_count) or ref_count <= :zero',
+                                       ExpressionAttributeValues={':zero': 0})
+        except ClientError as e:
+            raise Exception(f"Error repairing blob {content_sha256}: {str(e)}")
+        return True
+
+    if row_exists(image_id_for_key(key)):
+        return False
+    delete_keys([key])
+    return True
+
+# Delete a row whose object is gone, with everything that hangs off it
+def repair_dangling_row(image_id, key):
+    if object_exists(key):
+        return False
+    table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+    try:
+        old_item = table.delete_item(
+            Key={'image_id': image_id},
+            ConditionExpression='attribute_exists(image_id)',
+            ReturnValues='ALL_OLD'
+        ).get('Attributes')
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            return False
+        raise Exception(f"Error deleting metadata from DynamoDB: {str(e)}")
+
+    remove_image(dynamodb.Table(SEARCH_INDEX_TABLE_NAME), image_id, old_item.get('title'), old_item.get('description'))
+    tombstone(shared_store(), image_id)
+    delete_keys([derivative['key'] for derivative in old_item.get('derivatives') or []])
+    if old_item.get('content_sha256'):
+        release_blob(dynamodb.Table(BLOB_TABLE_NAME), old_item['content_sha256'])
+    return True
+
+# Delete derivatives whose image has no row, unless a row appeared for it
+def repair_orphan_derivatives(image_id, keys):
+    if row_exists(image_id):
+        return False
+    delete_keys(keys)
+    return True
+
+def resolve(report, kind, key, last_modified, now, repair_fn, *args):
+    if last_modified is not None and last_modified > now - GRACE_SECONDS:
+        report.finding(kind, key, 'recent')
+    elif not report.repair:
+        report.finding(kind, key, 'reported')
+    else:
+        report.finding(kind, key, 'repaired' if repair_fn(*args) else 'skipped')
+
+# Reconcile every object and row whose key starts with prefix
+def reconcile_prefix(prefix, repair=False, now=None):
+    now = time.time() if now is None else now
+    report = Report(prefix, repair)
+
+    def counted(objects):
+        for entry in objects:
+            report.counts['objects'] += 1
+            yield entry
+
+    with SortedRuns() as originals, SortedRuns() as image_ids:
+        sort_metadata(prefix, originals, image_ids)
+        report.counts['rows'] = originals.count
+
+        objects = (entry for entry in counted(list_objects(prefix)) if not entry[0].startswith(DERIVATIVE_PREFIX))
+        for side, key, value in merge_join(objects, originals):
+            if side == 'row':
+                image_id, status = value
+                if status == 'active':  # pending rows have no object until finalized
+                    resolve(report, 'dangling_rows', key, None, now, repair_dangling_row, image_id, key)
+            elif key.startswith(BLOB_KEY_PREFIX) or image_id_for_key(key):
+                resolve(report, 'orphan_objects', key, value, now, repair_orphan_object, key)
+            else:
+                report.finding('unknown_objects', key, 'reported')
+
+        if not prefix.startswith(BLOB_KEY_PREFIX):
+            derivatives = group_derivatives(counted(list_objects(DERIVATIVE_PREFIX + prefix)))
+            groups = ((group_key, (keys, newest)) for group_key, keys, newest in derivatives)
+            for side, group_key, value in merge_join(groups, image_ids):
+                if side == 'object':
+                    keys, newest = value
+                    image_id = group_key[:-1]
+                    resolve(report, 'orphan_derivatives', DERIVATIVE_PREFIX + group_key, newest, now,
+                            repair_orphan_derivatives, image_id, keys)
+
+    return report.as_dict()
+
+# Lambda handler (scheduled): reconcile each prefix in turn, handing back the
+# ones there was no time left for
+@instrument('reconcile_images')
+def lambda_handler(event, context):
+    try:
+        prefixes = event.get('prefixes')
+        if prefixes is None:
+            prefixes = [event.get('prefix') or '']
+        repair = event.get('repair') is True
+        if not isinstance(prefixes, list) or not all(isinstance(prefix, str) for prefix in prefixes) or \
+                any(prefix.startswith(DERIVATIVE_PREFIX) for prefix in prefixes):
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'message': 'prefixes must be a list of key prefixes outside derivatives/'})
+            }
+
+        reports = []
+        remaining = []
+        for position, prefix in enumerate(prefixes):
+            if reports and context is not None and context.get_remaining_time_in_millis() < MIN_REMAINING_MS:
+                remaining = prefixes[position:]
+                break
+            reports.append(reconcile_prefix(prefix, repair=repair))
+
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'message': 'Reconciliation complete' if not remaining else 'Reconciliation incomplete',
+                'reports': reports,
+                'remaining_prefixes': remaining
+            })
+        }
+
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'message': str(e)})
+        }
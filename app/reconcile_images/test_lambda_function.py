@@ -0,0 +1,127 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+import sys
+import json
+from botocore.exceptions import ClientError
+
+# Shared modules ship as a Lambda layer; make them importable for local runs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'layer', 'python'))
+
+from lambda_function import lambda_handler, reconcile_prefix, merge_join, group_derivatives, SortedRuns
+
+NOW = 1700000000
+OLD = NOW - 86400
+
+
+def scanned(*items):
+    return lambda table, segments, request=None: iter(items)
+
+
+def listing(objects):
+    return lambda prefix: iter([entry for entry in objects if entry[0].startswith(prefix)])
+
+
+class TestReconcile(unittest.TestCase):
+
+    def test_sorted_runs_spill_and_merge(self):
+        with SortedRuns(run_size=3) as runs:
+            for value in ['d', 'a', 'f', 'c', 'b', 'e', 'g']:
+                runs.add((value, value.upper()))
+            self.assertEqual(len(runs.runs), 2)
+            self.assertEqual([entry[0] for entry in runs], list('abcdefg'))
+            self.assertEqual(runs.count, 7)
+
+    def test_merge_join(self):
+        objects = [('a.jpg', 1), ('blobs/x', 2), ('c.jpg', 3)]
+        rows = [('a.jpg', 'a', 'active'), ('b.jpg', 'b', 'active'), ('blobs/x', 'd', 'active'),
+                ('blobs/x', 'e', 'active')]
+        self.assertEqual(list(merge_join(objects, rows)),
+                         [('row', 'b.jpg', ('b', 'active')), ('object', 'c.jpg', 3)])
+
+    def test_group_derivatives_sorts_like_ids(self):
+        objects = [('derivatives/ab-c/128.jpg', 1), ('derivatives/ab/128.jpg', 2), ('derivatives/ab/512.jpg', 5)]
+        self.assertEqual(list(group_derivatives(objects)),
+                         [('ab-c/', ['derivatives/ab-c/128.jpg'], 1),
+                          ('ab/', ['derivatives/ab/128.jpg', 'derivatives/ab/512.jpg'], 5)])
+
+    @patch('lambda_function.list_objects')
+    @patch('lambda_function.scan_items')
+    def test_report_finds_each_kind(self, mock_scan_items, mock_list_objects):
+        mock_scan_items.side_effect = scanned(
+            {'image_id': 'a', 's3_key': 'a.jpg'},
+            {'image_id': 'b'},  # object missing
+            {'image_id': 'p', 'status': 'pending'},  # not uploaded yet
+            {'image_id': 's', 's3_key': 'blobs/123'}
+        )
+        mock_list_objects.side_effect = listing([
+            ('a.jpg', OLD), ('blobs/123', OLD), ('blobs/456', OLD), ('derivatives/a/128.jpg', OLD),
+            ('derivatives/gone/128.jpg', OLD), ('new.jpg', NOW - 10), ('notes.txt', OLD), ('z.jpg', OLD)
+        ])
+
+        report = reconcile_prefix('', now=NOW)
+
+        counts = report['counts']
+        self.assertEqual((counts['rows'], counts['objects']), (4, 10))  # derivatives are listed twice
+        self.assertEqual([entry['key'] for entry in report['samples']['dangling_rows']], ['b.jpg'])
+        self.assertEqual([(entry['key'], entry['action']) for entry in report['samples']['orphan_objects']],
+                         [('blobs/456', 'reported'), ('new.jpg', 'recent'), ('z.jpg', 'reported')])
+        self.assertEqual([entry['key'] for entry in report['samples']['orphan_derivatives']], ['derivatives/gone/'])
+        self.assertEqual([entry['key'] for entry in report['samples']['unknown_objects']], ['notes.txt'])
+
+    @patch('lambda_function.release_blob')
+    @patch('lambda_function.remove_image')
+    @patch('lambda_function.s3')
+    @patch('lambda_function.dynamodb')
+    @patch('lambda_function.list_objects')
+    @patch('lambda_function.scan_items')
+    def test_repair(self, mock_scan_items, mock_list_objects, mock_dynamodb, mock_s3, mock_remove_image,
+                    mock_release_blob):
+        mock_scan_items.side_effect = scanned({'image_id': 'b', 's3_key': 'blobs/9'}, {'image_id': 'c'})
+        mock_list_objects.side_effect = listing([('c.jpg', OLD), ('z.jpg', OLD), ('derivatives/y/1.jpg', OLD)])
+        table = mock_dynamodb.Table.return_value
+        table.get_item.return_value = {}  # still no rows for z and y
+        table.delete_item.return_value = {'Attributes': {'image_id': 'b', 'title': 'Sunset', 'content_sha256': '9',
+                                                         'derivatives': [{'key': 'derivatives/b/128.jpg'}]}}
+        mock_s3.head_object.side_effect = ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, 'HeadObject')
+
+        report = reconcile_prefix('', repair=True, now=NOW)
+
+        self.assertEqual(report['counts']['repaired'], 3)
+        deleted = [call[1]['Delete']['Objects'] for call in mock_s3.delete_objects.call_args_list]
+        self.assertIn([{'Key': 'z.jpg'}], deleted)
+        self.assertIn([{'Key': 'derivatives/b/128.jpg'}], deleted)
+        self.assertIn([{'Key': 'derivatives/y/1.jpg'}], deleted)
+        self.assertEqual(table.delete_item.call_args[1]['Key'], {'image_id': 'b'})
+        mock_remove_image.assert_called_once()
+        mock_release_blob.assert_called_once_with(table, '9')
+
+    @patch('lambda_function.s3')
+    @patch('lambda_function.dynamodb')
+    @patch('lambda_function.list_objects')
+    @patch('lambda_function.scan_items')
+    def test_repair_skips_orphan_that_gained_a_row(self, mock_scan_items, mock_list_objects, mock_dynamodb, mock_s3):
+        mock_scan_items.side_effect = scanned()
+        mock_list_objects.side_effect = listing([('z.jpg', OLD)])
+        mock_dynamodb.Table.return_value.get_item.return_value = {'Item': {'image_id': 'z'}}
+        report = reconcile_prefix('', repair=True, now=NOW)
+        self.assertEqual(report['counts']['skipped'], 1)
+        mock_s3.delete_objects.assert_not_called()
+
+    @patch('lambda_function.reconcile_prefix')
+    def test_handler_hands_back_remaining_prefixes(self, mock_reconcile_prefix):
+        mock_reconcile_prefix.return_value = {'prefix': '0'}
+        context = MagicMock()
+        context.get_remaining_time_in_millis.return_value = 1000
+        response = lambda_handler({'prefixes': ['0', '1', '2']}, context)
+        self.assertEqual(response['statusCode'], 200)
+        body = json.loads(response['body'])
+        self.assertEqual(body['remaining_prefixes'], ['1', '2'])
+        mock_reconcile_prefix.assert_called_once_with('0', repair=False)
+
+    def test_handler_rejects_derivative_prefix(self):
+        self.assertEqual(lambda_handler({'prefix': 'derivatives/a'}, None)['statusCode'], 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
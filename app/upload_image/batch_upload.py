@@ -0,0 +1,239 @@
+"""
+Batch upload endpoint (POST /images/batch, handler batch_upload.batch_upload_handler).
+
+Bulk importers send up to MAX_BATCH_FILES images per request instead of one
+request each, either as multipart/form-data with repeated image_file
+fields, or as JSON {"images": [{"title", "description", "image_file"}, ...]}
+with base64 files. In a multipart body the n-th title and description
+belong to the n-th image_file; a single title or description applies to
+every file. Originals go to S3 on a pool of UPLOAD_BATCH_CONCURRENCY
+threads (default 8), rows are written with BatchWriteItem (25 per call,
+unprocessed items retried with backoff) and the search postings through
+one batch writer. Batches are always processed synchronously; every file
+gets its own result, in request order.
+"""
+import os
+import json
+import time
+import uuid
+import base64
+import binascii
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from search_index import SEARCH_INDEX_TABLE_NAME, index_image
+from blob_store import BLOB_TABLE_NAME, release_blob
+from image_sniff import FORMAT_CONTENT_TYPES, validate_image, original_key
+from catalog_index import request_owner
+from request_metrics import instrument, phase, record
+from lambda_function import (s3, dynamodb, S3_BUCKET_NAME, DYNAMODB_TABLE_NAME, CONTENT_ADDRESSED_STORAGE,
+                             parse_multipart_formdata, decode_base64_body, upload_to_s3, store_blob, metadata_item)
+
+MAX_BATCH_FILES = int(os.environ.get('UPLOAD_BATCH_MAX_FILES', 50))
+UPLOAD_CONCURRENCY = int(os.environ.get('UPLOAD_BATCH_CONCURRENCY', 8))
+BATCH_WRITE_MAX_ITEMS = 25
+MAX_ATTEMPTS = 6
+BACKOFF_SECONDS = 0.05
+
+RESULT_CREATED = 'created'
+RESULT_ERROR = 'error'
+
+def response(status_code, body):
+    return {
+        'statusCode': status_code,
+        'body': json.dumps(body)
+    }
+
+def chunks(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+# The n-th value of a repeated field, or its only value when given once
+def nth_value(values, index):
+    if not values:
+        return None
+    return values[0] if len(values) == 1 else values[index]
+
+def parse_batch_request(event):
+    """
+    Returns a list of {title, description, image_file} entries; image_file
+    is None when the file could not be decoded. Raises ValueError on a
+    malformed request.
+    """
+    headers = event.get('headers') or {}
+    content_type = headers.get('Content-Type') or headers.get('content-type') or ''
+    if content_type.startswith('multipart/form-data'):
+        form_data = parse_multipart_formdata(decode_base64_body(event.get('body') or ''), content_type,
+                                             repeated=True)
+        files = form_data.get('image_file', [])
+        titles, descriptions = form_data.get('title', []), form_data.get('description', [])
+        for name, values in (('title', titles), ('description', descriptions)):
+            if len(values) not in (0, 1, len(files)):
+                raise ValueError(f'Expected one {name} per image_file, or a single {name} for all')
+        return [{'title': nth_value(titles, index), 'description': nth_value(descriptions, index),
+                 'image_file': image_file} for index, image_file in enumerate(files)]
+
+    try:
+        payload = json.loads(event.get('body') or '{}')
+    except ValueError:
+        raise ValueError('Request body must be JSON or multipart/form-data')
+    images = payload.get('images') if isinstance(payload, dict) else None
+    if not isinstance(images, list) or not all(isinstance(image, dict) for image in images):
+        raise ValueError('images must be a list of {title, description, image_file} objects')
+    entries = []
+    for image in images:
+        try:
+            image_file = base64.b64decode(image.get('image_file') or '', validate=True)
+        except (binascii.Error, TypeError):
+            image_file = None
+        entries.append({'title': image.get('title'), 'description': image.get('description'),
+                        'image_file': image_file})
+    return entries
+
+# Checks one entry; returns an error message or None
+def check_entry(entry):
+    if not entry['title'] or not entry['description'] or not entry['image_file']:
+        return 'Image file, title, and description are required'
+    try:
+        entry['image_info'] = validate_image(entry['image_file'])
+    except ValueError as e:
+        return f'Invalid image: {str(e)}'
+    return None
+
+# Upload one entry's original; sets s3_key (and content_sha256 for blobs)
+def store_entry(entry):
+    content_type = FORMAT_CONTENT_TYPES[entry['image_info']['format']]
+    if CONTENT_ADDRESSED_STORAGE:
+        entry['content_sha256'] = hashlib.sha256(entry['image_file']).hexdigest()
+        entry['s3_key'] = store_blob(entry['image_file'], entry['content_sha256'], content_type)
+    else:
+        entry['s3_key'] = upload_to_s3(entry['image_file'], original_key(entry['image_id'],
+                                                                         entry['image_info']['format']),
+                                       content_type)
+
+def save_metadata_batch(items):
+    """
+    Writes metadata rows with BatchWriteItem, 25 per call, retrying
+    unprocessed items with exponential backoff. Returns the image_ids that
+    could not be written.
+    """
+    failed = []
+    for chunk in chunks(items, BATCH_WRITE_MAX_ITEMS):
+        request = {DYNAMODB_TABLE_NAME: [{'PutRequest': {'Item': item}} for item in chunk]}
+        try:
+            for attempt in range(MAX_ATTEMPTS):
+                result = dynamodb.batch_write_item(RequestItems=request)
+                request = result.get('UnprocessedItems') or {}
+                if not request:
+                    break
+                time.sleep(BACKOFF_SECONDS * (2 ** attempt))
+        except ClientError:
+            pass  # earlier attempts wrote everything but what is still in request
+        for unprocessed in request.get(DYNAMODB_TABLE_NAME, []):
+            failed.append(unprocessed['PutRequest']['Item']['image_id'])
+    return failed
+
+# Remove the stored originals of entries whose rows were not written
+def discard_stored(entries):
+    keys = []
+    blob_table = dynamodb.Table(BLOB_TABLE_NAME)
+    for entry in entries:
+        if not entry.get('content_sha256') or release_blob(blob_table, entry['content_sha256']):
+            keys.append(entry['s3_key'])
+    if keys:
+        try:
+            s3.delete_objects(Bucket=S3_BUCKET_NAME, Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True})
+        except ClientError:
+            pass  # left to reconcile_images
+
+def upload_images(entries, owner_id=None, workers=None):
+    """
+    Stores a batch of checked entries. Returns one result per entry:
+    {'status': 'created', 'image_id', 's3_url'} or {'status': 'error', 'message'}.
+    """
+    workers = workers or UPLOAD_CONCURRENCY
+    results = [None] * len(entries)
+    valid = []
+    with phase('validate'):
+        for index, entry in enumerate(entries):
+            error = check_entry(entry)
+            if error:
+                results[index] = {'status': RESULT_ERROR, 'message': error}
+            else:
+                entry['image_id'] = str(uuid.uuid4())
+                valid.append((index, entry))
+
+    # S3 puts are independent; run them concurrently on a bounded pool
+    def store(indexed_entry):
+        try:
+            store_entry(indexed_entry[1])
+            return None
+        except Exception as e:
+            return str(e)
+
+    stored = []
+    if valid:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(valid)))) as pool:
+            for (index, entry), error in zip(valid, pool.map(store, valid)):
+                if error:
+                    results[index] = {'status': RESULT_ERROR, 'message': error}
+                else:
+                    stored.append((index, entry))
+
+    items = {}
+    for index, entry in stored:
+        s3_url = f"https://{S3_BUCKET_NAME}.s3.amazonaws.com/{entry['s3_key']}"
+        items[entry['image_id']] = metadata_item(entry['image_id'], entry['title'], entry['description'], s3_url,
+                                                 s3_key=entry['s3_key'], content_sha256=entry.get('content_sha256'),
+                                                 image_info=entry['image_info'], owner_id=owner_id)
+    failed = set(save_metadata_batch(list(items.values())))
+    discard_stored([entry for _, entry in stored if entry['image_id'] in failed])
+
+    saved = []
+    for index, entry in stored:
+        image_id = entry['image_id']
+        if image_id in failed:
+            results[index] = {'status': RESULT_ERROR, 'message': 'Error saving metadata to DynamoDB'}
+        else:
+            results[index] = {'status': RESULT_CREATED, 'image_id': image_id, 's3_url': items[image_id]['s3_url']}
+            saved.append(entry)
+
+    # Search postings of every new image go out through one batch writer.
+    # Best effort, like the single upload: the rows are already written
+    index_table = dynamodb.Table(SEARCH_INDEX_TABLE_NAME)
+    try:
+        with index_table.batch_writer() as writer:
+            for entry in saved:
+                index_image(index_table, entry['image_id'], entry['title'], entry['description'], batch=writer)
+    except Exception:
+        record('search_index_errors')
+    return results
+
+# Lambda handler to upload many images at once
+@instrument('upload_image.batch')
+def batch_upload_handler(event, context):
+    try:
+        try:
+            with phase('parse'):
+                entries = parse_batch_request(event)
+        except ValueError as e:
+            return response(400, {'message': f'Invalid request body: {str(e)}'})
+        if not entries:
+            return response(400, {'message': 'At least one image is required'})
+        if len(entries) > MAX_BATCH_FILES:
+            return response(400, {'message': f'At most {MAX_BATCH_FILES} images per request'})
+
+        results = upload_images(entries, owner_id=request_owner(event))
+        counts = {}
+        for index, result in enumerate(results):
+            result['index'] = index
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+
+        return response(200, {
+            'message': 'Batch upload completed',
+            'counts': counts,
+            'results': results
+        })
+
+    except Exception as e:
+        return response(500, {'message': str(e)})
@@ -1,84 +1,274 @@
-import boto3
+import os
+import re
 import json
+import time
 import uuid
 import base64
+import binascii
+import hashlib
+from botocore.exceptions import ClientError
+from aws_clients import lazy_client, lazy_dynamodb
+from search_index import SEARCH_INDEX_TABLE_NAME, index_image
+from blob_store import BLOB_TABLE_NAME, blob_key, acquire_blob, mark_blob_uploaded, release_blob
+from s3_transfer import MULTIPART_THRESHOLD, BytesViewReader, multipart_upload
+from job_queue import upload_queue
+from image_sniff import FORMAT_CONTENT_TYPES, validate_image, original_key
+from catalog_index import listing_attributes, request_owner
+from request_metrics import instrument, phase, record
 
 S3_BUCKET_NAME = 'image-bucket-madhu'
 DYNAMODB_TABLE_NAME = 'images-metadata'
+# Store each distinct file once under blobs/{sha256} (see blob_store)
+CONTENT_ADDRESSED_STORAGE = os.environ.get('CONTENT_ADDRESSED_STORAGE', 'false').lower() == 'true'
+# Store the bytes and a queued row, and leave the rest (hashing, blob
+# storage, search indexing) to the process_uploads worker
+ASYNC_PROCESSING = os.environ.get('UPLOAD_ASYNC_PROCESSING', 'false').lower() == 'true'
+STATUS_QUEUED = 'queued'
+# Namespace of image_ids derived from Idempotency-Key headers
+IDEMPOTENCY_NAMESPACE = uuid.UUID('6f1b7c4e-3a52-4d0e-9a8e-2f4b5c6d7e80')
 
-s3 = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb')
+s3 = lazy_client('s3')
+dynamodb = lazy_dynamodb()
 
-def parse_multipart_formdata(body, content_type):
+# Matches `; key=value` header parameters; quoted values may contain ';' and '='
+HEADER_PARAM_PATTERN = re.compile(r';\s*([^\s=;]+)\s*=\s*("(?:[^"\\]|\\.)*"|[^;]*)')
+
+def parse_header_params(value):
+    """
+    Parses the parameters of a header value such as
+    `form-data; name="image_file"; filename="a;b=c.jpg"` into a dict.
+    """
+    params = {}
+    for match in HEADER_PARAM_PATTERN.finditer(value):
+        key, raw = match.group(1).lower(), match.group(2).strip()
+        if len(raw) >= 2 and raw[0] == '"' and raw[-1] == '"':
+            raw = re.sub(r'\\(.)', r'\1', raw[1:-1])
+        params[key] = raw
+    return params
+
+def iter_multipart_parts(body, boundary):
+    """
+    Yields (headers, content) for each part of a multipart body.
+
+    The body is scanned once from left to right; content is a memoryview
+    slice of `body`, so no part is copied.
+    """
+    view = memoryview(body)
+    delimiter = b'--' + boundary.encode('latin-1')
+    separator = b'\r\n' + delimiter
+
+    position = body.find(delimiter)
+    if position == -1:
+        raise ValueError('Malformed multipart body: boundary not found')
+    position += len(delimiter)
+
+    while not body.startswith(b'--', position):
+        # Skip the rest of the delimiter line (transport padding + CRLF)
+        line_end = body.find(b'\r\n', position)
+        if line_end == -1:
+            raise ValueError('Malformed multipart body: truncated part')
+        headers_start = line_end + 2
+
+        if body.startswith(b'\r\n', headers_start):
+            headers_end, content_start = headers_start, headers_start + 2
+        else:
+            headers_end = body.find(b'\r\n\r\n', headers_start)
+            if headers_end == -1:
+                raise ValueError('Malformed multipart body: truncated part headers')
+            content_start = headers_end + 4
+
+        content_end = body.find(separator, content_start)
+        if content_end == -1:
+            raise ValueError('Malformed multipart body: closing boundary not found')
+
+        headers = {}
+        for line in view[headers_start:headers_end].tobytes().decode('utf-8').split('\r\n'):
+            if ':' in line:
+                key, value = line.split(':', 1)
+                headers[key.strip().lower()] = value.strip()
+
+        yield headers, view[content_start:content_end]
+        position = content_end + len(separator)
+
+def parse_multipart_formdata(body, content_type, repeated=False):
     """
     Parses a multipart/form-data payload manually.
+
+    File fields are returned as memoryview slices of `body` (zero-copy);
+    text fields are decoded to str. With repeated=True every field maps to
+    the list of its values in body order; otherwise the last value wins.
     """
     # Extract the boundary from the Content-Type header
-    boundary = content_type.split("boundary=")[1]
-    boundary = f"--{boundary}"  # Prefix the boundary with "--"
-    
-    # Split the body into parts using the boundary
-    parts = body.split(boundary.encode())
+    boundary = parse_header_params(content_type).get('boundary')
+    if not boundary:
+        raise ValueError('Missing multipart boundary')
 
     form_data = {}
-    for part in parts:
-        if not part or part == b"--\r\n":  # Skip empty parts and closing boundary
+    for headers, content in iter_multipart_parts(body, boundary):
+        disposition = parse_header_params(headers.get('content-disposition', ''))
+        name = disposition.get('name')
+        if name is None:
             continue
 
-        # Separate headers and content
-        headers, content = part.split(b'\r\n\r\n', 1)
-        content = content.rstrip(b'\r\n')  # Strip trailing CRLF
-
-        # Decode headers
-        headers = headers.decode('utf-8')
-        
-        # Check Content-Disposition header
-        if 'Content-Disposition' in headers:
-            # Extract the field name
-            disposition = headers.split(';')
-            name = None
-            for item in disposition:
-                if 'name=' in item:
-                    name = item.split('=')[1].strip('"')
-                    break
-            
-            # Check if this is a file field
-            if 'filename=' in headers:
-                form_data[name] = content  # Binary content of the file
-            else:
-                form_data[name] = content.decode('utf-8')  # Text content
+        # Check if this is a file field
+        if 'filename' in disposition:
+            value = content  # Binary content of the file
+        else:
+            value = content.tobytes().decode('utf-8')  # Text content
+        if repeated:
+            form_data.setdefault(name, []).append(value)
+        else:
+            form_data[name] = value
+
+    return form_data
+
+# Decodes the base64 body API Gateway delivers for binary payloads.
+# binascii reads an ASCII str in place, whereas base64.b64decode first makes
+# an encoded bytes copy of the whole body.
+def decode_base64_body(body):
+    try:
+        return binascii.a2b_base64(body)
+    except binascii.Error as e:
+        raise ValueError(f'body is not valid base64: {str(e)}')
 
+# Parses the JSON request body documented in the README, where image_file is
+# a base64 string inside the JSON document
+def parse_json_body(body):
+    payload = json.loads(body or '{}')
+    form_data = {
+        'title': payload.get('title'),
+        'description': payload.get('description')
+    }
+    if payload.get('image_file'):
+        form_data['image_file'] = base64.b64decode(payload['image_file'])
     return form_data
 
-def upload_to_s3(file_data, filename):
+def upload_to_s3(file_data, filename, content_type=None):
+    extra_args = {'ContentType': content_type} if content_type else {}
     try:
-        s3.put_object(Bucket=S3_BUCKET_NAME, Key=filename, Body=file_data)
+        # Large images go up as a concurrent multipart upload
+        if len(file_data) >= MULTIPART_THRESHOLD:
+            multipart_upload(s3, S3_BUCKET_NAME, filename, file_data, extra_args=extra_args)
+            return filename
+
+        # memoryview slices from the multipart parser are streamed without a copy
+        body = BytesViewReader(file_data) if isinstance(file_data, memoryview) else file_data
+        s3.put_object(Bucket=S3_BUCKET_NAME, Key=filename, Body=body, **extra_args)
         return filename
     except Exception as e:
         raise Exception(f"Error uploading image to S3: {str(e)}")
 
-def save_metadata_to_dynamodb(image_id, title, description, s3_url):
+# Store the file as a shared, reference-counted blob. Bytes already stored by
+# an earlier upload are not sent to S3 again. Returns the blob's S3 key.
+def store_blob(file_data, content_sha256, content_type=None):
+    table = dynamodb.Table(BLOB_TABLE_NAME)
+    key = blob_key(content_sha256)
+    if acquire_blob(table, content_sha256, len(file_data)):
+        try:
+            upload_to_s3(file_data, key, content_type)
+            mark_blob_uploaded(table, content_sha256)
+        except Exception:
+            release_blob(table, content_sha256)
+            raise
+    return key
+
+# The metadata row of an uploaded image
+def metadata_item(image_id, title, description, s3_url, s3_key=None, content_sha256=None, image_info=None,
+                  owner_id=None):
+    item = {
+        'image_id': image_id,
+        'title': title,
+        'description': description,
+        's3_url': s3_url
+    }
+    if s3_key:
+        item['s3_key'] = s3_key
+    if content_sha256:
+        item['content_sha256'] = content_sha256
+    if image_info:
+        item.update(image_info)  # format, width, height, size_bytes
+    item.update(listing_attributes(image_id, owner_id))  # created_at, time_bucket, owner_id
+    return item
+
+def save_metadata_to_dynamodb(image_id, title, description, s3_url, s3_key=None, content_sha256=None,
+                              image_info=None, owner_id=None):
     table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+    item = metadata_item(image_id, title, description, s3_url, s3_key, content_sha256, image_info, owner_id)
     try:
         table.put_item(
-            Item={
-                'image_id': image_id,
-                'title': title,
-                'description': description,
-                's3_url': s3_url
-            }
+            Item=item
         )
     except Exception as e:
         raise Exception(f"Error saving metadata to DynamoDB: {str(e)}")
 
+    # Keep the title/description search index in sync. Best effort: the row
+    # is saved and points at the stored original, and `search_index.py
+    # rebuild` repopulates missing postings
+    try:
+        index_image(dynamodb.Table(SEARCH_INDEX_TABLE_NAME), image_id, title, description)
+    except Exception:
+        record('search_index_errors')
+
+def get_upload(image_id):
+    try:
+        return dynamodb.Table(DYNAMODB_TABLE_NAME).get_item(Key={'image_id': image_id}, ConsistentRead=True).get('Item')
+    except ClientError as e:
+        raise Exception(f"Error retrieving metadata from DynamoDB: {str(e)}")
+
+# Record a queued row for an upload whose bytes are already in S3 and hand
+# it to the worker. Returns the existing row instead when a retried request
+# (same Idempotency-Key) already queued it.
+def enqueue_upload(image_id, title, description, s3_key, image_info=None, owner_id=None):
+    table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+    item = {
+        'image_id': image_id,
+        'title': title,
+        'description': description,
+        's3_url': f'https://{S3_BUCKET_NAME}.s3.amazonaws.com/{s3_key}',
+        's3_key': s3_key,
+        'status': STATUS_QUEUED,
+        'queued_at': int(time.time())
+    }
+    if image_info:
+        item.update(image_info)
+    item.update(listing_attributes(image_id, owner_id))
+    try:
+        table.put_item(Item=item, ConditionExpression='attribute_not_exists(image_id)')
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            return get_upload(image_id) or item
+        raise Exception(f"Error saving metadata to DynamoDB: {str(e)}")
+
+    try:
+        upload_queue().send({'image_id': image_id, 's3_key': s3_key}, deduplication_id=image_id)
+    except Exception:
+        # No job will ever pick the row up; the staged object is left to reconcile_images
+        table.delete_item(Key={'image_id': image_id})
+        raise
+    return item
+
+@instrument('upload_image')
 def lambda_handler(event, context):
     try:
         # Extract Content-Type and body
-        content_type = event['headers'].get('Content-Type') or event['headers'].get('content-type')
-        body = base64.b64decode(event['body'])  # Decode base64-encoded body from API Gateway
+        headers = event.get('headers') or {}
+        content_type = headers.get('Content-Type') or headers.get('content-type') or ''
+        idempotency_key = headers.get('Idempotency-Key') or headers.get('idempotency-key')
+
+        try:
+            with phase('parse'):
+                if content_type.startswith('multipart/form-data'):
+                    body = decode_base64_body(event['body'])  # Decode base64-encoded body from API Gateway
 
-        # Parse form-data
-        form_data = parse_multipart_formdata(body, content_type)
+                    # Parse form-data
+                    form_data = parse_multipart_formdata(body, content_type)
+                else:
+                    form_data = parse_json_body(event.get('body'))
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'message': f'Invalid request body: {str(e)}'})
+            }
 
         # Extract form fields and file
         title = form_data.get('title')
@@ -91,18 +281,72 @@ def lambda_handler(event, context):
                 'body': json.dumps({'message': 'Image file, title, and description are required'})
             }
 
+        # Format and dimensions come from the file header; no pixels are decoded
+        try:
+            with phase('validate'):
+                image_info = validate_image(image_file)
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'message': f'Invalid image: {str(e)}'})
+            }
+        image_content_type = FORMAT_CONTENT_TYPES[image_info['format']]
+        owner_id = request_owner(event)
+
+        if ASYNC_PROCESSING:
+            # A retried request (same Idempotency-Key) gets the same image_id
+            # and the status of its first attempt
+            item = None
+            if idempotency_key:
+                image_id = str(uuid.uuid5(IDEMPOTENCY_NAMESPACE, idempotency_key))
+                item = get_upload(image_id)
+            else:
+                image_id = str(uuid.uuid4())
+            if item is None:
+                # The bytes have to be in S3 before responding (SQS messages
+                # are capped at 256 KB); everything else happens in the worker
+                filename = upload_to_s3(image_file, original_key(image_id, image_info['format']), image_content_type)
+                item = enqueue_upload(image_id, title, description, filename, image_info, owner_id)
+            return {
+                'statusCode': 202,
+                'body': json.dumps({
+                    'message': 'Image accepted for processing',
+                    'image_id': image_id,
+                    'status': item.get('status'),
+                    's3_url': item.get('s3_url')
+                })
+            }
+
         # Generate a unique filename
         image_id = str(uuid.uuid4())
-        filename = f'{image_id}.jpg'
 
-        # Upload file to S3
-        upload_to_s3(image_file, filename)
+        if CONTENT_ADDRESSED_STORAGE:
+            # hashlib reads the memoryview in place; repeat uploads skip S3
+            content_sha256 = hashlib.sha256(image_file).hexdigest()
+            filename = store_blob(image_file, content_sha256, image_content_type)
+            s3_url = f'https://{S3_BUCKET_NAME}.s3.amazonaws.com/{filename}'
+            try:
+                save_metadata_to_dynamodb(image_id, title, description, s3_url,
+                                          s3_key=filename, content_sha256=content_sha256, image_info=image_info,
+                                          owner_id=owner_id)
+            except Exception:
+                # Only raised when the row was not written; drop its reference
+                if release_blob(dynamodb.Table(BLOB_TABLE_NAME), content_sha256):
+                    s3.delete_object(Bucket=S3_BUCKET_NAME, Key=filename)
+                raise
+        else:
+            # The extension matches the sniffed format
+            filename = original_key(image_id, image_info['format'])
+
+            # Upload file to S3
+            upload_to_s3(image_file, filename, image_content_type)
 
-        # Generate S3 URL
-        s3_url = f'https://{S3_BUCKET_NAME}.s3.amazonaws.com/{filename}'
+            # Generate S3 URL
+            s3_url = f'https://{S3_BUCKET_NAME}.s3.amazonaws.com/{filename}'
 
-        # Save metadata to DynamoDB
-        save_metadata_to_dynamodb(image_id, title, description, s3_url)
+            # Save metadata to DynamoDB
+            save_metadata_to_dynamodb(image_id, title, description, s3_url, s3_key=filename, image_info=image_info,
+                                      owner_id=owner_id)
 
         # Return success response
         return {
@@ -0,0 +1,238 @@
+"""
+Two-phase, direct-to-S3 uploads.
+
+Phase one (create_upload_handler, POST /upload/presign) writes a "pending"
+metadata row and returns a presigned POST policy, so the client sends the
+image bytes straight to S3 under the key of the declared format. Phase two
+marks the row active once the object is verified (size and type from a HEAD,
+format and dimensions from a ranged GET of its header): either the client calls finalize_upload_handler
+(POST /upload/{image_id}/finalize) or S3's ObjectCreated notification
+invokes s3_event_handler. Both handlers are deployed from this package
+alongside lambda_function.
+"""
+import os
+import json
+import time
+import uuid
+from urllib.parse import unquote_plus
+from botocore.exceptions import ClientError
+from search_index import SEARCH_INDEX_TABLE_NAME, index_image
+from metadata_cache import shared_store, invalidate
+from lambda_function import s3, dynamodb, S3_BUCKET_NAME, DYNAMODB_TABLE_NAME
+from image_sniff import FORMAT_CONTENT_TYPES, validate_image, original_key, image_id_for_original
+from catalog_index import listing_attributes, request_owner
+from request_metrics import instrument, phase
+
+STATUS_PENDING = 'pending'
+STATUS_ACTIVE = 'active'
+
+ALLOWED_CONTENT_TYPES = ('image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/heic')
+CONTENT_TYPE_FORMATS = {content_type: image_format for image_format, content_type in FORMAT_CONTENT_TYPES.items()}
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 50 * 1024 * 1024))
+UPLOAD_URL_EXPIRATION = int(os.environ.get('UPLOAD_URL_EXPIRATION', 900))
+# Pending rows that are never finalized expire through DynamoDB TTL
+PENDING_TTL_SECONDS = 24 * 3600
+# Bytes fetched from the front of an upload to read its format and
+# dimensions; JPEG EXIF/ICC segments in front of the frame header fit
+UPLOAD_HEADER_BYTES = int(os.environ.get('UPLOAD_HEADER_BYTES', 256 * 1024))
+
+def response(status_code, body):
+    return {
+        'statusCode': status_code,
+        'body': json.dumps(body)
+    }
+
+# Presigned POST policy that only accepts one object of the declared type
+# and at most max_bytes
+def generate_upload_policy(key, content_type, max_bytes):
+    try:
+        return s3.generate_presigned_post(
+            Bucket=S3_BUCKET_NAME,
+            Key=key,
+            Fields={'Content-Type': content_type},
+            Conditions=[
+                {'Content-Type': content_type},
+                ['content-length-range', 1, max_bytes]
+            ],
+            ExpiresIn=UPLOAD_URL_EXPIRATION
+        )
+    except ClientError as e:
+        raise Exception(f"Error generating upload policy: {str(e)}")
+
+def save_pending_metadata(image_id, title, description, s3_key, content_type, max_bytes, owner_id=None):
+    table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+    try:
+        table.put_item(
+            Item=dict({
+                'image_id': image_id,
+                'title': title,
+                'description': description,
+                's3_url': f'https://{S3_BUCKET_NAME}.s3.amazonaws.com/{s3_key}',
+                's3_key': s3_key,
+                'status': STATUS_PENDING,
+                'content_type': content_type,
+                'max_bytes': max_bytes,
+                'expires_at': int(time.time()) + PENDING_TTL_SECONDS
+            }, **listing_attributes(image_id, owner_id))
+        )
+    except ClientError as e:
+        raise Exception(f"Error saving metadata to DynamoDB: {str(e)}")
+
+def get_image_metadata(image_id):
+    table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+    try:
+        return table.get_item(Key={'image_id': image_id}, ConsistentRead=True).get('Item')
+    except ClientError as e:
+        raise Exception(f"Error retrieving metadata from DynamoDB: {str(e)}")
+
+# Returns the object's HEAD response, or None if it has not been uploaded
+def head_uploaded_object(s3_key):
+    try:
+        return s3.head_object(Bucket=S3_BUCKET_NAME, Key=s3_key)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise Exception(f"Error reading uploaded object from S3: {str(e)}")
+
+# First UPLOAD_HEADER_BYTES of the uploaded object
+def read_uploaded_header(s3_key):
+    try:
+        response = s3.get_object(Bucket=S3_BUCKET_NAME, Key=s3_key, Range=f'bytes=0-{UPLOAD_HEADER_BYTES - 1}')
+        return response['Body'].read()
+    except ClientError as e:
+        raise Exception(f"Error reading uploaded object from S3: {str(e)}")
+
+# Format and dimensions of the uploaded object, checked against the declared
+# content type and the upload limits; raises ValueError otherwise
+def inspect_upload(s3_key, content_type):
+    # The header is a prefix of the object; the size was already checked
+    image_info = validate_image(read_uploaded_header(s3_key), max_bytes=UPLOAD_HEADER_BYTES)
+    if FORMAT_CONTENT_TYPES[image_info['format']] != content_type:
+        raise ValueError(f"{image_info['format']} image uploaded as {content_type}")
+    return {'format': image_info['format'], 'width': image_info['width'], 'height': image_info['height']}
+
+def activate_upload(image_id):
+    """
+    Verifies the uploaded object against the pending row and marks the row
+    active. Returns (status_code, message); safe to call more than once.
+    Rows that are not pending presigned uploads (e.g. queued or processing
+    async uploads, whose objects also land in the bucket) are left alone.
+    """
+    metadata = get_image_metadata(image_id)
+    if not metadata:
+        return 404, 'Image not found'
+    status = metadata.get('status', STATUS_ACTIVE)
+    if status == STATUS_ACTIVE:
+        return 200, 'Image already active'
+    if status != STATUS_PENDING:
+        return 409, f'Image is {status}, not awaiting an upload'
+
+    content_type = metadata.get('content_type')
+    s3_key = metadata.get('s3_key') or original_key(image_id, CONTENT_TYPE_FORMATS.get(content_type, 'jpeg'))
+    head = head_uploaded_object(s3_key)
+    if head is None:
+        return 409, 'Image has not been uploaded yet'
+
+    size = head.get('ContentLength', 0)
+    if size > int(metadata.get('max_bytes', MAX_UPLOAD_BYTES)) or head.get('ContentType') != content_type:
+        # The policy should have prevented this; do not keep an object that breaks it
+        s3.delete_object(Bucket=S3_BUCKET_NAME, Key=s3_key)
+        return 422, 'Uploaded object does not match the upload policy'
+    # The policy only pins the Content-Type header; the bytes have to match it
+    try:
+        image_info = inspect_upload(s3_key, content_type)
+    except ValueError as e:
+        s3.delete_object(Bucket=S3_BUCKET_NAME, Key=s3_key)
+        return 422, f'Invalid image: {str(e)}'
+
+    table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+    try:
+        table.update_item(
+            Key={'image_id': image_id},
+            UpdateExpression='SET #status = :active, size_bytes = :size, #format = :format, #width = :width, '
+                             '#height = :height REMOVE expires_at',
+            ConditionExpression='#status = :pending',
+            ExpressionAttributeNames={'#status': 'status', '#format': 'format', '#width': 'width', '#height': 'height'},
+            ExpressionAttributeValues={':active': STATUS_ACTIVE, ':pending': STATUS_PENDING, ':size': size,
+                                       ':format': image_info['format'], ':width': image_info['width'],
+                                       ':height': image_info['height']}
+        )
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            return 200, 'Image already active'  # A concurrent finalize won the race
+        raise Exception(f"Error updating metadata in DynamoDB: {str(e)}")
+
+    index_image(dynamodb.Table(SEARCH_INDEX_TABLE_NAME), image_id, metadata.get('title'), metadata.get('description'))
+    # A view while the upload was pending may have cached a miss
+    invalidate(shared_store(), image_id)
+    return 200, 'Image uploaded successfully'
+
+# Lambda handler for POST /upload/presign
+@instrument('upload_image.presign')
+def create_upload_handler(event, context):
+    try:
+        try:
+            payload = json.loads(event.get('body') or '{}')
+        except ValueError:
+            return response(400, {'message': 'Request body must be JSON'})
+
+        title = payload.get('title')
+        description = payload.get('description')
+        content_type = payload.get('content_type', 'image/jpeg')
+        if not title or not description:
+            return response(400, {'message': 'Title and description are required'})
+        if content_type not in ALLOWED_CONTENT_TYPES:
+            return response(400, {'message': f'content_type must be one of {", ".join(ALLOWED_CONTENT_TYPES)}'})
+
+        max_bytes = MAX_UPLOAD_BYTES
+        if payload.get('content_length') is not None:
+            try:
+                max_bytes = int(payload['content_length'])
+            except (TypeError, ValueError):
+                max_bytes = 0
+            if max_bytes < 1 or max_bytes > MAX_UPLOAD_BYTES:
+                return response(400, {'message': f'content_length must be between 1 and {MAX_UPLOAD_BYTES}'})
+
+        image_id = str(uuid.uuid4())
+        # The extension matches the declared format, as for direct uploads
+        s3_key = original_key(image_id, CONTENT_TYPE_FORMATS[content_type])
+        with phase('presign'):
+            upload = generate_upload_policy(s3_key, content_type, max_bytes)
+        save_pending_metadata(image_id, title, description, s3_key, content_type, max_bytes,
+                              request_owner(event))
+
+        return response(200, {
+            'message': 'Upload URL created',
+            'image_id': image_id,
+            'upload': upload,
+            'expires_in': UPLOAD_URL_EXPIRATION
+        })
+
+    except Exception as e:
+        return response(500, {'message': str(e)})
+
+# Lambda handler for POST /upload/{image_id}/finalize
+@instrument('upload_image.finalize')
+def finalize_upload_handler(event, context):
+    try:
+        image_id = (event.get('pathParameters') or {}).get('image_id')
+        if not image_id:
+            return response(400, {'message': 'image_id is required'})
+
+        status_code, message = activate_upload(image_id)
+        return response(status_code, {'message': message, 'image_id': image_id})
+
+    except Exception as e:
+        return response(500, {'message': str(e)})
+
+# Lambda handler for the bucket's s3:ObjectCreated:* notification
+@instrument('upload_image.s3_event')
+def s3_event_handler(event, context):
+    results = {}
+    for record in event.get('Records', []):
+        key = unquote_plus(record['s3']['object']['key'])
+        image_id = image_id_for_original(key)
+        if not image_id:
+            continue
+        results[image_id] = activate_upload(image_id)[0]
+    return results
@@ -0,0 +1,173 @@
+"""
+S3 transfer helpers for upload_image.
+
+Objects at or above MULTIPART_THRESHOLD are sent with S3 multipart upload:
+parts go up concurrently on a bounded thread pool, each with its own
+Content-MD5, and a failed upload can be resumed from the parts S3 already
+has (or is aborted so no orphaned parts are billed).
+"""
+import io
+import os
+import time
+import base64
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from botocore.exceptions import ClientError
+
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3 minimum for every part but the last
+MAX_PARTS = 10000
+
+MULTIPART_THRESHOLD = int(os.environ.get('MULTIPART_THRESHOLD_BYTES', 16 * 1024 * 1024))
+PART_SIZE = int(os.environ.get('MULTIPART_PART_SIZE_BYTES', 8 * 1024 * 1024))
+MAX_CONCURRENCY = int(os.environ.get('MULTIPART_MAX_CONCURRENCY', 4))
+PART_ATTEMPTS = 3
+PART_BACKOFF_SECONDS = 0.2
+
+class MultipartUploadError(Exception):
+    """
+    Raised when a multipart upload fails. upload_id is set when the upload
+    was left open (abort_on_failure=False) and can be passed back to
+    multipart_upload to resume it.
+    """
+    def __init__(self, message, upload_id=None):
+        super(MultipartUploadError, self).__init__(message)
+        self.upload_id = upload_id
+
+class BytesViewReader(io.RawIOBase):
+    """
+    Read-only, seekable file object over a memoryview.
+
+    Lets boto3 stream a multipart file part to S3 straight out of the decoded
+    request body instead of copying the part into a new bytes object first.
+    """
+    def __init__(self, view):
+        self._view = view
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), len(self._view) - self._position)
+        if size <= 0:
+            return 0
+        buffer[:size] = self._view[self._position:self._position + size]
+        self._position += size
+        return size
+
+    def read(self, size=-1):
+        end = len(self._view) if size is None or size < 0 else min(len(self._view), self._position + size)
+        data = self._view[self._position:end].tobytes()
+        self._position = max(self._position, end)
+        return data
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        if offset < 0:
+            raise ValueError('negative seek position')
+        self._position = offset
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def __len__(self):
+        return len(self._view)
+
+# Base64 MD5 digest for the Content-MD5 header
+def content_md5(data):
+    return base64.b64encode(hashlib.md5(data).digest()).decode('ascii')
+
+# Split `size` bytes into [(part_number, start, end), ...]; the part size is
+# raised if needed to stay within S3's 10,000 part limit
+def part_ranges(size, part_size=PART_SIZE):
+    part_size = max(part_size, MIN_PART_SIZE, -(-size // MAX_PARTS))
+    return [(number, start, min(start + part_size, size))
+            for number, start in enumerate(range(0, size, part_size), 1)]
+
+# Upload one part, retrying transient failures; returns the part's ETag
+def upload_part(s3, bucket, key, upload_id, part_number, data):
+    for attempt in range(PART_ATTEMPTS):
+        try:
+            response = s3.upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number,
+                                      Body=BytesViewReader(data), ContentLength=len(data),
+                                      ContentMD5=content_md5(data))
+            return response['ETag']
+        except ClientError:
+            if attempt == PART_ATTEMPTS - 1:
+                raise
+            time.sleep(PART_BACKOFF_SECONDS * (2 ** attempt))
+
+# Parts S3 already holds for an open upload, as {part_number: (etag, size)}
+def list_uploaded_parts(s3, bucket, key, upload_id):
+    parts = {}
+    request = {'Bucket': bucket, 'Key': key, 'UploadId': upload_id}
+    while True:
+        response = s3.list_parts(**request)
+        for part in response.get('Parts', []):
+            parts[part['PartNumber']] = (part['ETag'], part['Size'])
+        if not response.get('IsTruncated'):
+            return parts
+        request['PartNumberMarker'] = response['NextPartNumberMarker']
+
+def multipart_upload(s3, bucket, key, data, part_size=PART_SIZE, max_concurrency=MAX_CONCURRENCY,
+                     upload_id=None, extra_args=None, abort_on_failure=True):
+    """
+    Uploads `data` (bytes or memoryview) to s3://bucket/key in parts.
+
+    Pass the upload_id of an earlier failed attempt to resume it; parts S3
+    already has with the expected size are not sent again.
+    """
+    view = data if isinstance(data, memoryview) else memoryview(data)
+    ranges = part_ranges(len(view), part_size)
+    etags = {}
+
+    try:
+        if upload_id:
+            uploaded = list_uploaded_parts(s3, bucket, key, upload_id)
+            etags = {number: uploaded[number][0] for number, start, end in ranges
+                     if number in uploaded and uploaded[number][1] == end - start}
+        else:
+            upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key, **(extra_args or {}))['UploadId']
+    except ClientError as e:
+        raise MultipartUploadError(f"Error starting multipart upload: {str(e)}", upload_id)
+
+    pending = [(number, start, end) for number, start, end in ranges if number not in etags]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(pending) or 1))) as pool:
+        futures = {pool.submit(upload_part, s3, bucket, key, upload_id, number, view[start:end]): number
+                   for number, start, end in pending}
+        try:
+            for future in as_completed(futures):
+                etags[futures[future]] = future.result()
+        except Exception as e:
+            for future in futures:
+                future.cancel()
+            if abort_on_failure:
+                abort_upload(s3, bucket, key, upload_id)
+                raise MultipartUploadError(f"Error uploading part: {str(e)}")
+            raise MultipartUploadError(f"Error uploading part: {str(e)}", upload_id)
+
+    try:
+        s3.complete_multipart_upload(
+            Bucket=bucket, Key=key, UploadId=upload_id,
+            MultipartUpload={'Parts': [{'PartNumber': number, 'ETag': etags[number]} for number in sorted(etags)]}
+        )
+    except ClientError as e:
+        if abort_on_failure:
+            abort_upload(s3, bucket, key, upload_id)
+            raise MultipartUploadError(f"Error completing multipart upload: {str(e)}")
+        raise MultipartUploadError(f"Error completing multipart upload: {str(e)}", upload_id)
+    return upload_id
+
+# Abort an open multipart upload so S3 discards its parts
+def abort_upload(s3, bucket, key, upload_id):
+    try:
+        s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+    except ClientError:
+        pass  # Parts are also reclaimed by the bucket's abort-incomplete-upload lifecycle rule
@@ -0,0 +1,175 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+import sys
+import json
+import base64
+import struct
+from botocore.exceptions import ClientError
+
+# Shared modules ship as a Lambda layer; make them importable for local runs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'layer', 'python'))
+
+from batch_upload import batch_upload_handler, parse_batch_request, save_metadata_batch, upload_images
+
+PNG_DATA = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR' + struct.pack('>II', 2, 1) + b'\x08\x02\x00\x00\x00'
+
+
+# Parts in the given order: (name, value) for text, (name, (filename, data)) for files
+def build_multipart(boundary, parts):
+    lines = []
+    for name, value in parts:
+        if isinstance(value, tuple):
+            lines.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{value[0]}"\r\n'
+                         f'Content-Type: image/png\r\n\r\n'.encode() + value[1] + b'\r\n')
+        else:
+            lines.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'.encode()
+                         + value.encode() + b'\r\n')
+    lines.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(lines)
+
+
+def multipart_event(parts):
+    return {'headers': {'Content-Type': 'multipart/form-data; boundary=XyZ'},
+            'body': base64.b64encode(build_multipart('XyZ', parts)).decode('utf-8')}
+
+
+class TestParseBatchRequest(unittest.TestCase):
+
+    def test_repeated_multipart_fields_pair_up_in_order(self):
+        entries = parse_batch_request(multipart_event([
+            ('title', 'Sunset'), ('description', 'Beach'), ('image_file', ('a.png', PNG_DATA)),
+            ('title', 'Harbor'), ('description', 'Boats'), ('image_file', ('b.png', PNG_DATA + b'b'))]))
+        self.assertEqual([(entry['title'], entry['description']) for entry in entries],
+                         [('Sunset', 'Beach'), ('Harbor', 'Boats')])
+        self.assertEqual(entries[1]['image_file'].tobytes(), PNG_DATA + b'b')
+
+    def test_single_title_applies_to_every_file(self):
+        entries = parse_batch_request(multipart_event([
+            ('title', 'Trip'), ('description', 'Day 1'), ('description', 'Day 2'),
+            ('image_file', ('a.png', PNG_DATA)), ('image_file', ('b.png', PNG_DATA))]))
+        self.assertEqual([(entry['title'], entry['description']) for entry in entries],
+                         [('Trip', 'Day 1'), ('Trip', 'Day 2')])
+
+        with self.assertRaises(ValueError):
+            parse_batch_request(multipart_event([
+                ('title', 'A'), ('title', 'B'), ('description', 'D'),
+                ('image_file', ('a.png', PNG_DATA)), ('image_file', ('b.png', PNG_DATA)),
+                ('image_file', ('c.png', PNG_DATA))]))
+
+    def test_json_body(self):
+        body = json.dumps({'images': [
+            {'title': 'Sunset', 'description': 'Beach', 'image_file': base64.b64encode(PNG_DATA).decode('utf-8')},
+            {'title': 'Broken', 'description': 'Not base64', 'image_file': '***'}]})
+        entries = parse_batch_request({'body': body})
+        self.assertEqual(entries[0]['image_file'], PNG_DATA)
+        self.assertIsNone(entries[1]['image_file'])
+        for bad in ('not json', json.dumps({'images': 'x'}), json.dumps([1])):
+            with self.assertRaises(ValueError):
+                parse_batch_request({'body': bad})
+
+
+class TestBatchUpload(unittest.TestCase):
+
+    @patch('batch_upload.time.sleep')
+    @patch('batch_upload.dynamodb')
+    def test_save_metadata_chunks_and_retries(self, mock_dynamodb, mock_sleep):
+        items = [{'image_id': f'id-{n}'} for n in range(60)]
+        unprocessed = {'images-metadata': [{'PutRequest': {'Item': items[3]}}]}
+        mock_dynamodb.batch_write_item.side_effect = [{'UnprocessedItems': unprocessed}, {}, {}, {}]
+
+        self.assertEqual(save_metadata_batch(items), [])
+        sizes = [len(call[1]['RequestItems']['images-metadata'])
+                 for call in mock_dynamodb.batch_write_item.call_args_list]
+        self.assertEqual(sizes, [25, 1, 25, 10])
+        mock_sleep.assert_called_once()
+
+    @patch('batch_upload.time.sleep')
+    @patch('batch_upload.dynamodb')
+    def test_save_metadata_error_on_retry_fails_only_unwritten_items(self, mock_dynamodb, mock_sleep):
+        items = [{'image_id': f'id-{n}'} for n in range(30)]
+        unprocessed = {'images-metadata': [{'PutRequest': {'Item': items[3]}}]}
+        throttled = ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'slow down'}}, 'BatchWriteItem')
+        mock_dynamodb.batch_write_item.side_effect = [{'UnprocessedItems': unprocessed}, throttled, throttled]
+
+        # The retry of the first chunk and the second chunk both fail
+        self.assertEqual(save_metadata_batch(items), ['id-3'] + [f'id-{n}' for n in range(25, 30)])
+
+    @patch('batch_upload.index_image')
+    @patch('batch_upload.save_metadata_batch')
+    @patch('batch_upload.upload_to_s3')
+    @patch('batch_upload.s3')
+    @patch('batch_upload.dynamodb')
+    def test_upload_images_reports_per_file(self, mock_dynamodb, mock_s3, mock_upload_to_s3,
+                                            mock_save_metadata_batch, mock_index_image):
+        def upload(data, key, content_type):
+            if data == PNG_DATA + b'fail':
+                raise Exception('Error uploading image to S3: boom')
+            return key
+        mock_upload_to_s3.side_effect = upload
+        # The row of the last file is not written
+        mock_save_metadata_batch.side_effect = lambda items: [items[-1]['image_id']]
+
+        entries = [
+            {'title': 'Sunset', 'description': 'Beach', 'image_file': PNG_DATA},
+            {'title': 'Text', 'description': 'Not an image', 'image_file': b'dummy image data'},
+            {'title': '', 'description': 'No title', 'image_file': PNG_DATA},
+            {'title': 'Fail', 'description': 'S3 error', 'image_file': PNG_DATA + b'fail'},
+            {'title': 'Harbor', 'description': 'Boats', 'image_file': PNG_DATA + b'x'}
+        ]
+        results = upload_images(entries, owner_id='user-1', workers=2)
+
+        self.assertEqual([result['status'] for result in results], ['created', 'error', 'error', 'error', 'error'])
+        self.assertTrue(results[1]['message'].startswith('Invalid image'))
+        self.assertIn('boom', results[3]['message'])
+        self.assertEqual(results[4]['message'], 'Error saving metadata to DynamoDB')
+        self.assertEqual(results[0]['s3_url'],
+                         f"https://image-bucket-madhu.s3.amazonaws.com/{results[0]['image_id']}.png")
+
+        items = mock_save_metadata_batch.call_args[0][0]
+        self.assertEqual(len(items), 2)
+        self.assertEqual((items[0]['owner_id'], items[0]['format'], items[0]['title']), ('user-1', 'png', 'Sunset'))
+        mock_index_image.assert_called_once()
+        # The original of the file whose row failed is removed again
+        self.assertEqual(mock_s3.delete_objects.call_args[1]['Delete']['Objects'], [{'Key': items[1]['s3_key']}])
+
+    @patch('batch_upload.index_image')
+    @patch('batch_upload.save_metadata_batch')
+    @patch('batch_upload.upload_to_s3')
+    @patch('batch_upload.s3')
+    @patch('batch_upload.dynamodb')
+    def test_index_error_keeps_saved_rows(self, mock_dynamodb, mock_s3, mock_upload_to_s3, mock_save_metadata_batch,
+                                          mock_index_image):
+        mock_upload_to_s3.side_effect = lambda data, key, content_type: key
+        mock_save_metadata_batch.return_value = []
+        mock_index_image.side_effect = Exception('Error writing search postings: throttled')
+
+        results = upload_images([{'title': 'Sunset', 'description': 'Beach', 'image_file': PNG_DATA}])
+
+        self.assertEqual(results[0]['status'], 'created')
+        mock_s3.delete_objects.assert_not_called()
+
+    @patch('batch_upload.upload_images')
+    def test_handler(self, mock_upload_images):
+        mock_upload_images.return_value = [{'status': 'created', 'image_id': 'a', 's3_url': 'u'},
+                                           {'status': 'error', 'message': 'Invalid image: x'}]
+        event = multipart_event([('title', 'T'), ('description', 'D'),
+                                 ('image_file', ('a.png', PNG_DATA)), ('image_file', ('b.png', b'x'))])
+        event['requestContext'] = {'authorizer': {'claims': {'sub': 'user-1'}}}
+        response = batch_upload_handler(event, None)
+        self.assertEqual(response['statusCode'], 200)
+        body = json.loads(response['body'])
+        self.assertEqual(body['counts'], {'created': 1, 'error': 1})
+        self.assertEqual([result['index'] for result in body['results']], [0, 1])
+        self.assertEqual(mock_upload_images.call_args[1]['owner_id'], 'user-1')
+
+    def test_handler_rejects_empty_and_oversized_batches(self):
+        self.assertEqual(batch_upload_handler({'body': json.dumps({'images': []})}, None)['statusCode'], 400)
+        with patch('batch_upload.MAX_BATCH_FILES', 1):
+            images = [{'title': 'T', 'description': 'D', 'image_file': ''}] * 2
+            response = batch_upload_handler({'body': json.dumps({'images': images})}, None)
+        self.assertEqual(response['statusCode'], 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
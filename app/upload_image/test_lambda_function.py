@@ -1,8 +1,21 @@
 import unittest
 from unittest.mock import patch, MagicMock
+import os
+import sys
 import json
 import base64
-from lambda_function import lambda_handler
+import struct
+import hashlib
+
+# Shared modules ship as a Lambda layer; make them importable for local runs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'layer', 'python'))
+
+from lambda_function import (lambda_handler, parse_multipart_formdata, upload_to_s3, save_metadata_to_dynamodb,
+                             BytesViewReader)
+from catalog_index import shard_of
+
+# A 2x1 PNG header: enough for the format sniffer, which never decodes pixels
+PNG_DATA = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR' + struct.pack('>II', 2, 1) + b'\x08\x02\x00\x00\x00'
 
 class TestUploadImageLambdaHandler(unittest.TestCase):
 
@@ -12,7 +25,7 @@ class TestUploadImageLambdaHandler(unittest.TestCase):
         mock_upload_to_s3.return_value = 'test-image.jpg'
         mock_save_metadata_to_dynamodb.return_value = None
 
-        dummy_image_data = base64.b64encode(b"dummy image data").decode('utf-8')
+        dummy_image_data = base64.b64encode(PNG_DATA).decode('utf-8')
 
         event = {
             'body': json.dumps({
@@ -29,6 +42,71 @@ class TestUploadImageLambdaHandler(unittest.TestCase):
         self.assertEqual(body['message'], 'Image uploaded successfully')
         self.assertIn('image_id', body)
 
+    @patch('lambda_function.upload_to_s3')
+    @patch('lambda_function.save_metadata_to_dynamodb')
+    def test_key_and_content_type_follow_sniffed_format(self, mock_save_metadata_to_dynamodb, mock_upload_to_s3):
+        event = {'body': json.dumps({'image_file': base64.b64encode(PNG_DATA).decode('utf-8'),
+                                     'title': 'Test Image', 'description': 'Test Description'})}
+
+        response = lambda_handler(event, None)
+
+        self.assertEqual(response['statusCode'], 200)
+        image_id = json.loads(response['body'])['image_id']
+        mock_upload_to_s3.assert_called_once_with(PNG_DATA, f'{image_id}.png', 'image/png')
+        kwargs = mock_save_metadata_to_dynamodb.call_args[1]
+        self.assertEqual(kwargs['s3_key'], f'{image_id}.png')
+        self.assertEqual(kwargs['image_info'], {'format': 'png', 'width': 2, 'height': 1, 'size_bytes': len(PNG_DATA)})
+        self.assertIsNone(kwargs['owner_id'])
+
+    @patch('lambda_function.index_image')
+    @patch('lambda_function.dynamodb')
+    def test_metadata_row_carries_listing_keys(self, mock_dynamodb, mock_index_image):
+        save_metadata_to_dynamodb('abc', 'Title', 'Description', 'https://x/abc.png', s3_key='abc.png',
+                                  owner_id='user-1')
+        item = mock_dynamodb.Table.return_value.put_item.call_args[1]['Item']
+        self.assertEqual(item['owner_id'], 'user-1')
+        self.assertIsInstance(item['created_at'], int)
+        self.assertTrue(item['time_bucket'].endswith(f'#{shard_of("abc")}'))
+
+    @patch('lambda_function.CONTENT_ADDRESSED_STORAGE', True)
+    @patch('lambda_function.release_blob')
+    @patch('lambda_function.index_image')
+    @patch('lambda_function.mark_blob_uploaded')
+    @patch('lambda_function.acquire_blob')
+    @patch('lambda_function.upload_to_s3')
+    @patch('lambda_function.s3')
+    @patch('lambda_function.dynamodb')
+    def test_index_error_keeps_saved_row_and_blob(self, mock_dynamodb, mock_s3, mock_upload_to_s3, mock_acquire_blob,
+                                                  mock_mark_blob_uploaded, mock_index_image, mock_release_blob):
+        mock_acquire_blob.return_value = True
+        mock_index_image.side_effect = Exception('Error writing search postings: throttled')
+        event = {'body': json.dumps({'image_file': base64.b64encode(PNG_DATA).decode('utf-8'),
+                                     'title': 'Test Image', 'description': 'Test Description'})}
+
+        response = lambda_handler(event, None)
+
+        self.assertEqual(response['statusCode'], 200)
+        mock_dynamodb.Table.return_value.put_item.assert_called_once()
+        mock_release_blob.assert_not_called()
+        mock_s3.delete_object.assert_not_called()
+
+        # A failed row write still gives the reference back
+        mock_dynamodb.Table.return_value.put_item.side_effect = Exception('throttled')
+        mock_release_blob.return_value = True
+        self.assertEqual(lambda_handler(event, None)['statusCode'], 500)
+        mock_release_blob.assert_called_once()
+        mock_s3.delete_object.assert_called_once()
+
+    @patch('lambda_function.upload_to_s3')
+    def test_rejects_files_that_are_not_images(self, mock_upload_to_s3):
+        for data in (b'dummy image data', PNG_DATA[:20]):
+            event = {'body': json.dumps({'image_file': base64.b64encode(data).decode('utf-8'),
+                                         'title': 'Test Image', 'description': 'Test Description'})}
+            response = lambda_handler(event, None)
+            self.assertEqual(response['statusCode'], 400)
+            self.assertTrue(json.loads(response['body'])['message'].startswith('Invalid image'))
+        mock_upload_to_s3.assert_not_called()
+
     @patch('lambda_function.upload_to_s3')
     @patch('lambda_function.save_metadata_to_dynamodb')
     def test_lambda_handler_missing_fields(self, mock_save_metadata_to_dynamodb, mock_upload_to_s3):
@@ -50,7 +128,7 @@ class TestUploadImageLambdaHandler(unittest.TestCase):
     def test_lambda_handler_upload_failure(self,mock_upload_to_s3):
         mock_upload_to_s3.side_effect = Exception('S3 upload error')
 
-        dummy_image_data = base64.b64encode(b"dummy image data").decode('utf-8')
+        dummy_image_data = base64.b64encode(PNG_DATA).decode('utf-8')
 
         event = {
             'body': json.dumps({
@@ -73,7 +151,7 @@ class TestUploadImageLambdaHandler(unittest.TestCase):
 
         mock_save_metadata_to_dynamodb.side_effect = Exception('DynamoDB error')
 
-        dummy_image_data = base64.b64encode(b"dummy image data").decode('utf-8')
+        dummy_image_data = base64.b64encode(PNG_DATA).decode('utf-8')
 
         event = {
             'body': json.dumps({
@@ -89,5 +167,184 @@ class TestUploadImageLambdaHandler(unittest.TestCase):
         body = json.loads(response['body'])
         self.assertEqual(body['message'], 'DynamoDB error')
 
+def build_multipart(boundary, fields, files):
+    lines = []
+    for name, value in fields.items():
+        lines.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'.encode() + value.encode() + b'\r\n')
+    for name, (filename, data) in files.items():
+        lines.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: image/jpeg\r\n\r\n'.encode() + data + b'\r\n')
+    lines.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(lines)
+
+class TestParseMultipartFormdata(unittest.TestCase):
+
+    def test_parses_text_and_file_fields(self):
+        image = b'\xff\xd8binary\r\n\r\ndata\r\n'
+        body = build_multipart('XyZ', {'title': 'Sunset', 'description': 'Beach'}, {'image_file': ('a.jpg', image)})
+        form_data = parse_multipart_formdata(body, 'multipart/form-data; boundary=XyZ')
+        self.assertEqual(form_data['title'], 'Sunset')
+        self.assertEqual(form_data['description'], 'Beach')
+        # File content keeps its trailing CRLF and is a zero-copy view of the body
+        self.assertIsInstance(form_data['image_file'], memoryview)
+        self.assertEqual(form_data['image_file'].tobytes(), image)
+        self.assertIs(form_data['image_file'].obj, body)
+
+    def test_repeated_fields(self):
+        body = (b'--XyZ\r\nContent-Disposition: form-data; name="title"\r\n\r\nA\r\n'
+                b'--XyZ\r\nContent-Disposition: form-data; name="image_file"; filename="a.png"\r\n\r\n1\r\n'
+                b'--XyZ\r\nContent-Disposition: form-data; name="title"\r\n\r\nB\r\n'
+                b'--XyZ\r\nContent-Disposition: form-data; name="image_file"; filename="b.png"\r\n\r\n2\r\n'
+                b'--XyZ--')
+        form_data = parse_multipart_formdata(body, 'multipart/form-data; boundary=XyZ', repeated=True)
+        self.assertEqual(form_data['title'], ['A', 'B'])
+        self.assertEqual([part.tobytes() for part in form_data['image_file']], [b'1', b'2'])
+        self.assertEqual(parse_multipart_formdata(body, 'multipart/form-data; boundary=XyZ')['title'], 'B')
+
+    def test_quoted_values_and_boundary_with_equals(self):
+        boundary = 'abc==def'
+        body = (f'--{boundary}\r\nContent-Disposition: form-data; name="image_file"; filename="a;b=c.jpg"\r\n\r\n'
+                f'DATA\r\n--{boundary}\r\nContent-Disposition: form-data; name="title"\r\n\r\nx=y\r\n'
+                f'--{boundary}--').encode()
+        form_data = parse_multipart_formdata(body, f'multipart/form-data; boundary="{boundary}"')
+        self.assertEqual(form_data['image_file'].tobytes(), b'DATA')
+        self.assertEqual(form_data['title'], 'x=y')
+
+    def test_missing_closing_boundary(self):
+        body = b'--XyZ\r\nContent-Disposition: form-data; name="title"\r\n\r\nSunset'
+        with self.assertRaises(ValueError):
+            parse_multipart_formdata(body, 'multipart/form-data; boundary=XyZ')
+
+    def test_bytes_view_reader_streams_and_seeks(self):
+        reader = BytesViewReader(memoryview(b'0123456789')[2:8])
+        self.assertEqual(reader.read(4), b'2345')
+        self.assertEqual(reader.read(), b'67')
+        reader.seek(0, 2)
+        self.assertEqual(reader.tell(), 6)
+        reader.seek(1)
+        self.assertEqual(reader.read(2), b'34')
+
+    @patch('lambda_function.upload_to_s3')
+    @patch('lambda_function.save_metadata_to_dynamodb')
+    def test_lambda_handler_multipart_body(self, mock_save_metadata_to_dynamodb, mock_upload_to_s3):
+        body = build_multipart('XyZ', {'title': 'Sunset', 'description': 'Beach'}, {'image_file': ('a.png', PNG_DATA)})
+        event = {
+            'headers': {'Content-Type': 'multipart/form-data; boundary=XyZ'},
+            'body': base64.b64encode(body).decode('utf-8')
+        }
+        response = lambda_handler(event, None)
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual(mock_upload_to_s3.call_args[0][0].tobytes(), PNG_DATA)
+
+    def test_lambda_handler_malformed_multipart(self):
+        event = {
+            'headers': {'content-type': 'multipart/form-data; boundary=XyZ'},
+            'body': base64.b64encode(b'no boundary here').decode('utf-8')
+        }
+        response = lambda_handler(event, None)
+        self.assertEqual(response['statusCode'], 400)
+
+    @patch('lambda_function.MULTIPART_THRESHOLD', 4)
+    @patch('lambda_function.multipart_upload')
+    @patch('lambda_function.s3')
+    def test_upload_to_s3_uses_multipart_above_threshold(self, mock_s3, mock_multipart_upload):
+        upload_to_s3(b'small', 'a.png', 'image/png')
+        mock_multipart_upload.assert_called_once_with(mock_s3, 'image-bucket-madhu', 'a.png', b'small',
+                                                      extra_args={'ContentType': 'image/png'})
+        mock_s3.put_object.assert_not_called()
+
+        upload_to_s3(b'abc', 'b.jpg')
+        mock_s3.put_object.assert_called_once_with(Bucket='image-bucket-madhu', Key='b.jpg', Body=b'abc')
+
+    @patch('lambda_function.CONTENT_ADDRESSED_STORAGE', True)
+    @patch('lambda_function.mark_blob_uploaded')
+    @patch('lambda_function.acquire_blob')
+    @patch('lambda_function.upload_to_s3')
+    @patch('lambda_function.save_metadata_to_dynamodb')
+    def test_content_addressed_upload(self, mock_save_metadata_to_dynamodb, mock_upload_to_s3,
+                                      mock_acquire_blob, mock_mark_blob_uploaded):
+        digest = hashlib.sha256(PNG_DATA).hexdigest()
+        event = {
+            'body': json.dumps({
+                'image_file': base64.b64encode(PNG_DATA).decode('utf-8'),
+                'title': 'Test Image',
+                'description': 'Test Description'
+            })
+        }
+
+        # First upload of these bytes stores the blob
+        mock_acquire_blob.return_value = True
+        response = lambda_handler(event, None)
+        self.assertEqual(response['statusCode'], 200)
+        mock_upload_to_s3.assert_called_once_with(PNG_DATA, f'blobs/{digest}', 'image/png')
+        kwargs = mock_save_metadata_to_dynamodb.call_args[1]
+        self.assertEqual(kwargs, {'s3_key': f'blobs/{digest}', 'content_sha256': digest,
+                                  'image_info': {'format': 'png', 'width': 2, 'height': 1, 'size_bytes': len(PNG_DATA)},
+                                  'owner_id': None})
+
+        # A repeat upload is a metadata-only write
+        mock_upload_to_s3.reset_mock()
+        mock_acquire_blob.return_value = False
+        response = lambda_handler(event, None)
+        self.assertEqual(response['statusCode'], 200)
+        mock_upload_to_s3.assert_not_called()
+        self.assertEqual(json.loads(response['body'])['s3_url'], f'https://image-bucket-madhu.s3.amazonaws.com/blobs/{digest}')
+
+    @patch('lambda_function.ASYNC_PROCESSING', True)
+    @patch('lambda_function.upload_queue')
+    @patch('lambda_function.dynamodb')
+    @patch('lambda_function.upload_to_s3')
+    @patch('lambda_function.save_metadata_to_dynamodb')
+    def test_async_upload_is_queued(self, mock_save_metadata_to_dynamodb, mock_upload_to_s3, mock_dynamodb,
+                                    mock_upload_queue):
+        mock_upload_to_s3.side_effect = lambda data, key, content_type: key
+        table = mock_dynamodb.Table.return_value
+        table.get_item.return_value = {}
+        event = {
+            'headers': {'Idempotency-Key': 'req-1'},
+            'requestContext': {'authorizer': {'claims': {'sub': 'user-1'}}},
+            'body': json.dumps({
+                'image_file': base64.b64encode(PNG_DATA).decode('utf-8'),
+                'title': 'Test Image',
+                'description': 'Test Description'
+            })
+        }
+
+        response = lambda_handler(event, None)
+
+        self.assertEqual(response['statusCode'], 202)
+        body = json.loads(response['body'])
+        self.assertEqual(body['status'], 'queued')
+        image_id = body['image_id']
+        self.assertEqual(table.put_item.call_args[1]['Item']['status'], 'queued')
+        self.assertEqual(table.put_item.call_args[1]['Item']['owner_id'], 'user-1')
+        mock_upload_queue.return_value.send.assert_called_once_with(
+            {'image_id': image_id, 's3_key': f'{image_id}.png'}, deduplication_id=image_id)
+        mock_save_metadata_to_dynamodb.assert_not_called()
+
+        # A retry with the same key reports the first attempt without uploading again
+        mock_upload_to_s3.reset_mock()
+        table.get_item.return_value = {'Item': {'image_id': image_id, 'status': 'active', 's3_url': body['s3_url']}}
+        response = lambda_handler(event, None)
+        self.assertEqual(response['statusCode'], 202)
+        self.assertEqual(json.loads(response['body'])['image_id'], image_id)
+        self.assertEqual(json.loads(response['body'])['status'], 'active')
+        mock_upload_to_s3.assert_not_called()
+
+    @patch('lambda_function.ASYNC_PROCESSING', True)
+    @patch('lambda_function.upload_queue')
+    @patch('lambda_function.dynamodb')
+    @patch('lambda_function.upload_to_s3')
+    def test_async_upload_send_failure_removes_row(self, mock_upload_to_s3, mock_dynamodb, mock_upload_queue):
+        mock_upload_to_s3.side_effect = lambda data, key, content_type: key
+        mock_upload_queue.return_value.send.side_effect = Exception('Error enqueueing job: throttled')
+        event = {'body': json.dumps({'image_file': base64.b64encode(PNG_DATA).decode('utf-8'),
+                                     'title': 'Test Image', 'description': 'Test Description'})}
+
+        response = lambda_handler(event, None)
+
+        self.assertEqual(response['statusCode'], 500)
+        mock_dynamodb.Table.return_value.delete_item.assert_called_once()
+
 if __name__ == '__main__':
     unittest.main()
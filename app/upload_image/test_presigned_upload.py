@@ -0,0 +1,174 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+import sys
+import json
+import base64
+import struct
+from io import BytesIO
+from botocore.exceptions import ClientError
+
+# Shared modules ship as a Lambda layer; make them importable for local runs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'layer', 'python'))
+
+from presigned_upload import create_upload_handler, finalize_upload_handler, s3_event_handler, activate_upload
+from lambda_function import lambda_handler
+
+# Smallest JPEG header the format sniffer accepts
+JPEG_DATA = (b'\xff\xd8\xff\xc0' + struct.pack('>HBHHB', 8, 8, 1, 2, 3) + b'\xff\xda\x00\x02' + b'\x00' * 16
+             + b'\xff\xd9')
+
+
+def client_error(code):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, 'Operation')
+
+
+class TestCreateUploadHandler(unittest.TestCase):
+
+    @patch('presigned_upload.save_pending_metadata')
+    @patch('presigned_upload.s3')
+    def test_returns_presigned_post(self, mock_s3, mock_save_pending_metadata):
+        mock_s3.generate_presigned_post.return_value = {'url': 'https://bucket', 'fields': {'key': 'x.jpg'}}
+        event = {'body': json.dumps({'title': 'Sunset', 'description': 'Beach', 'content_type': 'image/png',
+                                     'content_length': 1024})}
+        response = create_upload_handler(event, None)
+
+        self.assertEqual(response['statusCode'], 200)
+        body = json.loads(response['body'])
+        self.assertEqual(body['upload']['url'], 'https://bucket')
+        kwargs = mock_s3.generate_presigned_post.call_args[1]
+        # Stored under the declared format's extension
+        self.assertEqual(kwargs['Key'], f"{body['image_id']}.png")
+        self.assertIn(['content-length-range', 1, 1024], kwargs['Conditions'])
+        self.assertIn({'Content-Type': 'image/png'}, kwargs['Conditions'])
+        mock_save_pending_metadata.assert_called_once_with(body['image_id'], 'Sunset', 'Beach',
+                                                           f"{body['image_id']}.png", 'image/png', 1024, None)
+
+    def test_rejects_unsupported_content_type(self):
+        event = {'body': json.dumps({'title': 'Doc', 'description': 'PDF', 'content_type': 'application/pdf'})}
+        self.assertEqual(create_upload_handler(event, None)['statusCode'], 400)
+
+    def test_rejects_oversized_upload(self):
+        event = {'body': json.dumps({'title': 'Big', 'description': 'Huge', 'content_length': 10 ** 12})}
+        self.assertEqual(create_upload_handler(event, None)['statusCode'], 400)
+
+
+class TestActivateUpload(unittest.TestCase):
+
+    def pending_item(self):
+        return {'image_id': 'abc', 'title': 'Sunset', 'description': 'Beach', 'status': 'pending',
+                'content_type': 'image/jpeg', 'max_bytes': 100}
+
+    @patch('presigned_upload.index_image')
+    @patch('presigned_upload.s3')
+    @patch('presigned_upload.dynamodb')
+    def test_marks_row_active_and_indexes(self, mock_dynamodb, mock_s3, mock_index_image):
+        table = mock_dynamodb.Table.return_value
+        table.get_item.return_value = {'Item': self.pending_item()}
+        mock_s3.head_object.return_value = {'ContentLength': 42, 'ContentType': 'image/jpeg'}
+        mock_s3.get_object.return_value = {'Body': BytesIO(JPEG_DATA)}
+
+        self.assertEqual(activate_upload('abc'), (200, 'Image uploaded successfully'))
+        mock_s3.head_object.assert_called_once_with(Bucket='image-bucket-madhu', Key='abc.jpg')
+        self.assertTrue(mock_s3.get_object.call_args[1]['Range'].startswith('bytes=0-'))
+        kwargs = table.update_item.call_args[1]
+        self.assertEqual(kwargs['ConditionExpression'], '#status = :pending')
+        values = kwargs['ExpressionAttributeValues']
+        self.assertEqual((values[':size'], values[':format'], values[':width'], values[':height']),
+                         (42, 'jpeg', 2, 1))
+        mock_index_image.assert_called_once_with(table, 'abc', 'Sunset', 'Beach')
+
+    @patch('presigned_upload.s3')
+    @patch('presigned_upload.dynamodb')
+    def test_object_not_uploaded_yet(self, mock_dynamodb, mock_s3):
+        mock_dynamodb.Table.return_value.get_item.return_value = {'Item': self.pending_item()}
+        mock_s3.head_object.side_effect = client_error('404')
+        self.assertEqual(activate_upload('abc')[0], 409)
+
+    @patch('presigned_upload.s3')
+    @patch('presigned_upload.dynamodb')
+    def test_object_breaking_policy_is_deleted(self, mock_dynamodb, mock_s3):
+        mock_dynamodb.Table.return_value.get_item.return_value = {'Item': self.pending_item()}
+        mock_s3.head_object.return_value = {'ContentLength': 4096, 'ContentType': 'image/jpeg'}
+        self.assertEqual(activate_upload('abc')[0], 422)
+        mock_s3.delete_object.assert_called_once_with(Bucket='image-bucket-madhu', Key='abc.jpg')
+
+    @patch('presigned_upload.s3')
+    @patch('presigned_upload.dynamodb')
+    def test_object_not_matching_declared_format_is_deleted(self, mock_dynamodb, mock_s3):
+        item = dict(self.pending_item(), content_type='image/png', s3_key='abc.png')
+        mock_dynamodb.Table.return_value.get_item.return_value = {'Item': item}
+        mock_s3.head_object.return_value = {'ContentLength': 42, 'ContentType': 'image/png'}
+        mock_s3.get_object.return_value = {'Body': BytesIO(JPEG_DATA)}
+        self.assertEqual(activate_upload('abc')[0], 422)
+        mock_s3.delete_object.assert_called_once_with(Bucket='image-bucket-madhu', Key='abc.png')
+        mock_dynamodb.Table.return_value.update_item.assert_not_called()
+
+        mock_s3.get_object.return_value = {'Body': BytesIO(b'not an image')}
+        self.assertEqual(activate_upload('abc')[0], 422)
+
+    @patch('presigned_upload.s3')
+    @patch('presigned_upload.dynamodb')
+    def test_already_active_is_idempotent(self, mock_dynamodb, mock_s3):
+        mock_dynamodb.Table.return_value.get_item.return_value = {'Item': {'image_id': 'abc', 'status': 'active'}}
+        self.assertEqual(activate_upload('abc')[0], 200)
+        mock_s3.head_object.assert_not_called()
+
+    @patch('presigned_upload.s3')
+    @patch('presigned_upload.dynamodb')
+    def test_async_upload_is_left_alone(self, mock_dynamodb, mock_s3):
+        mock_dynamodb.Table.return_value.get_item.return_value = {'Item': {'image_id': 'abc', 'status': 'queued'}}
+        self.assertEqual(activate_upload('abc')[0], 409)
+        mock_s3.head_object.assert_not_called()
+        mock_s3.delete_object.assert_not_called()
+        mock_dynamodb.Table.return_value.update_item.assert_not_called()
+
+
+class TestFinalizeHandlers(unittest.TestCase):
+
+    @patch('presigned_upload.activate_upload')
+    def test_finalize_handler(self, mock_activate_upload):
+        mock_activate_upload.return_value = (404, 'Image not found')
+        response = finalize_upload_handler({'pathParameters': {'image_id': 'abc'}}, None)
+        self.assertEqual(response['statusCode'], 404)
+        self.assertEqual(finalize_upload_handler({'pathParameters': {}}, None)['statusCode'], 400)
+
+    @patch('presigned_upload.activate_upload')
+    def test_s3_event_handler(self, mock_activate_upload):
+        mock_activate_upload.return_value = (200, 'Image uploaded successfully')
+        event = {'Records': [{'s3': {'object': {'key': 'abc.png'}}},
+                             {'s3': {'object': {'key': 'derivatives/abc/128.jpg'}}},
+                             {'s3': {'object': {'key': 'notes.txt'}}}]}
+        self.assertEqual(s3_event_handler(event, None), {'abc': 200})
+        mock_activate_upload.assert_called_once_with('abc')
+
+    @patch('lambda_function.ASYNC_PROCESSING', True)
+    @patch('lambda_function.upload_queue')
+    @patch('lambda_function.upload_to_s3')
+    @patch('presigned_upload.s3')
+    @patch('lambda_function.dynamodb')
+    def test_s3_event_for_async_upload(self, mock_dynamodb, mock_s3, mock_upload_to_s3, mock_upload_queue):
+        rows = {}
+        table = mock_dynamodb.Table.return_value
+        table.put_item.side_effect = lambda Item, **kwargs: rows.setdefault(Item['image_id'], Item)
+        table.get_item.side_effect = lambda Key, **kwargs: {'Item': rows[Key['image_id']]}
+        mock_upload_to_s3.side_effect = lambda data, key, content_type: key
+        mock_s3.head_object.return_value = {'ContentLength': len(JPEG_DATA), 'ContentType': 'image/jpeg'}
+        event = {'body': json.dumps({'image_file': base64.b64encode(JPEG_DATA).decode('utf-8'),
+                                     'title': 'Sunset', 'description': 'Beach'})}
+
+        response = lambda_handler(event, None)
+        self.assertEqual(response['statusCode'], 202)
+        image_id = json.loads(response['body'])['image_id']
+
+        # The async upload's object landing in the bucket notifies the presigned path too
+        with patch('presigned_upload.dynamodb', mock_dynamodb):
+            results = s3_event_handler({'Records': [{'s3': {'object': {'key': f'{image_id}.jpg'}}}]}, None)
+        self.assertEqual(results[image_id], 409)
+        mock_s3.delete_object.assert_not_called()
+        table.update_item.assert_not_called()
+        self.assertEqual(rows[image_id]['status'], 'queued')
+
+
+if __name__ == '__main__':
+    unittest.main()
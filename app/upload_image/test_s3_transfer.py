@@ -0,0 +1,85 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import base64
+import hashlib
+from botocore.exceptions import ClientError
+from s3_transfer import part_ranges, multipart_upload, MultipartUploadError, MIN_PART_SIZE
+
+MB = 1024 * 1024
+
+
+def client_error(operation):
+    return ClientError({'Error': {'Code': 'InternalError', 'Message': 'boom'}}, operation)
+
+
+def recording_client():
+    s3 = MagicMock()
+    s3.create_multipart_upload.return_value = {'UploadId': 'upload-1'}
+    uploaded = {}
+
+    def upload_part(**kwargs):
+        uploaded[kwargs['PartNumber']] = (kwargs['Body'].read(), kwargs['ContentMD5'])
+        return {'ETag': f'"etag-{kwargs["PartNumber"]}"'}
+
+    s3.upload_part.side_effect = upload_part
+    return s3, uploaded
+
+
+class TestS3Transfer(unittest.TestCase):
+
+    def test_part_ranges(self):
+        self.assertEqual(part_ranges(12 * MB, 5 * MB), [(1, 0, 5 * MB), (2, 5 * MB, 10 * MB), (3, 10 * MB, 12 * MB)])
+        # Part size never drops below the S3 minimum
+        self.assertEqual(part_ranges(6 * MB, 1 * MB)[0], (1, 0, MIN_PART_SIZE))
+
+    def test_multipart_upload_sends_parts_with_md5(self):
+        s3, uploaded = recording_client()
+        data = bytes(range(256)) * (48 * 1024)  # 12 MB
+        multipart_upload(s3, 'bucket', 'key.jpg', data, part_size=5 * MB, max_concurrency=3)
+
+        self.assertEqual(b''.join(uploaded[number][0] for number in sorted(uploaded)), data)
+        for body, md5 in uploaded.values():
+            self.assertEqual(md5, base64.b64encode(hashlib.md5(body).digest()).decode('ascii'))
+        parts = s3.complete_multipart_upload.call_args[1]['MultipartUpload']['Parts']
+        self.assertEqual([part['PartNumber'] for part in parts], [1, 2, 3])
+        s3.abort_multipart_upload.assert_not_called()
+
+    @patch('s3_transfer.time')
+    def test_multipart_upload_aborts_on_failure(self, mock_time):
+        s3 = MagicMock()
+        s3.create_multipart_upload.return_value = {'UploadId': 'upload-1'}
+        s3.upload_part.side_effect = client_error('UploadPart')
+        with self.assertRaises(MultipartUploadError) as raised:
+            multipart_upload(s3, 'bucket', 'key.jpg', b'x' * (6 * MB), part_size=5 * MB)
+        self.assertIsNone(raised.exception.upload_id)
+        s3.abort_multipart_upload.assert_called_once_with(Bucket='bucket', Key='key.jpg', UploadId='upload-1')
+        s3.complete_multipart_upload.assert_not_called()
+
+    @patch('s3_transfer.time')
+    def test_multipart_upload_can_be_left_open_for_resume(self, mock_time):
+        s3 = MagicMock()
+        s3.create_multipart_upload.return_value = {'UploadId': 'upload-1'}
+        s3.upload_part.side_effect = client_error('UploadPart')
+        with self.assertRaises(MultipartUploadError) as raised:
+            multipart_upload(s3, 'bucket', 'key.jpg', b'x' * (6 * MB), part_size=5 * MB, abort_on_failure=False)
+        self.assertEqual(raised.exception.upload_id, 'upload-1')
+        s3.abort_multipart_upload.assert_not_called()
+
+    def test_resume_skips_parts_already_uploaded(self):
+        s3, uploaded = recording_client()
+        s3.list_parts.return_value = {
+            'Parts': [{'PartNumber': 1, 'ETag': '"old-1"', 'Size': 5 * MB},
+                      {'PartNumber': 2, 'ETag': '"short-2"', 'Size': 1}],
+            'IsTruncated': False
+        }
+        multipart_upload(s3, 'bucket', 'key.jpg', b'x' * (11 * MB), part_size=5 * MB, upload_id='upload-0')
+
+        s3.create_multipart_upload.assert_not_called()
+        # Part 2 was listed with the wrong size, so it is sent again
+        self.assertEqual(sorted(uploaded), [2, 3])
+        parts = s3.complete_multipart_upload.call_args[1]['MultipartUpload']['Parts']
+        self.assertEqual(parts[0], {'PartNumber': 1, 'ETag': '"old-1"'})
+
+
+if __name__ == '__main__':
+    unittest.main()
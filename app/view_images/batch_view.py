@@ -0,0 +1,90 @@
+"""
+Batch view endpoint (POST /images/view, handler batch_view.batch_view_handler).
+
+A gallery page needs download URLs for 50-200 images. This resolves them in
+one invocation: metadata comes from the metadata cache and, for the misses,
+batch_get_item (100 keys per call), then every URL is presigned in one pass.
+Each image_id gets its own status in the response.
+"""
+import json
+from lambda_function import (S3_BUCKET_NAME, get_images_metadata, generate_presigned_url, parse_view_options,
+                             is_viewable, select_object)
+from request_metrics import instrument, phase
+
+MAX_BATCH_SIZE = 500
+
+STATUS_OK = 'ok'
+STATUS_NOT_FOUND = 'not_found'
+
+def response(status_code, body):
+    return {
+        'statusCode': status_code,
+        'body': json.dumps(body)
+    }
+
+# image_ids from a JSON body {"image_ids": [...], "size": ..., ...} or the
+# query string (?ids=a,b,c); view options may come from either
+def parse_request(event):
+    query_params = dict(event.get('queryStringParameters') or {})
+    payload = {}
+    if event.get('body'):
+        try:
+            payload = json.loads(event['body'])
+        except ValueError:
+            raise ValueError('Request body must be JSON')
+        if not isinstance(payload, dict):
+            raise ValueError('Request body must be a JSON object')
+
+    image_ids = payload.get('image_ids')
+    if image_ids is None and query_params.get('ids'):
+        image_ids = [image_id for image_id in query_params['ids'].split(',') if image_id]
+    if not isinstance(image_ids, list) or not image_ids or \
+            not all(isinstance(image_id, str) and image_id for image_id in image_ids):
+        raise ValueError('image_ids must be a non-empty list of strings')
+    if len(image_ids) > MAX_BATCH_SIZE:
+        raise ValueError(f'At most {MAX_BATCH_SIZE} image_ids per request')
+
+    for name in ('size', 'format', 'expires'):
+        if payload.get(name) is not None:
+            query_params[name] = str(payload[name])
+    return image_ids, query_params
+
+# Lambda handler returning download URLs for many images at once
+@instrument('view_images.batch')
+def batch_view_handler(event, context):
+    try:
+        try:
+            with phase('parse'):
+                image_ids, query_params = parse_request(event)
+                options = parse_view_options(query_params, event.get('headers') or {})
+        except ValueError as e:
+            return response(400, {'message': str(e)})
+
+        metadata = get_images_metadata(image_ids)
+
+        images = {}
+        counts = {STATUS_OK: 0, STATUS_NOT_FOUND: 0}
+        for image_id in dict.fromkeys(image_ids):
+            image_metadata = metadata.get(image_id)
+            if not is_viewable(image_metadata):
+                images[image_id] = {'status': STATUS_NOT_FOUND}
+                counts[STATUS_NOT_FOUND] += 1
+                continue
+            s3_key, variant = select_object(image_id, image_metadata, options)
+            try:
+                download_url = generate_presigned_url(S3_BUCKET_NAME, s3_key, expiration=options['expires_in'])
+            except Exception as e:
+                images[image_id] = {'status': 'error', 'message': str(e)}
+                counts['error'] = counts.get('error', 0) + 1
+                continue
+            images[image_id] = {'status': STATUS_OK, 'variant': variant, 'download_url': download_url}
+            counts[STATUS_OK] += 1
+
+        return response(200, {
+            'message': 'Images resolved',
+            'counts': counts,
+            'images': images
+        })
+
+    except Exception as e:
+        return response(500, {'message': str(e)})
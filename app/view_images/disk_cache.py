@@ -0,0 +1,117 @@
+"""
+Size-bounded LRU cache of files in a local directory.
+
+Holds rendered image transforms in /tmp so repeat requests to a warm
+container (or the local gateway) are served without fetching or decoding
+the original. Entries are whole files named by their key; the index of
+keys, sizes and recency lives in memory and is rebuilt from the directory
+(oldest modification first) when the cache is created, so a restarted
+process keeps what it rendered. Writes go to a temporary file and are
+renamed into place, so readers never see a partial entry. When the total
+size exceeds max_bytes the least recently used files are deleted.
+"""
+import os
+import uuid
+import threading
+from collections import OrderedDict
+
+class DiskCache(object):
+    """get(key) -> bytes or None; put(key, data). Keys must be valid file names."""
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> size in bytes, least recently used first
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load()
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    # Index whatever an earlier process left in the directory
+    def load(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        found = []
+        for name in names:
+            if name.startswith('.'):
+                continue  # unfinished write
+            try:
+                stat = os.stat(self.path(name))
+            except FileNotFoundError:
+                continue
+            found.append((stat.st_mtime, name, stat.st_size))
+        with self.lock:
+            for _, name, size in sorted(found):
+                self.entries[name] = size
+                self.total_bytes += size
+            evicted = self.evict()
+        self.remove_files(evicted)
+
+    def get(self, key):
+        with self.lock:
+            known = key in self.entries
+            if known:
+                self.entries.move_to_end(key)
+        if known:
+            try:
+                with open(self.path(key), 'rb') as handle:
+                    data = handle.read()
+                with self.lock:
+                    self.hits += 1
+                return data
+            except FileNotFoundError:
+                self.forget(key)  # deleted behind our back
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return False
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = self.path(f'.{key}.{uuid.uuid4().hex}')
+        with open(temporary, 'wb') as handle:
+            handle.write(data)
+        os.replace(temporary, self.path(key))
+        with self.lock:
+            self.total_bytes += len(data) - self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            evicted = self.evict()
+        self.remove_files(evicted)
+        return True
+
+    def forget(self, key):
+        with self.lock:
+            self.total_bytes -= self.entries.pop(key, 0)
+
+    # Drop least recently used entries until the cache fits; call with the
+    # lock held, then delete the returned keys' files outside it
+    def evict(self):
+        evicted = []
+        while self.total_bytes > self.max_bytes and self.entries:
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            evicted.append(key)
+        return evicted
+
+    def remove_files(self, keys):
+        for key in keys:
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                    'evictions': self.evictions, 'entries': len(self.entries), 'bytes': self.total_bytes,
+                    'max_bytes': self.max_bytes}
@@ -1,16 +1,33 @@
+import os
 import json
-import boto3
+import time
 from botocore.exceptions import ClientError
-from datetime import datetime, timedelta
+from aws_clients import lazy_client, lazy_dynamodb
+from metadata_cache import MetadataCache, shared_store
+from presigned_url_cache import PresignedUrlCache, MAX_PRESIGNED_EXPIRY_SECONDS
+from request_metrics import instrument, phase
 
 S3_BUCKET_NAME = 'image-bucket-madhu'
 DYNAMODB_TABLE_NAME = 'images-metadata'
 REGION_NAME = 'ap-south-1'
+BATCH_GET_MAX_KEYS = 100
+BATCH_GET_MAX_ATTEMPTS = 5
+BATCH_GET_BACKOFF_SECONDS = 0.05
+# Log the metadata cache counters every N lookups (0 disables)
+CACHE_STATS_EVERY = int(os.environ.get('METADATA_CACHE_STATS_EVERY', 1000))
 
-dynamodb = boto3.resource('dynamodb')
-s3 = boto3.client('s3', region_name=REGION_NAME)
+# Download URLs are signed per time window so repeat views get the same URL
+# (0 signs a fresh URL per request); `expires` may ask for up to the maximum
+PRESIGNED_URL_WINDOW_SECONDS = int(os.environ.get('PRESIGNED_URL_WINDOW_SECONDS', 900))
+PRESIGNED_URL_CACHE_SIZE = int(os.environ.get('PRESIGNED_URL_CACHE_SIZE', 4096))
+DEFAULT_EXPIRY_SECONDS = int(os.environ.get('PRESIGNED_URL_EXPIRY_SECONDS', 3600))
+MAX_EXPIRY_SECONDS = min(int(os.environ.get('PRESIGNED_URL_MAX_EXPIRY_SECONDS', 43200)),
+                         MAX_PRESIGNED_EXPIRY_SECONDS - PRESIGNED_URL_WINDOW_SECONDS)
 
-def get_image_metadata(image_id):
+dynamodb = lazy_dynamodb()
+s3 = lazy_client('s3', region_name=REGION_NAME)
+
+def load_image_metadata(image_id):
     table = dynamodb.Table(DYNAMODB_TABLE_NAME)
     try:
         response = table.get_item(
@@ -21,15 +38,121 @@ def get_image_metadata(image_id):
     except ClientError as e:
         raise Exception(f"Error retrieving metadata from DynamoDB: {str(e)}")
 
-def generate_presigned_url(bucket_name, object_name, expiration=3600):
+# Metadata of many images with batch_get_item (100 keys per call, unprocessed
+# keys retried with backoff); returns {image_id: item} for the ones that exist
+def load_images_metadata(image_ids):
+    found = {}
+    keys = [{'image_id': image_id} for image_id in image_ids]
+
     try:
-        response = s3.generate_presigned_url('get_object',
-                                             Params={'Bucket': bucket_name, 'Key': object_name},
-                                             ExpiresIn=expiration)
-        return response
+        for start in range(0, len(keys), BATCH_GET_MAX_KEYS):
+            request = {DYNAMODB_TABLE_NAME: {'Keys': keys[start:start + BATCH_GET_MAX_KEYS]}}
+            for attempt in range(BATCH_GET_MAX_ATTEMPTS):
+                response = dynamodb.batch_get_item(RequestItems=request)
+                for item in response.get('Responses', {}).get(DYNAMODB_TABLE_NAME, []):
+                    found[item['image_id']] = item
+                request = response.get('UnprocessedKeys') or {}
+                if not request:
+                    break
+                time.sleep(BATCH_GET_BACKOFF_SECONDS * (2 ** attempt))
+            if request:
+                raise Exception("Error retrieving metadata from DynamoDB: unprocessed keys remained after retries")
+    except ClientError as e:
+        raise Exception(f"Error retrieving metadata from DynamoDB: {str(e)}")
+
+    return found
+
+# Views outnumber writes by orders of magnitude, so metadata is read through
+# a per-container LRU and the shared cache (when configured)
+metadata_cache = MetadataCache(load_image_metadata, store=shared_store(), batch_loader=load_images_metadata)
+lookups = 0
+
+def record_lookups(count):
+    global lookups
+    previous = lookups
+    lookups += count
+    if CACHE_STATS_EVERY and lookups // CACHE_STATS_EVERY > previous // CACHE_STATS_EVERY:
+        print(json.dumps({'metadata_cache': metadata_cache.stats(), 'presigned_url_cache': url_cache.stats()}))
+
+def get_image_metadata(image_id):
+    with phase('metadata'):
+        item = metadata_cache.get(image_id)
+    record_lookups(1)
+    return item
+
+# {image_id: item or None} for many images in as few DynamoDB calls as possible
+def get_images_metadata(image_ids):
+    with phase('metadata'):
+        items = metadata_cache.get_many(image_ids)
+    record_lookups(len(items))
+    return items
+
+url_cache = PresignedUrlCache(s3, PRESIGNED_URL_WINDOW_SECONDS, PRESIGNED_URL_CACHE_SIZE)
+
+def generate_presigned_url(bucket_name, object_name, expiration=DEFAULT_EXPIRY_SECONDS):
+    try:
+        with phase('presign'):
+            url, _ = url_cache.get(bucket_name, object_name, expiration)
+        return url
     except ClientError as e:
         raise Exception(f"Error generating pre-signed URL: {str(e)}")
 
+# Pick the derivative to serve for a requested size: the smallest one at
+# least that large (the largest one if none is), in the preferred format
+# when it exists. Returns None when the original is the best match.
+def select_derivative(derivatives, size, preferred_format=None):
+    if not derivatives:
+        return None
+    candidates = [d for d in derivatives if d.get('format') == preferred_format] or \
+        [d for d in derivatives if d.get('format') == 'jpeg'] or derivatives
+    large_enough = [d for d in candidates if int(d['size']) >= size]
+    if large_enough:
+        return min(large_enough, key=lambda d: int(d['size']))
+    # Every derivative is smaller than requested; the original is closest
+    return None
+
+# Download options shared by the single and batch views; raises ValueError
+# with a client-facing message on bad input
+def parse_view_options(query_params, headers):
+    expires_in = DEFAULT_EXPIRY_SECONDS
+    if query_params.get('expires'):
+        try:
+            expires_in = int(query_params['expires'])
+        except ValueError:
+            expires_in = 0
+        if not 1 <= expires_in <= MAX_EXPIRY_SECONDS:
+            raise ValueError(f'expires must be between 1 and {MAX_EXPIRY_SECONDS} seconds')
+
+    size = None
+    if query_params.get('size'):
+        try:
+            size = int(query_params['size'])
+        except ValueError:
+            size = 0
+        if size < 1:
+            raise ValueError('size must be a positive integer')
+
+    accept = headers.get('Accept') or headers.get('accept') or ''
+    preferred_format = query_params.get('format') or ('webp' if 'image/webp' in accept else 'jpeg')
+    return {'expires_in': expires_in, 'size': size, 'preferred_format': preferred_format}
+
+# Rows of presigned uploads stay pending until the object is finalized
+def is_viewable(image_metadata):
+    return bool(image_metadata) and image_metadata.get('status', 'active') == 'active'
+
+# S3 key and variant name to serve for an image under the given options
+def select_object(image_id, image_metadata, options):
+    s3_key = image_metadata.get('s3_key') or f'{image_id}.jpg'
+    variant = 'original'
+    # Serve the closest derivative when a size is requested
+    if options['size']:
+        derivative = select_derivative(image_metadata.get('derivatives'), options['size'], options['preferred_format'])
+        if derivative:
+            s3_key = derivative['key']
+            variant = f"{int(derivative['size'])}.{derivative['format']}"
+    return s3_key, variant
+
+@instrument('view_images')
 def lambda_handler(event, context):
     try:
         path_params = event.get('pathParameters', {})
@@ -43,14 +166,22 @@ def lambda_handler(event, context):
 
         image_metadata = get_image_metadata(image_id)
 
-        if not image_metadata:
+        if not is_viewable(image_metadata):
             return {
                 'statusCode': 404,
                 'body': json.dumps({'message': 'Image not found'})
             }
 
-        s3_key = f'{image_id}.jpg'
-        presigned_url = generate_presigned_url(S3_BUCKET_NAME, s3_key)
+        try:
+            options = parse_view_options(event.get('queryStringParameters') or {}, event.get('headers') or {})
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'message': str(e)})
+            }
+
+        s3_key, variant = select_object(image_id, image_metadata, options)
+        presigned_url = generate_presigned_url(S3_BUCKET_NAME, s3_key, expiration=options['expires_in'])
 
         # Respond with the pre-signed URL for image download
         return {
@@ -58,6 +189,7 @@ def lambda_handler(event, context):
             'body': json.dumps({
                 'message': 'Image found',
                 'image_id': image_id,
+                'variant': variant,
                 'download_url': presigned_url
             })
         }
@@ -66,4 +198,37 @@ def lambda_handler(event, context):
         return {
             'statusCode': 500,
             'body': json.dumps({'message': str(e)})
-        }
\ No newline at end of file
+        }
+
+# GET /image/{image_id}/status: progress of an upload accepted for
+# asynchronous processing. Read uncached, since the status changes.
+@instrument('view_images.status')
+def status_handler(event, context):
+    try:
+        image_id = (event.get('pathParameters') or {}).get('image_id')
+        if not image_id:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'message': 'image_id is required'})
+            }
+
+        image_metadata = load_image_metadata(image_id)
+        if not image_metadata:
+            return {
+                'statusCode': 404,
+                'body': json.dumps({'message': 'Image not found'})
+            }
+
+        body = {'image_id': image_id, 'status': image_metadata.get('status', 'active')}
+        if image_metadata.get('error'):
+            body['error'] = image_metadata['error']
+        return {
+            'statusCode': 200,
+            'body': json.dumps(body)
+        }
+
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'message': str(e)})
+        }
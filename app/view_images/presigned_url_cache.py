@@ -0,0 +1,99 @@
+"""
+Reusable presigned download URLs.
+
+A SigV4 presigned URL embeds its signing time, so signing on every request
+gives every view a different URL and browsers/CDNs never get a cache hit.
+Here URLs are signed as of the start of a fixed time window
+(PRESIGNED_URL_WINDOW_SECONDS) and stay valid for the window plus the
+requested expiry, so every request for the same object and expiry within a
+window gets the identical URL, valid for at least the requested time.
+Signed URLs are memoized per (bucket, key, expiry, window) in a bounded LRU;
+derivatives have their own S3 keys, so the key also identifies the variant.
+"""
+import time
+import datetime
+import threading
+from collections import OrderedDict
+
+# S3 rejects presigned URLs valid for more than 7 days
+MAX_PRESIGNED_EXPIRY_SECONDS = 7 * 24 * 3600
+
+_signing_time = threading.local()
+_clock_lock = threading.Lock()
+
+def _install_pinnable_clock():
+    """
+    botocore's SigV4 signer takes the signing time from
+    botocore.auth.get_current_datetime. Wrap it once so a thread can pin the
+    time it signs at; every other caller still gets the current time.
+    """
+    import botocore.auth
+
+    with _clock_lock:
+        current = botocore.auth.get_current_datetime
+        if getattr(current, 'pinnable', False):
+            return
+
+        def get_current_datetime(*args, **kwargs):
+            pinned = getattr(_signing_time, 'value', None)
+            return pinned if pinned is not None else current(*args, **kwargs)
+
+        get_current_datetime.pinnable = True
+        botocore.auth.get_current_datetime = get_current_datetime
+
+# Presigned GET URL for bucket/key, signed as of `signed_at` (epoch seconds)
+# when given, otherwise now
+def sign_get_url(s3, bucket, key, expires_in, signed_at=None):
+    params = {'Bucket': bucket, 'Key': key}
+    if signed_at is None:
+        return s3.generate_presigned_url('get_object', Params=params, ExpiresIn=expires_in)
+    _install_pinnable_clock()
+    _signing_time.value = datetime.datetime.fromtimestamp(signed_at, datetime.timezone.utc).replace(tzinfo=None)
+    try:
+        return s3.generate_presigned_url('get_object', Params=params, ExpiresIn=expires_in)
+    finally:
+        _signing_time.value = None
+
+class PresignedUrlCache(object):
+    """
+    get(bucket, key, expires_in) -> (url, expires_at). With window_seconds=0
+    every call signs a fresh URL valid for exactly expires_in.
+    """
+    def __init__(self, s3, window_seconds, max_entries, clock=time.time):
+        self.s3 = s3
+        self.window_seconds = int(window_seconds)
+        self.max_entries = max_entries
+        self.clock = clock
+        self.entries = OrderedDict()  # (bucket, key, expires_in, window_start) -> (url, expires_at)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, bucket, key, expires_in):
+        now = int(self.clock())
+        if self.window_seconds <= 0:
+            return sign_get_url(self.s3, bucket, key, expires_in), now + expires_in
+
+        window_start = now - now % self.window_seconds
+        cache_key = (bucket, key, expires_in, window_start)
+        with self.lock:
+            entry = self.entries.get(cache_key)
+            if entry is not None:
+                self.entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # Valid until window_start + window + expires_in >= now + expires_in
+        valid_for = min(self.window_seconds + expires_in, MAX_PRESIGNED_EXPIRY_SECONDS)
+        entry = (sign_get_url(self.s3, bucket, key, valid_for, signed_at=window_start), window_start + valid_for)
+        with self.lock:
+            self.entries[cache_key] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries),
+                    'max_entries': self.max_entries, 'window_seconds': self.window_seconds}
@@ -0,0 +1,87 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import json
+
+# Shared modules ship as a Lambda layer; make them importable for local runs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'layer', 'python'))
+
+from batch_view import batch_view_handler, MAX_BATCH_SIZE
+from lambda_function import load_images_metadata
+
+
+class TestBatchView(unittest.TestCase):
+
+    @patch('batch_view.generate_presigned_url')
+    @patch('batch_view.get_images_metadata')
+    def test_per_image_status(self, mock_get_images_metadata, mock_generate_presigned_url):
+        mock_get_images_metadata.return_value = {
+            'a': {'image_id': 'a'},
+            'b': {'image_id': 'b', 'derivatives': [{'size': 128, 'format': 'jpeg', 'key': 'derivatives/b/128.jpeg'}]},
+            'p': {'image_id': 'p', 'status': 'pending'},
+            'x': None
+        }
+        mock_generate_presigned_url.side_effect = lambda bucket, key, expiration: f'https://signed/{key}'
+
+        event = {'body': json.dumps({'image_ids': ['a', 'b', 'p', 'x'], 'size': 100, 'expires': 600})}
+        response = batch_view_handler(event, None)
+
+        self.assertEqual(response['statusCode'], 200)
+        body = json.loads(response['body'])
+        self.assertEqual(body['counts'], {'ok': 2, 'not_found': 2})
+        self.assertEqual(body['images']['a'], {'status': 'ok', 'variant': 'original',
+                                               'download_url': 'https://signed/a.jpg'})
+        self.assertEqual(body['images']['b']['variant'], '128.jpeg')
+        self.assertEqual(body['images']['p'], {'status': 'not_found'})
+        self.assertEqual(body['images']['x'], {'status': 'not_found'})
+        mock_get_images_metadata.assert_called_once_with(['a', 'b', 'p', 'x'])
+        self.assertEqual(mock_generate_presigned_url.call_args[1]['expiration'], 600)
+
+    @patch('batch_view.generate_presigned_url')
+    @patch('batch_view.get_images_metadata')
+    def test_ids_from_query_string(self, mock_get_images_metadata, mock_generate_presigned_url):
+        mock_get_images_metadata.return_value = {'a': {'image_id': 'a'}, 'b': {'image_id': 'b'}}
+        mock_generate_presigned_url.return_value = 'https://signed'
+        response = batch_view_handler({'queryStringParameters': {'ids': 'a,b'}}, None)
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual(sorted(json.loads(response['body'])['images']), ['a', 'b'])
+
+    @patch('batch_view.get_images_metadata')
+    def test_bad_requests(self, mock_get_images_metadata):
+        for event in ({}, {'body': 'not json'}, {'body': json.dumps({'image_ids': []})},
+                      {'body': json.dumps({'image_ids': 'a'})},
+                      {'body': json.dumps({'image_ids': ['a'] * (MAX_BATCH_SIZE + 1)})},
+                      {'body': json.dumps({'image_ids': ['a'], 'expires': 0})}):
+            self.assertEqual(batch_view_handler(event, None)['statusCode'], 400)
+        mock_get_images_metadata.assert_not_called()
+
+    @patch('batch_view.get_images_metadata')
+    def test_metadata_error(self, mock_get_images_metadata):
+        mock_get_images_metadata.side_effect = Exception('Error retrieving metadata from DynamoDB: boom')
+        response = batch_view_handler({'body': json.dumps({'image_ids': ['a']})}, None)
+        self.assertEqual(response['statusCode'], 500)
+
+    @patch('lambda_function.time.sleep')
+    @patch('lambda_function.dynamodb')
+    def test_load_images_metadata_chunks_and_retries(self, mock_dynamodb, mock_sleep):
+        image_ids = [f'id-{n}' for n in range(150)]
+        unprocessed = {'images-metadata': {'Keys': [{'image_id': 'id-99'}]}}
+
+        def batch_get_item(RequestItems):
+            keys = RequestItems['images-metadata']['Keys']
+            if len(keys) == 100:
+                served = [{'image_id': key['image_id']} for key in keys if key['image_id'] != 'id-99']
+                return {'Responses': {'images-metadata': served}, 'UnprocessedKeys': unprocessed}
+            return {'Responses': {'images-metadata': [{'image_id': key['image_id']} for key in keys]}}
+
+        mock_dynamodb.batch_get_item.side_effect = batch_get_item
+        found = load_images_metadata(image_ids)
+
+        self.assertEqual(sorted(found), sorted(image_ids))
+        self.assertEqual(mock_dynamodb.batch_get_item.call_count, 3)
+        mock_sleep.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import os
+import time
+import tempfile
+from disk_cache import DiskCache
+
+
+class TestDiskCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def test_get_put(self):
+        cache = DiskCache(self.directory, 100)
+        self.assertIsNone(cache.get('a.jpg'))
+        self.assertTrue(cache.put('a.jpg', b'abc'))
+        self.assertEqual(cache.get('a.jpg'), b'abc')
+        cache.put('a.jpg', b'abcdef')
+        self.assertEqual(cache.get('a.jpg'), b'abcdef')
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate']), (2, 1, 0.6667))
+        self.assertEqual((stats['entries'], stats['bytes']), (1, 6))
+        # Only the entry itself is left, no temporary files
+        self.assertEqual(os.listdir(self.directory), ['a.jpg'])
+
+    def test_evicts_least_recently_used(self):
+        cache = DiskCache(self.directory, 10)
+        cache.put('a', b'1234')
+        cache.put('b', b'1234')
+        cache.get('a')
+        cache.put('c', b'1234')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), b'1234')
+        self.assertEqual(sorted(os.listdir(self.directory)), ['a', 'c'])
+        self.assertEqual(cache.stats()['evictions'], 1)
+        # Larger than the whole cache
+        self.assertFalse(cache.put('d', b'x' * 11))
+
+    def test_rebuilds_index_from_directory(self):
+        cache = DiskCache(self.directory, 100)
+        cache.put('old', b'1234')
+        cache.put('new', b'1234')
+        now = time.time()
+        os.utime(os.path.join(self.directory, 'old'), (now - 60, now - 60))
+        with open(os.path.join(self.directory, '.new.partial'), 'wb') as handle:
+            handle.write(b'x')
+
+        cache = DiskCache(self.directory, 6)
+        # The oldest file did not fit and was removed
+        self.assertEqual(cache.stats()['entries'], 1)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'old')))
+        self.assertEqual(cache.get('new'), b'1234')
+
+    def test_missing_file_is_a_miss(self):
+        cache = DiskCache(self.directory, 100)
+        cache.put('a', b'1234')
+        os.remove(os.path.join(self.directory, 'a'))
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['bytes'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
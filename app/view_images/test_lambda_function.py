@@ -1,7 +1,13 @@
 import unittest
 from unittest.mock import patch, MagicMock
+import os
+import sys
 import json
-from lambda_function import lambda_handler
+
+# Shared modules ship as a Lambda layer; make them importable for local runs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'layer', 'python'))
+
+from lambda_function import lambda_handler, status_handler, select_derivative, metadata_cache
 
 
 class TestLambdaHandler(unittest.TestCase):
@@ -88,6 +94,88 @@ class TestLambdaHandler(unittest.TestCase):
         body = json.loads(response['body'])
         self.assertEqual(body['message'], 'Database error')
 
+    @patch('lambda_function.get_image_metadata')
+    def test_pending_image_not_found(self, mock_get_image_metadata):
+        mock_get_image_metadata.return_value = {'image_id': '12345', 'status': 'pending'}
+        event = {
+            'pathParameters': {
+                'image_id': '12345'
+            }
+        }
+        response = lambda_handler(event, None)
+        self.assertEqual(response['statusCode'], 404)
+
+    @patch('lambda_function.get_image_metadata')
+    @patch('lambda_function.generate_presigned_url')
+    def test_size_serves_closest_derivative(self, mock_generate_presigned_url, mock_get_image_metadata):
+        mock_get_image_metadata.return_value = {
+            'image_id': '12345',
+            'derivatives': [
+                {'size': 128, 'format': 'jpeg', 'key': 'derivatives/12345/128.jpg'},
+                {'size': 512, 'format': 'jpeg', 'key': 'derivatives/12345/512.jpg'},
+                {'size': 512, 'format': 'webp', 'key': 'derivatives/12345/512.webp'}
+            ]
+        }
+        mock_generate_presigned_url.return_value = 'https://presigned-url.com'
+        event = {
+            'pathParameters': {'image_id': '12345'},
+            'queryStringParameters': {'size': '200'},
+            'headers': {'Accept': 'image/webp,image/*'}
+        }
+        response = lambda_handler(event, None)
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual(json.loads(response['body'])['variant'], '512.webp')
+        mock_generate_presigned_url.assert_called_once_with('image-bucket-madhu', 'derivatives/12345/512.webp',
+                                                            expiration=3600)
+
+    def test_select_derivative(self):
+        derivatives = [
+            {'size': 128, 'format': 'jpeg', 'key': 'a'},
+            {'size': 1024, 'format': 'jpeg', 'key': 'b'}
+        ]
+        self.assertEqual(select_derivative(derivatives, 100)['key'], 'a')
+        self.assertEqual(select_derivative(derivatives, 600, 'webp')['key'], 'b')
+        # Larger than every derivative: the original is the closest match
+        self.assertIsNone(select_derivative(derivatives, 2048))
+        self.assertIsNone(select_derivative(None, 100))
+
+    @patch('lambda_function.get_image_metadata')
+    def test_invalid_size(self, mock_get_image_metadata):
+        mock_get_image_metadata.return_value = {'image_id': '12345'}
+        event = {
+            'pathParameters': {'image_id': '12345'},
+            'queryStringParameters': {'size': 'big'}
+        }
+        self.assertEqual(lambda_handler(event, None)['statusCode'], 400)
+
+    @patch('lambda_function.get_image_metadata')
+    def test_invalid_expires(self, mock_get_image_metadata):
+        mock_get_image_metadata.return_value = {'image_id': '12345'}
+        for expires in ('soon', '0', str(10 ** 7)):
+            event = {'pathParameters': {'image_id': '12345'}, 'queryStringParameters': {'expires': expires}}
+            self.assertEqual(lambda_handler(event, None)['statusCode'], 400)
+
+    @patch('lambda_function.generate_presigned_url')
+    @patch('lambda_function.dynamodb')
+    def test_metadata_is_cached_between_views(self, mock_dynamodb, mock_generate_presigned_url):
+        metadata_cache.entries.clear()
+        mock_dynamodb.Table.return_value.get_item.return_value = {'Item': {'image_id': '12345'}}
+        mock_generate_presigned_url.return_value = 'https://example.com/12345.jpg'
+        for _ in range(3):
+            self.assertEqual(lambda_handler({'pathParameters': {'image_id': '12345'}}, None)['statusCode'], 200)
+        mock_dynamodb.Table.return_value.get_item.assert_called_once()
+
+    @patch('lambda_function.load_image_metadata')
+    def test_status_handler(self, mock_load_image_metadata):
+        mock_load_image_metadata.return_value = {'image_id': '12345', 'status': 'failed', 'error': 'uploaded file is empty'}
+        response = status_handler({'pathParameters': {'image_id': '12345'}}, None)
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual(json.loads(response['body']),
+                         {'image_id': '12345', 'status': 'failed', 'error': 'uploaded file is empty'})
+
+        mock_load_image_metadata.return_value = None
+        self.assertEqual(status_handler({'pathParameters': {'image_id': '12345'}}, None)['statusCode'], 404)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,70 @@
+import unittest
+from unittest.mock import MagicMock
+import datetime
+from urllib.parse import urlsplit, parse_qs
+import boto3
+import botocore.auth
+from presigned_url_cache import PresignedUrlCache
+
+
+def query(url):
+    return {name: values[0] for name, values in parse_qs(urlsplit(url).query).items()}
+
+
+class TestPresignedUrlCache(unittest.TestCase):
+
+    def setUp(self):
+        self.s3 = boto3.client('s3', region_name='ap-south-1', aws_access_key_id='testing',
+                               aws_secret_access_key='testing')
+        self.now = 1700000100  # 100 s into a 900 s window
+
+    def cache(self, window_seconds=900, max_entries=10):
+        return PresignedUrlCache(self.s3, window_seconds, max_entries, clock=lambda: self.now)
+
+    def test_same_url_within_window(self):
+        cache = self.cache()
+        url, expires_at = cache.get('bucket', 'abc.jpg', 3600)
+        self.now += 500
+        self.assertEqual(cache.get('bucket', 'abc.jpg', 3600)[0], url)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+        params = query(url)
+        self.assertEqual(params['X-Amz-Date'], '20231114T221500Z')  # window start
+        self.assertEqual(params['X-Amz-Expires'], str(900 + 3600))
+        self.assertGreaterEqual(expires_at, self.now + 3600)
+
+    def test_identical_url_from_a_fresh_cache(self):
+        # Another container signing in the same window produces the same URL
+        self.assertEqual(self.cache().get('bucket', 'abc.jpg', 3600), self.cache().get('bucket', 'abc.jpg', 3600))
+
+    def test_new_window_signs_new_url(self):
+        cache = self.cache()
+        url, _ = cache.get('bucket', 'abc.jpg', 3600)
+        self.now += 900
+        self.assertNotEqual(cache.get('bucket', 'abc.jpg', 3600)[0], url)
+        self.assertNotEqual(cache.get('bucket', 'abc.jpg', 60)[0], cache.get('bucket', 'abc.jpg', 3600)[0])
+
+    def test_signing_time_is_not_pinned_afterwards(self):
+        self.cache().get('bucket', 'abc.jpg', 3600)
+        drift = datetime.datetime.utcnow() - botocore.auth.get_current_datetime()
+        self.assertLess(abs(drift.total_seconds()), 5)
+
+    def test_bounded(self):
+        cache = self.cache(max_entries=2)
+        for key in ('a.jpg', 'b.jpg', 'c.jpg'):
+            cache.get('bucket', key, 3600)
+        self.assertEqual([entry[1] for entry in cache.entries], ['b.jpg', 'c.jpg'])
+
+    def test_window_zero_signs_every_time(self):
+        s3 = MagicMock()
+        s3.generate_presigned_url.return_value = 'https://signed'
+        cache = PresignedUrlCache(s3, 0, 10, clock=lambda: self.now)
+        cache.get('bucket', 'abc.jpg', 60)
+        cache.get('bucket', 'abc.jpg', 60)
+        self.assertEqual(s3.generate_presigned_url.call_count, 2)
+        s3.generate_presigned_url.assert_called_with('get_object', Params={'Bucket': 'bucket', 'Key': 'abc.jpg'},
+                                                     ExpiresIn=60)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,210 @@
+import unittest
+from unittest.mock import patch
+import os
+import io
+import sys
+import time
+import base64
+import tempfile
+import threading
+
+# Shared modules ship as a Lambda layer; make them importable for local runs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'layer', 'python'))
+
+import transform_image
+from transform_image import (transform_handler, parse_transform, select_source, render_transform, single_flight,
+                             fit_within, etag_matches)
+from disk_cache import DiskCache
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def encoded(image, image_format='JPEG', **options):
+    output = io.BytesIO()
+    image.save(output, format=image_format, **options)
+    return output.getvalue()
+
+
+METADATA = {
+    'image_id': 'a', 's3_key': 'a.jpg', 'format': 'jpeg', 'width': 4000, 'height': 3000,
+    'derivatives': [{'size': 128, 'format': 'jpeg', 'key': 'derivatives/a/128.jpg', 'width': 128, 'height': 96},
+                    {'size': 512, 'format': 'jpeg', 'key': 'derivatives/a/512.jpg', 'width': 512, 'height': 384},
+                    {'size': 512, 'format': 'webp', 'key': 'derivatives/a/512.webp', 'width': 512, 'height': 384}]
+}
+
+
+class TestOptions(unittest.TestCase):
+
+    def test_parse_transform(self):
+        options = parse_transform({'w': '200', 'fmt': 'JPG', 'q': '70'}, {})
+        self.assertEqual(options, {'width': 200, 'height': None, 'format': 'jpeg', 'quality': 70,
+                                   'negotiated': False})
+        options = parse_transform({'h': '100'}, {'accept': 'image/avif,image/webp,*/*'})
+        self.assertEqual((options['format'], options['negotiated']), ('webp', True))
+        self.assertEqual(parse_transform({'w': '1'}, {})['format'], 'jpeg')
+        for params in ({}, {'w': '0'}, {'w': '100000'}, {'h': 'x'}, {'fmt': 'bmp'}, {'w': '10', 'q': '96'}):
+            with self.assertRaises(ValueError):
+                parse_transform(params, {})
+
+    def test_fit_within(self):
+        self.assertEqual(fit_within(4000, 3000, 200, None), (200, 150))
+        self.assertEqual(fit_within(4000, 3000, 200, 100), (133, 100))
+        # Never upscaled
+        self.assertEqual(fit_within(100, 50, 400, 400), (100, 50))
+
+    def test_select_source(self):
+        def source(**query):
+            return select_source('a', METADATA, parse_transform(query, {}))
+        self.assertEqual(source(w='90')[0], 'derivatives/a/128.jpg')
+        # 100 wide is 133 tall if the original turns out to be rotated
+        self.assertEqual(source(w='100')[0], 'derivatives/a/512.jpg')
+        self.assertEqual(source(w='300', fmt='webp')[0], 'derivatives/a/512.webp')
+        # Taller than the 512 derivative once rotated
+        self.assertEqual(source(h='400')[0], 'a.jpg')
+        self.assertEqual(source(w='2000')[0], 'a.jpg')
+        self.assertEqual(select_source('b', {}, parse_transform({'w': '10'}, {})), ('b.jpg', None, None, None))
+
+    def test_etag_matches(self):
+        self.assertTrue(etag_matches('"x", "abc"', '"abc"'))
+        self.assertTrue(etag_matches('W/"abc"', '"abc"'))
+        self.assertTrue(etag_matches('*', '"abc"'))
+        self.assertFalse(etag_matches('"x"', '"abc"'))
+        self.assertFalse(etag_matches(None, '"abc"'))
+
+    def test_single_flight(self):
+        calls, started, release = [], threading.Event(), threading.Event()
+
+        def produce():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return b'data', 'miss'
+
+        results = []
+        first = threading.Thread(target=lambda: results.append(single_flight('k', produce)))
+        first.start()
+        started.wait(5)
+        second = threading.Thread(target=lambda: results.append(single_flight('k', produce)))
+        second.start()
+        time.sleep(0.05)
+        release.set()
+        first.join()
+        second.join()
+        self.assertEqual(results, [(b'data', 'miss')] * 2)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(transform_image._in_flight, {})
+
+
+@unittest.skipIf(Image is None, 'Pillow is not installed')
+class TestRender(unittest.TestCase):
+
+    def test_resize_and_transcode(self):
+        original = encoded(Image.radial_gradient('L').resize((800, 600)).convert('RGB'))
+        data = render_transform(io.BytesIO(original), 200, None, 'webp', None)
+        image = Image.open(io.BytesIO(data))
+        self.assertEqual((image.format, image.size), ('WEBP', (200, 150)))
+
+    def test_exif_rotation_and_alpha(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # displayed rotated 90 degrees
+        original = encoded(Image.new('RGB', (800, 400), 'red'), exif=exif.tobytes())
+        image = Image.open(io.BytesIO(render_transform(io.BytesIO(original), 100, None, 'jpeg', 50)))
+        self.assertEqual(image.size, (100, 200))
+
+        transparent = encoded(Image.new('RGBA', (40, 40), (0, 0, 0, 0)), 'PNG')
+        self.assertEqual(Image.open(io.BytesIO(render_transform(io.BytesIO(transparent), 20, 20, 'png', None))).mode,
+                         'RGBA')
+        self.assertEqual(Image.open(io.BytesIO(render_transform(io.BytesIO(transparent), 20, 20, 'jpeg', None))).mode,
+                         'RGB')
+
+
+@unittest.skipIf(Image is None, 'Pillow is not installed')
+class TestTransformHandler(unittest.TestCase):
+
+    def setUp(self):
+        cache = patch('transform_image.transform_cache', DiskCache(tempfile.mkdtemp(), 10 * 1024 * 1024))
+        cache.start()
+        self.addCleanup(cache.stop)
+        self.original = encoded(Image.radial_gradient('L').resize((800, 600)).convert('RGB'))
+
+    def event(self, headers=None, **query):
+        return {'pathParameters': {'image_id': 'a'}, 'queryStringParameters': query, 'headers': headers or {}}
+
+    @patch('transform_image.fetch_object')
+    @patch('transform_image.get_image_metadata')
+    def test_renders_once_then_serves_from_cache(self, mock_get_image_metadata, mock_fetch_object):
+        mock_get_image_metadata.return_value = {'image_id': 'a', 's3_key': 'a.jpg', 'format': 'jpeg',
+                                                'width': 800, 'height': 600}
+        mock_fetch_object.side_effect = lambda key: io.BytesIO(self.original)
+
+        response = transform_handler(self.event(w='200', fmt='webp'), None)
+        self.assertEqual(response['statusCode'], 200)
+        self.assertTrue(response['isBase64Encoded'])
+        headers = response['headers']
+        self.assertEqual((headers['Content-Type'], headers['X-Cache']), ('image/webp', 'miss'))
+        self.assertNotIn('Vary', headers)
+        self.assertEqual(Image.open(io.BytesIO(base64.b64decode(response['body']))).size, (200, 150))
+        mock_fetch_object.assert_called_once_with('a.jpg')
+
+        again = transform_handler(self.event(w='200', fmt='webp'), None)
+        self.assertEqual(again['headers']['X-Cache'], 'hit')
+        self.assertEqual((again['body'], again['headers']['ETag']), (response['body'], headers['ETag']))
+        self.assertEqual(mock_fetch_object.call_count, 1)
+
+        not_modified = transform_handler(self.event({'If-None-Match': headers['ETag']}, w='200', fmt='webp'), None)
+        self.assertEqual(not_modified['statusCode'], 304)
+        self.assertEqual(not_modified['headers']['ETag'], headers['ETag'])
+
+        # Other options are another result
+        other = transform_handler(self.event({'Accept': 'image/webp'}, w='100'), None)
+        self.assertNotEqual(other['headers']['ETag'], headers['ETag'])
+        self.assertEqual(other['headers']['Vary'], 'Accept')
+        self.assertEqual(mock_fetch_object.call_count, 2)
+
+    @patch('transform_image.fetch_object')
+    @patch('transform_image.get_image_metadata')
+    def test_source_already_matching_is_returned_as_is(self, mock_get_image_metadata, mock_fetch_object):
+        mock_get_image_metadata.return_value = {'image_id': 'a', 'format': 'jpeg', 'width': 800, 'height': 600}
+        mock_fetch_object.return_value = io.BytesIO(self.original)
+        with patch('transform_image.render_transform') as mock_render_transform:
+            response = transform_handler(self.event(w='1000', fmt='jpeg'), None)
+        mock_render_transform.assert_not_called()
+        self.assertEqual(base64.b64decode(response['body']), self.original)
+
+    @patch('transform_image.write_back')
+    @patch('transform_image.load_written_back')
+    @patch('transform_image.fetch_object')
+    @patch('transform_image.get_image_metadata')
+    def test_write_back(self, mock_get_image_metadata, mock_fetch_object, mock_load_written_back, mock_write_back):
+        mock_get_image_metadata.return_value = {'image_id': 'a'}
+        mock_fetch_object.return_value = io.BytesIO(self.original)
+        mock_load_written_back.return_value = None
+        with patch('transform_image.TRANSFORM_WRITE_BACK', True):
+            response = transform_handler(self.event(w='50', fmt='png'), None)
+            self.assertEqual(response['headers']['X-Cache'], 'miss')
+            image_id, key, image_format, data = mock_write_back.call_args[0]
+            self.assertEqual((image_id, image_format, data), ('a', 'png', base64.b64decode(response['body'])))
+            self.assertTrue(key.endswith('.png'))
+
+            # Another container finds it in S3
+            transform_image.transform_cache.forget(key)
+            mock_load_written_back.return_value = b'rendered'
+            response = transform_handler(self.event(w='50', fmt='png'), None)
+        self.assertEqual((response['headers']['X-Cache'], base64.b64decode(response['body'])), ('s3', b'rendered'))
+        self.assertEqual(mock_fetch_object.call_count, 1)
+
+    @patch('transform_image.get_image_metadata')
+    def test_errors(self, mock_get_image_metadata):
+        mock_get_image_metadata.return_value = None
+        self.assertEqual(transform_handler(self.event(w='10'), None)['statusCode'], 404)
+        mock_get_image_metadata.return_value = {'image_id': 'a', 'status': 'pending'}
+        self.assertEqual(transform_handler(self.event(w='10'), None)['statusCode'], 404)
+        self.assertEqual(transform_handler(self.event(w='-1'), None)['statusCode'], 400)
+        self.assertEqual(transform_handler({'pathParameters': {}}, None)['statusCode'], 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
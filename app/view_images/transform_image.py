@@ -0,0 +1,330 @@
+"""
+Resized/transcoded downloads (GET /image/{image_id}/transform, handler transform_image.transform_handler).
+
+    /image/{image_id}/transform?w=200&h=200&fmt=webp&q=75
+
+Returns the image itself (not a URL), fitted within w x h pixels (either may
+be left out; never upscaled) and encoded as fmt (jpeg, webp or png; default
+webp when the Accept header allows it, else jpeg) at quality q (1-95). Needs
+Pillow packaged with this function.
+
+The source is the smallest stored derivative (process_derivatives) that is
+at least as large as the output, else the original, so a 200 px preview
+never downloads a multi-megabyte original once derivatives exist. It is
+streamed from S3 into a spooled temporary file, then decoded (JPEGs at a
+reduced scale), resized and encoded on a pool of TRANSFORM_WORKERS threads.
+A source that already has the requested format and size is returned as is.
+
+Results are named by a hash of the source key and the options, which is
+also their strong ETag: If-None-Match answers 304 without touching S3, and
+Cache-Control lets browsers and CDNs keep them. They are kept in a
+size-bounded LRU on local disk (disk_cache) and, with
+TRANSFORM_WRITE_BACK=1, in S3 under derivatives/{image_id}/transforms/, where
+other containers find them before rendering (reconcile_images removes them
+once the image is deleted). Concurrent requests for the same result share
+one render. X-Cache says where a response came from (hit, s3, miss).
+
+Each invocation records cache_hit (0/1; its average is the hit rate) and the
+fetch, transform and cache phases in its request metrics, and the cache
+counters are logged every METADATA_CACHE_STATS_EVERY transforms.
+"""
+import os
+import io
+import json
+import base64
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from disk_cache import DiskCache
+from request_metrics import instrument, phase, record
+from lambda_function import (s3, S3_BUCKET_NAME, CACHE_STATS_EVERY, get_image_metadata, is_viewable,
+                             select_derivative)
+
+# Pillow is packaged with this function only when transforms are served
+try:
+    import PIL
+    from PIL import Image, ImageOps
+except ImportError:
+    PIL = Image = ImageOps = None
+
+FORMAT_EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp', 'png': 'png'}
+FORMAT_CONTENT_TYPES = {'jpeg': 'image/jpeg', 'webp': 'image/webp', 'png': 'image/png'}
+FORMAT_ALIASES = {'jpg': 'jpeg'}
+
+MAX_TRANSFORM_DIMENSION = int(os.environ.get('TRANSFORM_MAX_DIMENSION', 4096))
+DEFAULT_QUALITY = int(os.environ.get('TRANSFORM_QUALITY', 82))
+TRANSFORM_WORKERS = int(os.environ.get('TRANSFORM_WORKERS', os.cpu_count() or 1))
+TRANSFORM_CACHE_DIR = os.environ.get('TRANSFORM_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'image-transforms'))
+TRANSFORM_CACHE_MAX_MB = int(os.environ.get('TRANSFORM_CACHE_MAX_MB', 256))
+TRANSFORM_WRITE_BACK = os.environ.get('TRANSFORM_WRITE_BACK', '0') == '1'
+CACHE_CONTROL = os.environ.get('TRANSFORM_CACHE_CONTROL', 'public, max-age=86400')
+# Sources up to this size stay in memory while streamed; larger ones spill to /tmp
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+FETCH_CHUNK_BYTES = 1024 * 1024
+# Lambda caps a response at 6 MB, base64 included
+MAX_RESPONSE_BYTES = 4 * 1024 * 1024
+# Part of every result's name: a Pillow upgrade may encode different bytes
+RENDER_VERSION = f"1-{PIL.__version__ if PIL else 'none'}"
+EXIF_ORIENTATION = 0x0112
+
+transform_cache = DiskCache(TRANSFORM_CACHE_DIR, TRANSFORM_CACHE_MAX_MB * 1024 * 1024)
+transform_pool = ThreadPoolExecutor(max_workers=TRANSFORM_WORKERS, thread_name_prefix='transform')
+transforms = 0
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+def response(status_code, body, headers=None):
+    result = {
+        'statusCode': status_code,
+        'body': json.dumps(body)
+    }
+    if headers:
+        result['headers'] = headers
+    return result
+
+def parse_dimension(query_params, name):
+    if not query_params.get(name):
+        return None
+    try:
+        value = int(query_params[name])
+    except ValueError:
+        value = 0
+    if not 1 <= value <= MAX_TRANSFORM_DIMENSION:
+        raise ValueError(f'{name} must be between 1 and {MAX_TRANSFORM_DIMENSION}')
+    return value
+
+# Transform options from the query string; raises ValueError with a
+# client-facing message on bad input
+def parse_transform(query_params, headers):
+    width = parse_dimension(query_params, 'w')
+    height = parse_dimension(query_params, 'h')
+
+    image_format = query_params.get('fmt')
+    if image_format:
+        image_format = FORMAT_ALIASES.get(image_format.lower(), image_format.lower())
+        if image_format not in FORMAT_EXTENSIONS:
+            raise ValueError(f'fmt must be one of {", ".join(FORMAT_EXTENSIONS)}')
+    elif not width and not height:
+        raise ValueError('w, h or fmt is required')
+
+    quality = None
+    if query_params.get('q'):
+        try:
+            quality = int(query_params['q'])
+        except ValueError:
+            quality = 0
+        if not 1 <= quality <= 95:
+            raise ValueError('q must be between 1 and 95')
+
+    negotiated = not image_format
+    if negotiated:
+        accept = headers.get('Accept') or headers.get('accept') or ''
+        image_format = 'webp' if 'image/webp' in accept else 'jpeg'
+    return {'width': width, 'height': height, 'format': image_format, 'quality': quality, 'negotiated': negotiated}
+
+# Size of a width x height image fitted within max_width x max_height
+# (None: unbounded), never upscaled
+def fit_within(width, height, max_width, max_height):
+    scale = min((max_width or width) / width, (max_height or height) / height, 1.0)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def select_source(image_id, image_metadata, options):
+    """
+    (s3_key, format, width, height) of the image to render from: the smallest
+    derivative at least as large as the output, else the original. Original
+    dimensions are as stored, before EXIF rotation, so the output's longest
+    edge is worked out for both orientations.
+    """
+    original = (image_metadata.get('s3_key') or f'{image_id}.jpg', image_metadata.get('format'),
+                image_metadata.get('width'), image_metadata.get('height'))
+    if not original[2] or not original[3]:
+        return original
+    width, height = int(original[2]), int(original[3])
+    box = (options['width'], options['height'])
+    needed = max(max(fit_within(width, height, *box)), max(fit_within(height, width, *box)))
+    derivative = select_derivative(image_metadata.get('derivatives'), needed, options['format'])
+    if derivative is None:
+        return original
+    return derivative['key'], derivative['format'], derivative.get('width'), derivative.get('height')
+
+# Name of the rendered result, also its ETag: changes with the source and every option
+def result_key(source_key, options):
+    spec = '|'.join(str(part) for part in (source_key, options['width'], options['height'], options['format'],
+                                           options['quality'], RENDER_VERSION))
+    return f"{hashlib.sha256(spec.encode('utf-8')).hexdigest()[:40]}.{FORMAT_EXTENSIONS[options['format']]}"
+
+def write_back_key(image_id, key):
+    return f'derivatives/{image_id}/transforms/{key}'
+
+# True when the source already is the requested result
+def is_passthrough(source, options):
+    _, source_format, width, height = source
+    if source_format != options['format'] or options['quality'] or not width or not height:
+        return False
+    longest = max(int(width), int(height))
+    return (options['width'] or longest) >= longest and (options['height'] or longest) >= longest
+
+# Stream an S3 object into a spooled temporary file (in memory while small)
+def fetch_object(key):
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    try:
+        body = s3.get_object(Bucket=S3_BUCKET_NAME, Key=key)['Body']
+        for chunk in body.iter_chunks(FETCH_CHUNK_BYTES):
+            spool.write(chunk)
+    except ClientError as e:
+        spool.close()
+        raise Exception(f"Error downloading image from S3: {str(e)}")
+    spool.seek(0)
+    return spool
+
+def load_written_back(image_id, key):
+    try:
+        return s3.get_object(Bucket=S3_BUCKET_NAME, Key=write_back_key(image_id, key))['Body'].read()
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+            return None
+        raise Exception(f"Error downloading transformed image from S3: {str(e)}")
+
+def write_back(image_id, key, image_format, data):
+    try:
+        s3.put_object(Bucket=S3_BUCKET_NAME, Key=write_back_key(image_id, key), Body=data,
+                      ContentType=FORMAT_CONTENT_TYPES[image_format], CacheControl=CACHE_CONTROL)
+    except ClientError as e:
+        raise Exception(f"Error uploading transformed image to S3: {str(e)}")
+
+def render_transform(source, max_width, max_height, image_format, quality):
+    """
+    Decodes an image file and encodes it fitted within max_width x
+    max_height (as displayed, after EXIF rotation) in image_format.
+    """
+    if Image is None:
+        raise Exception('Pillow is required to transform images')
+    image = Image.open(source)
+    rotated = image.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8)
+    size = fit_within(image.width, image.height, *((max_height, max_width) if rotated else (max_width, max_height)))
+    # Let the JPEG decoder downscale by up to 8x while decoding (to no less than `size`)
+    image.draft('RGB', size)
+    image = ImageOps.exif_transpose(image)
+    if rotated:
+        size = size[::-1]
+    if image.mode not in ('RGB', 'L') and (image_format == 'jpeg' or image.mode not in ('RGBA', 'LA')):
+        image = image.convert('RGBA' if image_format != 'jpeg' and image.has_transparency_data else 'RGB')
+    if image.size != size:
+        image = image.resize(size, Image.LANCZOS)
+    output = io.BytesIO()
+    image.save(output, format=image_format.upper(), quality=quality or DEFAULT_QUALITY)
+    return output.getvalue()
+
+# Result bytes and where they came from ('s3' or 'miss'), rendering when
+# needed; stored in the disk cache (and S3 with write-back)
+def produce(image_id, key, source, options):
+    if TRANSFORM_WRITE_BACK:
+        with phase('write_back_read'):
+            data = load_written_back(image_id, key)
+        if data is not None:
+            with phase('cache_write'):
+                transform_cache.put(key, data)
+            return data, 's3'
+
+    with phase('fetch'):
+        spool = fetch_object(source[0])
+    try:
+        if is_passthrough(source, options):
+            data = spool.read()
+        else:
+            with phase('transform'):
+                data = transform_pool.submit(render_transform, spool, options['width'], options['height'],
+                                             options['format'], options['quality']).result()
+    finally:
+        spool.close()
+
+    with phase('cache_write'):
+        transform_cache.put(key, data)
+    if TRANSFORM_WRITE_BACK:
+        with phase('write_back'):
+            write_back(image_id, key, options['format'], data)
+    return data, 'miss'
+
+# Run produce() once per key at a time; concurrent callers wait for its result
+def single_flight(key, produce_result):
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        owner = future is None
+        if owner:
+            future = _in_flight[key] = Future()
+    if not owner:
+        return future.result()
+    try:
+        result = produce_result()
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(key, None)
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    # If-None-Match uses weak comparison
+    return '*' in tags or etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+def record_transform():
+    global transforms
+    transforms += 1
+    if CACHE_STATS_EVERY and transforms % CACHE_STATS_EVERY == 0:
+        print(json.dumps({'transform_cache': transform_cache.stats()}))
+
+# Lambda handler to serve a resized/transcoded image
+@instrument('view_images.transform')
+def transform_handler(event, context):
+    try:
+        image_id = (event.get('pathParameters') or {}).get('image_id')
+        if not image_id:
+            return response(400, {'message': 'image_id is required'})
+
+        headers = event.get('headers') or {}
+        try:
+            options = parse_transform(event.get('queryStringParameters') or {}, headers)
+        except ValueError as e:
+            return response(400, {'message': str(e)})
+
+        image_metadata = get_image_metadata(image_id)
+        if not is_viewable(image_metadata):
+            return response(404, {'message': 'Image not found'})
+
+        source = select_source(image_id, image_metadata, options)
+        key = result_key(source[0], options)
+        result_headers = {'ETag': f'"{key.split(".")[0]}"', 'Cache-Control': CACHE_CONTROL}
+        if options['negotiated']:
+            result_headers['Vary'] = 'Accept'
+        if etag_matches(headers.get('If-None-Match') or headers.get('if-none-match'), result_headers['ETag']):
+            return {'statusCode': 304, 'headers': result_headers, 'body': ''}
+
+        with phase('cache_read'):
+            data = transform_cache.get(key)
+        cache_status = 'hit'
+        if data is None:
+            data, cache_status = single_flight(key, lambda: produce(image_id, key, source, options))
+        record('cache_hit', 1 if cache_status == 'hit' else 0)
+        record_transform()
+
+        if len(data) > MAX_RESPONSE_BYTES:
+            return response(400, {'message': f'Transformed image is {len(data)} bytes, over the '
+                                             f'{MAX_RESPONSE_BYTES} byte limit; request a smaller size or format'})
+        result_headers.update({'Content-Type': FORMAT_CONTENT_TYPES[options['format']], 'X-Cache': cache_status})
+        return {
+            'statusCode': 200,
+            'headers': result_headers,
+            'isBase64Encoded': True,
+            'body': base64.b64encode(data).decode('ascii')
+        }
+
+    except Exception as e:
+        return response(500, {'message': str(e)})
@@ -0,0 +1,194 @@
+"""
+Helpers shared by the benchmark scripts.
+
+Benchmarks run the handlers in-process against moto's local AWS stand-ins
+(`pip install boto3 moto`), so no LocalStack container or network is needed.
+"""
+import os
+import sys
+import time
+import struct
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT, 'app')
+LAYER_DIR = os.path.join(APP_DIR, 'layer', 'python')
+
+REGION_NAME = 'us-east-1'
+
+if LAYER_DIR not in sys.path:
+    sys.path.insert(0, LAYER_DIR)
+
+# Handlers print a request_metrics line per invocation; keep benchmark output
+# readable unless a script (load_test, bench_instrumentation) asks for them
+os.environ.setdefault('METRICS_MODE', 'off')
+
+# Every handler is named lambda_function.py, so load each one under a unique
+# module name (e.g. load_handler('list_images') -> module 'list_images_lambda')
+def load_handler(function_name, module_name='lambda_function'):
+    path = os.path.join(APP_DIR, function_name, f'{module_name}.py')
+    function_dir = os.path.dirname(path)
+    added = function_dir not in sys.path
+    if added:
+        sys.path.insert(0, function_dir)
+    try:
+        spec = importlib.util.spec_from_file_location(f'{function_name}_{module_name}', path)
+        module = importlib.util.module_from_spec(spec)
+        # Registered so functions pickle by name (process pools)
+        sys.modules[spec.name] = module
+        spec.loader.exec_module(module)
+        return module
+    finally:
+        if added:
+            sys.path.remove(function_dir)
+
+# Start moto's in-process AWS mock with dummy credentials; returns the mock
+# so the caller can stop() it
+def start_mock_aws():
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    os.environ['AWS_DEFAULT_REGION'] = REGION_NAME
+    from moto import mock_aws
+
+    mock = mock_aws()
+    mock.start()
+    return mock
+
+# Counts items DynamoDB reads (ScannedCount for scans/queries, returned items
+# for gets). moto's latencies do not track real DynamoDB, so the benchmarks
+# report items read as the cost metric alongside wall-clock time.
+class ReadCounter(object):
+    def __init__(self):
+        self.items = 0
+
+    def __call__(self, parsed, model, **kwargs):
+        if model.name in ('Scan', 'Query'):
+            self.items += parsed.get('ScannedCount', parsed.get('Count', 0))
+        elif model.name == 'BatchGetItem':
+            self.items += sum(len(items) for items in parsed.get('Responses', {}).values())
+        elif model.name == 'GetItem' and 'Item' in parsed:
+            self.items += 1
+
+    def reset(self):
+        self.items = 0
+
+# Attach a ReadCounter to every DynamoDB client created from the default boto3
+# session from now on (call before loading handlers)
+def count_dynamodb_reads():
+    import boto3
+
+    counter = ReadCounter()
+    boto3._get_default_session().events.register('after-call.dynamodb', counter)
+    return counter
+
+# Create a pay-per-request table with a string hash (and optional range) key
+# and optional GSIs given as {index_name: (hash_key, range_key_or_None)}
+def create_table(dynamodb, name, hash_key, range_key=None, indexes=None):
+    attributes = {hash_key: 'S'}
+    key_schema = [{'AttributeName': hash_key, 'KeyType': 'HASH'}]
+    if range_key:
+        attributes[range_key] = 'S'
+        key_schema.append({'AttributeName': range_key, 'KeyType': 'RANGE'})
+
+    request = {
+        'TableName': name,
+        'KeySchema': key_schema,
+        'BillingMode': 'PAY_PER_REQUEST'
+    }
+    if indexes:
+        request['GlobalSecondaryIndexes'] = []
+        for index_name, (index_hash, index_range) in indexes.items():
+            attributes[index_hash] = 'S'
+            index_schema = [{'AttributeName': index_hash, 'KeyType': 'HASH'}]
+            if index_range:
+                attributes[index_range] = 'S'
+                index_schema.append({'AttributeName': index_range, 'KeyType': 'RANGE'})
+            request['GlobalSecondaryIndexes'].append({
+                'IndexName': index_name,
+                'KeySchema': index_schema,
+                'Projection': {'ProjectionType': 'ALL'}
+            })
+    request['AttributeDefinitions'] = [{'AttributeName': name, 'AttributeType': kind}
+                                       for name, kind in attributes.items()]
+    dynamodb.create_table(**request)
+    return dynamodb.Table(name)
+
+# Create the S3 bucket used by the handlers
+def create_bucket(s3, name):
+    s3.create_bucket(Bucket=name)
+
+# A 1920x1080 PNG header followed by random bytes: passes upload_image's
+# format check without encoding real pixels
+def image_payload(size):
+    header = b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' + struct.pack('>IIBBBBB', 1920, 1080, 8, 2, 0, 0, 0)
+    return header + os.urandom(max(0, size - len(header)))
+
+# Run fn() `repeat` times and return the list of wall-clock durations in seconds
+def timed(fn, repeat=1):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+# Nearest-rank percentile of a list of numbers
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+STUB_ITEM = {'image_id': {'S': 'img-1'}, 'title': {'S': 'Sunset'}, 'description': {'S': 'Beach at dusk'},
+             'status': {'S': 'active'}}
+
+
+# Minimal stand-in for DynamoDB and S3 endpoints: every DynamoDB call gets
+# STUB_ITEM back (as Item and Items), S3 listings are empty, every other S3
+# GET gets `object_body` and the remaining S3 calls succeed with an empty body. Measures client and handler overhead
+# without network latency or moto in the process.
+def start_stub_endpoint(object_body=b''):
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def respond(self):
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            headers = {'ETag': '"stub"'}
+            if self.headers.get('X-Amz-Target', '').startswith('DynamoDB'):
+                body = json.dumps({'Item': STUB_ITEM, 'Items': [STUB_ITEM], 'Count': 1, 'ScannedCount': 1,
+                                   'Attributes': STUB_ITEM, 'UnprocessedItems': {},
+                                   'UnprocessedKeys': {}}).encode()
+                headers['Content-Type'] = 'application/x-amz-json-1.0'
+            elif self.command == 'GET' and 'list-type=2' in self.path:
+                body = (b'<?xml version="1.0" encoding="UTF-8"?><ListBucketResult><IsTruncated>false'
+                        b'</IsTruncated><KeyCount>0</KeyCount></ListBucketResult>')
+                headers['Content-Type'] = 'application/xml'
+            elif self.command == 'GET':
+                body = object_body
+                headers['Content-Type'] = 'image/jpeg'
+            else:
+                body = b''
+            self.send_response(204 if self.command == 'DELETE' else 200)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            if self.command == 'HEAD':
+                body, headers['Content-Type'] = b'', 'image/jpeg'
+                self.send_header('Content-Length', str(len(object_body)))
+            else:
+                self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_PUT = do_POST = do_DELETE = do_HEAD = respond
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
@@ -0,0 +1,101 @@
+"""
+Request latency of synchronous vs queued uploads, and worker drain throughput.
+
+    python benchmarks/bench_async_upload.py --uploads 200 --size-kb 512 --concurrency 1,4,8
+
+Runs upload_image against moto with content-addressed storage on, first
+synchronously (hash, blob, metadata and search index on the request path),
+then with UPLOAD_ASYNC_PROCESSING (store the bytes, write a queued row,
+enqueue). The queued uploads are then drained by process_uploads from the
+in-process LocalQueue at each worker concurrency, re-queueing the same jobs
+for every run (later runs find the blob already recorded on the row). moto
+runs in-process and shares the GIL with the workers, so concurrency gains
+here understate those against real AWS, where a job is mostly waiting on
+network round trips.
+"""
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+
+import _support
+
+
+def upload_event(data, number):
+    return {'body': json.dumps({'title': f'Sunset {number}', 'description': 'Beach at dusk',
+                                'image_file': base64.b64encode(data).decode('ascii')})}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--uploads', type=int, default=200)
+    parser.add_argument('--size-kb', type=int, default=512)
+    parser.add_argument('--concurrency', default='1,4,8')
+    args = parser.parse_args(argv)
+
+    os.environ['CONTENT_ADDRESSED_STORAGE'] = 'true'
+    os.environ.pop('UPLOAD_QUEUE_URL', None)
+    mock = _support.start_mock_aws()
+    try:
+        import boto3
+        import search_index
+        import blob_store
+        from job_queue import LocalQueue
+
+        dynamodb = boto3.resource('dynamodb', region_name=_support.REGION_NAME)
+        s3 = boto3.client('s3', region_name=_support.REGION_NAME)
+        upload = _support.load_handler('upload_image')
+        worker = _support.load_handler('process_uploads')
+        _support.create_bucket(s3, upload.S3_BUCKET_NAME)
+        table = _support.create_table(dynamodb, upload.DYNAMODB_TABLE_NAME, 'image_id')
+        _support.create_table(dynamodb, search_index.SEARCH_INDEX_TABLE_NAME, 'term', 'image_id')
+        _support.create_table(dynamodb, blob_store.BLOB_TABLE_NAME, 'content_sha256')
+
+        payloads = [_support.image_payload(args.size_kb * 1024) for _ in range(args.uploads)]
+        print(f"{'mode':>6} {'uploads':>8} {'p50 ms':>8} {'p95 ms':>8} {'status':>7}")
+        queued = []
+        for mode in ('sync', 'async'):
+            upload.ASYNC_PROCESSING = mode == 'async'
+            latencies = []
+            statuses = set()
+            for number, data in enumerate(payloads):
+                event = upload_event(data, number)
+                start = time.perf_counter()
+                response = upload.lambda_handler(event, None)
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses.add(response['statusCode'])
+                if mode == 'async':
+                    body = json.loads(response['body'])
+                    queued.append((body['image_id'], body['s3_url'].rsplit('/', 1)[1]))
+            print(f"{mode:>6} {len(payloads):>8} {_support.percentile(latencies, 50):>8.1f} "
+                  f"{_support.percentile(latencies, 95):>8.1f} {','.join(map(str, sorted(statuses))):>7}")
+
+        print(f"\n{'workers':>8} {'jobs':>6} {'seconds':>8} {'jobs/s':>8} {'outcomes'}")
+        for concurrency in [int(value) for value in args.concurrency.split(',')]:
+            # Put the same uploads back in the queued state for each run
+            queue = LocalQueue()
+            for image_id, staged_key in queued:
+                table.update_item(Key={'image_id': image_id},
+                                  UpdateExpression='SET #status = :queued REMOVE lease_until, attempts',
+                                  ExpressionAttributeNames={'#status': 'status'},
+                                  ExpressionAttributeValues={':queued': 'queued'})
+                queue.send({'image_id': image_id, 's3_key': staged_key})
+            start = time.perf_counter()
+            counts = worker.drain(queue, concurrency=concurrency)
+            elapsed = time.perf_counter() - start
+            print(f"{concurrency:>8} {len(queued):>6} {elapsed:>8.2f} {len(queued) / elapsed:>8.0f} "
+                  f"{json.dumps(counts, sort_keys=True)}")
+            assert counts == {worker.DONE: len(queued)}, counts
+
+        active = sum(1 for image_id, _ in queued
+                     if table.get_item(Key={'image_id': image_id})['Item']['status'] == 'active')
+        assert active == len(queued), active
+    finally:
+        mock.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+Per-image delete loop vs. batch delete (images/sec and AWS calls).
+
+    python benchmarks/bench_batch_delete.py --images 1000
+
+Loads N images (original, two derivatives and search postings each) into
+moto, then removes them (a) by invoking delete_images' lambda_handler once per
+image, as clients had to before, and (b) with one batch_delete_handler call
+per 1000 ids. The calls column counts AWS API requests, which dominates
+latency against real AWS far more than it does against moto.
+"""
+import sys
+import json
+import argparse
+
+import _support
+
+
+class CallCounter(object):
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, **kwargs):
+        self.calls += 1
+
+
+def load_images(s3, metadata_table, index_table, search_index, bucket, count, prefix):
+    image_ids = [f'{prefix}-{number:06d}' for number in range(count)]
+    with metadata_table.batch_writer() as metadata_writer, index_table.batch_writer() as index_writer:
+        for image_id in image_ids:
+            derivatives = [{'size': size, 'format': 'jpeg', 'key': f'derivatives/{image_id}/{size}.jpg'}
+                           for size in (128, 512)]
+            title, description = f'Sunset {image_id}', 'Beach at dusk'
+            metadata_writer.put_item(Item={'image_id': image_id, 'title': title, 'description': description,
+                                           'derivatives': derivatives})
+            search_index.index_image(index_table, image_id, title, description, batch=index_writer)
+            for key in [f'{image_id}.jpg'] + [derivative['key'] for derivative in derivatives]:
+                s3.put_object(Bucket=bucket, Key=key, Body=b'x')
+    return image_ids
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    mock = _support.start_mock_aws()
+    try:
+        import boto3
+        import search_index
+
+        calls = CallCounter()
+        boto3._get_default_session().events.register('before-call.*', calls)
+        dynamodb = boto3.resource('dynamodb', region_name=_support.REGION_NAME)
+        s3 = boto3.client('s3', region_name=_support.REGION_NAME)
+        delete_images = _support.load_handler('delete_images')
+        batch_delete = _support.load_handler('delete_images', 'batch_delete')
+
+        _support.create_bucket(s3, delete_images.S3_BUCKET_NAME)
+        metadata_table = _support.create_table(dynamodb, delete_images.DYNAMODB_TABLE_NAME, 'image_id')
+        index_table = _support.create_table(dynamodb, search_index.SEARCH_INDEX_TABLE_NAME, 'term', 'image_id')
+
+        print(f"{'mode':>8} {'images':>7} {'seconds':>8} {'images/s':>9} {'calls':>7}")
+        for mode in ('single', 'batch'):
+            image_ids = load_images(s3, metadata_table, index_table, search_index,
+                                    delete_images.S3_BUCKET_NAME, args.images, mode)
+            calls.calls = 0
+
+            def run():
+                if mode == 'single':
+                    for image_id in image_ids:
+                        delete_images.lambda_handler({'pathParameters': {'image_id': image_id}}, None)
+                    return
+                for start in range(0, len(image_ids), batch_delete.MAX_BATCH_SIZE):
+                    chunk = image_ids[start:start + batch_delete.MAX_BATCH_SIZE]
+                    response = batch_delete.batch_delete_handler({'body': json.dumps({'image_ids': chunk})}, None)
+                    assert response['statusCode'] == 200, response['body']
+
+            elapsed = _support.timed(run)[0]
+            remaining = s3.list_objects_v2(Bucket=delete_images.S3_BUCKET_NAME).get('KeyCount', 0)
+            assert remaining == 0, f'{remaining} objects left after {mode} delete'
+            print(f"{mode:>8} {len(image_ids):>7} {elapsed:>8.2f} {len(image_ids) / elapsed:>9.1f} {calls.calls:>7}")
+    finally:
+        mock.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
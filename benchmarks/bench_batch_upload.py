@@ -0,0 +1,103 @@
+"""
+Import throughput of one upload per request vs. batch uploads, in images/sec.
+
+    python benchmarks/bench_batch_upload.py --images 200 --size-kb 256 --batch-sizes 10,25,50 --concurrency 1,8
+
+Runs against moto: first upload_image.lambda_handler once per image, then
+batch_upload.batch_upload_handler with multipart bodies of each batch size
+and each S3 upload concurrency. The in-process numbers leave out what a
+real import pays per request (API Gateway, Lambda invoke, TLS): the last
+column adds --request-overhead-ms per request to show its effect. moto
+shares the GIL with the upload pool, so the concurrency gains understate
+those against real S3.
+"""
+import sys
+import json
+import time
+import base64
+import argparse
+
+import _support
+
+
+def multipart_event(payloads, offset):
+    boundary = 'bench-boundary'
+    parts = []
+    for number, data in enumerate(payloads):
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="title"\r\n\r\n'
+                     f'Sunset {offset + number}\r\n'.encode())
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="description"\r\n\r\n'
+                     'Beach at dusk\r\n'.encode())
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="image_file"; filename="{number}.png"\r\n'
+                     'Content-Type: image/png\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return {'headers': {'Content-Type': f'multipart/form-data; boundary={boundary}'},
+            'body': base64.b64encode(b''.join(parts)).decode('ascii')}
+
+
+def run_single(upload, payloads):
+    events = [{'body': json.dumps({'title': f'Sunset {number}', 'description': 'Beach at dusk',
+                                   'image_file': base64.b64encode(data).decode('ascii')})}
+              for number, data in enumerate(payloads)]
+    start = time.perf_counter()
+    for event in events:
+        assert upload.lambda_handler(event, None)['statusCode'] == 200
+    return time.perf_counter() - start, len(events)
+
+
+def run_batches(batch_upload, payloads, batch_size, concurrency):
+    events = [multipart_event(payloads[start:start + batch_size], start)
+              for start in range(0, len(payloads), batch_size)]
+    batch_upload.UPLOAD_CONCURRENCY = concurrency
+    start = time.perf_counter()
+    for event in events:
+        response = batch_upload.batch_upload_handler(event, None)
+        body = json.loads(response['body'])
+        assert response['statusCode'] == 200 and set(body['counts']) == {'created'}, body
+    return time.perf_counter() - start, len(events)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', type=int, default=200)
+    parser.add_argument('--size-kb', type=int, default=256)
+    parser.add_argument('--batch-sizes', default='10,25,50')
+    parser.add_argument('--concurrency', default='1,8')
+    parser.add_argument('--request-overhead-ms', type=float, default=30)
+    args = parser.parse_args(argv)
+
+    mock = _support.start_mock_aws()
+    try:
+        import boto3
+        import search_index
+        import blob_store
+
+        dynamodb = boto3.resource('dynamodb', region_name=_support.REGION_NAME)
+        upload = _support.load_handler('upload_image')
+        batch_upload = _support.load_handler('upload_image', 'batch_upload')
+        _support.create_bucket(boto3.client('s3', region_name=_support.REGION_NAME), upload.S3_BUCKET_NAME)
+        _support.create_table(dynamodb, upload.DYNAMODB_TABLE_NAME, 'image_id')
+        _support.create_table(dynamodb, search_index.SEARCH_INDEX_TABLE_NAME, 'term', 'image_id')
+        _support.create_table(dynamodb, blob_store.BLOB_TABLE_NAME, 'content_sha256')
+        payloads = [_support.image_payload(args.size_kb * 1024) for _ in range(args.images)]
+
+        overhead = args.request_overhead_ms / 1000.0
+        print(f"{'mode':>14} {'requests':>9} {'seconds':>8} {'images/s':>9} "
+              f"{'images/s +' + str(int(args.request_overhead_ms)) + 'ms/req':>20}")
+
+        def report(mode, seconds, requests):
+            print(f"{mode:>14} {requests:>9} {seconds:>8.2f} {len(payloads) / seconds:>9.1f} "
+                  f"{len(payloads) / (seconds + requests * overhead):>20.1f}")
+
+        report('single', *run_single(upload, payloads))
+        for batch_size in [int(value) for value in args.batch_sizes.split(',')]:
+            for concurrency in [int(value) for value in args.concurrency.split(',')]:
+                report(f'batch {batch_size} x{concurrency}',
+                       *run_batches(batch_upload, payloads, batch_size, concurrency))
+    finally:
+        mock.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Per-image view calls vs. one batch view call (latency and DynamoDB calls).
+
+    python benchmarks/bench_batch_view.py --images 200 --rounds 5
+
+Loads N images into moto and resolves download URLs for all of them (a) by
+invoking view_images' lambda_handler once per image, as a gallery page did
+before, and (b) with one batch_view_handler call. Each round uses fresh
+image ids so the metadata cache starts cold; the calls column counts
+DynamoDB requests, the part that dominates latency against real AWS.
+"""
+import os
+import sys
+import json
+import argparse
+
+import _support
+
+
+class CallCounter(object):
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, **kwargs):
+        self.calls += 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('METADATA_CACHE_STATS_EVERY', '0')
+    mock = _support.start_mock_aws()
+    try:
+        import boto3
+
+        calls = CallCounter()
+        boto3._get_default_session().events.register('before-call.dynamodb', calls)
+        dynamodb = boto3.resource('dynamodb', region_name=_support.REGION_NAME)
+        batch_view = _support.load_handler('view_images', 'batch_view')
+        view_images = sys.modules['lambda_function']
+        table = _support.create_table(dynamodb, view_images.DYNAMODB_TABLE_NAME, 'image_id')
+
+        print(f"{'mode':>8} {'images':>7} {'p50 ms':>8} {'p95 ms':>8} {'calls':>7}")
+        for mode in ('single', 'batch'):
+            latencies = []
+            handler_calls = 0
+            for round_number in range(args.rounds):
+                image_ids = [f'{mode}-{round_number}-{number:05d}' for number in range(args.images)]
+                with table.batch_writer() as writer:
+                    for image_id in image_ids:
+                        writer.put_item(Item={'image_id': image_id, 'title': 'Sunset', 'status': 'active'})
+
+                def run():
+                    if mode == 'single':
+                        for image_id in image_ids:
+                            response = view_images.lambda_handler({'pathParameters': {'image_id': image_id}}, None)
+                            assert response['statusCode'] == 200, response['body']
+                        return
+                    response = batch_view.batch_view_handler({'body': json.dumps({'image_ids': image_ids})}, None)
+                    assert json.loads(response['body'])['counts']['ok'] == len(image_ids), response['body']
+
+                before = calls.calls
+                latencies.append(_support.timed(run)[0] * 1000)
+                handler_calls += calls.calls - before
+            print(f"{mode:>8} {args.images:>7} {_support.percentile(latencies, 50):>8.1f} "
+                  f"{_support.percentile(latencies, 95):>8.1f} {handler_calls // args.rounds:>7}")
+    finally:
+        mock.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Cold-start cost: import plus first DynamoDB call, old vs. shared clients.
+
+    python benchmarks/bench_cold_start.py --runs 15
+
+Every run is a fresh interpreter, like a new Lambda execution environment.
+The first call goes to a local stub endpoint (through the AWS_ENDPOINT_URL
+override), so it measures client construction and the first request rather
+than network latency. Modes:
+
+    resource  the old module prologue: boto3.resource('dynamodb') and
+              boto3.client('s3') at import, default settings
+    shared    aws_clients.lazy_dynamodb() / lazy_client('s3') from the layer
+    handler   importing view_images and invoking its lambda_handler
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+import _support
+
+CHILD_PROLOGUES = {
+    'resource': """
+import boto3
+dynamodb = boto3.resource('dynamodb')
+s3 = boto3.client('s3')
+""",
+    'shared': """
+from aws_clients import lazy_client, lazy_dynamodb
+dynamodb = lazy_dynamodb()
+s3 = lazy_client('s3')
+""",
+    'handler': """
+sys.path.insert(0, os.path.join(APP_DIR, 'view_images'))
+import lambda_function
+"""
+}
+
+CHILD_FIRST_CALLS = {
+    'resource': "dynamodb.Table('images-metadata').get_item(Key={'image_id': 'img-1'})",
+    'shared': "dynamodb.Table('images-metadata').get_item(Key={'image_id': 'img-1'})",
+    'handler': "lambda_function.lambda_handler({'pathParameters': {'image_id': 'img-1'}}, None)"
+}
+
+CHILD_TEMPLATE = """
+import os, sys, time, json
+APP_DIR = {app_dir!r}
+sys.path.insert(0, {layer_dir!r})
+start = time.perf_counter()
+{prologue}
+imported = time.perf_counter()
+{first_call}
+done = time.perf_counter()
+print(json.dumps({{'import_ms': (imported - start) * 1000, 'first_call_ms': (done - imported) * 1000}}))
+"""
+
+
+def run_child(mode, endpoint):
+    code = CHILD_TEMPLATE.format(app_dir=_support.APP_DIR, layer_dir=_support.LAYER_DIR,
+                                 prologue=CHILD_PROLOGUES[mode], first_call=CHILD_FIRST_CALLS[mode])
+    env = dict(os.environ, AWS_ENDPOINT_URL=endpoint, AWS_ACCESS_KEY_ID='testing',
+               AWS_SECRET_ACCESS_KEY='testing', AWS_DEFAULT_REGION=_support.REGION_NAME)
+    output = subprocess.run([sys.executable, '-c', code], env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=15)
+    parser.add_argument('--modes', default='resource,shared,handler')
+    args = parser.parse_args(argv)
+
+    server, endpoint = _support.start_stub_endpoint()
+    try:
+        print(f"{'mode':>9} {'import p50':>11} {'first call p50':>15} {'total p50':>10} {'total p90':>10}  (ms)")
+        for mode in args.modes.split(','):
+            run_child(mode, endpoint)  # warm the OS page cache
+            runs = [run_child(mode, endpoint) for _ in range(args.runs)]
+            totals = [run['import_ms'] + run['first_call_ms'] for run in runs]
+            print(f"{mode:>9} {_support.percentile([run['import_ms'] for run in runs], 50):>11.1f} "
+                  f"{_support.percentile([run['first_call_ms'] for run in runs], 50):>15.1f} "
+                  f"{_support.percentile(totals, 50):>10.1f} {_support.percentile(totals, 90):>10.1f}")
+    finally:
+        server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
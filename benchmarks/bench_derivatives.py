@@ -0,0 +1,68 @@
+"""
+Derivative rendering throughput (images/sec, total and per core).
+
+    python benchmarks/bench_derivatives.py --images 24 --width 3000 --height 2000 --workers 1,2,4
+
+Renders the configured sizes/formats of process_derivatives for a batch of
+synthetic JPEG originals on a process pool of each worker count. Only the
+CPU-bound decode/resize/encode step is timed; S3 I/O is excluded.
+"""
+import io
+import os
+import sys
+import time
+import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import _support
+
+
+def synthetic_jpeg(width, height, seed):
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    image = Image.new('RGB', (width, height), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(200):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.ellipse((x, y, x + rng.randrange(50, 400), y + rng.randrange(50, 400)),
+                     fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    # Sensor-like noise so the encoder has real work to do
+    image = Image.blend(image, Image.effect_noise((width, height), 40).convert('RGB'), 0.15)
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=90)
+    return output.getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', type=int, default=24)
+    parser.add_argument('--width', type=int, default=3000)
+    parser.add_argument('--height', type=int, default=2000)
+    parser.add_argument('--workers', default=','.join(str(n) for n in sorted({1, 2, os.cpu_count() or 1})))
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('AWS_DEFAULT_REGION', _support.REGION_NAME)
+    process_derivatives = _support.load_handler('process_derivatives')
+    originals = [synthetic_jpeg(args.width, args.height, seed) for seed in range(args.images)]
+    print(f"sizes {process_derivatives.DERIVATIVE_SIZES}, formats {process_derivatives.DERIVATIVE_FORMATS}, "
+          f"{args.images} originals of {args.width}x{args.height}, {os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'seconds':>8} {'images/s':>9} {'images/s/core':>14}")
+
+    for workers in [int(value) for value in args.workers.split(',')]:
+        start = time.perf_counter()
+        if workers == 1:
+            for data in originals:
+                process_derivatives.render_derivatives(data)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(process_derivatives.render_derivatives, originals))
+        elapsed = time.perf_counter() - start
+        rate = args.images / elapsed
+        print(f"{workers:>8} {elapsed:>8.2f} {rate:>9.1f} {rate / min(workers, os.cpu_count() or 1):>14.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+Throughput of the local gateway (app/local_gateway/gateway.py) over HTTP.
+
+    python benchmarks/bench_gateway.py --duration 10 --clients 1,16,64 --workers 32 --seed-images 50
+
+Starts the gateway in-process against moto, uploads --seed-images images
+through POST /upload, then for each client count runs that many asyncio
+clients for --duration seconds, each issuing GET /images?limit=20 and
+GET /image/{image_id} in turn. With keep-alive every client reuses one
+connection; --no-keep-alive opens a connection per request. Reports
+requests/s, p50/p99 latency and status codes. moto shares the GIL with the
+handler threads, so the numbers are a floor for what the gateway adds.
+"""
+import os
+import sys
+import json
+import time
+import base64
+import random
+import asyncio
+import argparse
+import threading
+import importlib.util
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import _support
+import load_test
+
+
+def load_gateway():
+    path = os.path.join(_support.APP_DIR, 'local_gateway', 'gateway.py')
+    spec = importlib.util.spec_from_file_location('local_gateway_gateway', path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def start_gateway(gateway, workers):
+    """Runs the gateway on its own event loop thread; returns (port, stop)."""
+    loop = asyncio.new_event_loop()
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='handler')
+    instance = gateway.Gateway(gateway.load_routes(gateway.ROUTES), default_limit=workers * 4, executor=executor)
+    server = loop.run_until_complete(instance.start('127.0.0.1', 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    def stop():
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        server.close()
+        executor.shutdown(wait=True)
+    return server.sockets[0].getsockname()[1], stop
+
+
+async def request(connection, port, method, target, body=b'', keep_alive=True):
+    if connection is None or not keep_alive:
+        connection = await asyncio.open_connection('127.0.0.1', port)
+    reader, writer = connection
+    writer.write(f'{method} {target} HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n'
+                 f'Content-Length: {len(body)}\r\nConnection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'
+                 .encode('latin-1') + body)
+    await writer.drain()
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+    length = next(int(line.split(':', 1)[1]) for line in head if line.lower().startswith('content-length:'))
+    payload = await reader.readexactly(length)
+    if not keep_alive:
+        writer.close()
+        connection = None
+    return connection, int(head[0].split(' ')[1]), payload
+
+
+async def seed(port, count, size_kb):
+    image_file = base64.b64encode(_support.image_payload(size_kb * 1024)).decode('ascii')
+    connection, image_ids = None, []
+    for number in range(count):
+        body = json.dumps({'title': f'Sunset {number}', 'description': 'Beach at dusk',
+                           'image_file': image_file}).encode('utf-8')
+        connection, status, payload = await request(connection, port, 'POST', '/upload', body)
+        assert status == 200, payload
+        image_ids.append(json.loads(payload)['image_id'])
+    connection[1].close()
+    return image_ids
+
+
+async def run_clients(port, clients, duration, image_ids, keep_alive):
+    latencies, statuses = [], Counter()
+    deadline = time.perf_counter() + duration
+
+    async def client(number):
+        rng = random.Random(number)
+        connection, turn = None, 0
+        while time.perf_counter() < deadline:
+            target = '/images?limit=20' if turn % 2 else f'/image/{rng.choice(image_ids)}'
+            start = time.perf_counter()
+            connection, status, _ = await request(connection, port, 'GET', target, keep_alive=keep_alive)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+            turn += 1
+        if connection is not None:
+            connection[1].close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(number) for number in range(clients)))
+    return latencies, statuses, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--clients', default='1,16,64')
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--seed-images', type=int, default=50)
+    parser.add_argument('--size-kb', type=int, default=64)
+    parser.add_argument('--no-keep-alive', action='store_true')
+    args = parser.parse_args(argv)
+
+    mock = _support.start_mock_aws()
+    try:
+        load_test.create_resources(None)
+        gateway = load_gateway()
+        port, stop = start_gateway(gateway, args.workers)
+        try:
+            image_ids = asyncio.run(seed(port, args.seed_images, args.size_kb))
+            print(f"{'clients':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}  status codes")
+            for clients in [int(value) for value in args.clients.split(',')]:
+                latencies, statuses, elapsed = asyncio.run(
+                    run_clients(port, clients, args.duration, image_ids, not args.no_keep_alive))
+                print(f"{clients:>7} {len(latencies) / elapsed:>9.1f} "
+                      f"{_support.percentile(latencies, 50) * 1000:>8.2f} "
+                      f"{_support.percentile(latencies, 99) * 1000:>8.2f}  {dict(sorted(statuses.items()))}")
+        finally:
+            stop()
+    finally:
+        mock.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Cost of header-only format sniffing per upload, next to Pillow.
+
+    python benchmarks/bench_image_sniff.py --megapixels 12 --repeat 2000
+
+Encodes one image per format at the given size (JPEG with a 64 KB EXIF
+segment in front of the frame header, as phone cameras write them; HEIC is
+a synthetic header since Pillow cannot write it) and times
+image_sniff.validate_image on each, against PIL.Image.open (header parse
+only) and a full decode. Prints p50/p99 microseconds per call and fails if
+validate_image's p99 reaches 1 ms for any format. Needs Pillow.
+"""
+import io
+import sys
+import struct
+import argparse
+
+import _support
+
+
+def box(box_type, payload):
+    return struct.pack('>I', 8 + len(payload)) + box_type + payload
+
+
+def full_box(box_type, payload):
+    return box(box_type, b'\x00\x00\x00\x00' + payload)
+
+
+# ftyp + meta (pitm, ipco with a tile and a full-size ispe, ipma) + mdat
+def heic_header(width, height, mdat_size):
+    ispe = lambda w, h: full_box(b'ispe', struct.pack('>II', w, h))
+    ipco = box(b'ipco', ispe(512, 512) + ispe(width, height))
+    ipma = full_box(b'ipma', struct.pack('>I', 2) + struct.pack('>HB', 1, 1) + bytes([0x81])
+                    + struct.pack('>HB', 2, 1) + bytes([0x82]))
+    meta = full_box(b'meta', full_box(b'pitm', struct.pack('>H', 2)) + box(b'iprp', ipco + ipma))
+    return box(b'ftyp', b'heic\x00\x00\x00\x00mif1heic') + meta + box(b'mdat', b'\x00' * mdat_size)
+
+
+def samples(width, height):
+    from PIL import Image
+
+    image = Image.new('RGB', (width, height))
+    # Some structure so the encoders produce realistic sizes
+    image.paste((200, 80, 20), (0, 0, width // 2, height // 2))
+    encoded = {}
+    for image_format, options in (('jpeg', {'exif': b'Exif\x00\x00' + b'\x00' * 65000}), ('png', {}),
+                                  ('gif', {}), ('webp', {})):
+        output = io.BytesIO()
+        image.save(output, format=image_format.upper(), **options)
+        encoded[image_format] = output.getvalue()
+    encoded['heic'] = heic_header(width, height, 2 * 1024 * 1024)
+    return encoded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--megapixels', type=float, default=12)
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--decode-repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    from PIL import Image
+    from image_sniff import validate_image
+
+    height = int((args.megapixels * 1e6 * 3 / 4) ** 0.5)
+    width = height * 4 // 3
+    print(f"{width}x{height}")
+    print(f"{'format':>6} {'bytes':>10} {'sniff p50 us':>13} {'sniff p99 us':>13} {'PIL open us':>12} "
+          f"{'decode ms':>10}")
+    slow = []
+    for image_format, data in samples(width, height).items():
+        info = validate_image(data)
+        assert (info['format'], info['width'], info['height']) == (image_format, width, height), info
+        sniff = [seconds * 1e6 for seconds in _support.timed(lambda: validate_image(data), args.repeat)]
+        pil_open, decode = '-', '-'
+        if image_format != 'heic':
+            pil_open = '%.1f' % _support.percentile([seconds * 1e6 for seconds in _support.timed(
+                lambda: Image.open(io.BytesIO(data)).size, args.repeat // 10 or 1)], 50)
+            decode = '%.1f' % _support.percentile([seconds * 1e3 for seconds in _support.timed(
+                lambda: Image.open(io.BytesIO(data)).load(), args.decode_repeat)], 50)
+        p99 = _support.percentile(sniff, 99)
+        if p99 >= 1000:
+            slow.append(image_format)
+        print(f"{image_format:>6} {len(data):>10} {_support.percentile(sniff, 50):>13.1f} {p99:>13.1f} "
+              f"{pil_open:>12} {decode:>10}")
+
+    assert not slow, f'sniffing took 1 ms or more at p99 for {slow}'
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
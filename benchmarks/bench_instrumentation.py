@@ -0,0 +1,102 @@
+"""
+Overhead of request_metrics, and its log summary on a moto workload.
+
+    python benchmarks/bench_instrumentation.py --calls 20000 --requests 300
+
+First times a trivial handler bare, wrapped by instrument() with EMF output
+(written to /dev/null) and wrapped with METRICS_MODE=off, plus one phase()
+block, and fails if instrumentation adds 50 us or more per invocation at
+p50. Then runs view_images and list_images against moto with EMF on,
+captures their log lines and prints what `request_metrics.py summarize`
+reports for them.
+"""
+import io
+import os
+import sys
+import argparse
+import contextlib
+
+import _support
+
+
+def overhead(calls):
+    import importlib
+    import request_metrics
+
+    def handler(event, context):
+        return {'statusCode': 200, 'body': '{}'}
+
+    def with_phase(event, context):
+        with request_metrics.phase('parse'):
+            pass
+        return {'statusCode': 200, 'body': '{}'}
+
+    results = {'bare': _support.timed(lambda: handler({}, None), calls)}
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        instrumented = request_metrics.instrument('bench')(handler)
+        results['emf'] = _support.timed(lambda: instrumented({}, None), calls)
+        instrumented_phase = request_metrics.instrument('bench')(with_phase)
+        results['emf+phase'] = _support.timed(lambda: instrumented_phase({}, None), calls)
+
+    os.environ['METRICS_MODE'] = 'off'
+    try:
+        importlib.reload(request_metrics)
+        disabled = request_metrics.instrument('bench')(with_phase)
+        results['off+phase'] = _support.timed(lambda: disabled({}, None), calls)
+    finally:
+        os.environ['METRICS_MODE'] = 'emf'
+        importlib.reload(request_metrics)
+    return {mode: _support.percentile(durations, 50) * 1e6 for mode, durations in results.items()}
+
+
+def workload(requests):
+    mock = _support.start_mock_aws()
+    try:
+        import boto3
+        import request_metrics
+
+        dynamodb = boto3.resource('dynamodb', region_name=_support.REGION_NAME)
+        table = _support.create_table(dynamodb, 'images-metadata', 'image_id')
+        _support.create_bucket(boto3.client('s3', region_name=_support.REGION_NAME), 'image-bucket-madhu')
+        with table.batch_writer() as writer:
+            for number in range(200):
+                writer.put_item(Item={'image_id': f'img-{number}', 'title': f'Sunset {number}',
+                                      'description': 'Beach at dusk'})
+
+        view_images = _support.load_handler('view_images')
+        list_images = _support.load_handler('list_images')
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            for number in range(requests):
+                view_images.lambda_handler({'pathParameters': {'image_id': f'img-{number % 200}'}}, None)
+                list_images.lambda_handler({'queryStringParameters': {'title': 'Sunset', 'limit': '20'}}, None)
+        return request_metrics.summarize(request_metrics.read_documents(output.getvalue().splitlines()))
+    finally:
+        mock.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args(argv)
+
+    os.environ['METRICS_MODE'] = 'emf'  # _support turns metrics off for the other benchmarks
+    results = overhead(args.calls)
+    print(f"{'mode':>10} {'p50 us':>8} {'overhead us':>12}")
+    for mode, micros in results.items():
+        print(f"{mode:>10} {micros:>8.2f} {micros - results['bare']:>12.2f}")
+
+    summary = workload(args.requests)
+    print(f"\n{'handler':<14} {'metric':<22} {'count':>6} {'p50':>8} {'p99':>8}")
+    for handler in sorted(summary):
+        for name in sorted(summary[handler]):
+            stats = summary[handler][name]
+            print(f"{handler:<14} {name:<22} {stats['count']:>6} {stats['p50']:>8.2f} {stats['p99']:>8.2f}")
+
+    assert results['emf+phase'] - results['bare'] < 50, 'instrumentation adds 50 us or more per invocation'
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
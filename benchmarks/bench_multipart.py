@@ -0,0 +1,131 @@
+"""
+Peak memory and throughput of upload_image's multipart parsing.
+
+    python benchmarks/bench_multipart.py --sizes-mb 1,10,50
+
+Each (parser, size) pair runs in a fresh subprocess (Linux only: the peak is
+read from /proc/self/status after resetting it through /proc/self/clear_refs). "legacy" is the split/rstrip parser upload_image used before the
+streaming parser; "streaming" is the current parse_multipart_formdata, with the
+file part drained through BytesViewReader the way put_object reads it. Peak
+RSS is reported as growth over the process's RSS once the handler is imported
+and the API Gateway event (the base64 body) is in memory; both include the one
+unavoidable decoded copy of the body.
+"""
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import tempfile
+import subprocess
+
+import _support
+
+BOUNDARY = '----benchmarkBoundary7MA4YWxkTrZu0gW'
+# Read size botocore uses when streaming a file object body
+CHUNK_SIZE = 1024 * 1024
+
+
+def legacy_parse(body, content_type):
+    boundary = '--' + content_type.split('boundary=')[1]
+    form_data = {}
+    for part in body.split(boundary.encode()):
+        if not part or part == b'--\r\n':
+            continue
+        headers, content = part.split(b'\r\n\r\n', 1)
+        content = content.rstrip(b'\r\n')
+        headers = headers.decode('utf-8')
+        if 'Content-Disposition' in headers:
+            name = None
+            for item in headers.split(';'):
+                if 'name=' in item:
+                    name = item.split('=')[1].strip('"')
+                    break
+            form_data[name] = content if 'filename=' in headers else content.decode('utf-8')
+    return form_data
+
+
+def build_event(size):
+    image = os.urandom(size)
+    body = (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="title"\r\n\r\nBenchmark\r\n'
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="image_file"; filename="bench.jpg"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode() + image + f'\r\n--{BOUNDARY}--\r\n'.encode()
+    return base64.b64encode(body).decode('ascii')
+
+
+def read_status_kb(field):
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    raise KeyError(field)
+
+
+# Reset the kernel's peak-RSS watermark (Linux) so the peak measured afterwards
+# belongs to the code under test, not to loading the event
+def reset_peak_rss():
+    with open('/proc/self/clear_refs', 'w') as clear_refs:
+        clear_refs.write('5')
+    return read_status_kb('VmRSS') * 1024
+
+
+def peak_rss_bytes():
+    return read_status_kb('VmHWM') * 1024
+
+
+# Runs in the child process; event_path holds the base64 API Gateway body
+def measure(parser, event_path):
+    content_type = f'multipart/form-data; boundary={BOUNDARY}'
+    upload_image = _support.load_handler('upload_image')
+    with open(event_path) as event_file:
+        event_body = event_file.read()
+    rss_before = reset_peak_rss()
+
+    start = time.perf_counter()
+    if parser == 'legacy':
+        body = base64.b64decode(event_body)
+        consumed = len(legacy_parse(body, content_type)['image_file'])
+    else:
+        body = upload_image.decode_base64_body(event_body)
+        image = upload_image.parse_multipart_formdata(body, content_type)['image_file']
+        reader = upload_image.BytesViewReader(image)
+        consumed = 0
+        chunk = reader.read(CHUNK_SIZE)
+        while chunk:
+            consumed += len(chunk)
+            chunk = reader.read(CHUNK_SIZE)
+    elapsed = time.perf_counter() - start
+
+    return {'peak_rss_growth': peak_rss_bytes() - rss_before, 'seconds': elapsed, 'bytes': consumed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes-mb', default='1,10,50')
+    parser.add_argument('--child', nargs=2, metavar=('PARSER', 'EVENT_PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        os.environ.setdefault('AWS_DEFAULT_REGION', _support.REGION_NAME)
+        print(json.dumps(measure(args.child[0], args.child[1])))
+        return 0
+
+    print(f"{'size MB':>8} {'parser':>10} {'peak RSS growth MB':>19} {'MB/s':>8}")
+    for size_mb in [int(value) for value in args.sizes_mb.split(',')]:
+        with tempfile.NamedTemporaryFile('w', suffix='.b64', delete=False) as event_file:
+            event_file.write(build_event(size_mb * 1024 * 1024))
+        try:
+            for name in ('legacy', 'streaming'):
+                output = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+                                                  '--child', name, event_file.name])
+                result = json.loads(output)
+                print(f"{size_mb:>8} {name:>10} {result['peak_rss_growth'] / 1048576.0:>19.1f} "
+                      f"{size_mb / result['seconds']:>8.0f}")
+        finally:
+            os.unlink(event_file.name)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Whole-table export throughput (items/sec) vs. parallel scan segment count.
+
+    python benchmarks/bench_parallel_scan.py --items 20000 --segments 1,2,4,8,16
+    python benchmarks/bench_parallel_scan.py --backend moto --items 5000
+
+Exports every item with bulk_scan.export_table to an in-memory NDJSON stream.
+The default stub backend serves Segment/TotalSegments scans from memory and
+sleeps --page-latency-ms per page, standing in for the network round trip
+and per-partition read rate that bound a real single-threaded scan. moto
+does its work under the GIL in this process, so its numbers mostly show
+that overlapping requests only pays off when time is spent waiting.
+"""
+import io
+import sys
+import time
+import argparse
+
+import _support
+
+
+class StubTable(object):
+    def __init__(self, items, page_size, page_latency):
+        self.items = items
+        self.page_size = page_size
+        self.page_latency = page_latency
+
+    def scan(self, Segment=0, TotalSegments=1, ExclusiveStartKey=None, **kwargs):
+        time.sleep(self.page_latency)
+        start = ExclusiveStartKey['position'] if ExclusiveStartKey else Segment
+        stop = start + self.page_size * TotalSegments
+        response = {'Items': self.items[start:stop:TotalSegments]}
+        if stop < len(self.items):
+            response['LastEvaluatedKey'] = {'position': stop}
+        return response
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--backend', choices=['stub', 'moto'], default='stub')
+    parser.add_argument('--items', type=int, default=20000)
+    parser.add_argument('--segments', default='1,2,4,8,16')
+    parser.add_argument('--page-size', type=int, default=500, help='items per page (stub backend)')
+    parser.add_argument('--page-latency-ms', type=float, default=25.0, help='per page (stub backend)')
+    args = parser.parse_args(argv)
+
+    mock = None
+    items = [{'image_id': f'img-{number:07d}', 'title': f'Sunset {number}', 'description': 'Beach at dusk',
+              'status': 'active'} for number in range(args.items)]
+    if args.backend == 'moto':
+        mock = _support.start_mock_aws()
+        import boto3
+        import aws_clients
+
+        table = _support.create_table(boto3.resource('dynamodb', region_name=_support.REGION_NAME),
+                                      'images-metadata', 'image_id')
+        with table.batch_writer() as writer:
+            for item in items:
+                writer.put_item(Item=item)
+        table = aws_clients.dynamodb(region_name=_support.REGION_NAME).Table('images-metadata')
+    else:
+        table = StubTable(items, args.page_size, args.page_latency_ms / 1000.0)
+
+    import bulk_scan
+
+    try:
+        print(f"{'segments':>8} {'items':>7} {'seconds':>8} {'items/s':>9} {'speedup':>8}")
+        baseline = None
+        for segments in [int(value) for value in args.segments.split(',')]:
+            stream = io.StringIO()
+            start = time.perf_counter()
+            exported = bulk_scan.export_table(table, bulk_scan.NdjsonWriter(stream), segments)
+            elapsed = time.perf_counter() - start
+            assert exported == args.items, f'exported {exported} of {args.items} items'
+            rate = exported / elapsed
+            baseline = baseline or rate
+            print(f"{segments:>8} {exported:>7} {elapsed:>8.2f} {rate:>9.0f} {rate / baseline:>7.1f}x")
+    finally:
+        if mock is not None:
+            mock.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
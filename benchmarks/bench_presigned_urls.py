@@ -0,0 +1,55 @@
+"""
+Presigned URL throughput: signing every request vs. the windowed URL cache.
+
+    python benchmarks/bench_presigned_urls.py --requests 20000 --keys 1000
+
+Replays view requests over --keys distinct objects (popularity is Zipf-like,
+as real views are) through view_images' PresignedUrlCache, once with
+window_seconds=0 (a fresh signature per request, the old behaviour) and once
+with the default window. Signing is local CPU work, so no AWS mock is needed.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+import _support
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--keys', type=int, default=1000)
+    parser.add_argument('--window-seconds', type=int, default=900)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    import boto3
+
+    s3 = boto3.client('s3', region_name=_support.REGION_NAME)
+    presigned_url_cache = _support.load_handler('view_images', 'presigned_url_cache')
+
+    rng = random.Random(args.seed)
+    keys = [f'img-{number:06d}.jpg' for number in range(args.keys)]
+    weights = [1.0 / rank for rank in range(1, args.keys + 1)]
+    requests = rng.choices(keys, weights=weights, k=args.requests)
+
+    print(f"{'mode':>8} {'requests':>9} {'seconds':>8} {'urls/s':>10} {'signatures':>11} {'distinct urls':>14}")
+    for mode, window_seconds in (('fresh', 0), ('cached', args.window_seconds)):
+        cache = presigned_url_cache.PresignedUrlCache(s3, window_seconds, max_entries=args.keys)
+        urls = set()
+        start = time.perf_counter()
+        for key in requests:
+            urls.add(cache.get('image-bucket-madhu', key, 3600)[0])
+        elapsed = time.perf_counter() - start
+        signatures = args.requests if window_seconds == 0 else cache.stats()['misses']
+        print(f"{mode:>8} {args.requests:>9} {elapsed:>8.2f} {args.requests / elapsed:>10.0f} "
+              f"{signatures:>11} {len(urls):>14}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
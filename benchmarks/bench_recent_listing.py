@@ -0,0 +1,118 @@
+"""
+Newest-first and per-owner listing: full scan + sort vs. the listing GSIs.
+
+    python benchmarks/bench_recent_listing.py --sizes 5000,20000 --owners 200
+
+Loads images-metadata into moto with created_at spread over the last two
+years, adds the indexes through catalog_index.create_indexes, then fetches
+the newest page of the whole catalog and of one owner's images (a) by
+scanning the table and sorting, the only way before the indexes, and (b)
+through list_images' list_recent_images and list_owner_images. Reports p50
+latency and DynamoDB items read per page, and checks that both return the
+same images.
+"""
+import sys
+import random
+import argparse
+
+import _support
+
+DAY_MS = 86400 * 1000
+
+
+def load_catalog(catalog_index, table, size, owners, seed):
+    rng = random.Random(seed)
+    now = catalog_index.now_ms()
+    with table.batch_writer() as writer:
+        for number in range(size):
+            image_id = f'img-{number:08d}'
+            item = {'image_id': image_id, 'title': f'Image {number}', 'description': 'benchmark',
+                    'size_bytes': rng.randint(10000, 5000000)}
+            item.update(catalog_index.listing_attributes(image_id, f'user-{rng.randrange(owners)}',
+                                                         now - rng.randrange(730 * DAY_MS)))
+            writer.put_item(Item=item)
+
+
+# Baseline: read every row (optionally only one owner's) and sort by created_at
+def scan_newest(table, limit, owner_id=None):
+    request = {'ProjectionExpression': 'image_id, created_at'}
+    if owner_id:
+        request.update(FilterExpression='owner_id = :owner', ExpressionAttributeValues={':owner': owner_id})
+    items = []
+    while True:
+        response = table.scan(**request)
+        items.extend(response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            break
+        request['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    items.sort(key=lambda item: (item['created_at'], item['image_id']), reverse=True)
+    return [item['image_id'] for item in items[:limit]]
+
+
+def run(size, owners, limit, repeat, seed):
+    mock = _support.start_mock_aws()
+    try:
+        import boto3
+        import catalog_index
+
+        reads = _support.count_dynamodb_reads()
+        dynamodb = boto3.resource('dynamodb', region_name=_support.REGION_NAME)
+        table = _support.create_table(dynamodb, catalog_index.DYNAMODB_TABLE_NAME, 'image_id')
+        client = boto3.client('dynamodb', region_name=_support.REGION_NAME)
+        while catalog_index.create_indexes(client):
+            pass
+        load_catalog(catalog_index, table, size, owners, seed)
+
+        list_images = _support.load_handler('list_images')
+        owner_id = 'user-0'
+        fields = ('image_id',)
+        cases = {
+            'recent': (lambda: scan_newest(table, limit),
+                       lambda: [item['image_id'] for item in list_images.list_recent_images(limit=limit,
+                                                                                            fields=fields)[0]]),
+            'owner': (lambda: scan_newest(table, limit, owner_id),
+                      lambda: [item['image_id'] for item in list_images.list_owner_images(owner_id, limit=limit,
+                                                                                          fields=fields)[0]])
+        }
+        results = []
+        for name, (scan, indexed) in cases.items():
+            assert scan() == indexed(), f'{name}: index listing differs from the scan'
+            reads.reset()
+            scan_times = _support.timed(scan, repeat)
+            scan_reads = reads.items // repeat
+            reads.reset()
+            index_times = _support.timed(indexed, repeat)
+            index_reads = reads.items // repeat
+            results.append({
+                'size': size,
+                'listing': name,
+                'scan_p50_ms': _support.percentile(scan_times, 50) * 1000,
+                'index_p50_ms': _support.percentile(index_times, 50) * 1000,
+                'scan_items_read': scan_reads,
+                'index_items_read': index_reads
+            })
+        return results
+    finally:
+        mock.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='5000,20000')
+    parser.add_argument('--owners', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    print(f"{'items':>8} {'listing':>8} {'scan p50 ms':>12} {'index p50 ms':>13} {'scan items read':>16} "
+          f"{'index items read':>17}")
+    for size in [int(value) for value in args.sizes.split(',')]:
+        for result in run(size, args.owners, args.limit, args.repeat, args.seed):
+            print(f"{result['size']:>8} {result['listing']:>8} {result['scan_p50_ms']:>12.1f} "
+                  f"{result['index_p50_ms']:>13.1f} {result['scan_items_read']:>16} {result['index_items_read']:>17}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
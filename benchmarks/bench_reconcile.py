@@ -0,0 +1,90 @@
+"""
+Reconciler throughput and memory on a seeded catalog with injected faults.
+
+    python benchmarks/bench_reconcile.py --images 5000 --faults 0.01 --run-size 1000
+
+Loads N images (original plus one derivative each) into moto, then breaks a
+fraction of them: rows whose object is gone, objects whose row is gone and
+derivatives left behind by a deleted image. Runs reconcile_images in report
+mode, then with repair, then reports again, printing items/sec, the peak
+Python heap (tracemalloc) and the finding counts; the last pass must be clean.
+--run-size is the external-sort run, so peak memory should track it rather
+than --images. moto's listing and tracemalloc dominate the timings here;
+the point is correctness and flat memory. Finding log lines are discarded.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import contextlib
+import tracemalloc
+
+import _support
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', type=int, default=5000)
+    parser.add_argument('--faults', type=float, default=0.01, help='fraction of images broken per fault kind')
+    parser.add_argument('--run-size', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    os.environ['RECONCILE_RUN_SIZE'] = str(args.run_size)
+    os.environ['RECONCILE_GRACE_SECONDS'] = '0'
+    mock = _support.start_mock_aws()
+    try:
+        import boto3
+        import search_index
+        import blob_store
+
+        dynamodb = boto3.resource('dynamodb', region_name=_support.REGION_NAME)
+        s3 = boto3.client('s3', region_name=_support.REGION_NAME)
+        reconcile = _support.load_handler('reconcile_images')
+        bucket = reconcile.S3_BUCKET_NAME
+        _support.create_bucket(s3, bucket)
+        table = _support.create_table(dynamodb, reconcile.DYNAMODB_TABLE_NAME, 'image_id')
+        _support.create_table(dynamodb, search_index.SEARCH_INDEX_TABLE_NAME, 'term', 'image_id')
+        _support.create_table(dynamodb, blob_store.BLOB_TABLE_NAME, 'content_sha256')
+
+        rng = random.Random(args.seed)
+        image_ids = [f'{rng.getrandbits(128):032x}' for _ in range(args.images)]
+        broken = rng.sample(image_ids, 3 * int(args.images * args.faults))
+        fault_count = len(broken) // 3
+        missing_objects = set(broken[:fault_count])
+        missing_rows = set(broken[fault_count:2 * fault_count])
+        deleted_images = set(broken[2 * fault_count:])
+
+        with table.batch_writer() as writer:
+            for image_id in image_ids:
+                if image_id not in missing_rows and image_id not in deleted_images:
+                    writer.put_item(Item={'image_id': image_id, 'title': 'Sunset', 's3_key': f'{image_id}.jpg',
+                                          'derivatives': [{'key': f'derivatives/{image_id}/128.jpg'}]})
+                if image_id not in missing_objects and image_id not in deleted_images:
+                    s3.put_object(Bucket=bucket, Key=f'{image_id}.jpg', Body=b'x')
+                s3.put_object(Bucket=bucket, Key=f'derivatives/{image_id}/128.jpg', Body=b'x')
+
+        print(f"{'pass':>8} {'seconds':>8} {'items/s':>9} {'peak MB':>8} {'dangling':>9} {'orphans':>8} "
+              f"{'orphan drv':>11} {'repaired':>9}")
+        for label, repair in (('report', False), ('repair', True), ('verify', False)):
+            tracemalloc.start()
+            start = time.perf_counter()
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                report = reconcile.reconcile_prefix('', repair=repair, now=time.time() + 1)
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] / 1e6
+            tracemalloc.stop()
+            counts = report['counts']
+            items = counts['objects'] + counts['rows']
+            print(f"{label:>8} {elapsed:>8.2f} {items / elapsed:>9.0f} {peak:>8.1f} {counts['dangling_rows']:>9} "
+                  f"{counts['orphan_objects']:>8} {counts['orphan_derivatives']:>11} {counts['repaired']:>9}")
+
+        assert counts['dangling_rows'] == counts['orphan_objects'] == counts['orphan_derivatives'] == 0, counts
+    finally:
+        mock.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
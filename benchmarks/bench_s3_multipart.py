@@ -0,0 +1,72 @@
+"""
+Throughput of upload_image's S3 transfer across part sizes and concurrency.
+
+    python benchmarks/bench_s3_multipart.py --size-mb 64 --part-sizes-mb 5,8,16 --concurrency 1,4,8
+
+Uploads run against moto's in-process S3, which answers instantly. To model
+the network, every request first sleeps for --rtt-ms plus its body size over
+--stream-mbps (per-connection bandwidth; single S3 streams are typically
+capped well below the NIC). Sleeping releases the GIL the way socket I/O
+does, which is where concurrent part uploads pay off. The single put_object
+row is the baseline.
+"""
+import os
+import sys
+import time
+import argparse
+
+import _support
+
+BUCKET = 'bench-uploads'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=64)
+    parser.add_argument('--part-sizes-mb', default='5,8,16')
+    parser.add_argument('--concurrency', default='1,4,8')
+    parser.add_argument('--rtt-ms', type=float, default=30.0)
+    parser.add_argument('--stream-mbps', type=float, default=40.0, help='per-connection MB/s, 0 = unlimited')
+    args = parser.parse_args(argv)
+
+    mock = _support.start_mock_aws()
+    try:
+        import boto3
+
+        upload_image = _support.load_handler('upload_image')
+        s3_transfer = sys.modules['s3_transfer']
+
+        s3 = boto3.client('s3', region_name=_support.REGION_NAME)
+        _support.create_bucket(s3, BUCKET)
+
+        def simulate_network(request, **kwargs):
+            delay = args.rtt_ms / 1000.0
+            if args.stream_mbps:
+                delay += int(request.headers.get('Content-Length', 0)) / (args.stream_mbps * 1024 * 1024)
+            time.sleep(delay)
+
+        s3.meta.events.register('before-send.s3', simulate_network)
+
+        data = memoryview(os.urandom(args.size_mb * 1024 * 1024))
+        print(f"{'mode':>10} {'part MB':>8} {'threads':>8} {'seconds':>8} {'MB/s':>8}")
+
+        start = time.perf_counter()
+        s3.put_object(Bucket=BUCKET, Key='single.bin', Body=upload_image.BytesViewReader(data))
+        elapsed = time.perf_counter() - start
+        print(f"{'put_object':>10} {'-':>8} {1:>8} {elapsed:>8.2f} {args.size_mb / elapsed:>8.1f}")
+
+        for part_size_mb in [int(value) for value in args.part_sizes_mb.split(',')]:
+            for concurrency in [int(value) for value in args.concurrency.split(',')]:
+                start = time.perf_counter()
+                s3_transfer.multipart_upload(s3, BUCKET, 'multipart.bin', data,
+                                             part_size=part_size_mb * 1024 * 1024, max_concurrency=concurrency)
+                elapsed = time.perf_counter() - start
+                print(f"{'multipart':>10} {part_size_mb:>8} {concurrency:>8} {elapsed:>8.2f} "
+                      f"{args.size_mb / elapsed:>8.1f}")
+    finally:
+        mock.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Compare substring scan vs. inverted-index lookup for title/description search.
+
+    python benchmarks/bench_search_index.py --sizes 10000,100000,1000000
+
+For each catalog size the metadata and search-index tables are loaded into
+moto, then the same queries run as (a) a full filtered scan of
+images-metadata, as list_images did before the index, and (b) list_images'
+search_images through images-search-index. The cost column is DynamoDB items
+read per query, which is what drives RCU and latency on real DynamoDB; moto's
+Query walks the whole table, so its wall-clock numbers understate the index.
+Loading 1M items into moto takes a long time; pass smaller sizes for a quick
+run.
+"""
+import sys
+import random
+import argparse
+
+import _support
+
+# Word frequencies in real titles are Zipf-like: a few very common words and a
+# long tail of rare ones
+BASE_WORDS = [
+    'sunset', 'beach', 'mountain', 'river', 'forest', 'city', 'night', 'street',
+    'portrait', 'family', 'dog', 'cat', 'bird', 'flower', 'garden', 'snow',
+    'winter', 'summer', 'autumn', 'spring', 'lake', 'bridge', 'car', 'train',
+    'food', 'coffee', 'party', 'wedding', 'concert', 'museum', 'desert', 'ocean'
+]
+VOCABULARY = BASE_WORDS + [f'{word}{number}' for number in range(1, 160) for word in BASE_WORDS[:32]]
+WEIGHTS = [1.0 / rank for rank in range(1, len(VOCABULARY) + 1)]
+
+
+def random_text(rng, words):
+    return ' '.join(rng.choices(VOCABULARY, weights=WEIGHTS, k=words))
+
+
+def load_catalog(search_index, metadata_table, index_table, size, seed):
+    rng = random.Random(seed)
+    with metadata_table.batch_writer() as metadata_writer, index_table.batch_writer() as index_writer:
+        for number in range(size):
+            image_id = f'img-{number:08d}'
+            title = random_text(rng, 2)
+            description = random_text(rng, 6)
+            metadata_writer.put_item(Item={'image_id': image_id, 'title': title, 'description': description})
+            search_index.index_image(index_table, image_id, title, description, batch=index_writer)
+
+
+# Baseline: read the whole table with one contains() filter per query word
+def scan_search(metadata_table, query):
+    conditions = []
+    values = {}
+    for number, word in enumerate(query.split()):
+        conditions.append(f'(contains(title, :w{number}) or contains(#description, :w{number}))')
+        values[f':w{number}'] = word
+    request = {
+        'FilterExpression': ' and '.join(conditions),
+        'ExpressionAttributeNames': {'#description': 'description'},
+        'ExpressionAttributeValues': values
+    }
+    matches = 0
+    while True:
+        response = metadata_table.scan(**request)
+        matches += response['Count']
+        if 'LastEvaluatedKey' not in response:
+            return matches
+        request['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def run(size, queries, seed):
+    mock = _support.start_mock_aws()
+    try:
+        import boto3
+        import search_index
+
+        reads = _support.count_dynamodb_reads()
+        dynamodb = boto3.resource('dynamodb', region_name=_support.REGION_NAME)
+        metadata_table = _support.create_table(dynamodb, search_index.DYNAMODB_TABLE_NAME, 'image_id')
+        index_table = _support.create_table(dynamodb, search_index.SEARCH_INDEX_TABLE_NAME, 'term', 'image_id')
+        load_catalog(search_index, metadata_table, index_table, size, seed)
+
+        list_images = _support.load_handler('list_images')
+        rng = random.Random(seed + 1)
+        # Query the kind of words users type: two mid-frequency terms
+        queries_text = [' '.join(rng.sample(VOCABULARY[32:800], 2)) for _ in range(queries)]
+
+        scan_reads = []
+        scan_times = []
+        index_reads = []
+        index_times = []
+        for query in queries_text:
+            reads.reset()
+            scan_times.extend(_support.timed(lambda: scan_search(metadata_table, query)))
+            scan_reads.append(reads.items)
+            reads.reset()
+            index_times.extend(_support.timed(lambda: list_images.search_images(query, limit=10)))
+            index_reads.append(reads.items)
+
+        return {
+            'size': size,
+            'scan_p50_ms': _support.percentile(scan_times, 50) * 1000,
+            'index_p50_ms': _support.percentile(index_times, 50) * 1000,
+            'scan_items_read': sum(scan_reads) // queries,
+            'index_items_read': sum(index_reads) // queries
+        }
+    finally:
+        mock.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--queries', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    print(f"{'items':>10} {'scan p50 ms':>12} {'index p50 ms':>13} {'scan items read':>16} {'index items read':>17}")
+    for size in [int(value) for value in args.sizes.split(',')]:
+        result = run(size, args.queries, args.seed)
+        print(f"{result['size']:>10} {result['scan_p50_ms']:>12.1f} {result['index_p50_ms']:>13.1f} "
+              f"{result['scan_items_read']:>16} {result['index_items_read']:>17}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
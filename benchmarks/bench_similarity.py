@@ -0,0 +1,160 @@
+"""
+Similar-image query latency vs. catalog size: multi-index hash vs. linear scan.
+
+    python benchmarks/bench_similarity.py --sizes 10000,100000,1000000 --distances 4,10 --queries 200
+
+For each catalog size, synthetic 64-bit hashes are generated the way real
+catalogs look to dHash: a share of near-duplicate clusters (copies with a
+few flipped bits) among unrelated images. Each query hash is the hash of a
+catalogued image with a few bits flipped. For each distance it reports
+the p50/p99 query time of similarity_index.MultiIndexHash and the share of
+the catalog whose full distance it had to check, and the p50/p99 of a
+linear scan over every hash. Both must return the same matches. It also
+reports how long the index took to build.
+
+--handler-size N additionally loads N rows into moto and times
+similar_images_handler: the first call (parallel scan and build) and warm
+calls.
+"""
+import sys
+import json
+import time
+import random
+import argparse
+
+import _support
+
+
+def catalog(size, seed, duplicate_share=0.3, cluster_size=5, flips=3):
+    rng = random.Random(seed)
+    hashes = []
+    while len(hashes) < size:
+        value = rng.getrandbits(64)
+        hashes.append(value)
+        if rng.random() < duplicate_share:
+            for _ in range(min(cluster_size - 1, size - len(hashes))):
+                copy = value
+                for _ in range(rng.randint(1, flips)):
+                    copy ^= 1 << rng.randrange(64)
+                hashes.append(copy)
+    return hashes
+
+
+def linear_search(hashes, value, max_distance, hamming):
+    matches = []
+    for number, candidate in enumerate(hashes):
+        distance = hamming(candidate, value)
+        if distance <= max_distance:
+            matches.append((distance, number))
+    matches.sort()
+    return matches
+
+
+# Images whose full distance a search checks (found through any chunk table)
+def candidate_count(index, value, max_distance):
+    candidates = set()
+    masks = index.flip_masks(max_distance // index.CHUNKS)
+    for table, chunk in zip(index.tables, index.chunks(value)):
+        for mask in masks:
+            candidates.update(table.get(chunk ^ mask, ()))
+    return len(candidates)
+
+
+def run_size(similarity_index, size, distances, query_count, seed):
+    hashes = catalog(size, seed)
+    start = time.perf_counter()
+    index = similarity_index.MultiIndexHash()
+    for number, value in enumerate(hashes):
+        index.add(number, value)
+    build_seconds = time.perf_counter() - start
+
+    rng = random.Random(seed + 1)
+    queries = []
+    for _ in range(query_count):
+        value = rng.choice(hashes)
+        for _ in range(rng.randint(0, 2)):
+            value ^= 1 << rng.randrange(64)
+        queries.append(value)
+
+    rows = []
+    for max_distance in distances:
+        index_seconds, linear_seconds, checked, matches = [], [], 0, 0
+        for value in queries:
+            start = time.perf_counter()
+            found = index.search(value, max_distance)
+            index_seconds.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            expected = linear_search(hashes, value, max_distance, similarity_index.hamming)
+            linear_seconds.append(time.perf_counter() - start)
+            assert found == expected, 'multi-index hash and linear scan disagree'
+            checked += candidate_count(index, value, max_distance)
+            matches += len(found)
+        rows.append((max_distance, index_seconds, linear_seconds, checked / (len(queries) * size),
+                     matches / len(queries)))
+    return build_seconds, rows
+
+
+def run_handler(size, seed):
+    mock = _support.start_mock_aws()
+    try:
+        import boto3
+        import similarity_index
+
+        dynamodb = boto3.resource('dynamodb', region_name=_support.REGION_NAME)
+        table = _support.create_table(dynamodb, similarity_index.DYNAMODB_TABLE_NAME, 'image_id')
+        _support.create_table(dynamodb, similarity_index.SIMILARITY_LOG_TABLE_NAME, 'stream', 'change_id')
+        hashes = catalog(size, seed)
+        with table.batch_writer() as writer:
+            for number, value in enumerate(hashes):
+                writer.put_item(Item={'image_id': f'img-{number}', 'title': f'Image {number}',
+                                      'phash': similarity_index.hash_hex(value)})
+
+        similar_images = _support.load_handler('list_images', 'similar_images')
+        similarity_index.reset_cache()
+        # Query with the first image that has near-duplicates
+        query = next(number for number in range(size - 1)
+                     if similarity_index.hamming(hashes[number], hashes[number + 1]) <= 3)
+        event = {'queryStringParameters': {'image_id': f'img-{query}', 'distance': '10'}}
+        start = time.perf_counter()
+        response = similar_images.similar_images_handler(event, None)
+        cold = time.perf_counter() - start
+        assert response['statusCode'] == 200, response
+        warm = _support.timed(lambda: similar_images.similar_images_handler(event, None), 20)
+        return cold, warm, len(json.loads(response['body'])['images'])
+    finally:
+        mock.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--distances', default='4,10')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--handler-size', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    import similarity_index
+
+    distances = [int(value) for value in args.distances.split(',')]
+    print(f"{'size':>9} {'dist':>4} {'build s':>8} {'matches':>8} {'checked':>8} "
+          f"{'index p50 ms':>13} {'index p99 ms':>13} {'scan p50 ms':>12} {'scan p99 ms':>12} {'speedup':>8}")
+    for size in [int(value) for value in args.sizes.split(',')]:
+        build_seconds, rows = run_size(similarity_index, size, distances, args.queries, args.seed)
+        for max_distance, index_seconds, linear_seconds, checked, matches in rows:
+            index_p50 = _support.percentile(index_seconds, 50) * 1000
+            linear_p50 = _support.percentile(linear_seconds, 50) * 1000
+            print(f"{size:>9} {max_distance:>4} {build_seconds:>8.2f} {matches:>8.1f} {checked:>8.2%} "
+                  f"{index_p50:>13.3f} {_support.percentile(index_seconds, 99) * 1000:>13.3f} "
+                  f"{linear_p50:>12.3f} {_support.percentile(linear_seconds, 99) * 1000:>12.3f} "
+                  f"{linear_p50 / index_p50:>7.1f}x")
+
+    if args.handler_size:
+        cold, warm, found = run_handler(args.handler_size, args.seed)
+        print(f"\nsimilar_images_handler over {args.handler_size} rows (moto): first call {cold * 1000:.0f} ms "
+              f"(scan + build), warm p50 {_support.percentile(warm, 50) * 1000:.1f} ms, {found} images returned")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
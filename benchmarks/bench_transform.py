@@ -0,0 +1,124 @@
+"""
+Latency of on-the-fly transforms (view_images transform_image.transform_handler).
+
+    python benchmarks/bench_transform.py --images 20 --width 4000 --height 3000 --sizes 200,800
+
+Stores --images synthetic JPEG originals in moto, with their derivatives
+(process_derivatives' defaults) for half of them, then for each output
+width requests a webp of every image three times: the first request renders
+(miss), the second is served from the disk cache (hit) and the third sends
+the ETag back and gets 304. Reports p50/p99 of each, split by whether the
+image has derivatives (used when one is large enough), plus response sizes
+and the cache's hit rate. Finally --burst threads request one new result at
+once; concurrent misses share a single render.
+"""
+import os
+import sys
+import json
+import base64
+import argparse
+import tempfile
+import threading
+
+import _support
+from bench_derivatives import synthetic_jpeg
+
+
+def seed_images(s3, table, count, width, height):
+    process_derivatives = _support.load_handler('process_derivatives')
+    with_derivatives = set()
+    for number in range(count):
+        image_id = f'img-{number}'
+        data = synthetic_jpeg(width, height, number)
+        s3.put_object(Bucket='image-bucket-madhu', Key=f'{image_id}.jpg', Body=data)
+        item = {'image_id': image_id, 's3_key': f'{image_id}.jpg', 'format': 'jpeg', 'width': width,
+                'height': height, 'size_bytes': len(data)}
+        if number % 2:
+            derivatives = []
+            for size, image_format, encoded, derivative_width, derivative_height in \
+                    process_derivatives.render_derivatives(data):
+                key = process_derivatives.derivative_key(image_id, size, image_format)
+                s3.put_object(Bucket='image-bucket-madhu', Key=key, Body=encoded)
+                derivatives.append({'size': size, 'format': image_format, 'key': key, 'width': derivative_width,
+                                    'height': derivative_height})
+            item['derivatives'] = derivatives
+            with_derivatives.add(image_id)
+        table.put_item(Item=item)
+    return with_derivatives
+
+
+def summary(samples):
+    return (f"{_support.percentile(samples, 50) * 1000:>8.2f} {_support.percentile(samples, 99) * 1000:>8.2f}"
+            if samples else f"{'-':>8} {'-':>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', type=int, default=20)
+    parser.add_argument('--width', type=int, default=4000)
+    parser.add_argument('--height', type=int, default=3000)
+    parser.add_argument('--sizes', default='200,800')
+    parser.add_argument('--burst', type=int, default=16)
+    args = parser.parse_args(argv)
+
+    os.environ['TRANSFORM_CACHE_DIR'] = tempfile.mkdtemp()
+    mock = _support.start_mock_aws()
+    try:
+        import boto3
+
+        s3 = boto3.client('s3', region_name=_support.REGION_NAME)
+        _support.create_bucket(s3, 'image-bucket-madhu')
+        dynamodb = boto3.resource('dynamodb', region_name=_support.REGION_NAME)
+        table = _support.create_table(dynamodb, 'images-metadata', 'image_id')
+        with_derivatives = seed_images(s3, table, args.images, args.width, args.height)
+        transform_image = _support.load_handler('view_images', 'transform_image')
+
+        def request(image_id, width, etag=None):
+            event = {'pathParameters': {'image_id': image_id},
+                     'queryStringParameters': {'w': str(width), 'fmt': 'webp'},
+                     'headers': {'If-None-Match': etag} if etag else {}}
+            return transform_image.transform_handler(event, None)
+
+        original_bytes = len(synthetic_jpeg(args.width, args.height, 0))
+        print(f"{args.images} originals of {args.width}x{args.height} (~{original_bytes // 1024} KB), "
+              f"{len(with_derivatives)} with derivatives; {transform_image.TRANSFORM_WORKERS} transform workers")
+        print(f"{'width':>6} {'derivs':>6} {'miss p50':>8} {'miss p99':>8} {'hit p50':>8} {'hit p99':>8} "
+              f"{'304 p50':>8} {'304 p99':>8} {'out KB':>7}")
+        for width in [int(value) for value in args.sizes.split(',')]:
+            for derivs in ('no', 'yes'):
+                image_ids = [f'img-{number}' for number in range(args.images)
+                             if (f'img-{number}' in with_derivatives) == (derivs == 'yes')]
+                misses, hits, revalidations, sizes = [], [], [], []
+                for image_id in image_ids:
+                    (seconds,) = _support.timed(lambda: request(image_id, width))
+                    misses.append(seconds)
+                    response = request(image_id, width)
+                    assert response['headers']['X-Cache'] == 'hit', response
+                    hits.extend(_support.timed(lambda: request(image_id, width)))
+                    sizes.append(len(base64.b64decode(response['body'])))
+                    etag = response['headers']['ETag']
+                    revalidations.extend(_support.timed(lambda: request(image_id, width, etag)))
+                print(f"{width:>6} {derivs:>6} {summary(misses)} {summary(hits)} {summary(revalidations)} "
+                      f"{sum(sizes) / len(sizes) / 1024 if sizes else 0:>7.1f}")
+
+        renders = []
+        original_render = transform_image.render_transform
+
+        def counted_render(*render_args):
+            renders.append(1)
+            return original_render(*render_args)
+        transform_image.render_transform = counted_render
+        threads = [threading.Thread(target=request, args=('img-0', 333)) for _ in range(args.burst)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print(f"\n{args.burst} concurrent requests for one new result: {len(renders)} render(s)")
+        print(json.dumps({'transform_cache': transform_image.transform_cache.stats()}))
+    finally:
+        mock.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
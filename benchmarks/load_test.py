@@ -0,0 +1,337 @@
+"""
+Load test of upload_image, list_images, view_images and delete_images.
+
+    python benchmarks/load_test.py --duration 20 --concurrency 1,8 \\
+        --mix upload=1,list=3,view=10,delete=1 --upload-sizes-kb 64,512,4096 \\
+        --list-filters scan,exact,q,recent --output run.json --compare baseline.json
+
+The handlers run in-process against moto, or against LocalStack with
+--endpoint-url http://localhost:4566 (docker-compose.yml); tables, indexes
+and the bucket are created when missing. After --seed-images uploads, each
+concurrency level runs that many worker threads for --duration seconds,
+each picking operations by the --mix weights: uploads of a random
+--upload-sizes-kb size, list calls with a random --list-filters filter
+(substring scan, exact title index, full-text q, sort=recent), views and
+deletes of images uploaded earlier. Per handler it reports throughput,
+p50/p95/p99 latency, errors and the p50 of each phase from the handlers'
+request_metrics lines. A sequential pass under tracemalloc then records
+each handler's peak allocation per invocation.
+
+--output saves the results as JSON. --compare reads an earlier file and
+exits 1 when a handler's p99 grew or its throughput fell by more than
+--threshold (default 0.25) at the same concurrency. moto shares the GIL
+with the workers, so compare moto runs with moto runs.
+"""
+import io
+import os
+import sys
+import json
+import time
+import base64
+import random
+import argparse
+import platform
+import threading
+import contextlib
+import subprocess
+import tracemalloc
+
+import _support
+
+HANDLERS = {'upload': 'upload_image', 'list': 'list_images', 'view': 'view_images', 'delete': 'delete_images'}
+LIST_FILTERS = {
+    'scan': {'title': 'Sunset'},
+    'exact': {'title': 'Sunset 7', 'match': 'exact'},
+    'q': {'q': 'sunset beach'},
+    'recent': {'sort': 'recent'}
+}
+TITLE_WORDS = ('Sunset', 'Harbor', 'Forest', 'Street')
+MEMORY_PASS_CALLS = 20
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        operation, _, weight = part.partition('=')
+        if operation not in HANDLERS:
+            raise argparse.ArgumentTypeError(f'unknown operation {operation}; use {", ".join(HANDLERS)}')
+        mix[operation] = float(weight or 1)
+    return mix
+
+
+def parse_filters(value):
+    filters = [name for name in value.split(',') if name]
+    unknown = [name for name in filters if name not in LIST_FILTERS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f'unknown list filters {unknown}; use {", ".join(LIST_FILTERS)}')
+    return filters
+
+
+def create_resources(endpoint_url):
+    """Tables, listing indexes and buckets the four handlers use (existing ones are kept)."""
+    import boto3
+    import search_index
+    import blob_store
+    import catalog_index
+
+    dynamodb = boto3.resource('dynamodb', region_name=_support.REGION_NAME, endpoint_url=endpoint_url)
+    tables = ((catalog_index.DYNAMODB_TABLE_NAME, ('image_id',), {'title-index': ('title', None)}),
+              (search_index.SEARCH_INDEX_TABLE_NAME, ('term', 'image_id'), None),
+              (blob_store.BLOB_TABLE_NAME, ('content_sha256',), None))
+    existing = set(boto3.client('dynamodb', region_name=_support.REGION_NAME,
+                                endpoint_url=endpoint_url).list_tables()['TableNames'])
+    for name, keys, indexes in tables:
+        if name not in existing:
+            _support.create_table(dynamodb, name, *keys, indexes=indexes)
+    client = boto3.client('dynamodb', region_name=_support.REGION_NAME, endpoint_url=endpoint_url)
+    while catalog_index.create_indexes(client):
+        pass
+
+    s3 = boto3.client('s3', region_name=_support.REGION_NAME, endpoint_url=endpoint_url)
+    buckets = {bucket['Name'] for bucket in s3.list_buckets().get('Buckets', [])}
+    for bucket in ('image-bucket-madhu', 'image-bucket'):
+        if bucket not in buckets:
+            _support.create_bucket(s3, bucket)
+
+
+class Workload(object):
+    """Builds handler events and tracks the image_ids that views and deletes can use."""
+    def __init__(self, handlers, mix, sizes_kb, filters, seed):
+        self.handlers = handlers
+        self.operations = list(mix)
+        self.weights = [mix[operation] for operation in self.operations]
+        self.payloads = {size: base64.b64encode(_support.image_payload(size * 1024)).decode('ascii')
+                         for size in sizes_kb}
+        self.filters = filters
+        self.seed = seed
+        self.image_ids = []
+        self.lock = threading.Lock()
+
+    def upload_event(self, rng):
+        title = f'{rng.choice(TITLE_WORDS)} {rng.randrange(20)}'
+        return {'body': json.dumps({'title': title, 'description': 'Beach at dusk',
+                                    'image_file': self.payloads[rng.choice(list(self.payloads))]})}
+
+    def call(self, operation, rng):
+        """Runs one operation; returns (handler name, seconds, status code)."""
+        if operation in ('view', 'delete'):
+            with self.lock:
+                if len(self.image_ids) < 10:
+                    operation = 'upload'  # keep enough images around to view
+                elif operation == 'delete':
+                    image_id = self.image_ids.pop(rng.randrange(len(self.image_ids)))
+                else:
+                    image_id = rng.choice(self.image_ids)
+        if operation == 'upload':
+            event = self.upload_event(rng)
+        elif operation == 'list':
+            event = {'queryStringParameters': dict(LIST_FILTERS[rng.choice(self.filters)], limit='20')}
+        else:
+            event = {'pathParameters': {'image_id': image_id}}
+
+        handler = self.handlers[operation]
+        start = time.perf_counter()
+        response = handler.lambda_handler(event, None)
+        seconds = time.perf_counter() - start
+        if operation == 'upload' and response['statusCode'] == 200:
+            with self.lock:
+                self.image_ids.append(json.loads(response['body'])['image_id'])
+        return HANDLERS[operation], seconds, response['statusCode']
+
+    def run(self, concurrency, duration):
+        samples = []
+        deadline = time.perf_counter() + duration
+
+        def worker(number):
+            rng = random.Random(self.seed * 1000 + number)
+            local = []
+            while time.perf_counter() < deadline:
+                local.append(self.call(rng.choices(self.operations, self.weights)[0], rng))
+            samples.extend(local)
+
+        threads = [threading.Thread(target=worker, args=(number,)) for number in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples, time.perf_counter() - start
+
+
+def summarize_run(samples, elapsed, metrics_lines):
+    import request_metrics
+
+    phases = request_metrics.summarize(request_metrics.read_documents(metrics_lines))
+    handlers = {}
+    for name in sorted({sample[0] for sample in samples}):
+        latencies = [seconds * 1000 for handler, seconds, _ in samples if handler == name]
+        statuses = {}
+        for handler, _, status_code in samples:
+            if handler == name:
+                statuses[str(status_code)] = statuses.get(str(status_code), 0) + 1
+        handlers[name] = {
+            'ops': len(latencies),
+            'throughput_ops_s': round(len(latencies) / elapsed, 2),
+            'p50_ms': round(_support.percentile(latencies, 50), 3),
+            'p95_ms': round(_support.percentile(latencies, 95), 3),
+            'p99_ms': round(_support.percentile(latencies, 99), 3),
+            'max_ms': round(max(latencies), 3),
+            'errors': sum(count for status, count in statuses.items() if status.startswith('5')),
+            'status_codes': statuses,
+            'phases_p50_ms': {metric[:-len('_ms')]: round(stats['p50'], 3)
+                              for metric, stats in phases.get(name, {}).items()
+                              if metric.endswith('_ms') and metric != 'duration_ms'}
+        }
+    return {'elapsed_s': round(elapsed, 3), 'ops': len(samples),
+            'throughput_ops_s': round(len(samples) / elapsed, 2), 'handlers': handlers}
+
+
+# Peak bytes allocated during one invocation, per handler
+def memory_pass(workload, seed):
+    rng = random.Random(seed)
+    peaks = {}
+    tracemalloc.start()
+    try:
+        for operation in ('upload', 'list', 'view', 'delete'):
+            for _ in range(MEMORY_PASS_CALLS):
+                baseline = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                handler, _, _ = workload.call(operation, rng)
+                peak_kb = (tracemalloc.get_traced_memory()[1] - baseline) / 1024
+                peaks[handler] = max(peaks.get(handler, 0), round(peak_kb, 1))
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def max_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=_support.ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Prints per-handler changes against a baseline; returns the regressions."""
+    regressions = []
+    previous_runs = {run['concurrency']: run for run in baseline.get('runs', [])}
+    print(f"\n{'conc':>5} {'handler':<14} {'p99 ms':>16} {'ops/s':>16}")
+    for run in results['runs']:
+        previous = previous_runs.get(run['concurrency'])
+        if previous is None:
+            continue
+        for name, current in run['handlers'].items():
+            before = previous['handlers'].get(name)
+            if before is None:
+                continue
+            p99_change = current['p99_ms'] / before['p99_ms'] - 1 if before['p99_ms'] else 0
+            throughput_change = current['throughput_ops_s'] / before['throughput_ops_s'] - 1 \
+                if before['throughput_ops_s'] else 0
+            print(f"{run['concurrency']:>5} {name:<14} {before['p99_ms']:>7.1f}->{current['p99_ms']:<7.1f}"
+                  f" {before['throughput_ops_s']:>7.1f}->{current['throughput_ops_s']:<7.1f}"
+                  f" {p99_change:+.0%} {throughput_change:+.0%}")
+            if p99_change > threshold:
+                regressions.append(f"{name} at concurrency {run['concurrency']}: p99 {p99_change:+.0%}")
+            if throughput_change < -threshold:
+                regressions.append(f"{name} at concurrency {run['concurrency']}: throughput {throughput_change:+.0%}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--endpoint-url', default=None, help='LocalStack endpoint; default runs against moto')
+    parser.add_argument('--duration', type=float, default=20, help='seconds per concurrency level')
+    parser.add_argument('--concurrency', default='1,8')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('upload=1,list=3,view=10,delete=1'))
+    parser.add_argument('--upload-sizes-kb', default='64,512,4096')
+    parser.add_argument('--list-filters', type=parse_filters, default=list(LIST_FILTERS))
+    parser.add_argument('--seed-images', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', default=None, help='write the results to this JSON file')
+    parser.add_argument('--compare', default=None, help='earlier results JSON to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    os.environ.pop('UPLOAD_ASYNC_PROCESSING', None)
+    os.environ['METRICS_MODE'] = 'emf'  # the phase breakdown comes from the handlers' metrics lines
+    mock = None
+    if args.endpoint_url:
+        os.environ['AWS_ENDPOINT_URL'] = args.endpoint_url
+        os.environ.setdefault('AWS_ACCESS_KEY_ID', 'test')
+        os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'test')
+        os.environ.setdefault('AWS_DEFAULT_REGION', _support.REGION_NAME)
+    else:
+        mock = _support.start_mock_aws()
+    try:
+        create_resources(args.endpoint_url)
+        handlers = {operation: _support.load_handler(name) for operation, name in HANDLERS.items()}
+        sizes_kb = [int(value) for value in args.upload_sizes_kb.split(',')]
+        workload = Workload(handlers, args.mix, sizes_kb, args.list_filters, args.seed)
+
+        results = {
+            'meta': {
+                'backend': args.endpoint_url or 'moto',
+                'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'git_revision': git_revision(),
+                'python': platform.python_version(),
+                'duration_s': args.duration,
+                'mix': args.mix,
+                'upload_sizes_kb': sizes_kb,
+                'list_filters': args.list_filters,
+                'seed': args.seed
+            },
+            'runs': []
+        }
+        # Handlers print a request_metrics line per call; keep them for the phase breakdown
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            seed_rng = random.Random(args.seed)
+            for _ in range(args.seed_images):
+                workload.call('upload', seed_rng)
+        print(f"{'conc':>5} {'handler':<14} {'ops':>6} {'ops/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'errors':>6}  slowest phases (p50 ms)")
+        for concurrency in [int(value) for value in args.concurrency.split(',')]:
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                samples, elapsed = workload.run(concurrency, args.duration)
+            run = dict(concurrency=concurrency, **summarize_run(samples, elapsed, output.getvalue().splitlines()))
+            results['runs'].append(run)
+            for name, stats in run['handlers'].items():
+                slowest = sorted(stats['phases_p50_ms'].items(), key=lambda item: -item[1])[:3]
+                print(f"{concurrency:>5} {name:<14} {stats['ops']:>6} {stats['throughput_ops_s']:>8.1f} "
+                      f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['errors']:>6}  "
+                      + ' '.join(f'{phase}={ms:.1f}' for phase, ms in slowest))
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            results['memory_peak_kb'] = memory_pass(workload, args.seed + 1)
+        results['max_rss_kb'] = max_rss_kb()
+        print('\npeak KB per invocation: ' + ' '.join(f'{name}={kb:.0f}'
+                                                     for name, kb in sorted(results['memory_peak_kb'].items()))
+              + f"  (process max RSS {results['max_rss_kb']} KB)")
+    finally:
+        if mock:
+            mock.stop()
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
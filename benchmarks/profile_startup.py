@@ -0,0 +1,174 @@
+"""
+Startup profile of every handler in app/*/lambda_function.py.
+
+    python benchmarks/profile_startup.py --runs 5 [--top 8] [--json] [--check]
+
+For each function a fresh interpreter imports the handler under
+`python -X importtime` and invokes it once with a sample event against a
+local stub endpoint (AWS_ENDPOINT_URL), like a Lambda cold start without the
+network. Reports the median import time, first-invocation time and the
+slowest imports. --check compares the medians with startup_budgets.json and
+exits 1 if any function is over budget; benchmarks/test_startup_budget.py
+runs the same check in the test suite.
+"""
+import io
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+import _support
+
+# Written to stderr between phases so importtime lines can be attributed
+IMPORT_MARKER = '-- import --'
+INVOKE_MARKER = '-- first invocation --'
+BUDGETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_budgets.json')
+
+SAMPLE_EVENTS = {
+    'delete_images': {'pathParameters': {'image_id': 'img-1'}},
+    'list_images': {'queryStringParameters': {'title': 'Sunset'}},
+    'process_derivatives': {'image_ids': ['img-1']},
+    'process_uploads': {'Records': [{'messageId': 'job-1', 'body': json.dumps({'image_id': 'img-1',
+                                                                             's3_key': 'img-1.jpg'})}]},
+    'reconcile_images': {'prefix': 'img-'},
+    'upload_image': {'body': json.dumps({'title': 'Sunset', 'description': 'Beach at dusk',
+                                         'image_file': 'iVBORw0KGgoAAAANSUhEUgAAAEAAAAAwCAIAAAA='})},  # 64x48 PNG header
+    'view_images': {'pathParameters': {'image_id': 'img-1'}}
+}
+
+CHILD_TEMPLATE = """
+import sys, time, json
+sys.path[:0] = [{function_dir!r}, {layer_dir!r}]
+sys.stderr.write({import_marker!r} + '\\n')
+sys.stderr.flush()
+start = time.perf_counter()
+import lambda_function
+imported = time.perf_counter()
+sys.stderr.write({invoke_marker!r} + '\\n')
+sys.stderr.flush()
+response = lambda_function.lambda_handler(json.loads({event!r}), None)
+done = time.perf_counter()
+print(json.dumps({{'import_ms': (imported - start) * 1000, 'first_invocation_ms': (done - imported) * 1000,
+                  'status_code': response.get('statusCode', 500 if response.get('batchItemFailures') else 200)}}))
+"""
+
+
+def handler_names():
+    return sorted(name for name in os.listdir(_support.APP_DIR)
+                  if os.path.isfile(os.path.join(_support.APP_DIR, name, 'lambda_function.py')))
+
+
+# ([(module, cumulative_ms)] imported while loading the handler, same for its
+# first invocation) from -X importtime's stderr
+def parse_importtime(stderr):
+    # Modules loaded by interpreter startup (site, .pth files) are not counted
+    phases = {IMPORT_MARKER: [], INVOKE_MARKER: []}
+    phase = []
+    for line in stderr.splitlines():
+        if line in phases:
+            phase = phases[line]
+        elif line.startswith('import time:') and 'cumulative' not in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            phase.append((name.strip(), int(cumulative) / 1000.0))
+    return phases[IMPORT_MARKER], phases[INVOKE_MARKER]
+
+
+def run_once(function_name, endpoint):
+    code = CHILD_TEMPLATE.format(function_dir=os.path.join(_support.APP_DIR, function_name),
+                                 layer_dir=_support.LAYER_DIR,
+                                 event=json.dumps(SAMPLE_EVENTS.get(function_name, {})), import_marker=IMPORT_MARKER,
+                                 invoke_marker=INVOKE_MARKER)
+    env = dict(os.environ, AWS_ENDPOINT_URL=endpoint, AWS_ACCESS_KEY_ID='testing',
+               AWS_SECRET_ACCESS_KEY='testing', AWS_DEFAULT_REGION=_support.REGION_NAME,
+               PYTHONDONTWRITEBYTECODE='1', METRICS_MODE='emf')  # as deployed
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], env=env, check=True,
+                            capture_output=True, text=True)
+    run = json.loads(result.stdout.strip().splitlines()[-1])
+    run['imports'], run['invocation_imports'] = parse_importtime(result.stderr)
+    return run
+
+
+def profile(function_name, endpoint, runs=5):
+    """
+    Median import and first-invocation time of one handler over `runs` cold
+    starts, plus the import breakdown of the median run.
+    """
+    run_once(function_name, endpoint)  # warm the OS page cache
+    samples = sorted((run_once(function_name, endpoint) for _ in range(runs)),
+                     key=lambda run: run['import_ms'] + run['first_invocation_ms'])
+    median = samples[len(samples) // 2]
+    return {
+        'function': function_name,
+        'import_ms': _support.percentile([run['import_ms'] for run in samples], 50),
+        'first_invocation_ms': _support.percentile([run['first_invocation_ms'] for run in samples], 50),
+        'status_code': median['status_code'],
+        'imports': median['imports'],
+        'invocation_imports': median['invocation_imports']
+    }
+
+
+def load_budgets(path=BUDGETS_PATH):
+    with open(path) as budgets_file:
+        return json.load(budgets_file)
+
+
+# Messages for every measurement above its budget
+def over_budget(result, budgets):
+    budget = budgets.get(result['function'], {})
+    return [f"{result['function']}: {metric} {result[metric]:.1f} ms > budget {budget[metric]} ms"
+            for metric in ('import_ms', 'first_invocation_ms')
+            if metric in budget and result[metric] > budget[metric]]
+
+
+# Small JPEG for process_derivatives' first invocation (empty without Pillow)
+def sample_object():
+    try:
+        from PIL import Image
+    except ImportError:
+        return b''
+    output = io.BytesIO()
+    Image.new('RGB', (1200, 800), (200, 80, 20)).save(output, format='JPEG')
+    return output.getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=8, help='slowest imports to list per function')
+    parser.add_argument('--functions', default=','.join(handler_names()))
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--check', action='store_true', help='exit 1 if a function is over its budget')
+    args = parser.parse_args(argv)
+
+    server, endpoint = _support.start_stub_endpoint(sample_object())
+    try:
+        results = [profile(name, endpoint, args.runs) for name in args.functions.split(',')]
+    finally:
+        server.shutdown()
+
+    budgets = load_budgets()
+    failures = [message for result in results for message in over_budget(result, budgets)]
+    if args.json:
+        for result in results:
+            for key in ('imports', 'invocation_imports'):
+                result[key] = sorted(result[key], key=lambda entry: -entry[1])[:args.top]
+        print(json.dumps({'results': results, 'over_budget': failures}, indent=2))
+    else:
+        for result in results:
+            budget = budgets.get(result['function'], {})
+            print(f"{result['function']}: import {result['import_ms']:.1f} ms (budget {budget.get('import_ms')}), "
+                  f"first invocation {result['first_invocation_ms']:.1f} ms "
+                  f"(budget {budget.get('first_invocation_ms')}), status {result['status_code']}")
+            # Slowest imports at module load, then the ones deferred to the first call
+            for label in ('imports', 'invocation_imports'):
+                entries = [entry for entry in result[label] if entry[0] != 'lambda_function']
+                for name, cumulative_ms in sorted(entries, key=lambda entry: -entry[1])[:args.top]:
+                    print(f"    {label:<18} {cumulative_ms:8.1f} ms  {name}")
+        for message in failures:
+            print(f"OVER BUDGET {message}")
+    return 1 if args.check and failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
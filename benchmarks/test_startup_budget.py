@@ -0,0 +1,39 @@
+import unittest
+import importlib.util
+
+import _support
+import profile_startup
+
+
+@unittest.skipIf(importlib.util.find_spec('boto3') is None, 'boto3 is not installed')
+class TestStartupBudget(unittest.TestCase):
+    """
+    Cold-start budgets from startup_budgets.json. Importing a handler must
+    not build clients or pull boto3 in eagerly, and the first invocation must
+    stay within budget.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server, cls.endpoint = _support.start_stub_endpoint(profile_startup.sample_object())
+        cls.budgets = profile_startup.load_budgets()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def test_every_handler_has_a_budget(self):
+        self.assertEqual(sorted(self.budgets), profile_startup.handler_names())
+
+    def test_handlers_start_within_budget(self):
+        for function_name in profile_startup.handler_names():
+            with self.subTest(function=function_name):
+                result = profile_startup.profile(function_name, self.endpoint, runs=3)
+                self.assertEqual(result['status_code'], 200)
+                self.assertNotIn('boto3', [name for name, _ in result['imports']],
+                                 'boto3 should load on first use, not at import')
+                self.assertEqual(profile_startup.over_budget(result, self.budgets), [])
+
+
+if __name__ == '__main__':
+    unittest.main()